@@ -20,7 +20,10 @@ from core import statusMod
 from core import dbMod
 from core import errMod
 from core import configMod
+from core import calibIoMod
 from core import calibMod
+from core import basinStatusMod
+from core import snapshotMod
 
 # Set the Python path to include package specific functions.
 prPath = os.path.realpath(__file__)
@@ -160,6 +163,8 @@ def main(argv):
     jobData.trouteConfig = staticData.trouteConfig
     jobData.moduleLoadStr = staticData.moduleLoadStr
     jobData.moduleLoadTrouteStr = staticData.moduleLoadTrouteStr
+    jobData.groupWalltime = staticData.groupWalltime
+    jobData.groupHandoff = staticData.groupHandoff
  
     # Check gages in directory to match what's in the database
     try:
@@ -167,6 +172,21 @@ def main(argv):
     except:
         errMod.errOut(jobData)
 
+    # If this group job is being resubmitted, pull the state snapshot written by the
+    # previous one. It is ignored if the config file or the basins have changed.
+    snapPath = snapshotMod.snapshotPath(jobData,"CALIB",args.groupNum[0])
+    snapIn = snapshotMod.readSnapshot(jobData,snapPath,args.groupNum[0],configPath)
+    if snapIn is not None:
+        print("RESTORING STATE SNAPSHOT: " + snapPath)
+        snapshotMod.restoreMetaCache(jobData,snapIn)
+
+    # Load the domain metadata for all basins, along with the troute configuration,
+    # once up front instead of for every basin on every pass of the workflow.
+    try:
+        calibIoMod.loadMetaCache(jobData,db)
+    except:
+        errMod.errOut(jobData)
+
     # Calculate the CPU/group layout for all basins.
     try:
         jobData.calcGroupNum()
@@ -293,7 +313,8 @@ def main(argv):
     # -0.75 - The R/Python code to generate new parameters/stats has failed. CALIB.LOCK
     #         is put into place. 
     # -1.0 - Model has failed twice. A RUN.LOCK file has been created.
-    # Once all array elements are 1.0, then completeStatus goes to True, an entry into
+    # 3.0 - The calibration of the basin converged, and this iteration was skipped.
+    # Once all array elements are 1.0 (or 3.0), then completeStatus goes to True, an entry into
     # the database occurs, and the program will complete.
     keySlot = np.empty([len(jobData.gages),int(jobData.nIter)])
     keySlot[:,:] = 0.0
@@ -305,28 +326,27 @@ def main(argv):
     pbsJobId = np.empty([len(jobData.gages)],np.int64)
     pbsJobId[:] = -9999
     
-    # NOTE this is different from the spinup. We have a 2D array of values to account
-    # for all the iterations. 
-    entryValue = float(len(jobData.gages)*int(jobData.nIter))
-    
-    # Pull all the status values into the keySlot array. 
+    # Pull all the status values into the keySlot array with a single query.
     for basin in range(0,len(jobData.gages)):
-        domainID = jobData.gageIDs[basin]
-            
-        if domainID == -9999:
+        if jobData.gageIDs[basin] == -9999:
             jobData.errMsg = "ERROR: Unable to locate domainID for gage: " + str(jobData.gages[basin])
             errMod.errOut(jobData)
-            
-        # We are going to pull all values for one basin, then place them into the array.
-        # This is faster then looping over each iteration at a time. 
-        statusData = db.iterationStatus(jobData,domainID,str(jobData.gages[basin]))
-        statusData = [list(item) for item in statusData]
-        for iteration in range(0,int(jobData.nIter)):
-            for iteration2 in range(0,int(jobData.nIter)):
-                if statusData[iteration2][0] == iteration+1:
-                    keySlot[basin,iteration] = float(statusData[iteration2][1])
+
+    # Basins handled by this program. Their status is persisted to the Basin_Status
+    # table once per pass through the basins.
+    groupMask = np.array(jobData.gageGroup) == int(args.groupNum[0])
+    statusTracker = basinStatusMod.statusTracker(jobData,basinStatusMod.PHASE_CALIB,keySlot,groupMask)
+    try:
+        statusTracker.restoreIterations(jobData,db,keySlot,False)
+    except:
+        errMod.errOut(jobData)
+    if snapIn is not None:
+        snapshotMod.applySnapshot(jobData,snapIn,keySlot,pbsJobId,groupMask)
                     
-                
+    # Time at which this group job hands off to a successor before hitting its walltime.
+    handoffAt = statusMod.handoffTime(jobData,begTimeStamp)
+    groupScript = jobData.jobDir + "/run_group_" + str(args.groupNum[0]) + ".sh"
+
     while not completeStatus:
         basCount = 0
         # Walk through calibration directories for each basin. Determine the status of
@@ -356,34 +376,48 @@ def main(argv):
         # If the status goes to -0.75, a LOCK file is created and needs to be removed
         # manually by the user before the workflow can continue. 
 
-        for basin in range(0,len(jobData.gages)):
+        # Only process basins that are part of this group, per the argument passed into the
+        # program.
+        keySlot[~groupMask,:] = 1.0
+        # An iteration cannot begin until the previous one is complete, so the only
+        # iteration of each basin needing work is its first one not at 1.0.
+        actionIter = basinStatusMod.firstAction(basinStatusMod.encode(keySlot))
+        for basin in np.nonzero(groupMask)[0]:
             print("PROCESSING BASIN: " + str(basin))
-            for iteration in range(0,int(jobData.nIter)):
-                # Only process basins that are part of this group, per the argument passed into the
-                # program.
-                if jobData.gageGroup[basin] != int(args.groupNum[0]):
-                    keySlot[basin,iteration] = 1.0
-                    continue
+            iteration = int(actionIter[basin])
+            while iteration < int(jobData.nIter):
                 basCount += 1
                 print("PROCESSING ITERATION: " + str(iteration))
-                # Holding onto the status value before the workflow iterates for checking below.
-                keyStatusCheck1 = keySlot[basin,iteration]
-                # If the status is already 1.0, then continue the loop as now work needs to be done.
-                if keyStatusCheck1 == 1.0:
-                    continue
-                else:
-                    try:
-                        calibMod.runModel(jobData,staticData,db,jobData.gageIDs[basin],
-                                          jobData.gages[basin],keySlot,basin,iteration,pbsJobId)
-                    except:
-                        errMod.errOut(jobData)
-                # Temporary for Cheyenne to slow down the strain on PBS. 
-                keyStatusCheck2 = keySlot[basin,iteration]
-                # Put some spacing between launching model simulations.
+                try:
+                    calibMod.runModel(jobData,staticData,db,jobData.gageIDs[basin],
+                                      jobData.gages[basin],keySlot,basin,iteration,pbsJobId)
+                except:
+                    errMod.errOut(jobData)
+                # If this iteration is now complete, move onto the next one.
+                if keySlot[basin,iteration] != 1.0:
+                    break
+                iteration += 1
+            # Put some spacing between launching model simulations.
             time.sleep(15)
+            # Stop walking basins once this group job is due to hand off.
+            if statusMod.handoffDue(handoffAt):
+                break
+
+        # Persist the status changes from this pass in bulk.
+        try:
+            statusTracker.save(jobData,db,keySlot)
+        except:
+            errMod.errOut(jobData)
+
+        # Write the state snapshot used to resume this group if it is resubmitted.
+        try:
+            snapshotMod.writeSnapshot(jobData,snapPath,args.groupNum[0],configPath,keySlot,pbsJobId)
+        except:
+            errMod.errOut(jobData)
 
         # Check to see if program requirements have been met.
-        if keySlot.sum() == entryValue:
+        # Iterations skipped once a basin converged count as done.
+        if basinStatusMod.isDone(keySlot).all():
             if len(args.groupNum[0]) == 0:
             # If we aren't doing groups, this means all basins are complete.
                 jobData.calibComplete = 1
@@ -402,9 +436,20 @@ def main(argv):
                 except:
                     jobData.errMsg = "Unable to create complete flag: " + basinCompleteFlag
                     errMod.errOut(jobData)
+                snapshotMod.removeSnapshot(snapPath)
 
             completeStatus = True
 
+        # If this group job is close to its walltime, its state has been saved above.
+        # Submit a successor that starts once this job ends, and exit cleanly.
+        if not completeStatus and statusMod.handoffDue(handoffAt):
+            try:
+                nextId = statusMod.submitSuccessor(jobData,"WCG",args.groupNum[0],groupScript)
+            except:
+                errMod.errOut(jobData)
+            print("HANDING OFF GROUP: " + str(args.groupNum[0]) + " TO JOB: " + str(nextId))
+            sys.exit(0)
+
         # Open the Python LOCK file. Write a blank line to the file and close it.
         # This action will simply modify the file modification time while only adding
         # a blank line.
@@ -0,0 +1,286 @@
+# Module file containing asyncio based functions for probing the status of
+# basin group jobs from the orchestrator programs. Rather than checking one
+# group at a time, with a blocking scheduler call and a fixed sleep in-between
+# each group, all groups are probed concurrently once per "tick". A single
+# scheduler snapshot is taken per tick, and any per-group probes (qstat on a
+# known PBS job ID, COMPLETE flag checks) are fanned out with bounded
+# concurrency. The time to sweep all groups is then set by the slowest probe,
+# not the sum of every probe plus sleeps.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import asyncio
+import os
+import pwd
+import time
+import psutil
+from core import errMod
+from core import dbWriterMod
+from core import statusMod
+import warnings
+warnings.filterwarnings("ignore")
+
+# Number of seconds to wait after submitting a PBS job before trusting
+# qstat <jobID> to report it. Replaces the old blocking two minute sleep.
+PBS_SUBMIT_GRACE = 120.0
+
+# Number of consecutive failed qstat <jobID> probes before a PBS group job
+# is considered finished. Replaces the old blocking 60 second retry.
+PBS_MAX_MISSES = 2
+
+class groupProbeState:
+    def __init__(self,nGroups):
+        # Initialize object to hold per-group probe state that needs to persist
+        # between ticks of the orchestrator loop.
+        self.submitTime = [None]*nGroups
+        self.missCount = [0]*nGroups
+
+async def runCmdAsync(cmdList,semaphore):
+    """
+    Generic function to run a command without blocking the event loop. The
+    semaphore bounds the number of commands in flight at once. Returns
+    the exit code and the decoded standard output. An exit code of None
+    means the command could not be launched.
+    """
+    async with semaphore:
+        try:
+            proc = await asyncio.create_subprocess_exec(*cmdList,stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.DEVNULL)
+        except OSError:
+            return [None,'']
+        stdOut, stdErr = await proc.communicate()
+    return [proc.returncode,str(stdOut,'utf-8')]
+
+def listProcesses():
+    """
+    Generic function to build a dictionary of process names to process IDs for
+    all processes currently running on this machine.
+    """
+    procDict = {}
+    for proc in psutil.process_iter():
+        try:
+            procDict.setdefault(proc.name(),[]).append(proc.pid)
+        except:
+            # Process ended before we could get the name.
+            continue
+    return procDict
+
+async def schedulerSnapshot(jobData,pbsJobId,groupList,semaphore):
+    """
+    Generic function to take one snapshot of the scheduler (or process table
+    for MPI runs) that is shared by every group probe during a tick. Returns
+    a dictionary of job names to job IDs (or process ID lists for MPI).
+    """
+    snapshot = {}
+    if jobData.jobRunType == 1:
+        retCode, jobsTmp = await runCmdAsync(['bjobs','-u',str(jobData.owner),'-w','-noheader'],semaphore)
+        if retCode is None:
+            jobData.errMsg = "ERROR: Unable to run bjobs for user: " + str(jobData.owner)
+            raise Exception()
+        for lineTmp in jobsTmp.split('\n'):
+            colTmp = lineTmp.split()
+            if len(colTmp) >= 7:
+                snapshot[colTmp[6]] = colTmp[0]
+
+    if jobData.jobRunType == 2:
+        # qstat on the user is slow on large systems. Only run it if we have
+        # groups with no known job ID (restarting workflow, or new instance).
+        unknownIds = [groupNum for groupNum in groupList if pbsJobId[groupNum] == -9999]
+        if len(unknownIds) == 0:
+            return snapshot
+        retCode, jobsTmp = await runCmdAsync(['qstat','-u',str(jobData.owner)],semaphore)
+        if retCode is None:
+            jobData.errMsg = "ERROR: Unable to run qstat for user: " + str(jobData.owner)
+            raise Exception()
+        if retCode != 0:
+            # No jobs are running for the user.
+            return snapshot
+        # This is a CRUDE assumption based on the behavior of qstat on Cheyenne.
+        for lineTmp in jobsTmp.split('\n')[3:]:
+            colTmp = lineTmp.split()
+            if len(colTmp) >= 4:
+                try:
+                    snapshot[colTmp[3]] = int(colTmp[0].split('.')[0])
+                except ValueError:
+                    continue
+
+    if jobData.jobRunType == 3 or jobData.jobRunType == 6:
+        retCode, jobsTmp = await runCmdAsync(['squeue','-h','-u',str(jobData.owner),
+                                              '--format=%i %j'],semaphore)
+        if retCode is None:
+            jobData.errMsg = "ERROR: Unable to run squeue for user: " + str(jobData.owner)
+            raise Exception()
+        for lineTmp in jobsTmp.split('\n'):
+            colTmp = lineTmp.split()
+            if len(colTmp) >= 2:
+                snapshot[colTmp[1]] = colTmp[0]
+
+    if jobData.jobRunType == 4:
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            snapshot = await loop.run_in_executor(None,listProcesses)
+
+    return snapshot
+
+async def probeGroup(jobData,groupNum,pbsJobId,programType,flagPath,snapshot,probeState,semaphore):
+    """
+    Generic function to probe a single basin group. Returns a list containing
+    the group number, whether a group job is running, and whether the group
+    COMPLETE flag is present. The COMPLETE flag is checked after the job status
+    so a job finishing between the two checks is not resubmitted.
+    """
+    loop = asyncio.get_running_loop()
+    expName = programType + "_" + str(jobData.jobID) + "_" + str(groupNum)
+    status = False
+
+    if jobData.jobRunType == 1 or jobData.jobRunType == 3 or jobData.jobRunType == 6:
+        status = expName in snapshot
+
+    if jobData.jobRunType == 2:
+        # A group job close to its walltime may have submitted its own successor.
+        # Track the successor from here on.
+        nextId = await loop.run_in_executor(None,statusMod.takeHandoff,jobData,programType,groupNum)
+        if nextId is not None:
+            print("GROUP: " + str(groupNum) + " HANDED OFF TO JOB: " + str(nextId))
+            pbsJobId[groupNum] = nextId
+            probeState.submitTime[groupNum] = time.time()
+            probeState.missCount[groupNum] = 0
+        if pbsJobId[groupNum] == -9999:
+            if expName in snapshot:
+                # A job running from a previous instance of the workflow is
+                # still running. Set the job ID into the jobIds array.
+                pbsJobId[groupNum] = snapshot[expName]
+                print(pbsJobId[groupNum])
+                status = True
+        else:
+            submitTime = probeState.submitTime[groupNum]
+            if submitTime is not None and (time.time() - submitTime) < PBS_SUBMIT_GRACE:
+                # Give the scheduler time to register the job.
+                status = True
+            else:
+                retCode, jobsTmp = await runCmdAsync(['qstat',str(pbsJobId[groupNum])],semaphore)
+                if retCode == 0:
+                    probeState.missCount[groupNum] = 0
+                    status = True
+                else:
+                    probeState.missCount[groupNum] = probeState.missCount[groupNum] + 1
+                    status = probeState.missCount[groupNum] < PBS_MAX_MISSES
+
+    if jobData.jobRunType == 4:
+        if expName in snapshot:
+            # Ensure these are being ran by the proper user.
+            try:
+                uid = os.stat('/proc/%d' % snapshot[expName][0]).st_uid
+                userCheck = pwd.getpwuid(uid)[0]
+            except:
+                # Process ended before we could check the owner.
+                userCheck = None
+            if userCheck is not None:
+                if userCheck != str(jobData.owner):
+                    jobData.errMsg = "ERROR: " + expName + " is being ran by: " + \
+                                     userCheck + " When it should be ran by: " + jobData.owner
+                    raise Exception()
+                status = True
+
+    complete = await loop.run_in_executor(None,os.path.isfile,flagPath)
+
+    return [groupNum,status,complete]
+
+async def sweepGroups(jobData,pbsJobId,programType,flagPaths,probeState,semaphore):
+    """
+    Generic function to probe all incomplete basin groups concurrently. Groups
+    whose COMPLETE flag is already present are not probed against the scheduler.
+    """
+    loop = asyncio.get_running_loop()
+
+    userTmp = pwd.getpwuid(os.getuid()).pw_name
+    if userTmp != str(jobData.owner):
+        jobData.errMsg = "ERROR: you are not the owner of this job."
+        raise Exception()
+
+    groupList = [groupNum for groupNum in range(0,jobData.nGroups) if jobData.groupComplete[groupNum] != 1]
+    flagCheck = await asyncio.gather(*[loop.run_in_executor(None,os.path.isfile,flagPaths[groupNum])
+                                       for groupNum in groupList])
+
+    results = []
+    activeList = []
+    for groupNum, complete in zip(groupList,flagCheck):
+        if complete:
+            results.append([groupNum,False,True])
+        else:
+            activeList.append(groupNum)
+
+    if len(activeList) == 0:
+        return results
+
+    snapshot = await schedulerSnapshot(jobData,pbsJobId,activeList,semaphore)
+    probes = await asyncio.gather(*[probeGroup(jobData,groupNum,pbsJobId,programType,flagPaths[groupNum],
+                                               snapshot,probeState,semaphore) for groupNum in activeList])
+    results.extend(probes)
+    results.sort()
+
+    return results
+
+async def groupLoop(jobData,staticData,db,pbsJobId,programType,flagPaths,submitFunc):
+    """
+    Generic function containing the orchestrator event loop. Each tick, the
+    database is backed up (if needed) while all groups are probed. Groups that
+    are neither running nor complete are handed to submitFunc. The loop sleeps
+    only for what is left of the tick once the sweep finishes.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(staticData.orchMaxProbes)
+    probeState = groupProbeState(jobData.nGroups)
+
+    while True:
+        tickStart = time.time()
+
+        backupTask = loop.run_in_executor(None,jobData.backupDatabase,staticData,db)
+        try:
+            results = await sweepGroups(jobData,pbsJobId,programType,flagPaths,probeState,semaphore)
+        except:
+            errMod.errOut(jobData)
+        try:
+            await backupTask
+        except:
+            errMod.errOut(jobData)
+
+        for groupNum, status, complete in results:
+            if complete:
+                jobData.groupComplete[groupNum] = 1
+                continue
+            print('GROUP: ' + str(groupNum) + ' STATUS = ' + str(status))
+            if not status:
+                # We need to fire off a new group job.
+                print('SUBMITTING GROUP JOB: ' + str(groupNum))
+                submitFunc(groupNum)
+                probeState.submitTime[groupNum] = time.time()
+                probeState.missCount[groupNum] = 0
+                print(pbsJobId)
+
+        if sum(jobData.groupComplete) == jobData.nGroups:
+            return
+
+        await asyncio.sleep(max(0.0,staticData.orchTickInterval - (time.time() - tickStart)))
+
+def runGroupLoop(jobData,staticData,db,pbsJobId,programType,flagPaths,submitFunc):
+    """
+    Generic function to run the orchestrator event loop until all basin groups
+    have produced their COMPLETE flag.
+    :param programType: Group job name prefix (WCG, WSG, WVG).
+    :param flagPaths: List of COMPLETE flag paths, one per group.
+    :param submitFunc: Function taking a group number that (re)generates the
+                       group script and submits it.
+    """
+    # Group programs on this machine send their DB writes through the writer
+    # service (if enabled) while the loop runs.
+    try:
+        dbWriterMod.startWriter(jobData,staticData,db.lockPath)
+    except:
+        errMod.errOut(jobData)
+    try:
+        asyncio.run(groupLoop(jobData,staticData,db,pbsJobId,programType,flagPaths,submitFunc))
+    finally:
+        dbWriterMod.stopWriter()
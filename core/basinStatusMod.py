@@ -0,0 +1,260 @@
+# Module file containing the compact status representation for the
+# spinup/calibration/sensitivity/validation drivers. The workflow modules
+# track the status of each basin (and iteration) in a float "keySlot"
+# array, using the values documented in each driver. Here, each of those
+# values is given an int8 state code, which is what gets persisted to the
+# Basin_Status table, and used to find the cells needing action with
+# vectorized operations instead of walking every basin/iteration.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import numpy as np
+
+# Workflow phases, matching the genFlag values used by the group programs.
+PHASE_SPINUP = 0
+PHASE_CALIB = 1
+PHASE_VALID = 2
+PHASE_SENS = 4
+
+# State codes. The value in parenthesis is the keySlot value used by the
+# workflow modules. Some of the transient values are only used by one phase.
+UNKNOWN = -1
+READY = 0              # (0.0) Initial value, nothing running.
+VALID_PARM_GEN = 1     # (0.1) Validation parameter generation running.
+DEFAULT_PARAMS = 2     # (0.25) First iteration default parameters being generated.
+MODEL_RUNNING = 3      # (0.5) Model simulation in progress.
+TROUTE_RUNNING = 4     # (0.65) t-route running after the model simulation.
+MODEL_COMPLETE = 5     # (0.75) Model complete, ready for evaluation.
+EVAL_RUNNING = 6       # (0.9) R/Python evaluation code running.
+MODEL_FINISHED = 7     # (0.95) Model complete, outputs being checked.
+COMPLETE = 8           # (1.0) Complete.
+POSTPROC_COMPLETE = 9  # (2.0) Sensitivity post-processing complete.
+FAILED_ONCE = 10       # (-0.25) Model simulation found to have failed.
+RESTART_RUNNING = 11   # (-0.5) Model failed once, restart running.
+EVAL_FAILED = 12       # (-0.75) R/Python code failed. LOCK file in place.
+FAILED_TWICE = 13      # (-1.0) Model failed twice. LOCK file in place.
+INIT_FAILED = 14       # (-0.1) Initial parameter generation failed. LOCK file in place.
+TROUTE_FAILED = 15     # (-0.65) t-route failed, being re-ran.
+TROUTE_LOCKED = 16     # (-0.66) t-route failed twice. LOCK file in place.
+CALIB_RUNNING = 17     # (-0.7) Calibration code running.
+CALIB_LOCKED = 18      # (-0.705) Calibration code failed. LOCK file in place.
+CALIB_FAILED = 19      # (-0.05) Calibration code failed once, being re-ran.
+CALIB_RST_FAILED = 20  # (-0.0505) Calibration code failed after a restart.
+COLLECT_LOCKED = 21    # (-0.9) Collection/parameter generation failed. LOCK file in place.
+SKIPPED = 22           # (3.0) Calibration iteration skipped once the basin converged.
+
+# keySlot value for each state code, indexed by code.
+STATE_VALUES = np.array([0.0,0.1,0.25,0.5,0.65,0.75,0.9,0.95,1.0,2.0,
+                         -0.25,-0.5,-0.75,-1.0,-0.1,-0.65,-0.66,-0.7,
+                         -0.705,-0.05,-0.0505,-0.9,3.0])
+NUM_STATES = len(STATE_VALUES)
+
+# States in which a cell requires no more work from the workflow.
+DONE_STATES = [COMPLETE,POSTPROC_COMPLETE,SKIPPED]
+
+# keySlot value of a skipped calibration iteration. This is also the value
+# entered into the complete column of Calib_Stats for it.
+SKIPPED_VALUE = 3.0
+
+# Allowed state transitions, indexed by [old code, new code]. Any active
+# state may move to any other state, as the workflow modules determine the
+# status from the files on disk. A completed cell may only be upgraded by
+# the sensitivity post-processing, and a skipped cell is final.
+TRANSITIONS = np.ones([NUM_STATES,NUM_STATES],dtype=bool)
+TRANSITIONS[COMPLETE,:] = False
+TRANSITIONS[COMPLETE,COMPLETE] = True
+TRANSITIONS[COMPLETE,POSTPROC_COMPLETE] = True
+TRANSITIONS[POSTPROC_COMPLETE,:] = False
+TRANSITIONS[POSTPROC_COMPLETE,POSTPROC_COMPLETE] = True
+TRANSITIONS[SKIPPED,:] = False
+TRANSITIONS[SKIPPED,SKIPPED] = True
+
+# Sorted keySlot values, used to look up state codes.
+sortInd = np.argsort(STATE_VALUES)
+sortValues = STATE_VALUES[sortInd]
+
+def encode(keySlot):
+    """
+    Generic function to convert an array of keySlot values into int8 state
+    codes. Values not recognized are set to UNKNOWN.
+    """
+    keyTmp = np.asarray(keySlot,dtype=np.float64)
+    posTmp = np.clip(np.searchsorted(sortValues,keyTmp),0,NUM_STATES-1)
+    # Account for values falling just below the matching entry.
+    posLow = np.clip(posTmp-1,0,NUM_STATES-1)
+    useLow = np.abs(sortValues[posLow] - keyTmp) < np.abs(sortValues[posTmp] - keyTmp)
+    posTmp = np.where(useLow,posLow,posTmp)
+    codes = sortInd[posTmp].astype(np.int8)
+    codes[~np.isclose(sortValues[posTmp],keyTmp,rtol=0.0,atol=1.0e-6)] = UNKNOWN
+    return codes
+
+def decode(codes):
+    """
+    Generic function to convert an array of int8 state codes back into
+    keySlot values. UNKNOWN codes are returned as the initial value of 0.0.
+    """
+    codeTmp = np.asarray(codes,dtype=np.int64)
+    return np.where(codeTmp == UNKNOWN,0.0,STATE_VALUES[np.clip(codeTmp,0,NUM_STATES-1)])
+
+def invalidTransitions(oldCodes,newCodes):
+    """
+    Generic function to return a mask of cells whose change in state is
+    not permitted by the transition table. Cells with an UNKNOWN code on
+    either side are not checked.
+    """
+    oldTmp = np.asarray(oldCodes,dtype=np.int64)
+    newTmp = np.asarray(newCodes,dtype=np.int64)
+    checkInd = (oldTmp != UNKNOWN) & (newTmp != UNKNOWN)
+    badInd = np.zeros(oldTmp.shape,dtype=bool)
+    badInd[checkInd] = ~TRANSITIONS[oldTmp[checkInd],newTmp[checkInd]]
+    return badInd
+
+def needsAction(codes):
+    """
+    Generic function to return a mask of cells the workflow still needs to
+    act on.
+    """
+    return ~np.isin(codes,DONE_STATES)
+
+def isDone(keySlot):
+    """
+    Generic function to return a mask of keySlot cells that require no more
+    work, either complete or skipped.
+    """
+    return ~needsAction(encode(keySlot))
+
+def firstAction(codes):
+    """
+    Generic function to return, for a [basin,iteration] array of state codes,
+    the first iteration of each basin that still needs action. Since an
+    iteration cannot begin before the previous one completes, this is the
+    only iteration of each basin the workflow can act on. Basins with every
+    iteration complete are given the number of iterations.
+    """
+    actionTmp = needsAction(codes)
+    iterTmp = np.argmax(actionTmp,axis=1)
+    iterTmp[~actionTmp.any(axis=1)] = actionTmp.shape[1]
+    return iterTmp
+
+def toRows(jobID,domainIDs,phase,codes,cellInd):
+    """
+    Generic function to compose Basin_Status rows for the cells in cellInd,
+    given as a tuple of index arrays into a [basin] or [basin,iteration] array.
+    """
+    basinInd = cellInd[0]
+    if len(cellInd) > 1:
+        iterInd = cellInd[1]
+    else:
+        iterInd = np.zeros(len(basinInd),dtype=np.int64)
+    domainTmp = np.asarray(domainIDs,dtype=np.int64)[basinInd]
+    return [(int(jobID),int(domainTmp[i]),int(phase),int(iterInd[i]),int(codes[cellInd][i]))
+            for i in range(0,len(basinInd))]
+
+def cellIndex(domainTmp,iterTmp,domainIDs,shape):
+    """
+    Generic function to locate DB entries, given by their domainID and
+    zero-based iteration, in a [basin] or [basin,iteration] array. Returns
+    a mask of the entries found, along with their array index.
+    """
+    domainIDs = np.asarray(domainIDs,dtype=np.int64)
+    order = np.argsort(domainIDs)
+    posTmp = np.clip(np.searchsorted(domainIDs[order],domainTmp),0,len(domainIDs)-1)
+    keepInd = domainIDs[order][posTmp] == domainTmp
+    basinInd = order[posTmp]
+    if len(shape) == 1:
+        keepInd = keepInd & (iterTmp == 0)
+        return keepInd, (basinInd[keepInd],)
+    keepInd = keepInd & (iterTmp >= 0) & (iterTmp < shape[1])
+    return keepInd, (basinInd[keepInd],iterTmp[keepInd])
+
+def fromRows(results,domainIDs,shape):
+    """
+    Generic function to place Basin_Status rows of (domainID,iteration,state)
+    into an array of state codes of the given shape. Cells with no entry are
+    set to UNKNOWN.
+    """
+    codes = np.full(shape,UNKNOWN,dtype=np.int8)
+    if len(results) == 0 or len(domainIDs) == 0:
+        return codes
+    rowsTmp = np.array(results,dtype=np.int64).reshape(-1,3)
+    keepInd, cellInd = cellIndex(rowsTmp[:,0],rowsTmp[:,1],domainIDs,shape)
+    codes[cellInd] = rowsTmp[keepInd,2]
+    return codes
+
+class statusTracker:
+    def __init__(self,jobData,phase,keySlot,basinMask):
+        # Object to persist the keySlot array of a driver to the Basin_Status
+        # table. Only basins in basinMask (those handled by this program) are
+        # persisted, and only cells that changed since the last save are written.
+        # Cells not yet in the table are written on the first save.
+        self.jobID = int(jobData.jobID)
+        self.domainIDs = np.array(jobData.gageIDs,dtype=np.int64)
+        self.phase = phase
+        self.basinMask = np.array(basinMask,dtype=bool)
+        self.saved = np.full(np.shape(keySlot),UNKNOWN,dtype=np.int8)
+
+    def restore(self,jobData,db,keySlot,onlyDone=False):
+        """
+        Generic function to pull the persisted state codes for this job/phase
+        with a single query and place them into keySlot. If onlyDone is set,
+        only completed cells are restored, and the workflow determines the
+        status of the others from the files on disk.
+        """
+        try:
+            results = db.basinStatus(jobData,self.phase)
+        except:
+            raise
+        codes = fromRows(results,self.domainIDs,keySlot.shape)
+        restoreInd = codes != UNKNOWN
+        if onlyDone:
+            restoreInd = restoreInd & ~needsAction(codes)
+        restoreInd[~self.basinMask] = False
+        keySlot[restoreInd] = decode(codes[restoreInd])
+        self.saved[restoreInd] = codes[restoreInd]
+        return int(restoreInd.sum())
+
+    def restoreIterations(self,jobData,db,keySlot,sensFlag):
+        """
+        Generic function to pull the complete status of every basin/iteration
+        from the Calib_Stats (or Sens_Stats) table with a single query and place
+        them into keySlot. These tables are updated by the workflow modules as
+        each cell changes, so they are used over Basin_Status for these phases.
+        """
+        try:
+            results = db.jobIterationStatus(jobData,sensFlag)
+        except:
+            raise
+        if len(results) == 0 or len(self.domainIDs) == 0:
+            return 0
+        rowsTmp = np.array(results,dtype=np.float64).reshape(-1,3)
+        rowsTmp = rowsTmp[~np.isnan(rowsTmp).any(axis=1)]
+        keepInd, cellInd = cellIndex(rowsTmp[:,0].astype(np.int64),rowsTmp[:,1].astype(np.int64),
+                                     self.domainIDs,keySlot.shape)
+        keySlot[cellInd] = rowsTmp[keepInd,2]
+        return int(keepInd.sum())
+
+    def save(self,jobData,db,keySlot):
+        """
+        Generic function to write all changed cells to the Basin_Status table
+        in a single transaction.
+        """
+        codes = encode(keySlot)
+        changeInd = codes != self.saved
+        changeInd[~self.basinMask] = False
+        if not changeInd.any():
+            return 0
+        badInd = invalidTransitions(self.saved,codes) & changeInd
+        if badInd.any():
+            cellTmp = np.nonzero(badInd)
+            print("WARNING: " + str(len(cellTmp[0])) + " unexpected status transitions for job: " + \
+                  str(self.jobID) + " First domainID: " + str(self.domainIDs[cellTmp[0][0]]))
+        if (codes[changeInd] == UNKNOWN).any():
+            print("WARNING: Unrecognized status values found for job: " + str(self.jobID))
+        try:
+            db.updateBasinStatus(jobData,toRows(self.jobID,self.domainIDs,self.phase,codes,np.nonzero(changeInd)))
+        except:
+            raise
+        self.saved[changeInd] = codes[changeInd]
+        return int(changeInd.sum())
@@ -7,8 +7,18 @@
 import os
 import pandas as pd
 from core import errMod
+from core import dbMod
 import shutil
 import subprocess
+import hashlib
+import copy
+import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Names of the files in the top level job directory tracking the setup
+# of the model directories. Both are removed once the setup is complete.
+SETUP_MANIFEST = '.SETUP_MANIFEST'
+SETUP_DONE = '.SETUP_DONE'
 
 class gageMeta:
     def __init__(self):
@@ -38,6 +48,16 @@ class gageMeta:
         self.optLandRstFile = []
         self.optHydroRstFile = []
         self.chanParmFile = []
+        self.landNx = []
+        self.landNy = []
+        self.hydroNx = []
+        self.hydroNy = []
+        self.geoFileSize = []
+        self.fullDomFileSize = []
+        self.soilFileSize = []
+        self.hydroSpatialFileSize = []
+        self.wrfInputFileSize = []
+        self.rtLnkFileSize = []
     def pullGageMeta(self,jobData,db,gageName,domainID):
         # Function to extract locations of gage-specific spatial files.
         
@@ -46,11 +66,18 @@ class gageMeta:
                    'wrfInput':'','soilFile':'','hydroSpatial':'','forceDir':'',\
                    'obsDir':'','siteName':'','gageID':'','comID':'','nCoresMod':'','dxHydro':'',\
                    'aggFactor':'','domainID':domainID,'optLandRstFile':'',\
-                   'optHydroRstFile':'','chanParmFile':''}
-        try:
-            db.queryGageMeta(jobData,tmpMeta)
-        except:
-            raise
+                   'optHydroRstFile':'','chanParmFile':'','landNx':-9999,'landNy':-9999,\
+                   'hydroNx':-9999,'hydroNy':-9999,'geoFileSize':-9999,'fullDomFileSize':-9999,\
+                   'soilFileSize':-9999,'hydroSpatialFileSize':-9999,'wrfInputFileSize':-9999,\
+                   'rtLnkFileSize':-9999}
+        if int(domainID) in jobData.gageMetaCache:
+            # Use the Domain_Meta row cached at program startup.
+            dbMod.fillGageMeta(tmpMeta,jobData.gageMetaCache[int(domainID)])
+        else:
+            try:
+                db.queryGageMeta(jobData,tmpMeta)
+            except:
+                raise
             
         self.gage = tmpMeta['gageName']
         self.gageID = tmpMeta['gageID']
@@ -74,7 +101,92 @@ class gageMeta:
         self.optLandRstFile = tmpMeta['optLandRstFile']
         self.optHydroRstFile = tmpMeta['optHydroRstFile']
         self.chanParmFile = tmpMeta['chanParmFile']
+        self.landNx = tmpMeta['landNx']
+        self.landNy = tmpMeta['landNy']
+        self.hydroNx = tmpMeta['hydroNx']
+        self.hydroNy = tmpMeta['hydroNy']
+        self.geoFileSize = tmpMeta['geoFileSize']
+        self.fullDomFileSize = tmpMeta['fullDomFileSize']
+        self.soilFileSize = tmpMeta['soilFileSize']
+        self.hydroSpatialFileSize = tmpMeta['hydroSpatialFileSize']
+        self.wrfInputFileSize = tmpMeta['wrfInputFileSize']
+        self.rtLnkFileSize = tmpMeta['rtLnkFileSize']
         
+def loadMetaCache(jobData,db):
+    """
+    Generic function to load the Domain_Meta rows for all basins in this job
+    with a single query. Subsequent calls to gageMeta.pullGageMeta will use
+    these cached rows instead of querying the database for each basin on
+    each pass of the workflow. The troute YAML configuration is also parsed
+    once here if troute is being used. If the cache was already restored from
+    a group state snapshot and holds every basin, the query is skipped.
+    """
+    cacheMissing = [idTmp for idTmp in jobData.gageIDs if int(idTmp) not in jobData.gageMetaCache]
+    if len(jobData.gageMetaCache) == 0 or len(cacheMissing) > 0:
+        try:
+            jobData.gageMetaCache = db.queryGageMetaAll(jobData)
+        except:
+            raise
+
+    if jobData.trouteFlag == 1:
+        try:
+            loadTrouteYaml(jobData)
+        except:
+            raise
+
+def loadTrouteYaml(jobData):
+    """
+    Generic function to return the parsed troute YAML configuration file. The
+    file is only parsed the first time this is called. A deep copy is returned
+    as callers modify the dictionary for each basin.
+    """
+    if jobData.trouteYaml is None:
+        try:
+            with open(jobData.trouteConfig) as yamlFile:
+                jobData.trouteYaml = yaml.load(yamlFile, Loader=yaml.FullLoader)
+        except:
+            jobData.errMsg = "ERROR: Unable to read troute configuration file: " + str(jobData.trouteConfig)
+            raise
+
+    return copy.deepcopy(jobData.trouteYaml)
+
+def writeScript(jobData,outFile,content):
+    """
+    Generic function to write a shell script only if its content has changed.
+    The content hash of each script written is kept on jobData, so unchanged
+    scripts are not re-read, re-written or chmod'ed on every pass of the
+    workflow. Returns True if the file was written.
+    """
+    newHash = hashlib.md5(content.encode('utf-8')).hexdigest()
+
+    if os.path.isfile(outFile):
+        if outFile not in jobData.scriptHashes:
+            try:
+                with open(outFile,'rb') as fileObj:
+                    jobData.scriptHashes[outFile] = hashlib.md5(fileObj.read()).hexdigest()
+            except:
+                jobData.scriptHashes[outFile] = None
+        if jobData.scriptHashes[outFile] == newHash:
+            return False
+
+    try:
+        with open(outFile,'w') as fileObj:
+            fileObj.write(content)
+    except:
+        jobData.errMsg = "ERROR: Failure to create: " + outFile
+        raise
+
+    # Make the file an executable.
+    cmd = "chmod +x " + outFile
+    try:
+        subprocess.call(cmd,shell=True)
+    except:
+        jobData.errMsg = "ERROR: Failure to convert: " + outFile + " to an executable."
+        raise
+
+    jobData.scriptHashes[outFile] = newHash
+    return True
+
 def getGageList(jobData,db):
     # Function for extracting list of gages 
     # based on either the CSV file, or an SQL
@@ -171,613 +283,352 @@ def copyDefaultParms(jobData,runDir,gage,staticData):
             raise
     
         
-def setupModels(jobData,db,args,libPathTop):
-    # Function for setting up all model directories,
-    # links to forcings, namelist files, etc. 
-    # Function will loop through each basin to calibrate,
-    # extract information about geospatial files, nested
-    # index values, etc. This information will be used in 
-    # the setup. 
-    
-    # First create top level directory based on the job name.
+def setupIncomplete(jobData):
+    """
+    Generic function to check if a previous attempt at setting up the job
+    directories was interrupted. The setup manifest is only removed once
+    every entry in it has been completed.
+    """
     parentDir = jobData.outDir + "/" + jobData.jobName
-    
-    if os.path.isdir(parentDir):
-        jobData.errMsg = "ERROR: Top level directory: " + parentDir + " already exists"
-        raise Exception()
-        
-    try:
-        os.mkdir(parentDir)
-    except:
-        jobData.errMsg = "ERROR: Failure to create directory: " + parentDir
-        raise
-    
-    # Create gage-specific object that will contain gage-specific information.
-    gageData = gageMeta()
- 
+    return os.path.isfile(parentDir + "/" + SETUP_MANIFEST)
+
+def buildSetupManifest(jobData,db,args,libPathTop):
+    """
+    Generic function to build the list of all directories, symbolic links and
+    file copies needed to setup the model directories for every basin. Each
+    entry is a list of [action,source,destination], where action is one of
+    'dir', 'link' or 'copy'. Nothing is created on disk here, so any missing
+    input is reported before the setup begins.
+    """
+    parentDir = jobData.outDir + "/" + jobData.jobName
+    manifest = []
+
     # Copy config file to the top level directory. This will be used during
     # restarts to extract information about the job. It was decided to do
-    # this opposed to attempting to enter the plethura of information 
-    # specific to the job into the metadata table. 
-    configPath = str(args.configFile[0])
-    copyPath = parentDir + '/setup.config'
+    # this opposed to attempting to enter the plethura of information
+    # specific to the job into the metadata table.
+    manifest.append(['copy',str(args.configFile[0]),parentDir + '/setup.config'])
+
+    if jobData.calibFlag == 1 and not os.path.isfile(str(jobData.calibTbl)):
+        jobData.errMsg = "ERROR: Input file: " + str(jobData.calibTbl) + " not found."
+        raise Exception()
+    if jobData.sensFlag == 1 and not os.path.isfile(str(jobData.sensTbl)):
+        jobData.errMsg = "ERROR: Input file: " + str(jobData.sensTbl) + " not found."
+        raise Exception()
+
+    # Pull the domain metadata for all basins with a single query.
     try:
-        shutil.copy(configPath,copyPath)
+        loadMetaCache(jobData,db)
     except:
-        errMod.wipeJobDir(jobData,db)
-        jobData.errMsg = "ERROR: Failure to copy configuration setup file."
         raise
-        
-    # Loop through each basin and setup appropriate directories.
+
+    # Parameter tables linked into every model run directory. The urban
+    # and vegetation tables are optional.
+    tblList = [[str(jobData.genParmTbl),'GENPARM.TBL'],
+               [str(jobData.mpParmTbl),'MPTABLE.TBL'],
+               [str(jobData.soilParmTbl),'SOILPARM.TBL']]
+    if len(str(jobData.urbParmTbl)) > 0:
+        tblList.append([str(jobData.urbParmTbl),'URBPARM.TBL'])
+    if len(str(jobData.vegParmTbl)) > 0:
+        tblList.append([str(jobData.vegParmTbl),'VEGPARM.TBL'])
+
+    calibPyProgram = libPathTop + '/adjust_parameters.py'
+    sensPyProgram = libPathTop + '/adjust_parameters_sensitivity.py'
+    calibRProgram = libPathTop + '/calib_workflow.R'
+    calibRUtils = libPathTop + '/calib_utils.R'
+    sensPreRProgram = libPathTop + "/sens_workflow_pre.R"
+    sensCollectRProgram = libPathTop + "/Collect_simulated_flow.R"
+    sensPostRProgram = libPathTop + "/sens_workflow_post.R"
+    cleanPyProgram = libPathTop + "/clean_output.py"
+
+    gageData = gageMeta()
+
     for gage in range(0,len(jobData.gages)):
         gageDir = parentDir + "/" + str(jobData.gages[gage])
-        
-        try:
-            os.mkdir(gageDir)
-        except:
-            errMod.wipeJobDir(jobData,db)
-            jobData.errMsg = "ERROR: Failure to create directory: " + gageDir
-            raise
-            
-        # Create observations directory to hold obs for calibration/eval, etc
-        obsDir = gageDir + "/OBS"
-#        try:
-#            os.mkdir(obsDir)
-#        except:
-#            errMod.wipeJobDir(jobData,db)
-#            jobData.errMsg = "ERROR: Failure to create directory: " + obsDir
-#            raise
-        
-        # Create sub-directories for spinup/calibration runs.
-        spinupDir = gageDir + "/RUN.SPINUP"
-        try:
-            os.mkdir(spinupDir)
-        except:
-            errMod.wipeJobDir(jobData,db)
-            jobData.errMsg = "ERROR: Failure to create directory: " + spinupDir
-            raise
-            
-        outDir = gageDir + "/RUN.SPINUP/OUTPUT"
+        jobGageStr = str(jobData.jobID) + str(jobData.gageIDs[gage])
+
+        # Extract gage-specific information (geogrid file, fulldom file, etc)
+        # from metadata DB.
         try:
-            os.mkdir(outDir)
+            gageData.pullGageMeta(jobData,db,str(jobData.gages[gage]),jobData.gageIDs[gage])
         except:
-            errMod.wipeJobDir(jobData,db)
-            jobData.errMsg = "ERROR: Failure to create directory: " + outDir
             raise
-            
+
+        # Model run directories for this basin.
+        runDirs = [gageDir + "/RUN.SPINUP/OUTPUT"]
         if jobData.calibFlag == 1:
-            calibDir = gageDir + "/RUN.CALIB"
-            try:
-                os.mkdir(calibDir)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create directory: " + calibDir
-                raise
-            
-            outDir = gageDir + "/RUN.CALIB/OUTPUT"
-            try:
-                os.mkdir(outDir)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create directory: " + outDir
-                raise
-            
-            validDir = gageDir + "/RUN.VALID"
-            try:
-                os.mkdir(validDir)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create directory: " + validDir
-                raise
-            
-            outDir = gageDir + "/RUN.VALID/OUTPUT"
-            try:
-                os.mkdir(outDir)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create directory: " + outDir
-                raise
-            
-            outDir = gageDir + "/RUN.VALID/OUTPUT/CTRL"
-            try:
-                os.mkdir(outDir)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create directory: " + outDir
-                raise
-            
-            outDir = gageDir + "/RUN.VALID/OUTPUT/BEST"
-            try:
-                os.mkdir(outDir)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create directory: " + outDir
-                raise
-            
-        # Create the top level directories for the sensitivity analysis. 
+            runDirs.extend([gageDir + "/RUN.CALIB/OUTPUT",gageDir + "/RUN.VALID/OUTPUT/CTRL",
+                            gageDir + "/RUN.VALID/OUTPUT/BEST"])
+        sensDirs = []
         if jobData.sensFlag == 1:
-            sensDir = gageDir + "/RUN.SENSITIVITY"
-            try:
-                os.mkdir(sensDir)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create directory: " + sensDir
-                raise
-            for i in range(0,jobData.nSensIter):
-                tmpDir = sensDir + "/OUTPUT_" + str(i)
-                try:
-                    os.mkdir(tmpDir)
-                except:
-                    jobData.errMsg = "ERROR: Failure to create directory: " + tmpDir
-                    raise
-            
+            sensDirs = [gageDir + "/RUN.SENSITIVITY/OUTPUT_" + str(i) for i in range(0,jobData.nSensIter)]
+
+        # Create sub-directories for spinup/calibration/validation runs.
+        manifest.append(['dir','',gageDir])
+        manifest.append(['dir','',gageDir + "/RUN.SPINUP"])
+        manifest.append(['dir','',gageDir + "/RUN.SPINUP/OUTPUT"])
         if jobData.calibFlag == 1:
-            # Create subdirectory that will hold the original parameter files. These
-            # files will be modified by the workflow in-between calibration iterations.
-            baseParmDir = gageDir + "/RUN.CALIB/BASELINE_PARAMETERS"
-            try:
-                os.mkdir(baseParmDir)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create directory: " + baseParmDir
-                raise
-            
-            # Create subdirectory that will hold the initial parameter files. These
-            # are generated by the first set of parameter estimation programs that 
-            # will use the values specified in the table by the user. They will be
-            # used for the control run of the validation.
-            defaultParmDir = gageDir + "/RUN.CALIB/DEFAULT_PARAMETERS"
-            try:
-                os.mkdir(defaultParmDir)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create directory: " + defaultParmDir
-                raise
-            
-            # Copy table user provided with calibration parameters to the calibration directory.
-            origPath = str(jobData.calibTbl)
-            newPath = gageDir + "/RUN.CALIB/calib_parms.tbl"
-            if not os.path.isfile(origPath):
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Input file: " + origPath + " not found."
-                raise Exception()
-            try:
-                shutil.copy(origPath,newPath)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to copy: " + origPath + " to: " + newPath
-                raise
-            
-        # Copy parameter table with parameters to sensitivity directory.
+            manifest.append(['dir','',gageDir + "/RUN.CALIB"])
+            manifest.append(['dir','',gageDir + "/RUN.CALIB/OUTPUT"])
+            manifest.append(['dir','',gageDir + "/RUN.VALID"])
+            manifest.append(['dir','',gageDir + "/RUN.VALID/OUTPUT"])
+            manifest.append(['dir','',gageDir + "/RUN.VALID/OUTPUT/CTRL"])
+            manifest.append(['dir','',gageDir + "/RUN.VALID/OUTPUT/BEST"])
+            # Original parameter files, modified by the workflow in-between
+            # calibration iterations.
+            manifest.append(['dir','',gageDir + "/RUN.CALIB/BASELINE_PARAMETERS"])
+            # Initial parameter files generated from the values specified in the
+            # table by the user. Used for the control run of the validation.
+            manifest.append(['dir','',gageDir + "/RUN.CALIB/DEFAULT_PARAMETERS"])
+            # Final calibrated parameters.
+            manifest.append(['dir','',gageDir + "/RUN.CALIB/FINAL_PARAMETERS"])
         if jobData.sensFlag == 1:
-            origPath = str(jobData.sensTbl)
-            newPath = gageDir + "/RUN.SENSITIVITY/sens_params.tbl"
-            if not os.path.isfile(origPath):
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Input file: " + origPath + " not found."
-                raise Exception()
-            try:
-                shutil.copy(origPath,newPath)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to copy: " + origPath + " to: " + newPath
-                
+            manifest.append(['dir','',gageDir + "/RUN.SENSITIVITY"])
+            for sensDir in sensDirs:
+                manifest.append(['dir','',sensDir])
+
+        # Copy parameter tables provided by the user.
         if jobData.calibFlag == 1:
-            # Create sub-directory where fianl calibrated parameters will reside.
-            finalParmDir = gageDir + "/RUN.CALIB/FINAL_PARAMETERS"
-            try:
-                os.mkdir(finalParmDir)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create directory: " + finalParmDir
-                raise
+            manifest.append(['copy',str(jobData.calibTbl),gageDir + "/RUN.CALIB/calib_parms.tbl"])
+        if jobData.sensFlag == 1:
+            manifest.append(['copy',str(jobData.sensTbl),gageDir + "/RUN.SENSITIVITY/sens_params.tbl"])
 
         # Create symbolic links necessary for model runs.
-        link1 = gageDir + "/RUN.SPINUP/OUTPUT/W" + str(jobData.jobID) + str(jobData.gageIDs[gage])
-        link2 = gageDir + "/RUN.CALIB/OUTPUT/W" + str(jobData.jobID) + str(jobData.gageIDs[gage]) 
-        link3 = gageDir + "/RUN.VALID/OUTPUT/CTRL/WC" + str(jobData.jobID) + str(jobData.gageIDs[gage])
-        link4 = gageDir + "/RUN.VALID/OUTPUT/BEST/WB" + str(jobData.jobID) + str(jobData.gageIDs[gage])
-        try:
-            os.symlink(str(jobData.exe),link1)
-            if jobData.calibFlag == 1:
-                os.symlink(str(jobData.exe),link2)
-                os.symlink(str(jobData.exe),link3)
-                os.symlink(str(jobData.exe),link4)
-        except:
-            errMod.wipeJobDir(jobData,db)
-            jobData.errMsg = "ERROR: Unable to create symbolic link to WRF-Hydro executable."
-            raise
-            
+        manifest.append(['link',str(jobData.exe),gageDir + "/RUN.SPINUP/OUTPUT/W" + jobGageStr])
+        if jobData.calibFlag == 1:
+            manifest.append(['link',str(jobData.exe),gageDir + "/RUN.CALIB/OUTPUT/W" + jobGageStr])
+            manifest.append(['link',str(jobData.exe),gageDir + "/RUN.VALID/OUTPUT/CTRL/WC" + jobGageStr])
+            manifest.append(['link',str(jobData.exe),gageDir + "/RUN.VALID/OUTPUT/BEST/WB" + jobGageStr])
+        for i in range(0,len(sensDirs)):
+            manifest.append(['link',str(jobData.exe),sensDirs[i] + "/WHS" + jobGageStr + str(i)])
+        for runDir in runDirs + sensDirs:
+            manifest.append(['link',str(jobData.exe),runDir + "/wrf_hydro.exe"])
+            for tblPath, tblName in tblList:
+                manifest.append(['link',tblPath,runDir + "/" + tblName])
+
+        # Make a link to the CHANPARM table file (if gridded routing) for spinup
+        # purposes.
+        if str(gageData.chanParmFile) != "-9999":
+            manifest.append(['link',str(gageData.chanParmFile),gageDir + "/RUN.SPINUP/OUTPUT/CHANPARM.TBL"])
+
+        if jobData.calibFlag == 1:
+            # Copy original Fulldom, spatial soils, and HYDRO_TBL_2D file for calibrations.
+            baseParmDir = gageDir + "/RUN.CALIB/BASELINE_PARAMETERS"
+            manifest.append(['copy',str(gageData.fullDom),baseParmDir + "/Fulldom.nc"])
+            manifest.append(['copy',str(gageData.soilFile),baseParmDir + "/soil_properties.nc"])
+            manifest.append(['copy',str(gageData.hydroSpatial),baseParmDir + "/HYDRO_TBL_2D.nc"])
+            if str(gageData.chanParmFile) != "-9999":
+                manifest.append(['copy',str(gageData.chanParmFile),baseParmDir + "/CHANPARM.TBL"])
+            if jobData.gwBaseFlag == 1 or jobData.gwBaseFlag == 4:
+                manifest.append(['copy',str(gageData.gwFile),baseParmDir + "/GWBUCKPARM.nc"])
+
+        # Create symbolic links to the forcing and observations directories.
+        manifest.append(['link',str(gageData.forceDir),gageDir + "/FORCING"])
+        manifest.append(['link',str(gageData.obsDir),gageDir + "/OBS"])
+        if jobData.calibFlag == 1:
+            manifest.append(['link',gageDir + "/OBS",gageDir + "/RUN.CALIB/OBS"])
+            manifest.append(['link',gageDir + "/OBS",gageDir + "/RUN.VALID/OBS"])
         if jobData.sensFlag == 1:
-            for i in range(0,jobData.nSensIter):
-                link1 = gageDir + "/RUN.SENSITIVITY/OUTPUT_" + str(i) + "/WHS" + \
-                        str(jobData.jobID) + str(jobData.gageIDs[gage]) + str(i)
-                link2 = gageDir + "/RUN.SENSITIVITY/OUTPUT_" + str(i) + "/wrf_hydro.exe"
-                try:
-                    os.symlink(str(jobData.exe),link1)
-                except:
-                    jobData.errMsg = "ERROR: Unable to link WRF-Hydro executable to: " + link1
-                    raise
-                try:
-                    os.symlink(str(jobData.exe),link2)
-                except:
-                    jobData.errMsg = "ERROR: Unable to link WRF-Hydro executable to: " + link2
-                    raise
-            
-        link1 = gageDir + "/RUN.SPINUP/OUTPUT/wrf_hydro.exe"
-        link2 = gageDir + "/RUN.CALIB/OUTPUT/wrf_hydro.exe"
-        link3 = gageDir + "/RUN.VALID/OUTPUT/CTRL/wrf_hydro.exe"
-        link4 = gageDir + "/RUN.VALID/OUTPUT/BEST/wrf_hydro.exe"
-        try:
-            os.symlink(str(jobData.exe),link1)
-            if jobData.calibFlag == 1:
-                os.symlink(str(jobData.exe),link2)
-                os.symlink(str(jobData.exe),link3)
-                os.symlink(str(jobData.exe),link4)
-        except:
-            errMod.wipeJobDir(jobData,db)
-            jobData.errMsg = "ERROR: Unable to create symbolic link to WRF-Hydro executable."
-            raise
-            
-        link1 = gageDir + "/RUN.SPINUP/OUTPUT/GENPARM.TBL"
-        link2 = gageDir + "/RUN.CALIB/OUTPUT/GENPARM.TBL"
-        link3 = gageDir + "/RUN.VALID/OUTPUT/CTRL/GENPARM.TBL"
-        link4 = gageDir + "/RUN.VALID/OUTPUT/BEST/GENPARM.TBL"
+            manifest.append(['link',gageDir + "/OBS",gageDir + "/RUN.SENSITIVITY/OBS"])
+
+        # Link Python and R programs necessary to run calibration, parameter
+        # adjustments and sensitivity analysis.
+        if jobData.calibFlag == 1:
+            manifest.append(['link',calibPyProgram,gageDir + "/RUN.CALIB/adjust_parameters.py"])
+            manifest.append(['link',calibRProgram,gageDir + "/RUN.CALIB/calib_workflow.R"])
+            manifest.append(['link',calibRUtils,gageDir + "/RUN.CALIB/calib_utils.R"])
+        if jobData.sensFlag == 1:
+            manifest.append(['link',sensPreRProgram,gageDir + "/RUN.SENSITIVITY/sens_workflow_pre.R"])
+            manifest.append(['link',sensPyProgram,gageDir + "/RUN.SENSITIVITY/adjust_parameters_sensitivity.py"])
+            manifest.append(['link',calibRUtils,gageDir + "/RUN.SENSITIVITY/calib_utils.R"])
+            manifest.append(['link',sensPostRProgram,gageDir + "/RUN.SENSITIVITY/sens_workflow_post.R"])
+            for sensDir in sensDirs:
+                manifest.append(['link',sensCollectRProgram,sensDir + "/Collect_simulated_flow.R"])
+                manifest.append(['link',calibRUtils,sensDir + "/calib_utils.R"])
+                manifest.append(['link',cleanPyProgram,sensDir + "/clean_output.py"])
+
+        # Create symlinks for the mask files if running calibration and enableMask is 1
+        if jobData.calibFlag == 1 and jobData.enableMask == 1:
+            for maskName in ["mask.coarse.tif","mask.fine.tif","mask.GWBUCKET.csv"]:
+                maskFile = gageData.forceDir[0:-7] + maskName
+                manifest.append(['link',maskFile,gageDir + "/RUN.CALIB/" + maskName])
+                manifest.append(['link',maskFile,gageDir + "/RUN.VALID/OUTPUT/BEST/" + maskName])
+
+        # Create symlink for the calib_sites.csv file if running calibration and enableMultiSites = 1
+        if jobData.calibFlag == 1 and jobData.enableMultiSites == 1:
+            sitesFile = gageData.forceDir[0:-7] + "calib_sites.csv"
+            manifest.append(['link',sitesFile,gageDir + "/RUN.CALIB/calib_sites.csv"])
+            manifest.append(['link',sitesFile,gageDir + "/RUN.VALID/calib_sites.csv"])
+
+    return manifest
+
+def writeSetupManifest(jobData,manifest,manifestPath):
+    """
+    Generic function to write the setup manifest to disk, one tab separated
+    entry per line.
+    """
+    try:
+        with open(manifestPath,'w') as fileObj:
+            for action, srcPath, dstPath in manifest:
+                fileObj.write(action + '\t' + srcPath + '\t' + dstPath + '\n')
+    except:
+        jobData.errMsg = "ERROR: Failure to write setup manifest: " + manifestPath
+        raise
+
+def readSetupManifest(jobData,manifestPath):
+    """
+    Generic function to read a setup manifest written by writeSetupManifest.
+    """
+    try:
+        with open(manifestPath,'r') as fileObj:
+            manifest = [lineTmp.rstrip('\n').split('\t') for lineTmp in fileObj if len(lineTmp.strip()) > 0]
+    except:
+        jobData.errMsg = "ERROR: Failure to read setup manifest: " + manifestPath
+        raise
+    return manifest
+
+def runSetupEntry(entry):
+    """
+    Generic function to carry out a single setup manifest entry. Entries are
+    safe to repeat, so an entry interrupted part way through is simply ran again.
+    """
+    action, srcPath, dstPath = entry
+    if action == 'dir':
+        if not os.path.isdir(dstPath):
+            os.mkdir(dstPath)
+    elif action == 'link':
+        if os.path.islink(dstPath):
+            if os.readlink(dstPath) == srcPath:
+                return
+            os.unlink(dstPath)
+        os.symlink(srcPath,dstPath)
+    elif action == 'copy':
+        shutil.copy(srcPath,dstPath)
+
+def runSetupManifest(jobData,manifest,donePath):
+    """
+    Generic function to carry out all entries of a setup manifest with a pool
+    of threads. Directories are created one level at a time, so parent
+    directories exist before their contents are created. The index of each
+    completed entry is recorded in donePath, and entries already listed there
+    are skipped, so an interrupted setup picks up where it left off.
+    """
+    doneSet = set()
+    if os.path.isfile(donePath):
         try:
-            os.symlink(str(jobData.genParmTbl),link1)
-            if jobData.calibFlag == 1:
-                os.symlink(str(jobData.genParmTbl),link2)
-                os.symlink(str(jobData.genParmTbl),link3)
-                os.symlink(str(jobData.genParmTbl),link4)
+            with open(donePath,'r') as fileObj:
+                doneSet = set([int(lineTmp) for lineTmp in fileObj if len(lineTmp.strip()) > 0])
         except:
-            errMod.wipeJobDir(jobData,db)
-            jobData.errMsg = "ERROR: Unable to create symbolic link to general parameter table."
+            jobData.errMsg = "ERROR: Failure to read setup progress file: " + donePath
             raise
-            
-        if jobData.sensFlag == 1:
-            for i in range(0,jobData.nSensIter):
-                link1 = gageDir + "/RUN.SENSITIVITY/OUTPUT_" + str(i) + "/GENPARM.TBL"
+
+    dirLevels = {}
+    fileEntries = []
+    for idx in range(0,len(manifest)):
+        if idx in doneSet:
+            continue
+        if manifest[idx][0] == 'dir':
+            dirLevels.setdefault(manifest[idx][2].count('/'),[]).append(idx)
+        else:
+            fileEntries.append(idx)
+    waveList = [dirLevels[levelTmp] for levelTmp in sorted(dirLevels.keys())] + [fileEntries]
+
+    print("SETUP ENTRIES: " + str(len(manifest)) + " PREVIOUSLY COMPLETED: " + str(len(doneSet)))
+
+    try:
+        doneObj = open(donePath,'a')
+    except:
+        jobData.errMsg = "ERROR: Failure to open setup progress file: " + donePath
+        raise
+
+    with doneObj, ThreadPoolExecutor(max_workers=jobData.setupThreads) as pool:
+        for wave in waveList:
+            futureDict = {pool.submit(runSetupEntry,manifest[idx]): idx for idx in wave}
+            failList = []
+            for futureTmp in as_completed(futureDict):
+                idx = futureDict[futureTmp]
                 try:
-                    os.symlink(str(jobData.genParmTbl),link1)
+                    futureTmp.result()
                 except:
-                    jobData.errMsg = "ERROR: Unable to create symbolic link to: " + link1
-                    raise
-                    
-        link1 = gageDir + "/RUN.SPINUP/OUTPUT/MPTABLE.TBL"
-        link2 = gageDir + "/RUN.CALIB/OUTPUT/MPTABLE.TBL"
-        link3 = gageDir + "/RUN.VALID/OUTPUT/CTRL/MPTABLE.TBL"
-        link4 = gageDir + "/RUN.VALID/OUTPUT/BEST/MPTABLE.TBL"
+                    failList.append(idx)
+                    continue
+                doneObj.write(str(idx) + '\n')
+            doneObj.flush()
+            if len(failList) > 0:
+                action, srcPath, dstPath = manifest[min(failList)]
+                if action == 'dir':
+                    jobData.errMsg = "ERROR: Failure to create directory: " + dstPath
+                elif action == 'link':
+                    jobData.errMsg = "ERROR: Unable to create symbolic link: " + dstPath + " to: " + srcPath
+                else:
+                    jobData.errMsg = "ERROR: Failure to copy: " + srcPath + " to: " + dstPath
+                jobData.errMsg = jobData.errMsg + " (" + str(len(failList)) + " setup entries failed)." + \
+                                 " Re-run jobInit.py to resume the setup."
+                raise Exception()
+
+def setupModels(jobData,db,args,libPathTop):
+    # Function for setting up all model directories,
+    # links to forcings, namelist files, etc. 
+    # A manifest of every directory, link and copy needed for all 
+    # basins is built up front, and then carried out by a pool of
+    # threads. Completed entries are recorded, so if the setup fails
+    # or is interrupted, running jobInit.py again resumes the setup
+    # instead of starting over.
+    
+    # First create top level directory based on the job name.
+    parentDir = jobData.outDir + "/" + jobData.jobName
+    manifestPath = parentDir + "/" + SETUP_MANIFEST
+    donePath = parentDir + "/" + SETUP_DONE
+    
+    if os.path.isdir(parentDir):
+        if not os.path.isfile(manifestPath):
+            jobData.errMsg = "ERROR: Top level directory: " + parentDir + " already exists"
+            raise Exception()
+        print("RESUMING SETUP OF: " + parentDir)
         try:
-            os.symlink(str(jobData.mpParmTbl),link1)
-            if jobData.calibFlag == 1:
-                os.symlink(str(jobData.mpParmTbl),link2)
-                os.symlink(str(jobData.mpParmTbl),link3)
-                os.symlink(str(jobData.mpParmTbl),link4)
+            manifest = readSetupManifest(jobData,manifestPath)
         except:
-            errMod.wipeJobDir(jobData,db)
-            jobData.errMsg = "ERROR: Unable to create symbolic link to MP parameter table."
             raise
-            
-        if jobData.sensFlag == 1:
-            for i in range(0,jobData.nSensIter):
-                link1 = gageDir + "/RUN.SENSITIVITY/OUTPUT_" + str(i) + "/MPTABLE.TBL"
-                try:
-                    os.symlink(str(jobData.mpParmTbl),link1)
-                except:
-                    jobData.errMsg = "ERROR: Unable to create symbolic link to: " + link1
-                    raise
-                    
-        link1 = gageDir + "/RUN.SPINUP/OUTPUT/SOILPARM.TBL"
-        link2 = gageDir + "/RUN.CALIB/OUTPUT/SOILPARM.TBL"
-        link3 = gageDir + "/RUN.VALID/OUTPUT/CTRL/SOILPARM.TBL"
-        link4 = gageDir + "/RUN.VALID/OUTPUT/BEST/SOILPARM.TBL"
+    else:
+        # Until the manifest has been written, the setup cannot be resumed,
+        # so the job directory and DB entries are wiped on any failure.
         try:
-            os.symlink(str(jobData.soilParmTbl),link1)
-            if jobData.calibFlag == 1:
-                os.symlink(str(jobData.soilParmTbl),link2)
-                os.symlink(str(jobData.soilParmTbl),link3)
-                os.symlink(str(jobData.soilParmTbl),link4)
+            manifest = buildSetupManifest(jobData,db,args,libPathTop)
         except:
             errMod.wipeJobDir(jobData,db)
-            jobData.errMsg = "ERROR: Unable to create symbolic link to soil parameter table."
             raise
-            
-        if jobData.sensFlag == 1:
-            for i in range(0,jobData.nSensIter):
-                link1 = gageDir + "/RUN.SENSITIVITY/OUTPUT_" + str(i) + "/SOILPARM.TBL"
-                try:
-                    os.symlink(str(jobData.soilParmTbl),link1)
-                except:
-                    jobData.errMsg = "ERROR: Unable to create symbolic link to: " + link1
-                    raise
-                    
-        link1 = gageDir + "/RUN.SPINUP/OUTPUT/URBPARM.TBL"
-        link2 = gageDir + "/RUN.CALIB/OUTPUT/URBPARM.TBL"
-        link3 = gageDir + "/RUN.VALID/OUTPUT/CTRL/URBPARM.TBL"
-        link4 = gageDir + "/RUN.VALID/OUTPUT/BEST/URBPARM.TBL"
-        if (len(str(jobData.urbParmTbl)) > 0):
-           try:
-              os.symlink(str(jobData.urbParmTbl),link1)
-              if jobData.calibFlag == 1:
-                  os.symlink(str(jobData.urbParmTbl),link2)
-                  os.symlink(str(jobData.urbParmTbl),link3)
-                  os.symlink(str(jobData.urbParmTbl),link4)
-           except:
-              errMod.wipeJobDir(jobData,db)
-              jobData.errMsg = "ERROR: Unable to create symbolic link to urban parameter table."
-              raise
-            
-           if jobData.sensFlag == 1:
-              for i in range(0,jobData.nSensIter):
-                  link1 = gageDir + "/RUN.SENSITIVITY/OUTPUT_" + str(i) + "/URBPARM.TBL"
-                  try:
-                      os.symlink(str(jobData.urbParmTbl),link1)
-                  except:
-                      jobData.errMsg = "ERROR: Unable to create symbolic link to: " + link1
-                      raise
-                    
-        link1 = gageDir + "/RUN.SPINUP/OUTPUT/VEGPARM.TBL"
-        link2 = gageDir + "/RUN.CALIB/OUTPUT/VEGPARM.TBL"
-        link3 = gageDir + "/RUN.VALID/OUTPUT/CTRL/VEGPARM.TBL"
-        link4 = gageDir + "/RUN.VALID/OUTPUT/BEST/VEGPARM.TBL"
-        if (len(str(jobData.vegParmTbl)) > 0):
-          try:
-              os.symlink(str(jobData.vegParmTbl),link1)
-              if jobData.calibFlag == 1:
-                  os.symlink(str(jobData.vegParmTbl),link2)
-                  os.symlink(str(jobData.vegParmTbl),link3)
-                  os.symlink(str(jobData.vegParmTbl),link4)
-          except:
-              errMod.wipeJobDir(jobData,db)
-              jobData.errMsg = "ERROR: Unable to create symbolic link to vegetation parameter table."
-              raise
-            
-          if jobData.sensFlag == 1:
-              for i in range(0,jobData.nSensIter):
-                  link1 = gageDir + "/RUN.SENSITIVITY/OUTPUT_" + str(i) + "/VEGPARM.TBL"
-                  try:
-                      os.symlink(str(jobData.vegParmTbl),link1)
-                  except:
-                      jobData.errMsg = "ERROR: Unable to create symbolic link to: " + link1
-                      raise
-        
-        # Extract gage-specific information (geogrid file, fulldom file, etc)
-        # from metadata DB.
         try:
-            gageData.pullGageMeta(jobData,db,str(jobData.gages[gage]),jobData.gageIDs[gage])
+            os.mkdir(parentDir)
         except:
+            jobData.errMsg = "ERROR: Failure to create directory: " + parentDir
             errMod.wipeJobDir(jobData,db)
             raise
-            
-        # Make a copy of the CHANPARM table file (if gridded routing) for spinup
-        # purposes.
-        if gageData.chanParmFile != "-9999":
-            link = gageDir + "/RUN.SPINUP/OUTPUT/CHANPARM.TBL"
-            try:
-                os.symlink(str(gageData.chanParmFile),link)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Unable to create CHANPARM symlink for spinup for gage: " + \
-                                 str(jobData.gages[gage])
-                raise
-                
-        if jobData.calibFlag == 1:
-            # Copy original Fulldom, spatial soils, and HYDRO_TBL_2D file for calibrations.
-            origPath = str(gageData.fullDom)
-            newPath = baseParmDir + "/Fulldom.nc"
-            try:
-                shutil.copy(origPath,newPath)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to copy: " + origPath + " to: " + newPath
-                raise
-            
-            origPath = str(gageData.soilFile)
-            newPath = baseParmDir + "/soil_properties.nc"
-            try:
-                shutil.copy(origPath,newPath)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to copy: " + origPath + " to: " + newPath
-                raise
-            
-            origPath = str(gageData.hydroSpatial)
-            newPath = baseParmDir + "/HYDRO_TBL_2D.nc"
-            try:
-                shutil.copy(origPath,newPath)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to copy: " + origPath + " to : " + newPath
-                raise
-                
-            origPath = str(gageData.chanParmFile)
-            newPath = baseParmDir + "/CHANPARM.TBL"
-            if str(gageData.chanParmFile) != "-9999":
-                try:
-                    shutil.copy(origPath,newPath)
-                except:
-                    errMod.wipeJobDir(jobData,db)
-                    jobData.errMsg = "ERROR: Failure to copy: " + origPath + " to: " + newPath
-                    raise
-            
-            if jobData.gwBaseFlag == 1 or jobData.gwBaseFlag == 4:
-                origPath = str(gageData.gwFile)
-                newPath = baseParmDir + "/GWBUCKPARM.nc"
-                try:
-                    shutil.copy(origPath,newPath)
-                except:
-                    errMod.wipeJobDir(jobData,db)
-                    jobData.errMsg = "ERROR: Failure to copy: " + origPath + " to: " + newPath
-                    raise
-            
-        # Create symbolic link to forcing directory.
-        fLink = gageDir + "/FORCING"
         try:
-            os.symlink(str(gageData.forceDir),fLink)
+            writeSetupManifest(jobData,manifest,manifestPath)
         except:
             errMod.wipeJobDir(jobData,db)
-            jobData.errMsg = "ERROR: Failure to create FORCING link to: " + str(gageData.forceDir)
             raise
-            
-        # Create symbolic link to the observations file.
-        obsLink = gageDir + "/OBS"
+        
+    try:
+        runSetupManifest(jobData,manifest,donePath)
+    except:
+        raise
+    
+    # Setup is complete. Remove the manifest and progress files.
+    for pathTmp in [manifestPath,donePath]:
         try:
-            os.symlink(str(gageData.obsDir),obsLink)
+            os.remove(pathTmp)
         except:
-            errMod.wipeJobDir(jobData,db)
-            jobData.errMsg = "ERROR: Failure to create Observations link to: " + str(gageData.Dir)
+            jobData.errMsg = "ERROR: Failure to remove: " + pathTmp
             raise
-            
-        if jobData.calibFlag == 1:
-            # Create symbolic link to OBS directory in both the calibration and validation directories.
-            obsLink = gageDir + "/RUN.CALIB/OBS"
-            obsDir = gageDir + "/OBS"
-            try:
-                os.symlink(obsDir,obsLink)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create OBS link in RUN.CALIB to: " + obsDir
-                raise
-            obsLink = gageDir + "/RUN.VALID/OBS"
-            try:
-                os.symlink(obsDir,obsLink)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create OBS link in RUN.VALID to: " + obsDir
-                raise
-        if jobData.sensFlag == 1:
-            obsLink = gageDir + "/RUN.SENSITIVITY/OBS"
-            obsDir = gageDir + "/OBS"
-            try:
-                os.symlink(obsDir,obsLink)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to create OBS link in RUN.SENSITIVITY to: " + obsDir
-                raise
-            
-        # Copy Python and R program necessary to run calibration and parameter 
-        # adjustments into the calibration run directory.
-        calibPyProgram = libPathTop + '/adjust_parameters.py'
-        sensPyProgram = libPathTop + '/adjust_parameters_sensitivity.py'
-        calibRProgram = libPathTop + '/calib_workflow.R'
-        calibRUtils = libPathTop + '/calib_utils.R'
-        if jobData.calibFlag == 1:
-            try:
-                link = gageDir + "/RUN.CALIB/adjust_parameters.py"
-                os.symlink(calibPyProgram,link)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to link: " + calibPyProgram
-                raise
-                
-            try:
-                link = gageDir + '/RUN.CALIB/calib_workflow.R'
-                os.symlink(calibRProgram,link)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to link: " + calibRProgram
-                raise
 
-            try:
-                link = gageDir + "/RUN.CALIB/calib_utils.R"
-                os.symlink(calibRUtils,link)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to link: " + calibRUtils
-                raise
-                
-        # Copy Python and R programs necessary to run parameter generation and 
-        # sensitivity analysis. 
-        sensPreRProgram = libPathTop + "/sens_workflow_pre.R"
-        sensCollectRProgram = libPathTop + "/Collect_simulated_flow.R"
-        sensPostRProgram = libPathTop + "/sens_workflow_post.R"
-        if jobData.sensFlag == 1:
-            try:
-                link = gageDir + "/RUN.SENSITIVITY/sens_workflow_pre.R"
-                os.symlink(sensPreRProgram,link)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to link: " + sensPreRProgram
-                raise
-            try:
-                link = gageDir + "/RUN.SENSITIVITY/adjust_parameters_sensitivity.py"
-                os.symlink(sensPyProgram,link)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to link: " + sensPyProgram
-                raise
-            try:
-                link = gageDir + "/RUN.SENSITIVITY/calib_utils.R"
-                os.symlink(calibRUtils,link)
-            except:
-                errMod.wipeJobDir(jobData,db)
-                jobData.errMsg = "ERROR: Failure to link: " + calibRUtils
-                raise
-            for i in range(0,jobData.nSensIter):
-                link1 = gageDir + "/RUN.SENSITIVITY/OUTPUT_" + str(i) + "/Collect_simulated_flow.R"
-                try:
-                    os.symlink(sensCollectRProgram,link1)
-                except:
-                    jobData.errMsg = "ERROR: Unable to create symbolic link to: " + link1
-                    raise
-                link1 = gageDir + "/RUN.SENSITIVITY/OUTPUT_" + str(i) + "/calib_utils.R"
-                try:
-                    os.symlink(calibRUtils,link1)
-                except:
-                    jobData.errMsg = "ERROR: Unable to create symbolic link to: " + link1
-                    raise
-            try:
-                link = gageDir + "/RUN.SENSITIVITY/sens_workflow_post.R"
-                os.symlink(sensPostRProgram,link)
-            except:
-                jobData.errMsg = "ERROR: Failure to link: " + sensPostRProgram
-                raise
-
-        # Create symlink for the mask file if runnig calibration and enableMask is 1
-        
-        if jobData.calibFlag == 1 and jobData.enableMask == 1 :
-           try:
-               maskFile = gageData.forceDir[0:-7] + "mask.coarse.tif"
-               link = gageDir + "/RUN.CALIB/mask.coarse.tif"
-               os.symlink(maskFile,link)
-               link = gageDir + "/RUN.VALID/OUTPUT/BEST/mask.coarse.tif"
-               os.symlink(maskFile,link)
 
-               maskFile = gageData.forceDir[0:-7] + "mask.fine.tif"
-               link = gageDir + "/RUN.CALIB/mask.fine.tif"
-               os.symlink(maskFile,link)
-               link = gageDir + "/RUN.VALID/OUTPUT/BEST/mask.fine.tif"
-               os.symlink(maskFile,link)
-
-               maskFile = gageData.forceDir[0:-7] + "mask.GWBUCKET.csv"
-               link = gageDir + "/RUN.CALIB/mask.GWBUCKET.csv"
-               os.symlink(maskFile,link)
-               link = gageDir + "/RUN.VALID/OUTPUT/BEST/mask.GWBUCKET.csv"
-               os.symlink(maskFile,link)
-
-           except:
-               jobData.errMsg = "ERROR: Failure creating the symlink to the mask"
-               raise
-
-        # Create symlink for the calib_sites.csv file if runnig calibration and enableMultiSites = 1
-
-        if jobData.calibFlag == 1 and jobData.enableMultiSites == 1 :
-           try:
-               maskFile = gageData.forceDir[0:-7] + "calib_sites.csv"
-               link = gageDir + "/RUN.CALIB/calib_sites.csv"
-               os.symlink(maskFile,link)
-               link = gageDir + "/RUN.VALID/calib_sites.csv"
-               os.symlink(maskFile,link)
-
-           except:
-               jobData.errMsg = "ERROR: Failure creating the symlink to the calib_sites.csv which is required in the case of enableMultiSites = 1"
-               raise
-
-
-
-def generateCalibGroupScript(jobData,groupNum,scriptPath,topDir):
+def generateCalibGroupScript(jobData,groupNum,scriptPath,topDir,program='calib.py',jobPrefix='WCG',
+                             label='Calibrations'):
     """
     Function to generate the run script for a particular group of basins.
+    The same script is used by the pipeline program, which passes in its own
+    program name, job name prefix and label.
     :param jobData:
     :param groupNum:
     :return:
@@ -788,21 +639,21 @@ def generateCalibGroupScript(jobData,groupNum,scriptPath,topDir):
             fileObj = open(scriptPath,'w')
             fileObj.write('#!/bin/bash\n')
             fileObj.write('#\n')
-            fileObj.write('# PBS Batch Script to Run WRF-Hydro Group Calibrations\n')
+            fileObj.write('# PBS Batch Script to Run WRF-Hydro Group ' + label + '\n')
             fileObj.write('#\n')
-            inStr = '#PBS -N WCG_' + str(jobData.jobID) + '_' + str(groupNum) + '\n'
+            inStr = '#PBS -N ' + jobPrefix + '_' + str(jobData.jobID) + '_' + str(groupNum) + '\n'
             fileObj.write(inStr)
             if len(jobData.acctKey.strip()) > 0:
                 inStr = "#PBS -A " + str(jobData.acctKey) + '\n'
                 fileObj.write(inStr)
-            fileObj.write('#PBS -l walltime=12:00:00\n')
+            fileObj.write('#PBS -l walltime=' + str(jobData.groupWalltime) + '\n')
             if len(jobData.queName.strip()) > 0:
                 inStr = "#PBS -q " + str(jobData.queName) + "\n"
                 fileObj.write(inStr)
-            inStr = "#PBS -o " + jobData.jobDir + "/WCG_" + str(jobData.jobID) + "_" + \
+            inStr = "#PBS -o " + jobData.jobDir + "/" + jobPrefix + "_" + str(jobData.jobID) + "_" + \
                 str(groupNum) + ".out\n"
             fileObj.write(inStr)
-            inStr = "#PBS -e " + jobData.jobDir + "/WCG_" + str(jobData.jobID) + "_" + \
+            inStr = "#PBS -e " + jobData.jobDir + "/" + jobPrefix + "_" + str(jobData.jobID) + "_" + \
                     str(groupNum) + ".err\n"
             fileObj.write(inStr)
             inStr = "#PBS -l select=" + str(jobData.nNodesMod) + ":ncpus=" + str(jobData.nCoresPerNode) + \
@@ -813,7 +664,7 @@ def generateCalibGroupScript(jobData,groupNum,scriptPath,topDir):
             for m in jobData.moduleLoadStr:
                 fileObj.write(m)
                 fileObj.write("\n")
-            inStr = "python calib.py " + str(jobData.jobID) + " " + str(groupNum) + " --optDbPath " + jobData.dbPath + "\n"
+            inStr = "python " + program + " " + str(jobData.jobID) + " " + str(groupNum) + " --optDbPath " + jobData.dbPath + "\n"
             fileObj.write(inStr)
             fileObj.close()
         except:
@@ -825,22 +676,22 @@ def generateCalibGroupScript(jobData,groupNum,scriptPath,topDir):
             fileObj = open(scriptPath, 'w')
             fileObj.write('#!/bin/bash\n')
             fileObj.write('#\n')
-            fileObj.write('# Slurm Batch Script to Run WRF-Hydro Group Calibrations\n')
+            fileObj.write('# Slurm Batch Script to Run WRF-Hydro Group ' + label + '\n')
             fileObj.write('#\n')
-            inStr = "#SBATCH -J WCG_" + str(jobData.jobID) + "_" + str(groupNum) + '\n'
+            inStr = "#SBATCH -J " + jobPrefix + "_" + str(jobData.jobID) + "_" + str(groupNum) + '\n'
             fileObj.write(inStr)
             if len(jobData.acctKey.strip()) > 0:
                 inStr = "#SBATCH -A " + str(jobData.acctKey) + '\n'
                 fileObj.write(inStr)
-            inStr = "#SBATCH -t 12:00:00\n"
+            inStr = "#SBATCH -t " + str(jobData.groupWalltime) + "\n"
             fileObj.write(inStr)
             if len(jobData.queName.strip()) > 0:
                 inStr = "#SBATCH -p " + str(jobData.queName) + "\n"
                 fileObj.write(inStr)
-            inStr = "#SBATCH -o " + jobData.jobDir + "/WCG_" + str(jobData.jobID) + "_" + \
+            inStr = "#SBATCH -o " + jobData.jobDir + "/" + jobPrefix + "_" + str(jobData.jobID) + "_" + \
                     str(groupNum) + ".out\n"
             fileObj.write(inStr)
-            inStr = "#SBATCH -e " + jobData.jobDir + "/WCG_" + str(jobData.jobID) + "_" + \
+            inStr = "#SBATCH -e " + jobData.jobDir + "/" + jobPrefix + "_" + str(jobData.jobID) + "_" + \
                         str(groupNum) + ".err\n"
             fileObj.write(inStr)
             inStr = "#SBATCH -N " + str(jobData.nNodesMod) + '\n'
@@ -852,7 +703,7 @@ def generateCalibGroupScript(jobData,groupNum,scriptPath,topDir):
             for m in jobData.moduleLoadStr:
                 fileObj.write(m)
                 fileObj.write("\n")
-            inStr = "python calib.py " + str(jobData.jobID) + " " + str(groupNum) + " --optDbPath " + jobData.dbPath + "\n"
+            inStr = "python " + program + " " + str(jobData.jobID) + " " + str(groupNum) + " --optDbPath " + jobData.dbPath + "\n"
             fileObj.write(inStr)
             fileObj.close()
         except:
@@ -864,13 +715,13 @@ def generateCalibGroupScript(jobData,groupNum,scriptPath,topDir):
             fileObj = open(scriptPath, 'w')
             fileObj.write('#!/bin/bash\n')
             fileObj.write('#\n')
-            fileObj.write('#Script to Run WRF-Hydro Group Calibrations\n')
+            fileObj.write('#Script to Run WRF-Hydro Group ' + label + '\n')
             fileObj.write('#\n')
             fileObj.write('cd ' + topDir + '\n')
             for m in jobData.moduleLoadStr:
                 fileObj.write(m)
                 fileObj.write("\n")
-            inStr = "python calib.py " + str(jobData.jobID) + " " + str(
+            inStr = "python " + program + " " + str(jobData.jobID) + " " + str(
                 groupNum) + " --optDbPath " + jobData.dbPath + "\n"
             fileObj.write(inStr)
             fileObj.close()
@@ -906,7 +757,7 @@ def generateSpinupGroupScript(jobData,groupNum,scriptPath,topDir):
             if len(jobData.acctKey.strip()) > 0:
                 inStr = "#PBS -A " + str(jobData.acctKey) + '\n'
                 fileObj.write(inStr)
-            fileObj.write('#PBS -l walltime=12:00:00\n')
+            fileObj.write('#PBS -l walltime=' + str(jobData.groupWalltime) + '\n')
             if len(jobData.queName.strip()) > 0:
                 inStr = "#PBS -q " + str(jobData.queName) + "\n"
                 fileObj.write(inStr)
@@ -943,7 +794,7 @@ def generateSpinupGroupScript(jobData,groupNum,scriptPath,topDir):
             if len(jobData.acctKey.strip()) > 0:
                 inStr = "#SBATCH -A " + str(jobData.acctKey) + '\n'
                 fileObj.write(inStr)
-            inStr = "#SBATCH -t 12:00:00\n"
+            inStr = "#SBATCH -t " + str(jobData.groupWalltime) + "\n"
             fileObj.write(inStr)
             if len(jobData.queName.strip()) > 0:
                 inStr = "#SBATCH -p " + str(jobData.queName) + "\n"
@@ -1017,7 +868,7 @@ def generateValidGroupScript(jobData,groupNum,scriptPath,valid_type,topDir):
             if len(jobData.acctKey.strip()) > 0:
                 inStr = "#PBS -A " + str(jobData.acctKey) + '\n'
                 fileObj.write(inStr)
-            fileObj.write('#PBS -l walltime=12:00:00\n')
+            fileObj.write('#PBS -l walltime=' + str(jobData.groupWalltime) + '\n')
             if len(jobData.queName.strip()) > 0:
                 inStr = "#PBS -q " + str(jobData.queName) + "\n"
                 fileObj.write(inStr)
@@ -1054,7 +905,7 @@ def generateValidGroupScript(jobData,groupNum,scriptPath,valid_type,topDir):
             if len(jobData.acctKey.strip()) > 0:
                 inStr = "#SBATCH -A " + str(jobData.acctKey) + '\n'
                 fileObj.write(inStr)
-            inStr = "#SBATCH -t 12:00:00\n"
+            inStr = "#SBATCH -t " + str(jobData.groupWalltime) + "\n"
             fileObj.write(inStr)
             if len(jobData.queName.strip()) > 0:
                 inStr = "#SBATCH -p " + str(jobData.queName) + "\n"
@@ -1107,3 +958,4 @@ def generateValidGroupScript(jobData,groupNum,scriptPath,valid_type,topDir):
         except:
             jobData.errMsg = "ERROR: Failure to convert: " + scriptPath + " to an executable."
             raise
+
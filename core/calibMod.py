@@ -9,6 +9,12 @@ from core import calibIoMod
 from core import namelistMod
 from core import statusMod
 from core import errMod
+from core import retentionMod
+from core import streamEvalMod
+from core import fidelityMod
+from core import convergeMod
+from core import restartStoreMod
+from core import basinStatusMod
 import subprocess
 import time
 import psutil
@@ -46,8 +52,7 @@ def runTroute(statusData,staticData,db,gageID,gage,gageMeta,basinNum):
         except:
             raise
     
-        yamlFile = open(statusData.trouteConfig)
-        yamlDict = yaml.load(yamlFile, Loader=yaml.FullLoader)
+        yamlDict = calibIoMod.loadTrouteYaml(statusData)
 
         begDate = staticData.bCalibDate
         endDate = staticData.eCalibDate
@@ -161,18 +166,11 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
         raise
 
     # Create the shell scripts that will use the MPI command specified by the user to run
-    # or restart the model.
-    runFile = runDir + "/run_WH.sh"
-    rstFile = runDir + "/run_WH_Restart.sh"
+    # or restart the model. These are only re-written if their content has changed.
     try:
         generateMpiCalibScript(statusData, int(gageID), int(basinNum), runDir, workDir, staticData)
     except:
         raise
-
-    if os.path.isfile(runFile):
-        os.remove(runFile)
-    if os.path.isfile(rstFile):
-        os.remove(rstFile)
     try:
         generateMpiScript(statusData, int(gageID), int(basinNum), runDir)
     except:
@@ -194,6 +192,16 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
         basinStatus = statusMod.checkBasJob(statusData,basinNum,pbsJobId)
     except:
         raise
+
+    # Enforce the output retention policy while the model is running. Once the
+    # model is no longer running, a final pass is made before any evaluation.
+    try:
+        if basinStatus:
+            retentionMod.startWatcher(statusData,staticData,runDir,1)
+        else:
+            retentionMod.stopWatcher(statusData,staticData,runDir)
+    except:
+        raise
         
     # Check to see if an R script calibration job is occurring.
     try:
@@ -211,6 +219,7 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
     rDataFile = workDir + "/proj_data.Rdata"
     trouteCompleteFlag = runDir + '/trouteFlag.COMPLETE'
     pidPath  = runDir + "/tpid.txt"
+    earlyStopFlag = workDir + "/" + streamEvalMod.EARLY_STOP_FLAG
 
     # Initialize flags to False. These flags will help guide the workflow
     # in decision making. 
@@ -221,6 +230,9 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
         runFlag = False
         runCalib = False
         return
+    if keyStatus == basinStatusMod.SKIPPED_VALUE:
+        # Iteration skipped once the calibration of this basin converged.
+        return
 
     if keyStatus == 0.65:
         if os.path.isfile(trouteCompleteFlag):
@@ -228,8 +240,7 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
             keyStatus = 0.75
             runCalib = True
         else:
-            yamlFile = open(statusData.trouteConfig)
-            yamlDict = yaml.load(yamlFile, Loader=yaml.FullLoader)
+            yamlDict = calibIoMod.loadTrouteYaml(statusData)
             runStatus = statusMod.walkModTroute(staticData.bCalibDate,staticData.eCalibDate,runDir,yamlDict)
             begDate = runStatus[0]
             endDate = runStatus[1]
@@ -261,8 +272,7 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
             keyStatus = 0.75
             runCalib = True
         else:
-            yamlFile = open(statusData.trouteConfig)
-            yamlDict = yaml.load(yamlFile, Loader=yaml.FullLoader)
+            yamlDict = calibIoMod.loadTrouteYaml(statusData)
             runStatus = statusMod.walkModTroute(staticData.bCalibDate,staticData.eCalibDate,runDir,yamlDict)
             begDate = runStatus[0]
             endDate = runStatus[1]
@@ -309,6 +319,25 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
                
     # For uncompleted simulations that are still listed as running.
     if keyStatus == 0.5:
+        # If a model is running for this basin, score the output written so far. The
+        # simulation is stopped if it fails the screening over the short period, or
+        # can no longer beat the best parameter set.
+        if basinStatus:
+            try:
+                if fidelityMod.checkScreening(statusData,staticData,db,gageID,gageMeta,int(basinNum),
+                                              iteration,workDir,runDir):
+                    basinStatus = False
+                    retentionMod.stopWatcher(statusData,staticData,runDir)
+            except:
+                raise
+        if basinStatus:
+            try:
+                if streamEvalMod.checkEarlyStop(statusData,staticData,db,gageID,gageMeta,int(basinNum),
+                                                iteration,workDir,runDir):
+                    basinStatus = False
+                    retentionMod.stopWatcher(statusData,staticData,runDir)
+            except:
+                raise
         # If a model is running for this basin, continue and set keyStatus to 0.5
         if basinStatus:
             print("MODEL RUN FOUND")
@@ -316,6 +345,21 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
             keyStatus = 0.5
             runFlag = False
             runCalib = False
+        elif os.path.isfile(earlyStopFlag):
+            # Simulation was stopped early. Set to 0.75 for the calibration code to
+            # record the parameter set as rejected. t-route is not needed.
+            try:
+                errMod.cleanCalib(statusData,workDir,runDir)
+                errMod.scrubParams(statusData,workDir,staticData)
+                fidelityMod.markStopped(statusData,staticData,db,gageID,iteration)
+                db.markCalibStopped(statusData,int(statusData.jobID),int(gageID),iteration)
+            except:
+                raise
+            print("MODEL STOPPED EARLY AND IS READY FOR PARAMETER GENERATION")
+            keySlot[basinNum,iteration] = 0.75
+            keyStatus = 0.75
+            runFlag = False
+            runCalib = True
         else:
             # Either simulation has completed, or potentially crashed. Walk the run
             # run directory and see where the model is at based on RESTART files. 
@@ -460,6 +504,11 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
                     keyStatus = 1.0
                     runFlag = False
                     runCalib = False
+                    # Skip the remaining iterations if the calibration has converged.
+                    try:
+                        convergeMod.checkConvergence(statusData,staticData,db,gageID,basinNum,iteration,keySlot)
+                    except:
+                        raise
                 elif os.path.isfile(missingFlag):
                     # This is a unique situation where either an improper COMID (linkID) was passed to
                     # the R program, pulling NA from the model. Or, the observations file contains
@@ -536,6 +585,11 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
                 keyStatus = 1.0
                 runFlag = False
                 runCalib = False
+                # Skip the remaining iterations if the calibration has converged.
+                try:
+                    convergeMod.checkConvergence(statusData,staticData,db,gageID,basinNum,iteration,keySlot)
+                except:
+                    raise
             elif os.path.isfile(missingFlag):
                 # This is a unique situation where either an improper COMID (linkID) was passed to 
                 # the R program, pulling NA from the model. Or, the observations file contains 
@@ -1106,6 +1160,9 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
             statusData.errMsg = "ERROR: Unable to launch WRF-Hydro job for gage: " + str(gageMeta.gage[basinNum])
             raise
 
+        # Start pruning the run directory per the output retention policy.
+        retentionMod.startWatcher(statusData,staticData,runDir,1)
+
         # Revert statuses to -0.5 for next loop to convey the model crashed once. 
         keyStatus = -0.5
         keySlot[basinNum,iteration] = -0.5
@@ -1157,6 +1214,7 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
         # clean up old calibration related files, except for new parameter files.
         try:
             errMod.cleanCalib(statusData,workDir,runDir)
+            streamEvalMod.clearEarlyStop(statusData,workDir,runDir)
         except:
             raise
             
@@ -1171,6 +1229,9 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,iteration,pbs
             statusData.errMsg = "ERROR: Unable to launch WRF-Hydro job for gage: " + str(gageMeta.gage[basinNum])
             raise
 
+        # Start pruning the run directory per the output retention policy.
+        retentionMod.startWatcher(statusData,staticData,runDir,1)
+
         keyStatus = 0.5
         keySlot[basinNum,iteration] = 0.5
         
@@ -1476,35 +1537,20 @@ def generateMpiRstScript(jobData,gageID,basinNum, runDir):
     
     outFile = runDir + "/run_WH_Restart.sh"
     
-    if os.path.isfile(outFile):
-        jobData.errMsg = "ERROR: Run script: " + outFile + " already exists."
-        raise Exception()
-        
-    try:
-        fileObj = open(outFile,'w')
-        fileObj.write('#!/bin/bash\n')
-        inStr = 'cd ' + runDir + '\n'
-        fileObj.write(inStr)
-        if len(jobData.cpuPinCmd) > 0:
-            inStr = jobData.mpiCmd + " " + str(jobData.nCoresMod) + " " + jobData.cpuPinCmd + \
-                str(jobData.gageBegModelCpu[basinNum]) + "-" + \
-                str(jobData.gageEndModelCpu[basinNum]) + " ./W" + \
+    inStr = '#!/bin/bash\n'
+    inStr = inStr + 'cd ' + runDir + '\n'
+    if len(jobData.cpuPinCmd) > 0:
+        inStr = inStr + jobData.mpiCmd + " " + str(jobData.nCoresMod) + " " + jobData.cpuPinCmd + \
+            str(jobData.gageBegModelCpu[basinNum]) + "-" + \
+            str(jobData.gageEndModelCpu[basinNum]) + " ./W" + \
+            str(jobData.jobID) + str(gageID) + '\n'
+    else:
+        inStr = inStr + jobData.mpiCmd + " " + str(jobData.nCoresMod) + " ./W" + \
                 str(jobData.jobID) + str(gageID) + '\n'
-        else:
-            inStr = jobData.mpiCmd + " " + str(jobData.nCoresMod) + " ./W" + \
-                    str(jobData.jobID) + str(gageID) + '\n'
-        fileObj.write(inStr)
-        fileObj.close
-    except:
-        jobData.errMsg = "ERROR: Failure to create: " + outFile
-        raise
         
-    # Make the file an executable
-    cmd = "chmod +x " + outFile
     try:
-        subprocess.call(cmd,shell=True)
+        calibIoMod.writeScript(jobData,outFile,inStr)
     except:
-        jobData.errMsg = "ERROR: Failure to convert: " + outFile + " to an executable."
         raise
         
 def generateBsubScript(jobData,gageID,runDir):
@@ -1663,39 +1709,22 @@ def generateMpiScript(jobData,gageID,basinNum,runDir):
     
     outFile = runDir + "/run_WH.sh"
     
-    if os.path.isfile(outFile):
-        jobData.errMsg = "ERROR: Run script: " + outFile + " already exists."
-        raise Exception()
-        
-    try:
-        fileObj = open(outFile,'w')
-        fileObj.write('#!/bin/bash\n')
-        inStr = 'cd ' + runDir + '\n'
-        fileObj.write(inStr)
-        inStr = 'for FILE in HYDRO_RST.*; do if [ ! -L $FILE ] ; then rm -rf $FILE; fi; done\n'
-        fileObj.write(inStr)
-        inStr = 'for FILE in RESTART.*; do if [ ! -L $FILE ] ; then rm -rf $FILE; fi; done\n'
-        fileObj.write(inStr)
-        if len(jobData.cpuPinCmd) > 0:
-            inStr = jobData.mpiCmd + " " + str(jobData.nCoresMod) + " " + jobData.cpuPinCmd + \
-                    str(jobData.gageBegModelCpu[basinNum]) + "-" + \
-                    str(jobData.gageEndModelCpu[basinNum]) + " ./W" + \
-                    str(jobData.jobID) + str(gageID) + '\n'
-        else:
-            inStr = jobData.mpiCmd + " " + str(jobData.nCoresMod) + " ./W" + \
-                    str(jobData.jobID) + str(gageID) + '\n'
-        fileObj.write(inStr)
-        fileObj.close
-    except:
-        jobData.errMsg = 'Failure to create: ' + outFile
-        raise
+    inStr = '#!/bin/bash\n'
+    inStr = inStr + 'cd ' + runDir + '\n'
+    inStr = inStr + 'for FILE in HYDRO_RST.*; do if [ ! -L $FILE ] ; then rm -rf $FILE; fi; done\n'
+    inStr = inStr + 'for FILE in RESTART.*; do if [ ! -L $FILE ] ; then rm -rf $FILE; fi; done\n'
+    if len(jobData.cpuPinCmd) > 0:
+        inStr = inStr + jobData.mpiCmd + " " + str(jobData.nCoresMod) + " " + jobData.cpuPinCmd + \
+                str(jobData.gageBegModelCpu[basinNum]) + "-" + \
+                str(jobData.gageEndModelCpu[basinNum]) + " ./W" + \
+                str(jobData.jobID) + str(gageID) + '\n'
+    else:
+        inStr = inStr + jobData.mpiCmd + " " + str(jobData.nCoresMod) + " ./W" + \
+                str(jobData.jobID) + str(gageID) + '\n'
         
-    # Make the file an executable.
-    cmd = "chmod +x " + outFile
     try:
-        subprocess.call(cmd,shell=True)
+        calibIoMod.writeScript(jobData,outFile,inStr)
     except:
-        jobData.errMsg = "ERROR: Failure to convert: " + outFile + " to an executable."
         raise
         
 def generateRScript(jobData,gageMeta,gageNum,iteration):
@@ -1784,6 +1813,14 @@ def generateRScript(jobData,gageMeta,gageNum,iteration):
         fileObj.write('# Option to use multiple sites for calibration\n')
         inStr = "enableMultiSites <- " + str(int(jobData.enableMultiSites)) + "\n"
         fileObj.write(inStr)
+        fileObj.write('# Plot rendering mode and interval (see calib_plots.R)\n')
+        inStr = "plotMode <- " + str(int(jobData.plotMode)) + "\n"
+        fileObj.write(inStr)
+        inStr = "plotInterval <- " + str(int(jobData.plotInterval)) + "\n"
+        fileObj.write(inStr)
+        fileObj.write('# Number of DDS candidates screened with the surrogate each iteration (0 - off)\n')
+        inStr = "surrogateCand <- " + str(int(jobData.surrogateCand)) + "\n"
+        fileObj.write(inStr)
 
         fileObj.close
     except:
@@ -2023,35 +2060,18 @@ def generateMpiCalibScript(jobData,gageID,basinNum,runDir,workDir,staticData):
     
     outFile1 = workDir + "/run_WH_CALIB.sh"
     
-    if os.path.isfile(outFile1):
-        # We are just gonig to manually over-write the file everytime to be safe.
-        os.remove(outFile1)
-        
-    if not os.path.isfile(outFile1):
-        try:
-            fileObj = open(outFile1,'w')
-            fileObj.write('#!/bin/bash\n')
-            inStr = 'cd ' + workDir + '\n'
-            fileObj.write(inStr)
-            if len(jobData.cpuPinCmd) > 0:
-                inStr = jobData.mpiCmd + " 1 " + jobData.cpuPinCmd + \
-                        str(jobData.gageBegModelCpu[basinNum]) + " ./C" + \
-                        str(jobData.jobID) + str(gageID) + '\n'
-            else:
-                inStr = jobData.mpiCmd + " 1 ./C" + \
-                        str(jobData.jobID) + str(gageID) + '\n'
-            fileObj.write(inStr)
-            fileObj.close
-        except:
-            jobData.errMsg = "ERROR: Failure to create " + outFile1
-            raise
-            
-    # Make the file an executable.
-    cmd = "chmod +x " + outFile1
+    inStr = '#!/bin/bash\n'
+    inStr = inStr + 'cd ' + workDir + '\n'
+    if len(jobData.cpuPinCmd) > 0:
+        inStr = inStr + jobData.mpiCmd + " 1 " + jobData.cpuPinCmd + \
+                str(jobData.gageBegModelCpu[basinNum]) + " ./C" + \
+                str(jobData.jobID) + str(gageID) + '\n'
+    else:
+        inStr = inStr + jobData.mpiCmd + " 1 ./C" + \
+                str(jobData.jobID) + str(gageID) + '\n'
     try:
-        subprocess.call(cmd,shell=True)
+        calibIoMod.writeScript(jobData,outFile1,inStr)
     except:
-        jobData.errMsg = "ERROR: Failure to convert: " + outFile1 + " to an executable."
         raise
             
     outFile2 = workDir + '/calibCmd.sh'
@@ -2060,27 +2080,17 @@ def generateMpiCalibScript(jobData,gageID,basinNum,runDir,workDir,staticData):
     runRProgram = workDir + '/calib_workflow.R'
     srcScript = workDir + '/calibScript.R'
     
-    if not os.path.isfile(outFile2):
-        # This is the file that will run R code. First to generate params_new.txt and
-        # params_stats.txt. Python is called next, which will generate new parameters.
-        try:
-            fileObj = open(outFile2,'w')
-            fileObj.write('#!/bin/bash\n')
-            fileObj.write('Rscript ' + runRProgram + " " + srcScript + '\n')
-            fileObj.write('python ' + workDir + '/adjust_parameters.py ' + workDir + \
-                          ' ' + runDir + ' ' + str(staticData.gwBaseFlag) + ' ' + \
-                          str(staticData.chnRtOpt) + ' ' + str(staticData.enableMask) + ' \n')
-            fileObj.write('exit\n')
-        except:
-            jobData.errMsg = "ERROR: Failure to create: " + outFile2
-            raise
-            
-    # Make shell script an executable.
-    cmd = 'chmod +x ' + outFile2
+    # This is the file that will run R code. First to generate params_new.txt and
+    # params_stats.txt. Python is called next, which will generate new parameters.
+    inStr = '#!/bin/bash\n'
+    inStr = inStr + 'Rscript ' + runRProgram + " " + srcScript + '\n'
+    inStr = inStr + 'python ' + workDir + '/adjust_parameters.py ' + workDir + \
+            ' ' + runDir + ' ' + str(staticData.gwBaseFlag) + ' ' + \
+            str(staticData.chnRtOpt) + ' ' + str(staticData.enableMask) + ' \n'
+    inStr = inStr + 'exit\n'
     try:
-        subprocess.call(cmd,shell=True)
+        calibIoMod.writeScript(jobData,outFile2,inStr)
     except:
-        jobData.errMsg = "ERROR: Failure to convert: " + outFile2 + " to an executable."
         raise
         
     # Make symbolic link to newly created executable, which will be called by
@@ -2105,8 +2115,8 @@ def linkToRst(statusData,gage,runDir,gageMeta,staticData):
 
     if staticData.optSpinFlag == 0: 
         # Check to make sure symbolic link to spinup state exists.
-        check1 = statusData.jobDir + "/" + gage + "/RUN.SPINUP/OUTPUT/RESTART." + statusData.eSpinDate.strftime('%Y%m%d') + "00_DOMAIN1"
-        check2 = statusData.jobDir + "/" + gage + "/RUN.SPINUP/OUTPUT/HYDRO_RST." + statusData.eSpinDate.strftime('%Y-%m-%d') + "_00:00_DOMAIN1"
+        # If linked from the restart store, link to the files in the store directly.
+        check1, check2 = restartStoreMod.spinupState(statusData,gage)
         
         if not os.path.isfile(check1):
             statusData.errMsg = "ERROR: Spinup state: " + check1 + " not found."
@@ -0,0 +1,52 @@
+# Program to remove model output from a run directory using the same
+# cleanup engine as the Python workflow (errMod.cleanDir). This is called
+# from R code in place of system("rm -rf ...") calls, so directories
+# with many hourly output files are scanned once and no shell glob
+# expansion takes place.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import argparse
+import os
+import sys
+
+# Set the Python path to include package specific functions. This program
+# is typically called through a symbolic link in a run directory.
+prPath = os.path.realpath(__file__)
+pathSplit = prPath.split('/')
+libPath = '/'
+for j in range(1,len(pathSplit)-2):
+    libPath = libPath + pathSplit[j] + '/'
+sys.path.insert(0,libPath)
+
+from core import errMod
+
+class cleanMeta:
+    def __init__(self):
+        # Minimal object for errMod functions to place error messages into.
+        self.errMsg = []
+
+def main(argv):
+    # Parse arguments. User must input a directory and at least one pattern.
+    parser = argparse.ArgumentParser(description='Program to remove model output ' + \
+             'matching one or more file patterns.')
+    parser.add_argument('runDir',metavar='runDir',type=str,nargs=1,
+                        help='Directory containing model output.')
+    parser.add_argument('patterns',metavar='patterns',type=str,nargs='+',
+                        help='Shell-style patterns of files to remove.')
+
+    args = parser.parse_args()
+
+    cleanData = cleanMeta()
+    try:
+        nRemoved = errMod.cleanDir(cleanData,args.runDir[0],args.patterns)
+    except:
+        print(cleanData.errMsg)
+        sys.exit(1)
+
+    print("Removed " + str(nRemoved) + " entries from: " + args.runDir[0])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
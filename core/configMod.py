@@ -43,7 +43,30 @@ class jobMeta:
         self.optSpinFlag = []
         self.optCalStripFlag = []
         self.optCalStripHrs = []
+        self.outputRetention = []
+        self.retentionInterval = []
+        self.retentionRestarts = []
+        self.retainOutputs = []
         self.jobRunType = []
+        self.orchTickInterval = []
+        self.orchMaxProbes = []
+        self.setupThreads = []
+        self.dbWriter = []
+        self.groupWalltime = []
+        self.groupHandoff = []
+        self.plotMode = []
+        self.plotInterval = []
+        self.earlyStop = []
+        self.convergeIter = []
+        self.convergeTol = []
+        self.convergeGain = []
+        self.convergeMinIter = []
+        self.surrogateCand = []
+        self.mfScreenDays = []
+        self.mfMinPairs = []
+        self.spinEquilTol = []
+        self.spinEquilMinYears = []
+        self.restartStore = []
         self.mpiCmd = []
         self.cpuPinCmd = []
         self.nIter = []
@@ -164,6 +187,8 @@ class jobMeta:
         #self.maskFile = []
         self.enableMultiSites = []
         self.output_channelBucket_influx = []
+        self.gageMetaCache = {}
+        self.trouteYaml = None
 
     def checkGages2(self,db):
         #Function to extract domain ID values based on the SQL command placed into the
@@ -243,6 +268,25 @@ class jobMeta:
         self.queName = str(parser.get('logistics','optQueName'))
         self.optCalStripFlag = int(parser.get('logistics','stripCalibOutputs'))
         self.optCalStripHrs = int(parser.get('logistics','stripCalibHours'))
+        # Optional output retention policy options. Older configuration files
+        # will not contain these, so fall back on defaults (policy off).
+        if parser.has_option('logistics','outputRetention'):
+            self.outputRetention = int(parser.get('logistics','outputRetention'))
+        else:
+            self.outputRetention = 0
+        if parser.has_option('logistics','retentionInterval'):
+            self.retentionInterval = int(parser.get('logistics','retentionInterval'))
+        else:
+            self.retentionInterval = 60
+        if parser.has_option('logistics','retentionRestarts'):
+            self.retentionRestarts = int(parser.get('logistics','retentionRestarts'))
+        else:
+            self.retentionRestarts = 2
+        if parser.has_option('logistics','retainOutputs'):
+            self.retainOutputs = [typeTmp.strip().upper() for typeTmp in
+                                  str(parser.get('logistics','retainOutputs')).split(',') if len(typeTmp.strip()) > 0]
+        else:
+            self.retainOutputs = []
         self.nCoresMod = int(parser.get('logistics','nCoresModel'))
         self.nNodesMod = int(parser.get('logistics','nNodesModel'))
         self.nCoresPerNode = int(parser.get('logistics','nCoresPerNode'))
@@ -262,6 +306,84 @@ class jobMeta:
         self.coldStart = int(parser.get('logistics','coldStart'))
         self.optSpinFlag = int(parser.get('logistics','optSpinFlag'))
         self.jobRunType = int(parser.get('logistics','jobRunType'))
+        # Optional orchestrator probing options. Older configuration files
+        # will not contain these, so fall back on defaults.
+        if parser.has_option('logistics','orchTickInterval'):
+            self.orchTickInterval = int(parser.get('logistics','orchTickInterval'))
+        else:
+            self.orchTickInterval = 15
+        if parser.has_option('logistics','orchMaxProbes'):
+            self.orchMaxProbes = int(parser.get('logistics','orchMaxProbes'))
+        else:
+            self.orchMaxProbes = 8
+        if parser.has_option('logistics','setupThreads'):
+            self.setupThreads = int(parser.get('logistics','setupThreads'))
+        else:
+            self.setupThreads = 16
+        if parser.has_option('logistics','dbWriter'):
+            self.dbWriter = int(parser.get('logistics','dbWriter'))
+        else:
+            self.dbWriter = 0
+        if parser.has_option('logistics','groupWalltime'):
+            self.groupWalltime = str(parser.get('logistics','groupWalltime')).strip()
+        else:
+            self.groupWalltime = '12:00:00'
+        if parser.has_option('logistics','groupHandoff'):
+            self.groupHandoff = int(parser.get('logistics','groupHandoff'))
+        else:
+            self.groupHandoff = 30
+        if parser.has_option('logistics','plotMode'):
+            self.plotMode = int(parser.get('logistics','plotMode'))
+        else:
+            self.plotMode = 0
+        if parser.has_option('logistics','plotInterval'):
+            self.plotInterval = int(parser.get('logistics','plotInterval'))
+        else:
+            self.plotInterval = 10
+        if parser.has_option('logistics','earlyStop'):
+            self.earlyStop = int(parser.get('logistics','earlyStop'))
+        else:
+            self.earlyStop = 0
+        if parser.has_option('logistics','convergeIter'):
+            self.convergeIter = int(parser.get('logistics','convergeIter'))
+        else:
+            self.convergeIter = 0
+        if parser.has_option('logistics','convergeTol'):
+            self.convergeTol = float(parser.get('logistics','convergeTol'))
+        else:
+            self.convergeTol = 0.0
+        if parser.has_option('logistics','convergeGain'):
+            self.convergeGain = float(parser.get('logistics','convergeGain'))
+        else:
+            self.convergeGain = 0.0
+        if parser.has_option('logistics','convergeMinIter'):
+            self.convergeMinIter = int(parser.get('logistics','convergeMinIter'))
+        else:
+            self.convergeMinIter = 0
+        if parser.has_option('logistics','surrogateCand'):
+            self.surrogateCand = int(parser.get('logistics','surrogateCand'))
+        else:
+            self.surrogateCand = 0
+        if parser.has_option('logistics','mfScreenDays'):
+            self.mfScreenDays = int(parser.get('logistics','mfScreenDays'))
+        else:
+            self.mfScreenDays = 0
+        if parser.has_option('logistics','mfMinPairs'):
+            self.mfMinPairs = int(parser.get('logistics','mfMinPairs'))
+        else:
+            self.mfMinPairs = 5
+        if parser.has_option('logistics','spinEquilTol'):
+            self.spinEquilTol = float(parser.get('logistics','spinEquilTol'))
+        else:
+            self.spinEquilTol = 0.0
+        if parser.has_option('logistics','spinEquilMinYears'):
+            self.spinEquilMinYears = int(parser.get('logistics','spinEquilMinYears'))
+        else:
+            self.spinEquilMinYears = 0
+        if parser.has_option('logistics','restartStore'):
+            self.restartStore = str(parser.get('logistics','restartStore')).strip()
+        else:
+            self.restartStore = ''
         self.enableStreamflowCalib = int(parser.get('logistics','enableStreamflowCalib'))
         self.enableSnowCalib = int(parser.get('logistics','enableSnowCalib'))
         self.enableSoilMoistureCalib = int(parser.get('logistics','enableSoilMoistureCalib'))
@@ -399,10 +521,26 @@ class jobMeta:
         self.enableGwLoss = int(parser.get('hydroPhysics','enableGwBucketLoss'))
         self.gwLoss = int(parser.get('hydroPhysics','bucket_loss'))
 
+# Parsed configuration objects keyed by file path. Each entry holds the
+# modification time of the file when it was parsed, so a modified config
+# file is read in again.
+configCache = {}
+
 def readConfig(configFile):
     """
-    Generic function to read in data from a configuration file.
+    Generic function to read in data from a configuration file. The parsed
+    object is cached in-process, so repeated calls for an unchanged file
+    do not re-parse it.
     """
+    try:
+        cacheKey = os.path.realpath(configFile)
+        modTime = os.path.getmtime(cacheKey)
+    except OSError:
+        cacheKey = None
+    if cacheKey in configCache:
+        if configCache[cacheKey][0] == modTime:
+            return configCache[cacheKey][1]
+
     parser = SafeConfigParser()
     parser.read(configFile)
     
@@ -414,7 +552,10 @@ def readConfig(configFile):
     except:
         print("ERROR: Unable to assign values from config file.")
         raise
-        
+
+    if cacheKey is not None:
+        configCache[cacheKey] = [modTime,jobObj]
+
     return jobObj
     
 def createJob(argsUser):
@@ -625,6 +766,131 @@ def checkConfig(parser):
     if check < 0 or check > 1:
         print("ERROR: Invalid coldStart value specified.")
         raise Exception()
+
+    if parser.has_option('logistics','orchTickInterval'):
+        check = int(parser.get('logistics','orchTickInterval'))
+        if check <= 0:
+            print("ERROR: Invalid orchTickInterval value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','orchMaxProbes'):
+        check = int(parser.get('logistics','orchMaxProbes'))
+        if check <= 0:
+            print("ERROR: Invalid orchMaxProbes value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','setupThreads'):
+        check = int(parser.get('logistics','setupThreads'))
+        if check <= 0:
+            print("ERROR: Invalid setupThreads value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','dbWriter'):
+        check = int(parser.get('logistics','dbWriter'))
+        if check < 0 or check > 1:
+            print("ERROR: Invalid dbWriter flag specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','groupWalltime'):
+        check = str(parser.get('logistics','groupWalltime')).strip().split(':')
+        if len(check) != 3 or not all([valTmp.isdigit() for valTmp in check]):
+            print("ERROR: Invalid groupWalltime specified. Must be HH:MM:SS.")
+            raise Exception()
+        if int(check[1]) > 59 or int(check[2]) > 59:
+            print("ERROR: Invalid groupWalltime specified. Must be HH:MM:SS.")
+            raise Exception()
+
+    if parser.has_option('logistics','groupHandoff'):
+        check = int(parser.get('logistics','groupHandoff'))
+        if check < 0:
+            print("ERROR: Invalid groupHandoff value specified.")
+            raise Exception()
+        # The handoff margin must leave time for the group job to run basins.
+        wallTmp = '12:00:00'
+        if parser.has_option('logistics','groupWalltime'):
+            wallTmp = str(parser.get('logistics','groupWalltime')).strip()
+        hrTmp, minTmp, secTmp = [int(valTmp) for valTmp in wallTmp.split(':')]
+        if check > 0 and check*60 >= hrTmp*3600 + minTmp*60 + secTmp:
+            print("ERROR: groupHandoff (minutes) must be less than groupWalltime.")
+            raise Exception()
+
+    if parser.has_option('logistics','plotMode'):
+        check = int(parser.get('logistics','plotMode'))
+        if check < 0 or check > 4:
+            print("ERROR: Invalid plotMode specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','plotInterval'):
+        check = int(parser.get('logistics','plotInterval'))
+        if check <= 0:
+            print("ERROR: Invalid plotInterval value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','earlyStop'):
+        check = int(parser.get('logistics','earlyStop'))
+        if check < 0 or check > 1:
+            print("ERROR: Invalid earlyStop flag specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','convergeIter'):
+        check = int(parser.get('logistics','convergeIter'))
+        if check < 0:
+            print("ERROR: Invalid convergeIter value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','convergeTol'):
+        check = float(parser.get('logistics','convergeTol'))
+        if check < 0.0:
+            print("ERROR: Invalid convergeTol value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','convergeGain'):
+        check = float(parser.get('logistics','convergeGain'))
+        if check < 0.0:
+            print("ERROR: Invalid convergeGain value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','convergeMinIter'):
+        check = int(parser.get('logistics','convergeMinIter'))
+        if check < 0:
+            print("ERROR: Invalid convergeMinIter value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','surrogateCand'):
+        check = int(parser.get('logistics','surrogateCand'))
+        if check < 0:
+            print("ERROR: Invalid surrogateCand value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','mfScreenDays'):
+        check = int(parser.get('logistics','mfScreenDays'))
+        if check < 0:
+            print("ERROR: Invalid mfScreenDays value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','mfMinPairs'):
+        check = int(parser.get('logistics','mfMinPairs'))
+        if check < 3:
+            print("ERROR: Invalid mfMinPairs value specified. Must be at least 3.")
+            raise Exception()
+
+    if parser.has_option('logistics','spinEquilTol'):
+        check = float(parser.get('logistics','spinEquilTol'))
+        if check < 0.0:
+            print("ERROR: Invalid spinEquilTol value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','spinEquilMinYears'):
+        check = int(parser.get('logistics','spinEquilMinYears'))
+        if check < 0:
+            print("ERROR: Invalid spinEquilMinYears value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','restartStore'):
+        check = str(parser.get('logistics','restartStore')).strip()
+        if len(check) > 0 and not os.path.isdir(check):
+            print("ERROR: Restart store directory: " + check + " not found.")
+            raise Exception()
         
     check = int(parser.get('logistics','optSpinFlag'))
     if check < 0 or check > 1:
@@ -653,6 +919,32 @@ def checkConfig(parser):
         if check2 < 0:
             print("ERROR: Invalid stripCalibHours passed to program.")
             raise Exception()
+
+    if parser.has_option('logistics','outputRetention'):
+        check = int(parser.get('logistics','outputRetention'))
+        if check < 0 or check > 1:
+            print("ERROR: Invalid outputRetention option passed to program.")
+            raise Exception()
+
+    if parser.has_option('logistics','retentionInterval'):
+        check = int(parser.get('logistics','retentionInterval'))
+        if check <= 0:
+            print("ERROR: Invalid retentionInterval value specified.")
+            raise Exception()
+
+    if parser.has_option('logistics','retentionRestarts'):
+        check = int(parser.get('logistics','retentionRestarts'))
+        if check < 1:
+            print("ERROR: Invalid retentionRestarts value specified. Must be at least 1.")
+            raise Exception()
+
+    if parser.has_option('logistics','retainOutputs'):
+        for typeTmp in str(parser.get('logistics','retainOutputs')).split(','):
+            if len(typeTmp.strip()) == 0:
+                continue
+            if typeTmp.strip().upper() not in ['LDASOUT','CHANOBS','CHRTOUT','RTOUT','LSMOUT','GWOUT','LAKEOUT']:
+                print("ERROR: Invalid retainOutputs file type: " + typeTmp.strip())
+                raise Exception()
         
     check = str(parser.get('logistics','streamflowObjectiveFunction'))
     if len(check) == 0:
@@ -0,0 +1,97 @@
+# Module file containing the convergence check for the DDS calibration of a
+# basin. Each time a calibration iteration is complete, the curve of the best
+# objective function found so far is pulled from Calib_Stats. If it has gone
+# flat, or is projected to gain too little over the remaining iterations, the
+# remaining iterations of the basin are skipped, and entered with their own
+# status (basinStatusMod.SKIPPED_VALUE) rather than as complete, so they are
+# never mistaken for evaluated iterations. The basin then moves on to
+# validation, freeing up its model cores for basins that are still improving.
+# Each decision is recorded in the Calib_Convergence table.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import numpy as np
+from core import basinStatusMod
+
+# Reasons recorded for a converged basin.
+REASON_NO_IMPROVEMENT = "NO_IMPROVEMENT"
+REASON_PROJECTED_GAIN = "PROJECTED_GAIN"
+
+def enabled(staticData):
+    """
+    Generic function to determine if any convergence criteria have been
+    specified for this job.
+    """
+    return int(staticData.convergeIter) > 0 or float(staticData.convergeGain) > 0.0
+
+def bestCurve(results,nComplete):
+    """
+    Generic function to compose the best objective function found so far
+    after each evaluated iteration among the first nComplete, from the
+    (iteration,objfnVal) rows in Calib_Stats, in iteration order. Iterations
+    without a value (-9999), or stopped early (not returned by the DB), are
+    left out, so the curve only has an entry per evaluated iteration.
+    """
+    objTmp = []
+    for iterTmp, objfnTmp in results:
+        if objfnTmp is None or iterTmp is None:
+            continue
+        if 1 <= int(iterTmp) <= nComplete and float(objfnTmp) != -9999.0:
+            objTmp.append(float(objfnTmp))
+    return np.minimum.accumulate(np.array(objTmp,dtype=float))
+
+def checkConvergence(jobData,staticData,db,gageID,basinNum,iteration,keySlot):
+    """
+    Generic function to check if the calibration of a basin has converged,
+    once the given (zero-based) iteration is complete. If so, the remaining
+    iterations are set to complete in keySlot and the DB. Returns True if the
+    basin was found to have converged. Skipped iterations are given the
+    skipped status. The window is counted in evaluated iterations, so
+    candidates stopped early neither count as a lack of improvement nor
+    shorten the window.
+    """
+    nIter = int(jobData.nIter)
+    nComplete = int(iteration) + 1
+    if not enabled(staticData) or nComplete >= nIter:
+        return False
+    if nComplete < int(staticData.convergeMinIter):
+        return False
+
+    try:
+        results = db.calibObjectives(jobData,int(jobData.jobID),int(gageID))
+    except:
+        raise
+    curveTmp = bestCurve(results,nComplete)
+    nEval = len(curveTmp)
+    if nEval == 0:
+        return False
+
+    # Improvement over the last convergeIter evaluated iterations, or all of them.
+    windowTmp = int(staticData.convergeIter)
+    if windowTmp <= 0 or windowTmp >= nEval:
+        windowTmp = nEval - 1
+    if windowTmp < 1:
+        return False
+    improvement = curveTmp[-windowTmp-1] - curveTmp[-1]
+    projectedGain = improvement/windowTmp*(nIter - nComplete)
+
+    reason = None
+    if int(staticData.convergeIter) > 0 and nEval > int(staticData.convergeIter) and \
+       improvement <= float(staticData.convergeTol):
+        reason = REASON_NO_IMPROVEMENT
+    elif float(staticData.convergeGain) > 0.0 and projectedGain < float(staticData.convergeGain):
+        reason = REASON_PROJECTED_GAIN
+    if reason is None:
+        return False
+
+    print("CALIBRATION CONVERGED FOR BASIN: " + str(jobData.gages[basinNum]) + " AFTER ITERATION: " + \
+          str(nComplete) + " REASON: " + reason + " SKIPPING " + str(nIter - nComplete) + " ITERATIONS")
+    try:
+        db.logConvergence(jobData,int(jobData.jobID),int(gageID),iteration,reason,curveTmp[-1],
+                          improvement,projectedGain,basinStatusMod.SKIPPED_VALUE)
+    except:
+        raise
+    keySlot[basinNum,nComplete:] = basinStatusMod.SKIPPED_VALUE
+    return True
@@ -13,10 +13,33 @@ import os
 import shutil
 import time
 from core import errMod
+from core import dbWriterMod
 
 import warnings
 warnings.filterwarnings("ignore")
 
+# Basin_Status is created on first use for DB files initialized before it was added.
+BASIN_STATUS_TABLE = "CREATE TABLE IF NOT EXISTS Basin_Status " + \
+                     "(jobID integer, domainID integer, phase integer, iteration integer, " + \
+                     "state integer, PRIMARY KEY (jobID, domainID, phase, iteration))"
+
+# Calib_Convergence is created on first use for DB files initialized before it was added.
+CALIB_CONVERGENCE_TABLE = "CREATE TABLE IF NOT EXISTS Calib_Convergence " + \
+                          "(jobID integer, domainID integer, iteration integer, reason text, " + \
+                          "bestObj real, improvement real, projectedGain real, nSkipped integer, " + \
+                          "PRIMARY KEY (jobID, domainID))"
+
+# Calib_Fidelity is created on first use for DB files initialized before it was added.
+CALIB_FIDELITY_TABLE = "CREATE TABLE IF NOT EXISTS Calib_Fidelity " + \
+                       "(jobID integer, domainID integer, iteration integer, shortObj real, " + \
+                       "predictedObj real, threshold real, promoted integer, " + \
+                       "PRIMARY KEY (jobID, domainID, iteration))"
+
+# Calib_Stats.stopped is added on first use for DB files initialized before it was added.
+# It is set for iterations whose simulation was stopped early (fidelity screening or the
+# streaming lower bound), as their objective function value is a bound or prediction.
+CALIB_STATS_STOPPED = "ALTER TABLE Calib_Stats ADD COLUMN stopped integer default 0"
+
 class Database(object):
     def __init__(self,jobData):
         """
@@ -29,6 +52,7 @@ class Database(object):
         self.conn = None
         self.dbCursor = None
         self.lockPath = None
+        self.stoppedColumn = False
     
     def connect(self,jobData):
         """
@@ -56,6 +80,13 @@ class Database(object):
             self.dbCursor = None
             self.db = None
             raise
+
+        # If the orchestrator is running a DB writer service for this DB file,
+        # send writes through it. Reads are still made against the DB file.
+        sockTmp = dbWriterMod.connectClient(dbWriterMod.socketPath(jobData.dbPath))
+        if sockTmp is not None:
+            self.conn = dbWriterMod.writerConnection(self.conn,sockTmp)
+            self.dbCursor = self.conn.cursor()
             
         self.connected = True
         
@@ -423,28 +454,46 @@ class Database(object):
             jobData.errMsg = "ERROR: No gage data for: " + tmpMeta['gageName']
             raise Exception()
             
-        tmpMeta['gageID'] = results[0]
-        tmpMeta['comID'] = results[2]
-        tmpMeta['geoFile'] = results[13]
-        tmpMeta['landSpatialMeta'] = results[14]
-        tmpMeta['wrfInput'] = results[15]
-        tmpMeta['soilFile'] = results[16]
-        tmpMeta['fullDomFile'] = results[17]
-        tmpMeta['rtLnk'] = results[18]
-        tmpMeta['udMap'] = results[19]
-        tmpMeta['gwFile'] = results[20]
-        tmpMeta['gwMask'] = results[21]
-        tmpMeta['lkFile'] = results[22]
-        tmpMeta['forceDir'] = results[23]
-        tmpMeta['obsDir'] = results[24]
-        tmpMeta['siteName'] = results[25]
-        tmpMeta['dxHydro'] = results[39]
-        tmpMeta['aggFactor'] = results[40]
-        tmpMeta['hydroSpatial'] = results[41]
-        tmpMeta['optLandRstFile'] = results[42]
-        tmpMeta['optHydroRstFile'] = results[43]
-        tmpMeta['chanParmFile'] = results[44]
-        
+        fillGageMeta(tmpMeta,results)
+
+    def queryGageMetaAll(self,jobData):
+        """
+        Function to query the gages meta table for all basins in this job in a
+        single query. Returns a dictionary of Domain_Meta rows keyed by domainID.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        domainList = ",".join([str(int(domainID)) for domainID in jobData.gageIDs])
+        sqlCmd = "select * from \"Domain_Meta\" where \"domainID\" in (" + domainList + ");"
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(sqlCmd)
+                results = self.dbCursor.fetchall()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to query domain meta table for gages metadata."
+                    raise
+                else:
+                    attempts = attempts + 1
+
+        metaRows = {}
+        for row in results:
+            metaRows[int(row[0])] = row
+
+        return metaRows
+
     def jobStatus(self,jobData):
         """
         Function to extract job metadata (including status information) for
@@ -1306,6 +1355,451 @@ class Database(object):
                 else:
                     attempts = attempts + 1
         
+    def jobIterationStatus(self,jobData,sensFlag):
+        """
+        Generic function to extract the complete status of every basin/iteration
+        for a given job with a single query. Iterations are returned zero-based.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        jobID = int(jobData.jobID)
+
+        if sensFlag:
+            tblName = "Sens_Stats"
+        else:
+            tblName = "Calib_Stats"
+
+        sqlCmd = "select \"domainID\",iteration-1,complete from \"" + tblName + "\" where \"jobID\"=?;"
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(sqlCmd,(jobID,))
+                results = self.dbCursor.fetchall()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to extract " + tblName + " status for job ID: " + str(jobID)
+                    raise
+                else:
+                    attempts = attempts + 1
+
+        return results
+
+    def bestObjective(self,jobData,jobID,domainID):
+        """
+        Generic function to extract the objective function value of the best
+        calibration iteration completed so far for a basin. None is returned
+        if no iterations have completed.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        sqlCmd = "select \"objfnVal\" from \"Calib_Stats\" where \"jobID\"=? and \"domainID\"=? " + \
+                 "and best='1' and complete='1';"
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(sqlCmd,(int(jobID),int(domainID)))
+                results = self.dbCursor.fetchone()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to extract best objective function for job ID: " + \
+                                     str(jobID) + " domainID: " + str(domainID)
+                    raise
+                else:
+                    attempts = attempts + 1
+
+        if results is None:
+            return None
+        try:
+            bestObj = float(results[0])
+        except (TypeError,ValueError):
+            return None
+        if bestObj == -9999.0:
+            return None
+        return bestObj
+
+    def calibObjectives(self,jobData,jobID,domainID):
+        """
+        Generic function to extract the objective function value of each
+        completed calibration iteration for a basin, in iteration order.
+        Iterations stopped early are left out.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        sqlCmd = "select iteration,\"objfnVal\" from \"Calib_Stats\" where \"jobID\"=? and \"domainID\"=? " + \
+                 "and complete='1' and coalesce(stopped,0)=0 order by iteration;"
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.addStoppedColumn()
+                self.dbCursor.execute(sqlCmd,(int(jobID),int(domainID)))
+                results = self.dbCursor.fetchall()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to extract objective function values for job ID: " + \
+                                     str(jobID) + " domainID: " + str(domainID)
+                    raise
+                else:
+                    attempts = attempts + 1
+
+        return results
+
+    def logConvergence(self,jobData,jobID,domainID,iteration,reason,bestObj,improvement,projectedGain,
+                       skipStatus):
+        """
+        Generic function to record a calibration found to have converged after
+        the given (zero-based) iteration. The remaining iterations are entered
+        into Calib_Stats with the skipped status, and their statistics left at
+        -9999, and the decision is entered into Calib_Convergence, in a single
+        transaction.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        iterTmp = int(iteration) + 1
+        nSkipped = int(jobData.nIter) - iterTmp
+
+        sqlCmd1 = "update \"Calib_Stats\" set complete=? where \"jobID\"=? and \"domainID\"=? " + \
+                  "and iteration>?;"
+        sqlCmd2 = "insert or replace into \"Calib_Convergence\" (\"jobID\",\"domainID\",iteration,reason," + \
+                  "\"bestObj\",improvement,\"projectedGain\",\"nSkipped\") values (?,?,?,?,?,?,?,?);"
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(CALIB_CONVERGENCE_TABLE)
+                self.dbCursor.execute(sqlCmd1,(float(skipStatus),int(jobID),int(domainID),iterTmp))
+                self.dbCursor.execute(sqlCmd2,(int(jobID),int(domainID),iterTmp,str(reason),float(bestObj),
+                                               float(improvement),float(projectedGain),nSkipped))
+                self.conn.commit()
+                success = True
+            except:
+                try:
+                    self.conn.rollback()
+                except:
+                    pass
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to log calibration convergence for job ID: " + \
+                                     str(jobID) + " domainID: " + str(domainID) + " Iteration: " + str(iterTmp)
+                    raise
+                else:
+                    attempts = attempts + 1
+
+    def fidelityScreened(self,jobData,jobID,domainID,iteration):
+        """
+        Generic function to check if a calibration iteration (zero-based) of a
+        basin has already been through the multi-fidelity screening.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        sqlCmd = "select promoted from \"Calib_Fidelity\" where \"jobID\"=? and \"domainID\"=? and iteration=?;"
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(CALIB_FIDELITY_TABLE)
+                self.dbCursor.execute(sqlCmd,(int(jobID),int(domainID),int(iteration)+1))
+                results = self.dbCursor.fetchone()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to extract screening status for job ID: " + \
+                                     str(jobID) + " domainID: " + str(domainID) + " Iteration: " + str(iteration)
+                    raise
+                else:
+                    attempts = attempts + 1
+
+        return results is not None
+
+    def fidelityPairs(self,jobData,jobID,domainID):
+        """
+        Generic function to extract the short-period score from Calib_Fidelity,
+        along with the full-period objective function from Calib_Stats, for each
+        completed calibration iteration of a basin promoted to the full period.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        sqlCmd = "select f.\"shortObj\",s.\"objfnVal\" from \"Calib_Fidelity\" f inner join \"Calib_Stats\" s " + \
+                 "on f.\"jobID\"=s.\"jobID\" and f.\"domainID\"=s.\"domainID\" and f.iteration=s.iteration " + \
+                 "where f.\"jobID\"=? and f.\"domainID\"=? and f.promoted=? and s.complete='1';"
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(CALIB_FIDELITY_TABLE)
+                self.dbCursor.execute(sqlCmd,(int(jobID),int(domainID),1))
+                results = self.dbCursor.fetchall()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to extract screening scores for job ID: " + \
+                                     str(jobID) + " domainID: " + str(domainID)
+                    raise
+                else:
+                    attempts = attempts + 1
+
+        return results
+
+    def logFidelity(self,jobData,jobID,domainID,iteration,shortObj,predictedObj,threshold,promoted):
+        """
+        Generic function to enter the multi-fidelity screening of a calibration
+        iteration (zero-based) into Calib_Fidelity. The predicted objective
+        function and threshold are None until the promotion threshold has been
+        tuned for the basin.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        sqlCmd = "insert or replace into \"Calib_Fidelity\" (\"jobID\",\"domainID\",iteration,\"shortObj\"," + \
+                 "\"predictedObj\",threshold,promoted) values (?,?,?,?,?,?,?);"
+        if predictedObj is not None:
+            predictedObj = float(predictedObj)
+        if threshold is not None:
+            threshold = float(threshold)
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(CALIB_FIDELITY_TABLE)
+                self.dbCursor.execute(sqlCmd,(int(jobID),int(domainID),int(iteration)+1,float(shortObj),
+                                              predictedObj,threshold,int(promoted)))
+                self.conn.commit()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to log screening score for job ID: " + \
+                                     str(jobID) + " domainID: " + str(domainID) + " Iteration: " + str(iteration)
+                    raise
+                else:
+                    attempts = attempts + 1
+
+    def markFidelityStopped(self,jobData,jobID,domainID,iteration):
+        """
+        Generic function to flag a calibration iteration (zero-based) promoted
+        to the full period, but stopped early by the streaming evaluator.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        sqlCmd = "update \"Calib_Fidelity\" set promoted=? where \"jobID\"=? and \"domainID\"=? " + \
+                 "and iteration=? and promoted=?;"
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(CALIB_FIDELITY_TABLE)
+                self.dbCursor.execute(sqlCmd,(2,int(jobID),int(domainID),int(iteration)+1,1))
+                self.conn.commit()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to update screening status for job ID: " + \
+                                     str(jobID) + " domainID: " + str(domainID) + " Iteration: " + str(iteration)
+                    raise
+                else:
+                    attempts = attempts + 1
+
+    def addStoppedColumn(self):
+        """
+        Generic function to add the stopped column to Calib_Stats if the DB
+        file predates it. Only checked once per connection.
+        """
+        if self.stoppedColumn:
+            return
+        self.dbCursor.execute("PRAGMA table_info(\"Calib_Stats\");")
+        colList = [colTmp[1] for colTmp in self.dbCursor.fetchall()]
+        if 'stopped' not in colList:
+            self.dbCursor.execute(CALIB_STATS_STOPPED)
+            self.conn.commit()
+        self.stoppedColumn = True
+
+    def markCalibStopped(self,jobData,jobID,domainID,iteration):
+        """
+        Generic function to flag a calibration iteration (zero-based) whose
+        simulation was stopped early, so its objective function value is not
+        mistaken for that of a complete simulation.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        sqlCmd = "update \"Calib_Stats\" set stopped=1 where \"jobID\"=? and \"domainID\"=? and iteration=?;"
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.addStoppedColumn()
+                self.dbCursor.execute(sqlCmd,(int(jobID),int(domainID),int(iteration)+1))
+                self.conn.commit()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to flag stopped iteration for job ID: " + \
+                                     str(jobID) + " domainID: " + str(domainID) + " Iteration: " + str(iteration)
+                    raise
+                else:
+                    attempts = attempts + 1
+
+    def basinStatus(self,jobData,phase):
+        """
+        Generic function to extract the persisted state codes of every basin
+        for a given job/phase with a single query. The Basin_Status table is
+        created if the DB file predates it.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        jobID = int(jobData.jobID)
+
+        sqlCmd = "select \"domainID\",iteration,state from \"Basin_Status\" where \"jobID\"=? and phase=?;"
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(BASIN_STATUS_TABLE)
+                self.dbCursor.execute(sqlCmd,(jobID,int(phase)))
+                results = self.dbCursor.fetchall()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to extract basin status for job ID: " + str(jobID) + \
+                                     " phase: " + str(phase)
+                    raise
+                else:
+                    attempts = attempts + 1
+
+        return results
+
+    def updateBasinStatus(self,jobData,statusRows):
+        """
+        Generic function to persist a sweep's worth of state changes to the
+        Basin_Status table in a single transaction. Each row is
+        (jobID,domainID,phase,iteration,state).
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        if len(statusRows) == 0:
+            return
+
+        sqlCmd = "insert or replace into \"Basin_Status\" (\"jobID\",\"domainID\",phase,iteration,state) " + \
+                 "values (?,?,?,?,?);"
+
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(BASIN_STATUS_TABLE)
+                self.dbCursor.executemany(sqlCmd,statusRows)
+                self.conn.commit()
+                success = True
+            except:
+                try:
+                    self.conn.rollback()
+                except:
+                    pass
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Unable to update basin status for job ID: " + str(jobData.jobID)
+                    raise
+                else:
+                    attempts = attempts + 1
+
     def logCalibParams(self,jobData,jobID,domainID,calibTbl,iteration):
         """
         Generic function for logging newly created parameter values created
@@ -2085,6 +2579,60 @@ class Database(object):
                 else:
                     attempts = attempts + 1
             
+        # Cleanup Basin_Status. The table may not exist in older DB files.
+        sqlCmd = "delete from \"Basin_Status\" where \"jobID\"='" + str(jobData.jobID) + "';"
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(BASIN_STATUS_TABLE)
+                self.dbCursor.execute(sqlCmd)
+                self.conn.commit()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Failure to remove entries from Basin_Status for job: " + str(jobData.jobID)
+                    raise Exception()
+                else:
+                    attempts = attempts + 1
+
+        # Cleanup Calib_Convergence. The table may not exist in older DB files.
+        sqlCmd = "delete from \"Calib_Convergence\" where \"jobID\"='" + str(jobData.jobID) + "';"
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(CALIB_CONVERGENCE_TABLE)
+                self.dbCursor.execute(sqlCmd)
+                self.conn.commit()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Failure to remove entries from Calib_Convergence for job: " + str(jobData.jobID)
+                    raise Exception()
+                else:
+                    attempts = attempts + 1
+
+        # Cleanup Calib_Fidelity. The table may not exist in older DB files.
+        sqlCmd = "delete from \"Calib_Fidelity\" where \"jobID\"='" + str(jobData.jobID) + "';"
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(CALIB_FIDELITY_TABLE)
+                self.dbCursor.execute(sqlCmd)
+                self.conn.commit()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Failure to remove entries from Calib_Fidelity for job: " + str(jobData.jobID)
+                    raise Exception()
+                else:
+                    attempts = attempts + 1
+
         # Cleanup Sens_Params
         sqlCmd = "delete from \"Sens_Params\" where \"jobID\"='" + str(jobData.jobID) + "';"
         attempts = 0
@@ -2119,6 +2667,36 @@ class Database(object):
                 else:
                     attempts = attempts + 1
             
+    def removeJobID(self,jobData):
+        """
+        Generic function to remove the Job_Meta entry of a job whose
+        initialization failed, so the job can be entered again.
+        """
+        # Pause while backup process completes.
+        if self.lockPath != None:
+            while os.path.isfile(self.lockPath):
+                time.sleep(1)
+
+        if not self.connected:
+            jobData.errMsg = "ERROR: No Connection to Database: " + self.dbName
+            raise Exception()
+
+        sqlCmd = "delete from \"Job_Meta\" where \"jobID\"=?;"
+        attempts = 0
+        success = False
+        while attempts < 10 and not success:
+            try:
+                self.dbCursor.execute(sqlCmd,(int(jobData.jobID),))
+                self.conn.commit()
+                success = True
+            except:
+                time.sleep(5)
+                if attempts == 9:
+                    jobData.errMsg = "ERROR: Failure to remove Job_Meta entry for job: " + str(jobData.jobID)
+                    raise Exception()
+                else:
+                    attempts = attempts + 1
+
     def insertSensParms(self,jobData,parmsLogged,parmTxtFile,gageID):
         """
         Function to log sensitivity parameters created during the sensitivity pre-processing
@@ -2245,3 +2823,39 @@ class Database(object):
         except:
             jobData.errMsg = "ERROR: Unable to create empty file: " + completePath
             raise Exception()
+
+def fillGageMeta(tmpMeta,results):
+    """
+    Generic function to map a single Domain_Meta row into the temporary
+    gage metadata dictionary used by calibIoMod.gageMeta.
+    """
+    tmpMeta['gageID'] = results[0]
+    tmpMeta['comID'] = results[2]
+    tmpMeta['geoFile'] = results[13]
+    tmpMeta['landSpatialMeta'] = results[14]
+    tmpMeta['wrfInput'] = results[15]
+    tmpMeta['soilFile'] = results[16]
+    tmpMeta['fullDomFile'] = results[17]
+    tmpMeta['rtLnk'] = results[18]
+    tmpMeta['udMap'] = results[19]
+    tmpMeta['gwFile'] = results[20]
+    tmpMeta['gwMask'] = results[21]
+    tmpMeta['lkFile'] = results[22]
+    tmpMeta['forceDir'] = results[23]
+    tmpMeta['obsDir'] = results[24]
+    tmpMeta['siteName'] = results[25]
+    tmpMeta['dxHydro'] = results[39]
+    tmpMeta['aggFactor'] = results[40]
+    tmpMeta['hydroSpatial'] = results[41]
+    tmpMeta['optLandRstFile'] = results[42]
+    tmpMeta['optHydroRstFile'] = results[43]
+    tmpMeta['chanParmFile'] = results[44]
+    # Grid dimensions and file sizes were added to the Domain_Meta table later.
+    # Older DB files, or basins entered before then, will not have them.
+    dimNames = ['landNx','landNy','hydroNx','hydroNy','geoFileSize','fullDomFileSize',
+                'soilFileSize','hydroSpatialFileSize','wrfInputFileSize','rtLnkFileSize']
+    for i in range(0,len(dimNames)):
+        if len(results) > 45+i and results[45+i] is not None:
+            tmpMeta[dimNames[i]] = results[45+i]
+        else:
+            tmpMeta[dimNames[i]] = -9999
@@ -0,0 +1,343 @@
+# Module file containing a single-writer service for the calibration DB
+# file. When enabled, the orchestrator runs the service on a Unix socket.
+# Group programs running on the same machine send their write statements
+# (INSERT/UPDATE/DELETE) to the service instead of committing to the DB
+# file themselves. The service gathers whatever writes are waiting while
+# its previous commit runs and commits them together in one transaction,
+# then acknowledges each request. This removes the lock contention between
+# many group processes committing to one file on a network file system.
+# Reads are still made directly against the DB file.
+#
+# If the service cannot be reached, writes fall back to the DB file directly,
+# so a group program never depends on the orchestrator being alive.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import hashlib
+import json
+import os
+import queue
+import socket
+import socketserver
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+
+# Maximum number of requests committed in a single transaction.
+MAX_BATCH = 500
+
+# Running service for this process.
+writerService = None
+
+def socketPath(dbPath):
+    """
+    Generic function to return the Unix socket path of the writer service for
+    a DB file. The path is kept short, as Unix socket paths are limited to
+    about 100 characters.
+    """
+    hashTmp = hashlib.md5(os.path.realpath(dbPath).encode('utf-8')).hexdigest()[0:16]
+    return os.path.join(tempfile.gettempdir(),"wrfHydroCalib_DB_" + hashTmp + ".sock")
+
+def sendMsg(sock,msg):
+    """
+    Generic function to send a length-prefixed JSON message over a socket.
+    """
+    dataTmp = json.dumps(msg).encode('utf-8')
+    sock.sendall(struct.pack('>I',len(dataTmp)) + dataTmp)
+
+def recvMsg(sock):
+    """
+    Generic function to receive a length-prefixed JSON message from a socket.
+    Returns None if the other end closed the connection.
+    """
+    headTmp = recvAll(sock,4)
+    if headTmp is None:
+        return None
+    dataTmp = recvAll(sock,struct.unpack('>I',headTmp)[0])
+    if dataTmp is None:
+        return None
+    return json.loads(dataTmp.decode('utf-8'))
+
+def recvAll(sock,nBytes):
+    bufTmp = b''
+    while len(bufTmp) < nBytes:
+        chunkTmp = sock.recv(nBytes - len(bufTmp))
+        if not chunkTmp:
+            return None
+        bufTmp = bufTmp + chunkTmp
+    return bufTmp
+
+class writeRequest:
+    def __init__(self,cmds):
+        # Write statements from a single commit of a group program, along with
+        # the result of committing them.
+        self.cmds = cmds
+        self.errMsg = None
+        self.done = threading.Event()
+
+class requestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Each group program keeps a single connection open. Requests are
+        # handed to the writer thread, and the reply is sent once they are committed.
+        while True:
+            try:
+                msg = recvMsg(self.request)
+            except (OSError,ValueError):
+                return
+            if msg is None:
+                return
+            reqTmp = writeRequest(msg['cmds'])
+            self.server.writeQueue.put(reqTmp)
+            reqTmp.done.wait()
+            try:
+                if reqTmp.errMsg is None:
+                    sendMsg(self.request,{'status':'OK'})
+                else:
+                    sendMsg(self.request,{'status':'ERROR','msg':reqTmp.errMsg})
+            except OSError:
+                return
+
+class writerServer(socketserver.ThreadingMixIn,socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def waitLock(lockPath):
+    """
+    Generic function to pause while the DB backup process has the DB file locked.
+    """
+    if lockPath is not None:
+        while os.path.isfile(lockPath):
+            time.sleep(1)
+
+def commitRequests(conn,requests,lockPath):
+    """
+    Generic function to commit a batch of write requests in one transaction.
+    Each request is placed in its own savepoint, so a failing request is
+    rolled back and reported without affecting the others in the batch.
+    """
+    attempts = 0
+    success = False
+    while attempts < 10 and not success:
+        waitLock(lockPath)
+        try:
+            conn.execute("BEGIN IMMEDIATE;")
+            for reqTmp in requests:
+                conn.execute("SAVEPOINT request;")
+                try:
+                    for sqlCmd, params in reqTmp.cmds:
+                        conn.execute(sqlCmd,params)
+                    reqTmp.errMsg = None
+                except sqlite3.Error as err:
+                    conn.execute("ROLLBACK TO request;")
+                    reqTmp.errMsg = "ERROR: DB writer service unable to execute: " + sqlCmd + " - " + str(err)
+                conn.execute("RELEASE request;")
+            conn.execute("COMMIT;")
+            success = True
+        except sqlite3.Error as err:
+            try:
+                conn.execute("ROLLBACK;")
+            except sqlite3.Error:
+                pass
+            if attempts == 9:
+                for reqTmp in requests:
+                    reqTmp.errMsg = "ERROR: DB writer service unable to commit to the DB file - " + str(err)
+            else:
+                time.sleep(5)
+            attempts = attempts + 1
+
+    for reqTmp in requests:
+        reqTmp.done.set()
+
+def writerLoop(dbPath,lockPath,writeQueue,stopEvent):
+    """
+    Generic function containing the writer thread. All requests waiting in the
+    queue are committed together.
+    """
+    conn = sqlite3.connect(dbPath,isolation_level=None,check_same_thread=False,timeout=30)
+    while not stopEvent.is_set():
+        try:
+            reqTmp = writeQueue.get(timeout=1)
+        except queue.Empty:
+            continue
+        requests = [reqTmp]
+        while len(requests) < MAX_BATCH:
+            try:
+                requests.append(writeQueue.get_nowait())
+            except queue.Empty:
+                break
+        commitRequests(conn,requests,lockPath)
+    conn.close()
+
+class dbWriter:
+    def __init__(self,dbPath,lockPath):
+        # Initialize the writer service for a DB file.
+        self.dbPath = dbPath
+        self.lockPath = lockPath
+        self.sockPath = socketPath(dbPath)
+        self.server = None
+        self.stopEvent = threading.Event()
+        self.writeQueue = queue.Queue()
+        self.threads = []
+
+    def start(self,jobData):
+        # A socket left behind by an orchestrator that did not exit cleanly
+        # is removed. If another orchestrator is serving it, we leave it alone.
+        if os.path.exists(self.sockPath):
+            if connectClient(self.sockPath) is not None:
+                jobData.errMsg = "ERROR: A DB writer service is already running on: " + self.sockPath
+                raise Exception()
+            try:
+                os.remove(self.sockPath)
+            except:
+                jobData.errMsg = "ERROR: Unable to remove stale DB writer socket: " + self.sockPath
+                raise
+
+        try:
+            self.server = writerServer(self.sockPath,requestHandler)
+        except:
+            jobData.errMsg = "ERROR: Unable to start DB writer service on: " + self.sockPath
+            raise
+        self.server.writeQueue = self.writeQueue
+
+        self.threads.append(threading.Thread(target=writerLoop,args=(self.dbPath,self.lockPath,
+                                                                     self.writeQueue,self.stopEvent),daemon=True))
+        self.threads.append(threading.Thread(target=self.server.serve_forever,daemon=True))
+        for threadTmp in self.threads:
+            threadTmp.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self.stopEvent.set()
+        for threadTmp in self.threads:
+            threadTmp.join()
+        if os.path.exists(self.sockPath):
+            try:
+                os.remove(self.sockPath)
+            except OSError:
+                pass
+
+def startWriter(jobData,staticData,lockPath):
+    """
+    Generic function called by the orchestrators to start the writer service,
+    if it has been enabled in the configuration file.
+    """
+    global writerService
+    if staticData.dbWriter != 1 or writerService is not None:
+        return
+    writerTmp = dbWriter(jobData.dbPath,lockPath)
+    writerTmp.start(jobData)
+    writerService = writerTmp
+
+def stopWriter():
+    """
+    Generic function to stop the writer service, once group programs no
+    longer need it.
+    """
+    global writerService
+    if writerService is None:
+        return
+    writerService.stop()
+    writerService = None
+
+def connectClient(sockPath):
+    """
+    Generic function to connect to the writer service. Returns None if the
+    service is not reachable.
+    """
+    if not os.path.exists(sockPath):
+        return None
+    try:
+        sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        sock.connect(sockPath)
+    except OSError:
+        return None
+    return sock
+
+def isWrite(sqlCmd):
+    """
+    Generic function to determine if a SQL statement modifies the DB.
+    """
+    wordTmp = sqlCmd.lstrip().split(None,1)
+    if len(wordTmp) == 0:
+        return False
+    return wordTmp[0].lower() in ['insert','update','delete','replace']
+
+class writerConnection(object):
+    def __init__(self,conn,sock):
+        # Wrapper around a sqlite3 connection that sends pending writes to
+        # the writer service on commit.
+        self.conn = conn
+        self.sock = sock
+        self.pending = []
+
+    def commit(self):
+        cmds = self.pending
+        self.pending = []
+        if len(cmds) > 0 and self.sock is not None:
+            try:
+                sendMsg(self.sock,{'cmds':cmds})
+                reply = recvMsg(self.sock)
+            except (OSError,ValueError):
+                reply = None
+            if reply is None:
+                # Service is gone. Carry on writing to the DB file directly.
+                self.sock = None
+            elif reply['status'] != 'OK':
+                raise sqlite3.OperationalError(reply['msg'])
+            else:
+                cmds = []
+        for sqlCmd, params in cmds:
+            self.conn.execute(sqlCmd,params)
+        self.conn.commit()
+
+    def rollback(self):
+        self.pending = []
+        self.conn.rollback()
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        self.conn.close()
+
+    def cursor(self):
+        return writerCursor(self.conn.cursor(),self)
+
+    def __getattr__(self,name):
+        return getattr(self.conn,name)
+
+class writerCursor(object):
+    def __init__(self,cursor,conn):
+        # Wrapper around a sqlite3 cursor. Reads are made directly against
+        # the DB file, while writes wait for the next commit.
+        self.cursor = cursor
+        self.writerConn = conn
+
+    def execute(self,sqlCmd,params=()):
+        if isWrite(sqlCmd):
+            self.writerConn.pending.append([sqlCmd,list(params)])
+            return self
+        self.cursor.execute(sqlCmd,params)
+        return self
+
+    def executemany(self,sqlCmd,paramList):
+        if isWrite(sqlCmd):
+            for params in paramList:
+                self.writerConn.pending.append([sqlCmd,list(params)])
+            return self
+        self.cursor.executemany(sqlCmd,paramList)
+        return self
+
+    def __getattr__(self,name):
+        return getattr(self.cursor,name)
+
+    def __iter__(self):
+        return iter(self.cursor)
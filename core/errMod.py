@@ -10,14 +10,37 @@ import smtplib
 import shutil
 import pwd
 import os
-import glob
-import subprocess
+import re
+import fnmatch
+import tempfile
+import threading
 
 import warnings
 warnings.filterwarnings("ignore")
 
 uid = pwd.getpwuid(os.getuid()).pw_name
 
+# File patterns removed from a run directory between calibration simulations.
+OUTPUT_PATTERNS = ['diag_hydro.*','*.err','*.out','*.LDASOUT_DOMAIN1','*.CHRTOUT_DOMAIN1',
+                   'HYDRO_RST.*','RESTART.*_DOMAIN1','namelist.hrldas','hydro.namelist',
+                   'channel_restart_*','CHANOBS_DOMAIN*','troute*']
+
+# File patterns removed from a spinup run directory. RESTART files are kept
+# as those are needed by the calibrations.
+SPINUP_PATTERNS = ['diag_hydro.*','*.err','*.out','*.LDASOUT_DOMAIN1','*.CHRTOUT_DOMAIN1',
+                   'namelist.hrldas','hydro.namelist']
+
+# Misc diagnostic files cleared out before a model (re)start.
+DIAG_PATTERNS = ['diag_hydro.*']
+
+# Prefix of the hidden directories matched output is moved into prior to
+# being deleted in the background.
+CLEANUP_PREFIX = '.CLEANUP_'
+
+# Background deletion threads started by cleanDir, keyed by the cleanup
+# directory each is removing.
+cleanupThreads = {}
+
 def errOut(jobData):
     # Error function for handling communicating error messages
     # to user. If email was provided, an error email
@@ -55,130 +78,148 @@ def wipeJobDir(jobData,db):
     # to remove any table entries that were made for this failed attempt to iniitalize
     # an experiment.
     jobDir = jobData.outDir + "/" + jobData.jobName
-    try:
-        shutil.rmtree(jobDir)
-    except:
-        print("ERROR: Failure to remove: " + jobDir + " Please remove manually.")
-        raise
+    # Background deletions may still be running inside the job directory.
+    waitCleanup()
+    if os.path.isdir(jobDir):
+        try:
+            shutil.rmtree(jobDir)
+        except:
+            print("ERROR: Failure to remove: " + jobDir + " Please remove manually.")
+            raise
         
-    # Remove the DB entries that were made.
+    # Remove the DB entries that were made, including the job itself, so
+    # the job can be initialized again.
     try:
         db.cleanupJob(jobData)
+        db.removeJobID(jobData)
     except:
         print("ERROR: Failure to delete entries for job ID: " + str(jobData.jobID))
         
-def removeOutput(jobData,runDir):
+def compilePatterns(patterns,background=False):
     """
-    Generic function to clean up wrfHydro output. This is used specifically
-    between calibration simulations.
+    Generic function to combine a list of shell-style file patterns into a
+    single compiled regular expression, so each directory entry is only
+    tested once against all patterns. If background is True, stale cleanup
+    directories left behind by an interrupted background deletion are
+    matched as well.
     """
-    filesCheck = glob.glob(runDir + "/diag_hydro.*")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/diag_hydro.*"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove hydro diagnostic files from: " + runDir
-            raise
-            
-    filesCheck = glob.glob(runDir + "/*.err")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/*.err"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove error diagnostic files from: " + runDir
-            raise
-            
-    filesCheck = glob.glob(runDir + "/*.out")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/*.out"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove misc diagnostic files from: " + runDir
-            raise
-            
-    filesCheck = glob.glob(runDir + "/*.LDASOUT_DOMAIN1")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/*.LDASOUT_DOMAIN1"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove LDASOUT files from: " + runDir
-            raise
-    
-    filesCheck = glob.glob(runDir + "/*.CHRTOUT_DOMAIN1")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/*.CHRTOUT_DOMAIN1"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove CHRTOUT files from: " + runDir
-    
-    filesCheck = glob.glob(runDir + "/HYDRO_RST.*")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/HYDRO_RST.*"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove Hydro restart files from: " + runDir
-    
-    filesCheck = glob.glob(runDir + "/RESTART.*_DOMAIN1")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/RESTART.*_DOMAIN1"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove LSM restart files from: " + runDir
-    
-    if os.path.isfile(runDir + "/namelist.hrldas"):
-        try:
-            os.remove(runDir + "/namelist.hrldas")
-        except:
-            jobData.errMsg = "ERROR: Failure to remove: " + runDir + "/namelist.hrldas"
-            raise
-            
-    if os.path.isfile(runDir + "/hydro.namelist"):
+    patternList = list(patterns)
+    if background:
+        patternList.append(CLEANUP_PREFIX + '*')
+    return re.compile('|'.join([fnmatch.translate(patternTmp) for patternTmp in patternList]))
+
+def scanDir(runDir,patterns,background=False):
+    """
+    Generic function to walk a directory with a single os.scandir pass and
+    return the names of all entries matching any of the patterns. Cleanup
+    directories are only returned if background is True.
+    """
+    regex = compilePatterns(patterns,background)
+    matches = []
+    with os.scandir(runDir) as dirEntries:
+        for entry in dirEntries:
+            if regex.match(entry.name):
+                matches.append(entry.name)
+    return matches
+
+def deleteEntry(pathTmp):
+    """
+    Generic function to remove a file, symbolic link or directory.
+    """
+    if os.path.isdir(pathTmp) and not os.path.islink(pathTmp):
+        shutil.rmtree(pathTmp)
+    else:
+        os.unlink(pathTmp)
+
+def cleanDir(jobData,runDir,patterns,background=False):
+    """
+    Generic cleanup engine for model run directories. The directory is scanned
+    once with os.scandir, entries are classified against all patterns at once,
+    and the matches are removed in bulk without spawning any shell processes.
+    If background is True, the matches are first renamed into a hidden
+    cleanup directory inside runDir (a metadata-only operation), and the
+    actual deletion happens in a background thread. The run directory is
+    therefore clean by the time this returns, and the next model launch is
+    not held up by the deletion of large output files.
+    :param patterns: List of shell-style patterns (e.g. '*.LDASOUT_DOMAIN1').
+    :param background: Flag to delete the matched entries in a background thread.
+    :return: Number of entries removed.
+    """
+    if not os.path.isdir(runDir):
+        return 0
+
+    try:
+        matches = scanDir(runDir,patterns,background)
+    except:
+        jobData.errMsg = "ERROR: Unable to scan: " + runDir + " for output to remove."
+        raise
+
+    if len(matches) == 0:
+        return 0
+
+    if not background:
+        for nameTmp in matches:
+            try:
+                deleteEntry(os.path.join(runDir,nameTmp))
+            except FileNotFoundError:
+                continue
+            except:
+                jobData.errMsg = "ERROR: Unable to remove: " + os.path.join(runDir,nameTmp)
+                raise
+        return len(matches)
+
+    try:
+        trashDir = tempfile.mkdtemp(prefix=CLEANUP_PREFIX,dir=runDir)
+    except:
+        jobData.errMsg = "ERROR: Unable to create cleanup directory in: " + runDir
+        raise
+
+    staleDirs = []
+    for nameTmp in matches:
+        if nameTmp.startswith(CLEANUP_PREFIX):
+            # Left behind from a previous interrupted cleanup, unless a thread
+            # of this program is still removing it.
+            pathTmp = os.path.join(runDir,nameTmp)
+            if pathTmp in cleanupThreads and cleanupThreads[pathTmp].is_alive():
+                continue
+            staleDirs.append(pathTmp)
+            continue
         try:
-            os.remove(runDir + "/hydro.namelist")
+            os.rename(os.path.join(runDir,nameTmp),os.path.join(trashDir,nameTmp))
+        except FileNotFoundError:
+            continue
         except:
-            jobData.errMsg = "ERROR: Failure to remove: " + runDir + "/hydro.namelist"
+            jobData.errMsg = "ERROR: Unable to remove: " + os.path.join(runDir,nameTmp)
             raise
-     
-    filesCheck = glob.glob(runDir + "/channel_restart_*")
 
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/channel_restart_*"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove TROUTE restart files from: " + runDir
+    # Forget threads that have finished.
+    for pathTmp in [pathTmp for pathTmp, threadTmp in cleanupThreads.items() if not threadTmp.is_alive()]:
+        del cleanupThreads[pathTmp]
 
-    filesCheck = glob.glob(runDir + "/CHANOBS_DOMAIN*")
+    for pathTmp in [trashDir] + staleDirs:
+        threadTmp = threading.Thread(target=shutil.rmtree,args=(pathTmp,),kwargs={'ignore_errors':True})
+        threadTmp.start()
+        cleanupThreads[pathTmp] = threadTmp
 
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/CHANOBS_DOMAIN*"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove TROUTE CHANOBS files from: " + runDir
+    return len(matches)
 
-    filesCheck = glob.glob(runDir + "/troute*")
+def waitCleanup():
+    """
+    Generic function to block until all background deletions have finished.
+    """
+    while len(cleanupThreads) > 0:
+        cleanupThreads.popitem()[1].join()
 
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/troute*"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove TROUTE flag and status files from: " + runDir
+def removeOutput(jobData,runDir):
+    """
+    Generic function to clean up wrfHydro output. This is used specifically
+    between calibration simulations. Deletion of the output happens in the
+    background so the next simulation can be launched right away.
+    """
+    try:
+        cleanDir(jobData,runDir,OUTPUT_PATTERNS,background=True)
+    except:
+        raise
            
 def cleanCalib(jobData,workDir,runDir):
     """
@@ -275,15 +316,10 @@ def cleanRunDir(jobData,runDir):
     """
     Generic function to clear out any misc old diagnostic files that may be around.
     """
-    filesCheck = glob.glob(runDir + "/diag_hydro.*")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/diag_hydro.*"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove hydro diagnostic files from: " + runDir
-            raise
+    try:
+        cleanDir(jobData,runDir,DIAG_PATTERNS)
+    except:
+        raise
             
 def sendMsg(jobData):
     # Generic function for sending general messages out. This could be useful
@@ -319,68 +355,10 @@ def CleanSpinup(jobData,runDir):
     Generic function to clean up wrfHydro output from the spinup. This will not
     remove RESTART files as those are needed by the calibrations.
     """
-    filesCheck = glob.glob(runDir + "/diag_hydro.*")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/diag_hydro.*"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove hydro diagnostic files from: " + runDir
-            raise
-            
-    filesCheck = glob.glob(runDir + "/*.err")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/*.err"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove error diagnostic files from: " + runDir
-            raise
-            
-    filesCheck = glob.glob(runDir + "/*.out")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/*.out"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove misc diagnostic files from: " + runDir
-            raise
-            
-    filesCheck = glob.glob(runDir + "/*.LDASOUT_DOMAIN1")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/*.LDASOUT_DOMAIN1"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove LDASOUT files from: " + runDir
-            raise
-    
-    filesCheck = glob.glob(runDir + "/*.CHRTOUT_DOMAIN1")
-    
-    if len(filesCheck) > 0:
-        cmd = "rm " + runDir + "/*.CHRTOUT_DOMAIN1"
-        try:
-            subprocess.call(cmd,shell=True)
-        except:
-            jobData.errMsg = "ERROR: Unable to remove CHRTOUT files from: " + runDir
-            
-    if os.path.isfile(runDir + "/namelist.hrldas"):
-        try:
-            os.remove(runDir + "/namelist.hrldas")
-        except:
-            jobData.errMsg = "ERROR: Failure to remove: " + runDir + "/namelist.hrldas"
-            raise
-            
-    if os.path.isfile(runDir + "/hydro.namelist"):
-        try:
-            os.remove(runDir + "/hydro.namelist")
-        except:
-            jobData.errMsg = "ERROR: Failure to remove: " + runDir + "/hydro.namelist"
-            raise
+    try:
+        cleanDir(jobData,runDir,SPINUP_PATTERNS,background=True)
+    except:
+        raise
             
 def check_pid(pid):
      """ Check For the existence of a unix pid. """
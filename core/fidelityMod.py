@@ -0,0 +1,233 @@
+# Module file containing the multi-fidelity screening of calibration
+# simulations. Each candidate parameter set is first scored over a short
+# screening period, running from the beginning of the evaluation period for
+# mfScreenDays days, using the model output written so far. Only candidates
+# whose short-period score is competitive are promoted to the full calibration
+# period, and the others are stopped and recorded as rejected. The promotion
+# threshold is tuned for each basin from the candidates promoted so far, by
+# regressing their full-period objective function (from Calib_Stats) on their
+# short-period score (from Calib_Fidelity). Until there are enough of them,
+# or if the two are poorly correlated, every candidate is promoted.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import datetime
+import os
+import numpy as np
+from core import statusMod
+from core import streamEvalMod
+
+# Streamflow objective functions the short-period score can be computed for.
+SCREEN_OBJ_FUNCS = ['rmse','nse','nselog','nnse','nnsesq','kge','cor']
+
+# Minimum correlation between short and full-period scores for screening.
+MIN_CORR = 0.5
+
+# Number of residual standard deviations a candidate's predicted full-period
+# objective function must be above the best one found so far to be rejected.
+REJECT_SIGMA = 2.0
+
+# Values of the promoted column in Calib_Fidelity.
+REJECTED = 0
+PROMOTED = 1
+PROMOTED_STOPPED = 2
+
+# Iteration screened last for each run directory, and the iteration last
+# checked for in the DB, after the group program was (re)started.
+screenCache = {}
+dbCheckCache = {}
+
+def enabled(staticData):
+    """
+    Generic function to determine if multi-fidelity screening can be used for
+    this job. The short-period score is only computed for streamflow at a
+    single site, for the objective functions listed above.
+    """
+    if int(staticData.mfScreenDays) <= 0:
+        return False
+    if staticData.enableStreamflowCalib != 1 or staticData.enableMultiSites != 0:
+        return False
+    if float(staticData.streamflowWeight) <= 0.0:
+        return False
+    if screenEndDate(staticData) >= staticData.eCalibDate:
+        return False
+    return str(staticData.streamflowObjFunc).lower() in SCREEN_OBJ_FUNCS
+
+def screenEndDate(staticData):
+    """
+    Generic function to return the end of the screening period.
+    """
+    return staticData.bCalibEvalDate + datetime.timedelta(days=int(staticData.mfScreenDays))
+
+def shortObjective(objFn,modVals,obsVals):
+    """
+    Generic function to compute the streamflow objective function over the
+    screening period, from paired model/observed values, in the same form
+    minimized by the R code (1 - metric, or the RMSE).
+    """
+    if len(obsVals) < 2:
+        return None
+    if objFn == 'rmse':
+        return float(np.sqrt(np.mean((modVals - obsVals)**2)))
+    if objFn == 'cor' or objFn == 'kge':
+        if np.std(modVals) <= 0.0 or np.std(obsVals) <= 0.0 or np.mean(obsVals) == 0.0:
+            return None
+        corTmp = np.corrcoef(modVals,obsVals)[0,1]
+        if objFn == 'cor':
+            return float(1.0 - corTmp)
+        alphaTmp = np.std(modVals,ddof=1)/np.std(obsVals,ddof=1)
+        betaTmp = np.mean(modVals)/np.mean(obsVals)
+        return float(np.sqrt((corTmp - 1.0)**2 + (alphaTmp - 1.0)**2 + (betaTmp - 1.0)**2))
+    if objFn == 'nselog':
+        modVals = np.log(modVals + 1.0e-4)
+        obsVals = np.log(obsVals + 1.0e-4)
+    elif objFn == 'nnsesq':
+        modVals = modVals**2
+        obsVals = obsVals**2
+    sst = np.sum((obsVals - obsVals.mean())**2)
+    if sst <= 0.0:
+        return None
+    errTmp = np.sum((modVals - obsVals)**2)/sst
+    if objFn in ['nnse','nnsesq']:
+        # 1 - NNSE = (1 - NSE)/(2 - NSE)
+        errTmp = errTmp/(1.0 + errTmp)
+    return float(errTmp)
+
+def shortScore(staticData,workDir,runDir,linkId):
+    """
+    Generic function to compute the streamflow objective function over the
+    screening period from the model output written so far. None is returned
+    until the model has written output through the end of the screening period.
+    """
+    obsTmp = streamEvalMod.readObs(workDir,int(staticData.dailyAnalysis))
+    if obsTmp is None:
+        return None
+    modTimes, modVals = streamEvalMod.modelSeries(staticData,
+                                                  streamEvalMod.readModel(runDir,linkId,int(staticData.SplitOutputCount)))
+    endTime = streamEvalMod.epochSeconds(screenEndDate(staticData))
+    if len(modTimes) == 0 or modTimes.max() < endTime:
+        return None
+    keepInd = modTimes <= endTime
+    modTimes = modTimes[keepInd]
+    modVals = modVals[keepInd]
+    if int(staticData.dailyAnalysis) == 1:
+        modTimes, modVals = streamEvalMod.dailyMeans(modTimes,modVals)
+
+    posTmp = np.clip(np.searchsorted(obsTmp[0],modTimes),0,len(obsTmp[0])-1)
+    matchInd = (obsTmp[0][posTmp] == modTimes) & ~np.isnan(modVals)
+    return shortObjective(str(staticData.streamflowObjFunc).lower(),modVals[matchInd],obsTmp[1][posTmp[matchInd]])
+
+def fitThreshold(pairs,bestObj,minPairs):
+    """
+    Generic function to fit the full-period objective function of the promoted
+    candidates against their weighted short-period score. Returns the fit
+    (intercept, slope, residual standard deviation) and the short-period score
+    above which a candidate is rejected, or None if there are not enough
+    candidates, or the scores are poorly correlated.
+    """
+    pairTmp = np.array([[float(p[0]),float(p[1])] for p in pairs if p[0] is not None and p[1] is not None],
+                       dtype=np.float64).reshape(-1,2)
+    pairTmp = pairTmp[np.isfinite(pairTmp).all(axis=1) & (pairTmp[:,1] != -9999.0)]
+    if len(pairTmp) < max(int(minPairs),3):
+        return None
+    if np.std(pairTmp[:,0]) <= 0.0 or np.std(pairTmp[:,1]) <= 0.0:
+        return None
+    corTmp = np.corrcoef(pairTmp[:,0],pairTmp[:,1])[0,1]
+    if not np.isfinite(corTmp) or corTmp < MIN_CORR:
+        return None
+    slope, intercept = np.polyfit(pairTmp[:,0],pairTmp[:,1],1)
+    if slope <= 0.0:
+        return None
+    residTmp = pairTmp[:,1] - (intercept + slope*pairTmp[:,0])
+    sdTmp = np.sqrt(np.sum(residTmp**2)/(len(pairTmp) - 2))
+    threshold = (bestObj + REJECT_SIGMA*sdTmp - intercept)/slope
+    return intercept, slope, sdTmp, threshold
+
+def checkScreening(jobData,staticData,db,gageID,gageMeta,basinNum,iteration,workDir,runDir):
+    """
+    Generic function to screen a running calibration simulation, once the
+    model has written output through the end of the screening period. The
+    short-period score is recorded in Calib_Fidelity. If the candidate is
+    not promoted, the early stop flag is left for the R code, holding the
+    predicted full-period objective function, and the simulation is stopped.
+    Returns True if the simulation was stopped.
+    """
+    if iteration == 0 or not enabled(staticData):
+        return False
+    if screenCache.get(runDir) == iteration:
+        return False
+    if dbCheckCache.get(runDir) != iteration:
+        try:
+            if db.fidelityScreened(jobData,int(jobData.jobID),int(gageID),int(iteration)):
+                screenCache[runDir] = iteration
+                return False
+        except:
+            raise
+        dbCheckCache[runDir] = iteration
+
+    scoreTmp = shortScore(staticData,workDir,runDir,int(gageMeta.comID))
+    if scoreTmp is None or not np.isfinite(scoreTmp):
+        return False
+    # Weighted the same as in the combined objective function.
+    scoreTmp = float(staticData.streamflowWeight)*scoreTmp
+
+    try:
+        bestObj = db.bestObjective(jobData,int(jobData.jobID),int(gageID))
+        pairs = db.fidelityPairs(jobData,int(jobData.jobID),int(gageID))
+    except:
+        raise
+    fitTmp = None
+    if bestObj is not None:
+        fitTmp = fitThreshold(pairs,bestObj,int(staticData.mfMinPairs))
+
+    if fitTmp is None:
+        predictedObj = None
+        threshold = None
+        promoteFlag = PROMOTED
+    else:
+        predictedObj = fitTmp[0] + fitTmp[1]*scoreTmp
+        threshold = fitTmp[3]
+        promoteFlag = PROMOTED if scoreTmp <= threshold else REJECTED
+
+    try:
+        db.logFidelity(jobData,int(jobData.jobID),int(gageID),int(iteration),scoreTmp,predictedObj,
+                       threshold,promoteFlag)
+    except:
+        raise
+    screenCache[runDir] = iteration
+    if promoteFlag == PROMOTED:
+        print("SHORT-PERIOD SCORE: " + str(scoreTmp) + " PROMOTING TO FULL CALIBRATION PERIOD")
+        return False
+
+    print("SHORT-PERIOD SCORE: " + str(scoreTmp) + " ABOVE THRESHOLD: " + str(threshold) + \
+          ". PREDICTED OBJECTIVE FUNCTION: " + str(predictedObj) + " STOPPING SIMULATION")
+    flagPath = workDir + "/" + streamEvalMod.EARLY_STOP_FLAG
+    try:
+        with open(flagPath + ".TMP",'w') as fileObj:
+            fileObj.write(repr(float(predictedObj)/float(staticData.streamflowWeight)) + "\n")
+        os.replace(flagPath + ".TMP",flagPath)
+    except:
+        jobData.errMsg = "ERROR: Unable to create early stop flag: " + flagPath
+        raise
+
+    try:
+        statusMod.killBasJob(jobData,basinNum)
+    except:
+        raise
+    streamEvalMod.modelCache.pop(runDir,None)
+    return True
+
+def markStopped(jobData,staticData,db,gageID,iteration):
+    """
+    Generic function to record that a promoted candidate was stopped early
+    by the streaming evaluator, so its objective function value is not used
+    when tuning the promotion threshold.
+    """
+    if not enabled(staticData):
+        return
+    try:
+        db.markFidelityStopped(jobData,int(jobData.jobID),int(gageID),int(iteration))
+    except:
+        raise
@@ -6,6 +6,7 @@
 # Research Applications Laboratory
 
 import os
+from core import retentionMod
 
 import warnings
 warnings.filterwarnings("ignore")
@@ -45,6 +46,10 @@ def createHrldasNL(statusData,gageData,jobData,outDir,typeFlag,bDate,eDate,genFl
             minOutFlag = 1
     else:
         minOutFlag = 0
+
+    # Pull the output retention policy, which limits the land output to the
+    # cadence the evaluation reads.
+    policy = retentionMod.getPolicy(jobData,genFlag)
         
     # Write each line of the expected hrldas.namelist file.
     try:
@@ -172,7 +177,7 @@ def createHrldasNL(statusData,gageData,jobData,outDir,typeFlag,bDate,eDate,genFl
             # Produce minimal monthly outputs
             inStr = ' OUTPUT_TIMESTEP = 2592000\n'
         else:
-            inStr = ' OUTPUT_TIMESTEP = ' + str(jobData.lsmOutDt) + '\n'
+            inStr = ' OUTPUT_TIMESTEP = ' + str(retentionMod.lsmOutputTimestep(jobData,policy,bDate)) + '\n'
         fileObj.write(inStr)
         fileObj.write('\n')
         fileObj.write(' ! Land surface model restart file write frequency\n')
@@ -268,6 +273,10 @@ def createHydroNL(statusData,gageData,jobData,outDir,typeFlag,bDate,eDate,genFla
             minOutFlag = 1
     else:
         minOutFlag = 0
+
+    # Pull the output retention policy, which turns off output types the
+    # evaluation does not read.
+    policy = retentionMod.getPolicy(jobData,genFlag)
         
     # Write each line of the hydro namelist file.
     try:
@@ -500,27 +509,27 @@ def createHydroNL(statusData,gageData,jobData,outDir,typeFlag,bDate,eDate,genFla
             inStr = ' frxst_pts_out = 0 ! ASCII text file of forecast points or gage points (defined in Routelink)\n'
             fileObj.write(inStr)
         else:
-            inStr = ' CHRTOUT_DOMAIN = ' + str(jobData.chrtoutDomain) + ' ! Netcdf point timeseries output at all channel points (1d)\n'
+            inStr = ' CHRTOUT_DOMAIN = ' + str(retentionMod.outputFlag(policy,'CHRTOUT',jobData.chrtoutDomain)) + ' ! Netcdf point timeseries output at all channel points (1d)\n'
             fileObj.write(inStr)
             fileObj.write('                   ! 0 = no output, 1 = output\n')
-            inStr = ' CHANOBS_DOMAIN = ' + str(jobData.chanObs) + ' ! Netcdf point timeseries at forecast points or gage points (defined in Routelink)\n'
+            inStr = ' CHANOBS_DOMAIN = ' + str(retentionMod.outputFlag(policy,'CHANOBS',jobData.chanObs)) + ' ! Netcdf point timeseries at forecast points or gage points (defined in Routelink)\n'
             fileObj.write(inStr)
             fileObj.write('              ! 0 = no output, 1 = output at forecast points or gage points\n')
             inStr = ' CHRTOUT_GRID = ' + str(jobData.chrtoutGrid) + ' ! Netcdf grid of channel streamflow values (2d)' + '\n'
             fileObj.write(inStr)
             fileObj.write('              ! 0 = no output, 1 = output\n')
             fileObj.write('              ! NOTE: Not available with reach-based routing\n')
-            inStr = ' LSMOUT_DOMAIN = ' + str(jobData.lsmDomain) + ' ! Netcdf grid of variables passed between LSM and routing components\n'
+            inStr = ' LSMOUT_DOMAIN = ' + str(retentionMod.outputFlag(policy,'LSMOUT',jobData.lsmDomain)) + ' ! Netcdf grid of variables passed between LSM and routing components\n'
             fileObj.write(inStr)
             fileObj.write('              ! 0 = no output, 1 = output\n')
             fileObj.write('              ! NOTE: No scale_factor/add_offset available\n')
-            inStr = ' RTOUT_DOMAIN = ' + str(jobData.rtoutDomain) + ' ! Netcdf grid of terrain routing variables on routing grid\n'
+            inStr = ' RTOUT_DOMAIN = ' + str(retentionMod.outputFlag(policy,'RTOUT',jobData.rtoutDomain)) + ' ! Netcdf grid of terrain routing variables on routing grid\n'
             fileObj.write(inStr)
             fileObj.write('              ! 0 = no output, 1 = output\n')
-            inStr = ' output_gw = ' + str(jobData.gwOut) + ' ! Netcdf point of GW buckets\n'
+            inStr = ' output_gw = ' + str(retentionMod.outputFlag(policy,'GWOUT',jobData.gwOut)) + ' ! Netcdf point of GW buckets\n'
             fileObj.write(inStr)
             fileObj.write('              ! 0 = no output, 1 = output\n')
-            inStr = ' outlake = ' + str(jobData.lakeOut) + ' ! Netcdf point file of lakes (1d)\n'
+            inStr = ' outlake = ' + str(retentionMod.outputFlag(policy,'LAKEOUT',jobData.lakeOut)) + ' ! Netcdf point file of lakes (1d)\n'
             fileObj.write(inStr)
             fileObj.write('              ! 0 = no output, 1 = output\n')
             inStr = ' frxst_pts_out = ' + str(jobData.frxstPts) + ' ! ASCII text file of forecast points or gage points (defined in Routelink)\n'
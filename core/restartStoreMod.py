@@ -0,0 +1,279 @@
+# Module file containing the shared spinup restart store. A spinup is fully
+# determined by the basin domain files, the forcing, the model binary, the
+# parameter tables, the physics options and the spinup dates. A key is
+# composed by hashing all of these, and the restart files of a completed
+# spinup are published to the store under that key. Other jobs, in the same
+# DB or not, with the same key link the spinup state from the store and skip
+# the spinup entirely. Entries are published by copying the restart files
+# into a temporary directory in the store, which is then renamed into place,
+# so an entry is either complete or not there at all.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import configparser
+import hashlib
+import json
+import os
+import shutil
+import time
+from core import calibIoMod
+import warnings
+warnings.filterwarnings("ignore")
+
+# Incremented whenever the composition of the key changes.
+STORE_VERSION = 1
+
+# File left in the spinup directory once its restart files have been
+# published, or found to already be in the store.
+PUBLISHED_FLAG = "RESTART_STORE.PUBLISHED"
+
+# Sections of the configuration file holding the options that control the
+# model physics during the spinup.
+PHYSICS_SECTIONS = ['lsmPhysics','crocus','forcing','modelTime','hydroPhysics']
+
+# Basin domain files, by their gageMeta attribute.
+DOMAIN_FILES = ['geoFile','landSpatialMeta','fullDom','rtLnk','lkFile','gwFile','gwMask',
+                'udMap','wrfInput','soilFile','hydroSpatial','chanParmFile']
+
+# Hash of each file read so far, keyed by path, along with the size and
+# modification time the hash was computed for.
+fileHashes = {}
+
+def enabled(staticData):
+    """
+    Generic function to determine if the restart store has been turned on.
+    It is not used for cold starts, or optional spinup files, nor when t-route
+    is ran over the spinup, as only the model restart files are stored.
+    """
+    if len(str(staticData.restartStore)) == 0:
+        return False
+    return staticData.coldStart == 0 and staticData.optSpinFlag == 0 and staticData.trouteFlag == 0
+
+def hashFile(pathIn):
+    """
+    Generic function to compute the SHA-256 hash of the content of a file.
+    Hashes are kept in memory, and only recomputed if the file changes.
+    """
+    realPath = os.path.realpath(pathIn)
+    statTmp = os.stat(realPath)
+    stampTmp = [statTmp.st_size,statTmp.st_mtime]
+    if realPath in fileHashes and fileHashes[realPath][0] == stampTmp:
+        return fileHashes[realPath][1]
+    hashTmp = hashlib.sha256()
+    with open(realPath,'rb') as fileObj:
+        for chunkTmp in iter(lambda: fileObj.read(1048576),b''):
+            hashTmp.update(chunkTmp)
+    fileHashes[realPath] = [stampTmp,hashTmp.hexdigest()]
+    return fileHashes[realPath][1]
+
+def hashForcing(forceDir):
+    """
+    Generic function to compute a hash of the forcing directory. The forcing
+    is too large to be read, so the names and sizes of the files are hashed
+    instead.
+    """
+    hashTmp = hashlib.sha256()
+    nameList = sorted(os.listdir(forceDir))
+    for nameTmp in nameList:
+        try:
+            sizeTmp = os.stat(os.path.join(forceDir,nameTmp)).st_size
+        except OSError:
+            continue
+        hashTmp.update((nameTmp + ":" + str(sizeTmp) + "\n").encode('utf-8'))
+    return hashTmp.hexdigest()
+
+def physicsOptions(configPath):
+    """
+    Generic function to pull the physics options from the configuration file,
+    as a sorted list of [section,option,value] entries.
+    """
+    parser = configparser.RawConfigParser()
+    parser.optionxform = str
+    parser.read(configPath)
+    optionsOut = []
+    for sectionTmp in PHYSICS_SECTIONS:
+        if not parser.has_section(sectionTmp):
+            continue
+        for optionTmp, valueTmp in sorted(parser.items(sectionTmp)):
+            optionsOut.append([sectionTmp,optionTmp,valueTmp.strip()])
+    return optionsOut
+
+def storeKey(jobData,staticData,gageMeta):
+    """
+    Generic function to compose the restart store key for the spinup of a
+    basin. Along with the key, a description of the inputs is returned,
+    which is written with the published entry.
+    """
+    inputs = {}
+    inputs['version'] = STORE_VERSION
+    inputs['spinDates'] = [jobData.bSpinDate.strftime('%Y%m%d%H'),jobData.eSpinDate.strftime('%Y%m%d%H')]
+    # Spinups ended early by the equilibrium check produce different states.
+    inputs['spinEquil'] = [float(staticData.spinEquilTol),int(staticData.spinEquilMinYears)]
+    inputs['exe'] = hashFile(str(staticData.exe))
+    inputs['tables'] = {}
+    for tblTmp in ['genParmTbl','mpParmTbl','soilParmTbl','urbParmTbl','vegParmTbl']:
+        pathTmp = str(getattr(staticData,tblTmp))
+        if len(pathTmp) > 0:
+            inputs['tables'][tblTmp] = hashFile(pathTmp)
+    inputs['domain'] = {}
+    for attrTmp in DOMAIN_FILES:
+        pathTmp = str(getattr(gageMeta,attrTmp))
+        if pathTmp != "-9999" and len(pathTmp) > 0 and os.path.isfile(pathTmp):
+            inputs['domain'][attrTmp] = hashFile(pathTmp)
+    inputs['forcing'] = hashForcing(str(gageMeta.forceDir))
+    inputs['physics'] = physicsOptions(str(jobData.jobDir) + "/setup.config")
+
+    keyTmp = hashlib.sha256(json.dumps(inputs,sort_keys=True).encode('utf-8')).hexdigest()
+    return keyTmp, inputs
+
+def restartNames(jobData):
+    """
+    Generic function to return the names of the LSM and hydro restart files
+    at the end of the spinup.
+    """
+    lsmName = "RESTART." + jobData.eSpinDate.strftime('%Y%m%d') + "00_DOMAIN1"
+    hydroName = "HYDRO_RST." + jobData.eSpinDate.strftime('%Y-%m-%d') + "_00:00_DOMAIN1"
+    return lsmName, hydroName
+
+def entryDir(staticData,keyTmp):
+    """
+    Generic function to return the directory of a restart store entry.
+    """
+    return str(staticData.restartStore) + "/" + keyTmp[0:2] + "/" + keyTmp
+
+def spinupState(jobData,gage):
+    """
+    Generic function to return the paths to the spinup restart files of a
+    basin. If the spinup state was linked from the restart store, the paths
+    to the files in the store are returned, so simulations link to them directly.
+    """
+    lsmName, hydroName = restartNames(jobData)
+    spinDir = jobData.jobDir + "/" + gage + "/RUN.SPINUP/OUTPUT/"
+    return os.path.realpath(spinDir + lsmName), os.path.realpath(spinDir + hydroName)
+
+def linkStored(jobData,staticData,gageMeta,runDir):
+    """
+    Generic function to look up the spinup of a basin in the restart store.
+    If found, the restart files are linked into the spinup run directory,
+    which completes the spinup. Returns True if the spinup state was found.
+    """
+    if not enabled(staticData):
+        return False
+    try:
+        keyTmp, inputs = storeKey(jobData,staticData,gageMeta)
+    except:
+        jobData.errMsg = "ERROR: Unable to compose the restart store key for gage: " + str(gageMeta.gage)
+        raise
+    storeDir = entryDir(staticData,keyTmp)
+    lsmName, hydroName = restartNames(jobData)
+    if not os.path.isfile(storeDir + "/" + lsmName) or not os.path.isfile(storeDir + "/" + hydroName):
+        return False
+
+    for nameTmp in [lsmName,hydroName]:
+        linkTmp = runDir + "/" + nameTmp
+        try:
+            if os.path.islink(linkTmp) or os.path.isfile(linkTmp):
+                os.remove(linkTmp)
+            os.symlink(storeDir + "/" + nameTmp,linkTmp)
+        except:
+            jobData.errMsg = "ERROR: Failure to link: " + linkTmp + " to the restart store."
+            raise
+    print("SPINUP STATE FOR GAGE: " + str(gageMeta.gage) + " FOUND IN RESTART STORE: " + storeDir)
+    return True
+
+def publish(jobData,staticData,gageMeta,runDir):
+    """
+    Generic function to publish the restart files of a completed spinup to
+    the restart store. Nothing is done if the entry already exists, or if
+    the spinup state was itself linked from the store. Once done, a flag is
+    left in the spinup directory, so the key (which lists the forcing
+    directory) is not composed again on later passes.
+    """
+    if not enabled(staticData):
+        return
+    lsmName, hydroName = restartNames(jobData)
+    if os.path.islink(runDir + "/" + lsmName) and os.path.islink(runDir + "/" + hydroName):
+        return
+    flagPath = os.path.dirname(runDir) + "/" + PUBLISHED_FLAG
+    try:
+        if os.stat(flagPath).st_mtime >= os.stat(runDir + "/" + lsmName).st_mtime:
+            return
+    except OSError:
+        pass
+    try:
+        keyTmp, inputs = storeKey(jobData,staticData,gageMeta)
+    except:
+        jobData.errMsg = "ERROR: Unable to compose the restart store key for gage: " + str(gageMeta.gage)
+        raise
+    storeDir = entryDir(staticData,keyTmp)
+    if os.path.isdir(storeDir):
+        markPublished(jobData,flagPath,storeDir)
+        return
+
+    tmpDir = os.path.dirname(storeDir) + "/." + keyTmp + ".TMP." + str(os.getpid())
+    try:
+        os.makedirs(tmpDir)
+        for nameTmp in [lsmName,hydroName]:
+            shutil.copy2(os.path.realpath(runDir + "/" + nameTmp),tmpDir + "/" + nameTmp)
+        entryMeta = {'jobID':int(jobData.jobID),'gage':str(gageMeta.gage),'time':time.time(),'inputs':inputs}
+        with open(tmpDir + "/ENTRY.json",'w') as fileObj:
+            json.dump(entryMeta,fileObj,indent=1)
+    except:
+        shutil.rmtree(tmpDir,ignore_errors=True)
+        jobData.errMsg = "ERROR: Unable to publish the spinup state for gage: " + str(gageMeta.gage) + \
+                         " to the restart store: " + storeDir
+        raise
+
+    try:
+        os.rename(tmpDir,storeDir)
+    except OSError:
+        # Published by another job in the meantime.
+        shutil.rmtree(tmpDir,ignore_errors=True)
+        markPublished(jobData,flagPath,storeDir)
+        return
+    markPublished(jobData,flagPath,storeDir)
+    print("SPINUP STATE FOR GAGE: " + str(gageMeta.gage) + " PUBLISHED TO RESTART STORE: " + storeDir)
+
+def markPublished(jobData,flagPath,storeDir):
+    """
+    Generic function to leave the flag marking a spinup as published, holding
+    the store entry it was published to.
+    """
+    try:
+        with open(flagPath,'w') as fileObj:
+            fileObj.write(storeDir + "\n")
+    except:
+        jobData.errMsg = "ERROR: Unable to create flag: " + flagPath
+        raise
+
+def prefillGroups(jobData,staticData,db,flagPaths):
+    """
+    Generic function for the spinup orchestrator to link the spinup state of
+    each basin found in the restart store before any group is scheduled.
+    Groups with every basin found are flagged as complete.
+    """
+    if not enabled(staticData):
+        return
+    groupFound = {}
+    for basinTmp in range(0,len(jobData.gages)):
+        gageTmp = str(jobData.gages[basinTmp])
+        groupTmp = int(jobData.gageGroup[basinTmp])
+        gageMeta = calibIoMod.gageMeta()
+        try:
+            gageMeta.pullGageMeta(jobData,db,gageTmp,jobData.gageIDs[basinTmp])
+        except:
+            raise
+        runDir = jobData.jobDir + "/" + gageTmp + "/RUN.SPINUP/OUTPUT"
+        foundTmp = linkStored(jobData,staticData,gageMeta,runDir)
+        groupFound[groupTmp] = groupFound.get(groupTmp,True) and foundTmp
+
+    for groupTmp, foundTmp in groupFound.items():
+        if foundTmp and not os.path.isfile(flagPaths[groupTmp]):
+            try:
+                open(flagPaths[groupTmp],'a').close()
+            except:
+                jobData.errMsg = "ERROR: Unable to create complete flag: " + flagPaths[groupTmp]
+                raise
+            print("SPINUP FOR BASIN GROUP: " + str(groupTmp) + " FOUND IN RESTART STORE")
@@ -0,0 +1,254 @@
+# Module file containing the functions to cut basin restart states out of
+# the LSM (RESTART) and hydro (HYDRO_RST) restart files of a parent domain,
+# such as a regional spinup. Gridded fields are cut using the geo/hydro
+# extents of each basin in the Domain_Meta table, which are 1-based,
+# inclusive indices into the parent land and routing grids, counted from
+# the south-west corner. Channel, lake and groundwater bucket fields are
+# remapped from the parent to the basin by matching the IDs in the RouteLink,
+# LAKEPARM and GWBUCKPARM files of each.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import os
+import numpy as np
+from netCDF4 import Dataset
+import warnings
+warnings.filterwarnings("ignore")
+
+# Grid dimensions of the restart files, along with the extents (west, east,
+# south, north) used to cut each.
+LAND_DIMS = {'south_north':'sn','west_east':'we','iy':'sn','ix':'we'}
+ROUTING_DIMS = {'iyrt':'sn','ixrt':'we'}
+
+# Dimensions of the hydro restart files indexed by channel reach, lake and
+# groundwater bucket, along with the variables holding the IDs of each in the
+# parameter files.
+ID_DIMS = {'links':['link'],'lakes':['lake_id'],'basns':['ComID','Basin']}
+
+# Staggered grid dimensions in the global attributes of the LSM restart files.
+GRID_ATTS = {'WEST-EAST_GRID_DIMENSION':'we','SOUTH-NORTH_GRID_DIMENSION':'sn'}
+
+# IDs read from parent domain parameter files, keyed by path, so each worker
+# process only reads them once.
+parentCache = {}
+
+def gridSlices(west,east,south,north):
+    """
+    Generic function to convert the 1-based, inclusive extents of a basin
+    into slices of the parent grid.
+    """
+    if west < 1 or south < 1 or east < west or north < south:
+        raise ValueError("Invalid extents: " + str([west,east,south,north]))
+    return {'we':slice(int(west)-1,int(east)),'sn':slice(int(south)-1,int(north))}
+
+def readIds(pathIn,varNames):
+    """
+    Generic function to read the IDs from a parameter file, from the first
+    of the variable names found.
+    """
+    idTmp = Dataset(pathIn,'r')
+    try:
+        for varTmp in varNames:
+            if varTmp in idTmp.variables.keys():
+                return np.asarray(idTmp.variables[varTmp][:]).astype(np.int64).ravel()
+    finally:
+        idTmp.close()
+    raise ValueError("None of: " + str(varNames) + " found in: " + pathIn)
+
+def parentIds(pathIn,varNames):
+    """
+    Generic function to read the IDs from a parent domain parameter file,
+    using the IDs already read by this process if possible.
+    """
+    if pathIn not in parentCache:
+        parentCache[pathIn] = readIds(pathIn,varNames)
+    return parentCache[pathIn]
+
+def idIndex(parentId,basinId):
+    """
+    Generic function to find the position of each basin ID in the parent IDs.
+    Raises a ValueError if any of the basin IDs are missing from the parent.
+    """
+    orderTmp = np.argsort(parentId,kind='stable')
+    sortTmp = parentId[orderTmp]
+    posTmp = np.clip(np.searchsorted(sortTmp,basinId),0,max(len(sortTmp)-1,0))
+    if len(sortTmp) == 0:
+        foundTmp = np.zeros(len(basinId),dtype=bool)
+    else:
+        foundTmp = sortTmp[posTmp] == basinId
+    if not foundTmp.all():
+        raise ValueError(str(int((~foundTmp).sum())) + " of " + str(len(basinId)) + \
+                         " IDs not found in the parent domain, including: " + str(basinId[~foundTmp][0]))
+    return orderTmp[posTmp]
+
+def subsetVariable(varIn,dims,landSlices,routingSlices,idIndices):
+    """
+    Generic function to cut a variable down to a basin. Gridded dimensions
+    are sliced, which only reads the basin from the parent file, and ID
+    dimensions are remapped afterwards. Works on netCDF variables or arrays.
+    """
+    readTmp = []
+    for dimTmp in dims:
+        if dimTmp in LAND_DIMS:
+            readTmp.append(landSlices[LAND_DIMS[dimTmp]])
+        elif dimTmp in ROUTING_DIMS:
+            readTmp.append(routingSlices[ROUTING_DIMS[dimTmp]])
+        else:
+            readTmp.append(slice(None))
+    if len(dims) == 0:
+        dataOut = varIn[...]
+    else:
+        dataOut = varIn[tuple(readTmp)]
+    for axisTmp, dimTmp in enumerate(dims):
+        if dimTmp in idIndices:
+            dataOut = np.take(dataOut,idIndices[dimTmp],axis=axisTmp)
+    return dataOut
+
+def dimSize(dimName,dimLen,landSlices,routingSlices,idIndices):
+    """
+    Generic function to return the size of a dimension after subsetting.
+    """
+    if dimName in LAND_DIMS:
+        return len(range(*landSlices[LAND_DIMS[dimName]].indices(dimLen)))
+    if dimName in ROUTING_DIMS:
+        return len(range(*routingSlices[ROUTING_DIMS[dimName]].indices(dimLen)))
+    if dimName in idIndices:
+        return len(idIndices[dimName])
+    return dimLen
+
+def subsetFile(inPath,outPath,landSlices,routingSlices,idIndices,dropDims):
+    """
+    Generic function to write a basin restart file cut out of a parent
+    restart file. Variables along any of dropDims are left out. The file is
+    written under a temporary name, and renamed once complete.
+    """
+    tmpPath = outPath + ".TMP"
+    idIn = Dataset(inPath,'r')
+    try:
+        idIn.set_auto_maskandscale(False)
+        idOut = Dataset(tmpPath,'w',format=idIn.data_model)
+        try:
+            for dimName, dimObj in idIn.dimensions.items():
+                if dimName in dropDims:
+                    continue
+                if dimObj.isunlimited():
+                    idOut.createDimension(dimName,None)
+                else:
+                    sizeTmp = dimSize(dimName,len(dimObj),landSlices,routingSlices,idIndices)
+                    if sizeTmp == 0:
+                        raise ValueError("Dimension: " + dimName + " is empty for the basin.")
+                    idOut.createDimension(dimName,sizeTmp)
+
+            attsTmp = {k: idIn.getncattr(k) for k in idIn.ncattrs()}
+            for attName, extTmp in GRID_ATTS.items():
+                if attName in attsTmp:
+                    sliceTmp = landSlices[extTmp]
+                    attsTmp[attName] = np.int32(sliceTmp.stop - sliceTmp.start + 1)
+            idOut.setncatts(attsTmp)
+
+            for varName, varIn in idIn.variables.items():
+                if any(dimTmp in dropDims for dimTmp in varIn.dimensions):
+                    continue
+                attsTmp = {k: varIn.getncattr(k) for k in varIn.ncattrs()}
+                fillTmp = attsTmp.pop('_FillValue',None)
+                varOut = idOut.createVariable(varName,varIn.datatype,varIn.dimensions,fill_value=fillTmp)
+                varOut.set_auto_maskandscale(False)
+                varOut.setncatts(attsTmp)
+                varOut[...] = subsetVariable(varIn,varIn.dimensions,landSlices,routingSlices,idIndices)
+        finally:
+            idOut.close()
+    except:
+        if os.path.isfile(tmpPath):
+            os.remove(tmpPath)
+        raise
+    finally:
+        idIn.close()
+    os.replace(tmpPath,outPath)
+
+def checkShape(inPath,landSlices,routingSlices,landShape,routingShape):
+    """
+    Generic function to check the extents of a basin against the size of the
+    parent grids, and the size of the basin grids (nx,ny) if known.
+    """
+    idIn = Dataset(inPath,'r')
+    try:
+        dimsIn = {k: len(v) for k, v in idIn.dimensions.items()}
+    finally:
+        idIn.close()
+    for dimName, extTmp in list(LAND_DIMS.items()) + list(ROUTING_DIMS.items()):
+        if dimName not in dimsIn:
+            continue
+        slicesTmp = landSlices if dimName in LAND_DIMS else routingSlices
+        shapeTmp = landShape if dimName in LAND_DIMS else routingShape
+        if slicesTmp[extTmp].stop > dimsIn[dimName]:
+            raise ValueError("Extents beyond the parent grid along: " + dimName + " in: " + inPath)
+        expectTmp = shapeTmp[0] if extTmp == 'we' else shapeTmp[1]
+        if expectTmp is not None and slicesTmp[extTmp].stop - slicesTmp[extTmp].start != int(expectTmp):
+            raise ValueError("Extents along: " + dimName + " do not match the basin grid size: " + str(expectTmp))
+
+def subsetBasin(basinInfo,parentInfo,strict=False):
+    """
+    Generic function to cut the restart state of a single basin out of the
+    parent restart files. basinInfo holds the basin extents, grid sizes and
+    parameter files, and parentInfo the parent restart and parameter files.
+    If the basin has no parameter file for channel, lake or groundwater
+    bucket variables in the parent hydro restart file, those variables are
+    left out, or with strict, the basin is not written. The model will not
+    start from a restart file missing them, so strict is used when writing
+    straight into a calibration job. Returns a list of warning messages and
+    an error message (None if the basin was written). This is ran in worker
+    processes, so nothing is printed here.
+    """
+    warnList = []
+    gageTmp = str(basinInfo['gage_id'])
+    try:
+        landSlices = gridSlices(basinInfo['geo_w'],basinInfo['geo_e'],basinInfo['geo_s'],basinInfo['geo_n'])
+        routingSlices = gridSlices(basinInfo['hyd_w'],basinInfo['hyd_e'],basinInfo['hyd_s'],basinInfo['hyd_n'])
+    except ValueError as e:
+        return [warnList,"ERROR: Basin: " + gageTmp + " " + str(e)]
+
+    outDir = str(basinInfo['out_dir'])
+    if not os.path.isdir(outDir):
+        return [warnList,"ERROR: Output directory: " + outDir + " not found for basin: " + gageTmp]
+
+    # Remap the channel, lake and groundwater bucket fields through the IDs
+    # in the parameter files of the parent and basin domains.
+    idIndices = {}
+    dropDims = []
+    idHydro = Dataset(parentInfo['hydro_rst'],'r')
+    try:
+        hydroDims = list(idHydro.dimensions.keys())
+    finally:
+        idHydro.close()
+    for dimName, fileKey in [['links','rtlink_file'],['lakes','lake_file'],['basns','gw_file']]:
+        if dimName not in hydroDims:
+            continue
+        basinPath = str(basinInfo[fileKey])
+        if basinPath == '-9999' or not basinPath.endswith('.nc'):
+            if strict:
+                return [warnList,"ERROR: No " + fileKey + " netCDF file for basin: " + gageTmp + \
+                                 " to remap restart variables along: " + dimName]
+            warnList.append("WARNING: No " + fileKey + " netCDF file for basin: " + gageTmp + \
+                            ". Leaving out restart variables along: " + dimName)
+            dropDims.append(dimName)
+            continue
+        if parentInfo[fileKey] is None:
+            return [warnList,"ERROR: A parent " + fileKey + " is needed to remap: " + dimName]
+        try:
+            idIndices[dimName] = idIndex(parentIds(parentInfo[fileKey],ID_DIMS[dimName]),
+                                         readIds(basinPath,ID_DIMS[dimName]))
+        except Exception as e:
+            return [warnList,"ERROR: Unable to remap: " + dimName + " for basin: " + gageTmp + " " + str(e)]
+
+    landShape = [basinInfo.get('land_nx'),basinInfo.get('land_ny')]
+    routingShape = [basinInfo.get('hydro_nx'),basinInfo.get('hydro_ny')]
+    for inPath in [parentInfo['lsm_rst'],parentInfo['hydro_rst']]:
+        outPath = outDir + "/" + os.path.basename(inPath)
+        try:
+            checkShape(inPath,landSlices,routingSlices,landShape,routingShape)
+            subsetFile(inPath,outPath,landSlices,routingSlices,idIndices,dropDims)
+        except Exception as e:
+            return [warnList,"ERROR: Unable to create: " + outPath + " for basin: " + gageTmp + " " + str(e)]
+    return [warnList,None]
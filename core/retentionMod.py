@@ -0,0 +1,320 @@
+# Module file for the model output retention policy. The policy decides
+# which output types the namelists request, at what cadence, and which
+# files are kept in a run directory while a simulation is running. The
+# policy is derived from what the R evaluation code actually reads:
+# - CHANOBS files for streamflow (calibration, validation, sensitivity).
+# - LDASOUT files at hour 06 for snow (SNEQV).
+# - LDASOUT files at hours 00 and 12 for soil moisture (SOIL_M).
+# A lightweight watcher thread per run directory enforces the policy while
+# the model runs. Older restart files are removed, LDASOUT files for hours
+# that are not evaluated are removed, and the files that are kept are
+# reduced down to the variables the evaluation reads (extract-then-delete).
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import os
+import re
+import math
+import threading
+from netCDF4 import Dataset
+from core import errMod
+from core import spinEquilMod
+import warnings
+warnings.filterwarnings("ignore")
+
+# Output types that can be controlled by the retention policy, along with
+# the shell-style pattern of the files produced by the model.
+OUTPUT_TYPES = {'LDASOUT': '*.LDASOUT_DOMAIN1',
+                'CHANOBS': '*.CHANOBS_DOMAIN1',
+                'CHRTOUT': '*.CHRTOUT_DOMAIN1',
+                'RTOUT': '*.RTOUT_DOMAIN1',
+                'LSMOUT': '*.LSMOUT_DOMAIN1',
+                'GWOUT': '*.GWOUT_DOMAIN1',
+                'LAKEOUT': '*.LAKEOUT_DOMAIN1'}
+
+# Coordinate/time variables always carried over when a kept file is reduced.
+COORD_VARS = ['time','Times','reference_time','x','y','crs']
+
+# Regular expressions for restart files. Groups pull out the valid time.
+LSM_RST_REGEX = re.compile(r'^RESTART\.(\d{10})_DOMAIN1$')
+HYDRO_RST_REGEX = re.compile(r'^HYDRO_RST\.(\d{4})-(\d{2})-(\d{2})_(\d{2}):00_DOMAIN1$')
+
+# Regular expression for split output files (YYYYMMDDHHMM.TYPE_DOMAIN1).
+OUTPUT_REGEX = re.compile(r'^(\d{12})\.([A-Z]+)_DOMAIN1$')
+
+# Active watchers keyed by run directory.
+watchers = {}
+
+class retentionPolicy:
+    def __init__(self):
+        # Initialize object to hold the output retention policy for a
+        # simulation.
+        self.enabled = False
+        self.keepTypes = []
+        self.retainTypes = []
+        self.ldasHours = []
+        self.extractVars = {}
+        self.nRestarts = 2
+        self.keepRstTimes = []
+
+def getPolicy(jobData,genFlag):
+    """
+    Generic function to build the output retention policy for a simulation
+    based on which calibration objectives are turned on.
+    :param jobData: Configuration object (staticData).
+    :param genFlag: 0 spinup, 1 calibration, 2/3 validation, 4 sensitivity.
+    """
+    policy = retentionPolicy()
+    if jobData.outputRetention != 1:
+        return policy
+    policy.enabled = True
+    policy.nRestarts = jobData.retentionRestarts
+    policy.retainTypes = list(jobData.retainOutputs)
+
+    # The spinup only needs to produce restart files.
+    if genFlag != 0:
+        if genFlag == 4 or jobData.enableStreamflowCalib == 1:
+            policy.keepTypes.append('CHANOBS')
+            policy.extractVars['CHANOBS'] = ['feature_id','streamflow']
+        if genFlag != 4:
+            ldasVars = []
+            if jobData.enableSnowCalib == 1:
+                policy.ldasHours.append(6)
+                ldasVars.append('SNEQV')
+            if jobData.enableSoilMoistureCalib == 1:
+                policy.ldasHours.extend([0,12])
+                ldasVars.append('SOIL_M')
+            if len(ldasVars) > 0:
+                policy.keepTypes.append('LDASOUT')
+                policy.extractVars['LDASOUT'] = ldasVars
+        # t-route is fed by the channel output of the model.
+        if jobData.trouteFlag == 1:
+            policy.keepTypes.append('CHRTOUT')
+
+    # The spinup equilibrium check reads the restart files written on each
+    # anniversary of the end of the spinup, which may be older than the
+    # newest restarts by the time they are read.
+    if genFlag == 0 and spinEquilMod.enabled(jobData):
+        policy.keepRstTimes = [dTmp.strftime('%Y%m%d%H') for dTmp in
+                               spinEquilMod.anniversaries(jobData.bSpinDate,jobData.eSpinDate)]
+
+    policy.ldasHours = sorted(policy.ldasHours)
+    return policy
+
+def outputFlag(policy,outType,flagValue):
+    """
+    Generic function to return the namelist output flag to use for a given
+    output type. Types the evaluation does not read are turned off, unless the
+    user has asked for them to be retained.
+    """
+    if not policy.enabled or outType in policy.retainTypes:
+        return flagValue
+    if outType in policy.keepTypes:
+        if outType == 'CHANOBS':
+            # Make sure the output the evaluation reads is produced.
+            return 1
+        return flagValue
+    return 0
+
+def lsmOutputTimestep(jobData,policy,bDate):
+    """
+    Generic function to return the LSM OUTPUT_TIMESTEP (seconds). The land
+    output is only written at the cadence needed to produce the evaluated
+    hours of the day. If no land output is evaluated, monthly output is
+    produced, same as the minimal output option.
+    """
+    if not policy.enabled or 'LDASOUT' in policy.retainTypes:
+        return jobData.lsmOutDt
+    if len(policy.ldasHours) == 0:
+        return 2592000
+    stepHours = 24
+    for hourTmp in policy.ldasHours:
+        stepHours = math.gcd(stepHours,hourTmp)
+    stepSec = stepHours*3600
+    # Output times are relative to the start of the simulation, so only coarsen
+    # when the simulation starts on the cadence, and the original output
+    # timestep divides evenly into the new one.
+    if stepSec <= jobData.lsmOutDt or stepSec % jobData.lsmOutDt != 0:
+        return jobData.lsmOutDt
+    if bDate.hour % stepHours != 0 or bDate.minute != 0:
+        return jobData.lsmOutDt
+    return stepSec
+
+def extractFile(filePath,keepVars):
+    """
+    Generic function to reduce a NetCDF output file down to the variables the
+    evaluation reads. The reduced file is written next to the original and
+    then renamed over it, so readers never see a partial file. Returns True
+    if the file was rewritten.
+    """
+    idIn = Dataset(filePath,'r')
+    varList = [varTmp for varTmp in idIn.variables.keys()
+               if varTmp in keepVars or varTmp in COORD_VARS or varTmp in idIn.dimensions]
+    if len(varList) == len(idIn.variables.keys()):
+        # File has already been reduced.
+        idIn.close()
+        return False
+
+    tmpPath = filePath + '.EXTRACT'
+    idOut = Dataset(tmpPath,'w',format=idIn.data_model)
+    idIn.set_auto_maskandscale(False)
+    idOut.set_auto_maskandscale(False)
+    idOut.setncatts({attTmp: idIn.getncattr(attTmp) for attTmp in idIn.ncattrs()})
+
+    dimList = []
+    for varTmp in varList:
+        for dimTmp in idIn.variables[varTmp].dimensions:
+            if dimTmp not in dimList:
+                dimList.append(dimTmp)
+    for dimTmp in dimList:
+        if idIn.dimensions[dimTmp].isunlimited():
+            idOut.createDimension(dimTmp,None)
+        else:
+            idOut.createDimension(dimTmp,len(idIn.dimensions[dimTmp]))
+
+    for varTmp in varList:
+        varIn = idIn.variables[varTmp]
+        attDict = {attTmp: varIn.getncattr(attTmp) for attTmp in varIn.ncattrs()}
+        fillTmp = attDict.pop('_FillValue',None)
+        varOut = idOut.createVariable(varTmp,varIn.datatype,varIn.dimensions,fill_value=fillTmp,
+                                      zlib=idIn.data_model.startswith('NETCDF4'),complevel=2)
+        varOut.setncatts(attDict)
+        varOut[:] = varIn[:]
+
+    idIn.close()
+    idOut.close()
+    os.replace(tmpPath,filePath)
+    return True
+
+def pruneRunDir(jobData,staticData,runDir,policy,finalFlag=False):
+    """
+    Generic function to apply the retention policy to a model run directory.
+    The newest file of each output type is left alone, as the model may still
+    be writing to it, unless finalFlag is set and it is not evaluated.
+    :return: Number of files removed.
+    """
+    if not policy.enabled or not os.path.isdir(runDir):
+        return 0
+
+    # Output types that are turned off but still present (from a previous
+    # simulation, or a namelist written before the policy was turned on).
+    removePatterns = [OUTPUT_TYPES[typeTmp] for typeTmp in OUTPUT_TYPES.keys()
+                      if typeTmp not in policy.keepTypes and typeTmp not in policy.retainTypes]
+
+    try:
+        nameList = errMod.scanDir(runDir,list(OUTPUT_TYPES.values()) + ['RESTART.*_DOMAIN1','HYDRO_RST.*'])
+    except:
+        jobData.errMsg = "ERROR: Unable to scan: " + runDir + " for output retention."
+        raise
+
+    # Sort split output files by type, and restart files by valid time.
+    removeRegex = errMod.compilePatterns(removePatterns)
+    typeFiles = {}
+    rstTimes = {}
+    removeList = []
+    for nameTmp in nameList:
+        if removeRegex.match(nameTmp):
+            removeList.append(nameTmp)
+            continue
+        outMatch = OUTPUT_REGEX.match(nameTmp)
+        if outMatch:
+            typeFiles.setdefault(outMatch.group(2),[]).append([outMatch.group(1),nameTmp])
+            continue
+        rstMatch = LSM_RST_REGEX.match(nameTmp)
+        if rstMatch:
+            rstTimes.setdefault(rstMatch.group(1),[]).append(nameTmp)
+            continue
+        rstMatch = HYDRO_RST_REGEX.match(nameTmp)
+        if rstMatch:
+            rstTimes.setdefault(''.join(rstMatch.groups()),[]).append(nameTmp)
+
+    extractList = []
+    for typeTmp in typeFiles.keys():
+        if typeTmp in policy.retainTypes or typeTmp not in policy.keepTypes:
+            continue
+        fileList = sorted(typeFiles[typeTmp])
+        for timeTmp, nameTmp in fileList:
+            if typeTmp == 'LDASOUT' and int(timeTmp[8:10]) not in policy.ldasHours:
+                if finalFlag or nameTmp != fileList[-1][1]:
+                    removeList.append(nameTmp)
+            elif typeTmp in policy.extractVars.keys() and nameTmp != fileList[-1][1]:
+                # The newest file is never reduced, as it may be incomplete if
+                # the model is still running, or if it crashed mid-write.
+                extractList.append([nameTmp,policy.extractVars[typeTmp]])
+
+    # Keep only the newest restart times, along with any the policy asks to
+    # keep. Links to restarts from a previous simulation (spinup) are never
+    # removed.
+    for timeTmp in sorted(rstTimes.keys())[:-policy.nRestarts]:
+        if timeTmp in policy.keepRstTimes:
+            continue
+        for nameTmp in rstTimes[timeTmp]:
+            if not os.path.islink(os.path.join(runDir,nameTmp)):
+                removeList.append(nameTmp)
+
+    for nameTmp, keepVars in extractList:
+        try:
+            extractFile(os.path.join(runDir,nameTmp),keepVars)
+        except FileNotFoundError:
+            continue
+        except:
+            jobData.errMsg = "ERROR: Unable to extract evaluation variables from: " + \
+                             os.path.join(runDir,nameTmp)
+            raise
+
+    for nameTmp in removeList:
+        try:
+            errMod.deleteEntry(os.path.join(runDir,nameTmp))
+        except FileNotFoundError:
+            continue
+        except:
+            jobData.errMsg = "ERROR: Unable to remove: " + os.path.join(runDir,nameTmp)
+            raise
+
+    return len(removeList)
+
+def watchLoop(jobData,staticData,runDir,policy,stopEvent):
+    """
+    Generic function containing the watcher loop for a single run directory.
+    Errors are reported, but do not stop the watcher, as the next pass may
+    succeed once the model has moved on.
+    """
+    while not stopEvent.wait(staticData.retentionInterval):
+        try:
+            pruneRunDir(jobData,staticData,runDir,policy)
+        except:
+            print("WARNING: Output retention pass failed for: " + runDir)
+
+def startWatcher(jobData,staticData,runDir,genFlag):
+    """
+    Generic function to start the retention watcher for a run directory if
+    the policy is turned on and one is not already running.
+    """
+    policy = getPolicy(staticData,genFlag)
+    if not policy.enabled:
+        return
+    if runDir in watchers.keys() and watchers[runDir][0].is_alive():
+        return
+    stopEvent = threading.Event()
+    threadTmp = threading.Thread(target=watchLoop,args=(jobData,staticData,runDir,policy,stopEvent))
+    threadTmp.daemon = True
+    threadTmp.start()
+    watchers[runDir] = [threadTmp,stopEvent,policy]
+
+def stopWatcher(jobData,staticData,runDir):
+    """
+    Generic function to stop the retention watcher for a run directory once
+    the model is no longer running. A final pass is made over the directory
+    so every kept file has been reduced before the evaluation code reads it.
+    """
+    if runDir not in watchers.keys():
+        return
+    threadTmp, stopEvent, policy = watchers.pop(runDir)
+    stopEvent.set()
+    threadTmp.join()
+    try:
+        pruneRunDir(jobData,staticData,runDir,policy,finalFlag=True)
+    except:
+        raise
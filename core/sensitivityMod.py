@@ -10,6 +10,7 @@ from core import calibIoMod
 from core import namelistMod
 from core import statusMod
 from core import errMod
+from core import restartStoreMod
 import subprocess
 import time
 
@@ -2033,8 +2034,8 @@ def linkToRst(statusData,gage,runDir,gageMeta,staticData):
     link2 = runDir + "/HYDRO_RST." + statusData.bSensDate.strftime('%Y-%m-%d') + "_00:00_DOMAIN1"
     if staticData.optSpinFlag == 0: 
         # Check to make sure symbolic link to spinup state exists.
-        check1 = statusData.jobDir + "/" + gage + "/RUN.SPINUP/OUTPUT/RESTART." + statusData.eSpinDate.strftime('%Y%m%d') + "00_DOMAIN1"
-        check2 = statusData.jobDir + "/" + gage + "/RUN.SPINUP/OUTPUT/HYDRO_RST." + statusData.eSpinDate.strftime('%Y-%m-%d') + "_00:00_DOMAIN1"
+        # If linked from the restart store, link to the files in the store directly.
+        check1, check2 = restartStoreMod.spinupState(statusData,gage)
         if not os.path.isfile(check1):
             statusData.errMsg = "ERROR: Spinup state: " + check1 + " not found."
             raise Exception()
@@ -0,0 +1,146 @@
+# Module file containing functions for the per-group state snapshot. Each
+# pass through the basins, a group program writes the state it has built up
+# (status array, scheduler job IDs, last-known restart indices, the domain
+# metadata cache and script hashes) to a snapshot file in the job directory.
+# When the group job is resubmitted after hitting its walltime, the snapshot
+# is validated against the configuration file and the DB, and used to skip
+# re-querying metadata, re-reading every script and re-walking every run
+# directory before the workflow is back to doing useful work.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import json
+import os
+import time
+import numpy as np
+from core import statusMod
+
+# Incremented whenever the content of the snapshot changes.
+SNAPSHOT_VERSION = 1
+
+def snapshotPath(jobData,programType,groupNum):
+    """
+    Generic function to return the path to the snapshot file of a group program.
+    """
+    return str(jobData.jobDir) + "/" + programType + "_GROUP_" + str(groupNum) + ".SNAPSHOT"
+
+def fileStamp(pathIn):
+    """
+    Generic function to return the modification time and size of a file, or
+    None if it does not exist.
+    """
+    try:
+        statTmp = os.stat(pathIn)
+    except OSError:
+        return None
+    return [statTmp.st_mtime,statTmp.st_size]
+
+def writeSnapshot(jobData,snapPath,groupNum,configPath,keySlot,pbsJobId):
+    """
+    Generic function to write the state snapshot for a group program. The
+    snapshot is written to a temporary file and moved into place, so a group
+    job killed at walltime never leaves a partial snapshot behind.
+    """
+    snapOut = {}
+    snapOut['version'] = SNAPSHOT_VERSION
+    snapOut['time'] = time.time()
+    snapOut['jobID'] = int(jobData.jobID)
+    snapOut['groupNum'] = str(groupNum)
+    snapOut['config'] = fileStamp(configPath)
+    snapOut['gages'] = [str(gageTmp) for gageTmp in jobData.gages]
+    snapOut['gageIDs'] = [int(idTmp) for idTmp in jobData.gageIDs]
+    snapOut['keySlot'] = np.asarray(keySlot).tolist()
+    snapOut['pbsJobId'] = np.asarray(pbsJobId).tolist()
+    snapOut['restartCache'] = statusMod.restartCache
+    snapOut['scriptHashes'] = jobData.scriptHashes
+    snapOut['gageMetaCache'] = dict([(str(idTmp),list(rowTmp)) for idTmp, rowTmp in jobData.gageMetaCache.items()])
+
+    tmpPath = snapPath + ".TMP"
+    try:
+        with open(tmpPath,'w') as fileObj:
+            json.dump(snapOut,fileObj)
+            fileObj.flush()
+            os.fsync(fileObj.fileno())
+        os.replace(tmpPath,snapPath)
+    except:
+        jobData.errMsg = "ERROR: Unable to write state snapshot: " + snapPath
+        raise
+
+def readSnapshot(jobData,snapPath,groupNum,configPath):
+    """
+    Generic function to read the state snapshot for a group program. None is
+    returned if there is no snapshot, or if it was written for a different
+    job/group, a different set of basins, or before the configuration file
+    was last modified.
+    """
+    if not os.path.isfile(snapPath):
+        return None
+    try:
+        with open(snapPath,'r') as fileObj:
+            snapIn = json.load(fileObj)
+    except:
+        print("WARNING: Unable to read state snapshot: " + snapPath + ". Ignoring.")
+        return None
+
+    if snapIn.get('version') != SNAPSHOT_VERSION:
+        return None
+    if snapIn.get('jobID') != int(jobData.jobID) or snapIn.get('groupNum') != str(groupNum):
+        return None
+    if snapIn.get('config') != fileStamp(configPath):
+        print("WARNING: Configuration file modified since state snapshot was written. Ignoring snapshot.")
+        return None
+    if snapIn.get('gages') != [str(gageTmp) for gageTmp in jobData.gages] or \
+       snapIn.get('gageIDs') != [int(idTmp) for idTmp in jobData.gageIDs]:
+        print("WARNING: Basins have changed since state snapshot was written. Ignoring snapshot.")
+        return None
+
+    return snapIn
+
+def restoreMetaCache(jobData,snapIn):
+    """
+    Generic function to restore the domain metadata cache held in a snapshot,
+    so calibIoMod.loadMetaCache does not need to query the DB.
+    """
+    jobData.gageMetaCache = dict([(int(idTmp),rowTmp) for idTmp, rowTmp in snapIn['gageMetaCache'].items()])
+
+def applySnapshot(jobData,snapIn,keySlot,pbsJobId,groupMask):
+    """
+    Generic function to restore the state held in a snapshot. The keySlot
+    array passed in has already been restored from the DB, which remains
+    the authority on status. If the status of any basin in this group does
+    not match the snapshot, something has changed since it was written, and
+    the scheduler job IDs are not restored. Restart indices are checked
+    against the run directory when used, and scripts modified since the
+    snapshot was written are re-checked as usual.
+    """
+    snapTime = snapIn['time']
+    for pathTmp, hashTmp in snapIn['scriptHashes'].items():
+        stampTmp = fileStamp(pathTmp)
+        if stampTmp is not None and stampTmp[0] <= snapTime:
+            jobData.scriptHashes[pathTmp] = hashTmp
+
+    statusMod.restartCache.update(snapIn['restartCache'])
+
+    keyTmp = np.array(snapIn['keySlot'],dtype=np.float64)
+    if keyTmp.shape != keySlot.shape or not (keyTmp[groupMask] == keySlot[groupMask]).all():
+        print("WARNING: Basin status has changed since state snapshot was written. " + \
+              "Scheduler job IDs will not be restored.")
+        return False
+
+    pbsTmp = np.array(snapIn['pbsJobId'],dtype=np.int64)
+    if pbsTmp.shape == pbsJobId.shape:
+        pbsJobId[:] = pbsTmp
+    return True
+
+def removeSnapshot(snapPath):
+    """
+    Generic function to remove the snapshot once a group is complete.
+    """
+    for pathTmp in [snapPath,snapPath + ".TMP"]:
+        if os.path.isfile(pathTmp):
+            try:
+                os.remove(pathTmp)
+            except OSError:
+                pass
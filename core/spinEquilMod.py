@@ -0,0 +1,268 @@
+# Module file containing the equilibrium check for the model spinup. While
+# the spinup is running, the LSM and hydro restart files written on each
+# anniversary of the end of the spinup are read, and the basin-integrated
+# storages (soil moisture, groundwater bucket, channel) are computed. Once
+# the change in every storage over an annual cycle falls below a tolerance,
+# the model has reached equilibrium. The spinup is stopped, and the restart
+# files of that anniversary are promoted to the end of the spinup, which is
+# where the calibration/validation simulations pick up their initial state.
+# Restart files are only available on an anniversary if the restart
+# frequencies (lsmRstFreq/hydroRstFreq) line up with the end of the spinup.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import datetime
+import json
+import os
+import time
+import numpy as np
+from netCDF4 import Dataset
+from core import statusMod
+import warnings
+warnings.filterwarnings("ignore")
+
+# File in the spinup directory holding the storages computed so far.
+EQUIL_FILE = "SPINUP_EQUILIBRIUM.json"
+
+# Restart files modified more recently than this (seconds) may still be
+# being written by the model, and are picked up on a later check.
+MIN_FILE_AGE = 60.0
+
+# Storages compared between annual cycles.
+STORAGE_NAMES = ['soil','groundwater','channel']
+
+def enabled(staticData):
+    """
+    Generic function to determine if the spinup equilibrium check has been
+    turned on. It is not used when t-route is ran over the spinup, as it
+    needs the model output over the entire spinup period.
+    """
+    return float(staticData.spinEquilTol) > 0.0 and staticData.trouteFlag == 0
+
+def anniversaries(bDate,eDate):
+    """
+    Generic function to return the anniversaries of eDate after bDate, in
+    chronological order, not including eDate itself. February 29th falls back
+    to the 28th in years that are not leap years.
+    """
+    dateList = []
+    yearTmp = eDate.year - 1
+    while True:
+        try:
+            dTmp = eDate.replace(year=yearTmp)
+        except ValueError:
+            dTmp = eDate.replace(year=yearTmp,day=28)
+        if dTmp <= bDate:
+            break
+        dateList.append(dTmp)
+        yearTmp = yearTmp - 1
+    return dateList[::-1]
+
+def restartPaths(runDir,dCurrent):
+    """
+    Generic function to return the paths to the LSM and hydro restart files
+    valid at a given time.
+    """
+    lsmPath = runDir + "/RESTART." + dCurrent.strftime('%Y%m%d%H') + "_DOMAIN1"
+    hydroPath = runDir + "/HYDRO_RST." + dCurrent.strftime('%Y-%m-%d_%H') + ":00_DOMAIN1"
+    return lsmPath, hydroPath
+
+def readStorage(lsmPath,hydroPath,soilThick):
+    """
+    Generic function to compute the basin-integrated storages from a pair of
+    restart files. Soil moisture is the mean depth of water (mm) in the soil
+    column, the groundwater bucket is the mean bucket depth (mm), and the
+    channel storage is represented by the mean channel stage (m). Storages
+    whose variables are not in the restart files are left out.
+    """
+    storage = {}
+    idTmp = Dataset(lsmPath,'r')
+    try:
+        if 'SOIL_M' in idTmp.variables.keys():
+            # Dimensions are time, south_north, soil layers, west_east.
+            smTmp = np.ma.asarray(idTmp.variables['SOIL_M'][:],dtype=np.float64)
+            dzTmp = np.asarray(soilThick,dtype=np.float64)[:smTmp.shape[2]]*1000.0
+            columnTmp = np.ma.sum(smTmp*dzTmp.reshape(1,1,-1,1),axis=2)
+            storage['soil'] = float(np.ma.mean(columnTmp))
+    finally:
+        idTmp.close()
+
+    idTmp = Dataset(hydroPath,'r')
+    try:
+        if 'z_gwsubbas' in idTmp.variables.keys():
+            storage['groundwater'] = float(np.ma.mean(np.ma.asarray(idTmp.variables['z_gwsubbas'][:],dtype=np.float64)))
+        if 'hlink' in idTmp.variables.keys():
+            storage['channel'] = float(np.ma.mean(np.ma.asarray(idTmp.variables['hlink'][:],dtype=np.float64)))
+    finally:
+        idTmp.close()
+    return storage
+
+def storageDrift(storageOld,storageNew):
+    """
+    Generic function to compute the relative change of each storage over an
+    annual cycle. Returns None if the two have no storage in common.
+    """
+    driftTmp = {}
+    for nameTmp in STORAGE_NAMES:
+        if nameTmp not in storageOld or nameTmp not in storageNew:
+            continue
+        scaleTmp = max(abs(storageOld[nameTmp]),abs(storageNew[nameTmp]))
+        if scaleTmp <= 0.0:
+            driftTmp[nameTmp] = 0.0
+        else:
+            driftTmp[nameTmp] = abs(storageNew[nameTmp] - storageOld[nameTmp])/scaleTmp
+    if len(driftTmp) == 0:
+        return None
+    return driftTmp
+
+def readEquil(workDir,bDate,eDate):
+    """
+    Generic function to read the storages computed so far for a spinup, along
+    with the modification time of the LSM restart file each was read from.
+    Storages computed for a different spinup period are discarded.
+    """
+    periodTmp = [bDate.strftime('%Y%m%d%H'),eDate.strftime('%Y%m%d%H')]
+    equilData = {'period':periodTmp,'storage':{},'stamps':{}}
+    pathTmp = workDir + "/" + EQUIL_FILE
+    if not os.path.isfile(pathTmp):
+        return equilData
+    try:
+        with open(pathTmp,'r') as fileObj:
+            equilIn = json.load(fileObj)
+    except:
+        print("WARNING: Unable to read: " + pathTmp + ". Starting over.")
+        return equilData
+    if equilIn.get('period') != periodTmp:
+        return equilData
+    return equilIn
+
+def writeEquil(jobData,workDir,equilData):
+    """
+    Generic function to write the storages computed so far for a spinup.
+    """
+    pathTmp = workDir + "/" + EQUIL_FILE
+    try:
+        with open(pathTmp + ".TMP",'w') as fileObj:
+            json.dump(equilData,fileObj,indent=1)
+        os.replace(pathTmp + ".TMP",pathTmp)
+    except:
+        jobData.errMsg = "ERROR: Unable to write: " + pathTmp
+        raise
+
+def promoteRestart(jobData,runDir,dEquil,eDate):
+    """
+    Generic function to promote the restart files valid at dEquil to the end
+    of the spinup. The files are renamed, so the spinup is seen as complete
+    by the rest of the workflow. Returns False if the files could not be
+    renamed.
+    """
+    lsmPath, hydroPath = restartPaths(runDir,dEquil)
+    lsmEnd, hydroEnd = restartPaths(runDir,eDate)
+    try:
+        os.replace(lsmPath,lsmEnd)
+    except OSError:
+        return False
+    try:
+        os.replace(hydroPath,hydroEnd)
+    except OSError:
+        # Put the LSM restart back so the spinup can carry on as usual.
+        try:
+            os.replace(lsmEnd,lsmPath)
+        except OSError:
+            jobData.errMsg = "ERROR: Unable to restore: " + lsmPath
+            raise
+        return False
+    return True
+
+def checkEquilibrium(jobData,staticData,gageID,basinNum,pbsJobId,workDir,runDir):
+    """
+    Generic function to compute the storages from any new anniversary restart
+    files of a running spinup, and check if the model has reached equilibrium.
+    If so, the simulation is stopped, and the latest anniversary restart files
+    are promoted to the end of the spinup. Returns True if the simulation was
+    stopped.
+    """
+    if not enabled(staticData):
+        return False
+
+    bDate = jobData.bSpinDate
+    eDate = jobData.eSpinDate
+    equilData = readEquil(workDir,bDate,eDate)
+    storageAll = equilData['storage']
+    stampAll = equilData['stamps']
+
+    newFlag = False
+    for dTmp in anniversaries(bDate,eDate):
+        keyTmp = dTmp.strftime('%Y%m%d%H')
+        lsmPath, hydroPath = restartPaths(runDir,dTmp)
+        try:
+            stampTmp = os.stat(lsmPath).st_mtime
+            ageTmp = time.time() - max(stampTmp,os.stat(hydroPath).st_mtime)
+        except OSError:
+            # Restart files are removed by the retention policy once read.
+            continue
+        if keyTmp in storageAll and stampAll.get(keyTmp) == stampTmp:
+            continue
+        if ageTmp < MIN_FILE_AGE:
+            continue
+        try:
+            storageAll[keyTmp] = readStorage(lsmPath,hydroPath,staticData.soilThick)
+        except:
+            print("WARNING: Unable to read restart files valid at: " + keyTmp + " for spinup equilibrium.")
+            continue
+        stampAll[keyTmp] = stampTmp
+        newFlag = True
+        # Storages from later in a previous attempt at this spinup no longer apply.
+        for keyOld in [k for k in storageAll.keys() if k > keyTmp]:
+            storageAll.pop(keyOld,None)
+            stampAll.pop(keyOld,None)
+
+    if not newFlag:
+        return False
+    writeEquil(jobData,workDir,equilData)
+
+    # Compare the latest anniversary with the one a year before it.
+    keyList = sorted(storageAll.keys())
+    if len(keyList) < 2:
+        return False
+    dLast = datetime.datetime.strptime(keyList[-1],'%Y%m%d%H')
+    dPrev = datetime.datetime.strptime(keyList[-2],'%Y%m%d%H')
+    if dLast.year - dPrev.year != 1:
+        return False
+    if dLast.year - bDate.year < int(staticData.spinEquilMinYears):
+        return False
+    driftTmp = storageDrift(storageAll[keyList[-2]],storageAll[keyList[-1]])
+    if driftTmp is None:
+        return False
+    print("SPINUP STORAGE DRIFT FOR BASIN: " + str(jobData.gages[basinNum]) + " AT: " + keyList[-1] + \
+          " " + str(driftTmp))
+    if max(driftTmp.values()) >= float(staticData.spinEquilTol):
+        return False
+
+    # The model is stopped, and confirmed to have exited, before the restart
+    # files are promoted, so it does not write over them.
+    print("SPINUP FOR BASIN: " + str(jobData.gages[basinNum]) + " REACHED EQUILIBRIUM AT: " + \
+          keyList[-1] + ". STOPPING SIMULATION")
+    try:
+        statusMod.killBasJob(jobData,basinNum)
+        runTmp = statusMod.checkBasJob(jobData,basinNum,pbsJobId)
+    except:
+        raise
+    if runTmp:
+        jobData.errMsg = "ERROR: Unable to stop the spinup of basin: " + str(jobData.gages[basinNum]) + \
+                         " after reaching equilibrium."
+        raise Exception()
+
+    # If the files cannot be promoted, the spinup is restarted from them as
+    # after a crash.
+    if not promoteRestart(jobData,runDir,dLast,eDate):
+        print("WARNING: Unable to promote restart files valid at: " + keyList[-1] + \
+              " for basin: " + str(jobData.gages[basinNum]))
+        return True
+    print("PROMOTED RESTART FILES VALID AT: " + keyList[-1] + " TO THE END OF THE SPINUP")
+    equilData['equilibrium'] = keyList[-1]
+    equilData['drift'] = driftTmp
+    writeEquil(jobData,workDir,equilData)
+    return True
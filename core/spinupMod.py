@@ -11,6 +11,9 @@ from core import calibIoMod
 from core import namelistMod
 from core import statusMod
 from core import errMod
+from core import retentionMod
+from core import spinEquilMod
+from core import restartStoreMod
 import subprocess
 from yaml import SafeDumper 
 import yaml
@@ -46,8 +49,7 @@ def runTroute(statusData,staticData,db,gageID,gage,gageMeta, basinNum):
     except:
         raise
  
-    yamlFile = open(statusData.trouteConfig)
-    yamlDict = yaml.load(yamlFile, Loader=yaml.FullLoader)
+    yamlDict = calibIoMod.loadTrouteYaml(statusData)
     begDate = statusData.bSpinDate
     endDate = statusData.eSpinDate 
 
@@ -187,6 +189,16 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,pbsJobId):
         basinStatus = statusMod.checkBasJob(statusData,basinNum,pbsJobId)
     except:
         raise
+
+    # Enforce the output retention policy while the model is running. Once the
+    # model is no longer running, a final pass is made before any evaluation.
+    try:
+        if basinStatus:
+            retentionMod.startWatcher(statusData,staticData,runDir,0)
+        else:
+            retentionMod.stopWatcher(statusData,staticData,runDir)
+    except:
+        raise
         
     # Create path to LOCK file if neeced
     lockPath = workDir + "/RUN.LOCK"
@@ -208,8 +220,7 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,pbsJobId):
             keySlot[basinNum] = 1.0
             keyStatus = 1.0
             return
-        yamlFile = open(statusData.trouteConfig)
-        yamlDict = yaml.load(yamlFile, Loader=yaml.FullLoader)        
+        yamlDict = calibIoMod.loadTrouteYaml(statusData)
         runStatus = statusMod.walkModTroute(staticData.bSpinDate,staticData.eSpinDate,runDir,yamlDict)
         begDate = runStatus[0]
         endDate = runStatus[1]
@@ -232,6 +243,16 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,pbsJobId):
             #print("Unable to create complete flag because Troute didn't run successfully. Remove TROUTE.LOCK file: " + lockPath)
     # For uncompleted simulations that are still listed as running.
     if keyStatus == 0.5:
+        # If a model is running for this basin, check if it has reached equilibrium.
+        # If so, the spinup is stopped and the latest annual restart is promoted.
+        if basinStatus:
+            try:
+                if spinEquilMod.checkEquilibrium(statusData,staticData,gageID,int(basinNum),pbsJobId,
+                                                 workDir,runDir):
+                    basinStatus = False
+                    retentionMod.stopWatcher(statusData,staticData,runDir)
+            except:
+                raise
         # If a model is running for this basin, continue and set keyStatus to 0.5
         if basinStatus:
             keySlot[basinNum] = 0.5
@@ -350,6 +371,22 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,pbsJobId):
                     keySlot[basinNum] = 1.0
                     keyStatus = 1.0
     
+    # Publish a completed spinup to the shared restart store. A fresh spinup
+    # is linked from the store instead of being ran, if it has been ran before.
+    if keyStatus == 1.0:
+        try:
+            restartStoreMod.publish(statusData,staticData,gageMeta,runDir)
+        except:
+            raise
+    if keyStatus == 0.0 and runFlag and begDate == staticData.bSpinDate:
+        try:
+            if restartStoreMod.linkStored(statusData,staticData,gageMeta,runDir):
+                keySlot[basinNum] = 1.0
+                keyStatus = 1.0
+                runFlag = False
+        except:
+            raise
+
     if keyStatus == -0.25 and runFlag:
         # Restarting model from one crash
         # First delete namelist files if they exist.
@@ -389,6 +426,9 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,pbsJobId):
         except:
             statusData.errMsg = "ERROR: Unable to launch WRF-Hydro job for gage: " + str(gageMeta.gage[basinNum])
             raise
+
+        # Start pruning the run directory per the output retention policy.
+        retentionMod.startWatcher(statusData,staticData,runDir,0)
         #if statusData.jobRunType == 1:
         #    cmd = "bsub < " + runDir + "/run_WH.sh"
         #if statusData.jobRunType == 2:
@@ -456,6 +496,9 @@ def runModel(statusData,staticData,db,gageID,gage,keySlot,basinNum,pbsJobId):
         except:
             statusData.errMsg = "ERROR: Unable to launch WRF-Hydro job for gage: " + str(gageMeta.gage[basinNum])
             raise
+
+        # Start pruning the run directory per the output retention policy.
+        retentionMod.startWatcher(statusData,staticData,runDir,0)
         #if statusData.jobRunType == 1:
         #    cmd = "bsub < " + runDir + "/run_WH.sh"
         #if statusData.jobRunType == 2:
@@ -20,6 +20,11 @@ import warnings
 import ast
 warnings.filterwarnings("ignore")
 
+# Hour index of the last restart files found by walkMod for each run directory
+# and simulation period. Scans resume from this index when its restart files
+# are still present. Saved to, and restored from, the group state snapshot.
+restartCache = {}
+
 class statusMeta:
     def __init__(self):
         # Initialize empty object containing variables.
@@ -78,6 +83,12 @@ class statusMeta:
         self.slackObj = None
         self.gSQL = []
         self.dbPath = []
+        self.groupWalltime = '12:00:00'
+        self.groupHandoff = 0
+        # In-process caches populated once per program. See calibIoMod.loadMetaCache.
+        self.gageMetaCache = {}
+        self.trouteYaml = None
+        self.scriptHashes = {}
         self.trouteLock = []
         self.trouteCompleteBasin = []
     def checkGages(self,db):
@@ -475,6 +486,28 @@ def checkBasJob(jobData,gageNum,pbsJobId):
             
     return status
    
+def killBasJob(jobData,gageNum):
+    """
+    Generic function to stop a running model simulation for a basin. The
+    model instances found by checkBasJob are terminated, and killed if they
+    have not exited after 30 seconds.
+    """
+    exeName = "W" + str(jobData.jobID) + str(jobData.gageIDs[gageNum])
+    procList = []
+    for proc in psutil.process_iter():
+        try:
+            if proc.name() == exeName:
+                proc.terminate()
+                procList.append(proc)
+        except psutil.Error:
+            print(exeName + " Found, but ended before Python could stop it.")
+    gone, alive = psutil.wait_procs(procList,timeout=30)
+    for proc in alive:
+        try:
+            proc.kill()
+        except psutil.Error:
+            pass
+
 def walkModTroute(bDate,eDate,runDir,yamlDict): 
     """
     Generic function to walk a simulation directory, and determine where the model
@@ -530,15 +563,34 @@ def walkMod(bDate,eDate,runDir):
     
     # Initialize flag returned to user as True. Assume model needs to ran.
     runFlag = True
+
+    # If the restart files last found for this run directory are still present,
+    # there is no need to look for earlier ones.
+    cacheKey = runDir + "|" + bDateOrig.strftime('%Y%m%d%H') + "|" + eDate.strftime('%Y%m%d%H')
+    hourStart = 0
+    if cacheKey in restartCache:
+        hourTmp = int(restartCache[cacheKey])
+        dCurrent = bDateOrig + datetime.timedelta(seconds=3600.0*hourTmp)
+        lsmRestartPath = runDir + "/RESTART." + dCurrent.strftime('%Y%m%d%H') + "_DOMAIN1"
+        hydroRestartPath = runDir + "/HYDRO_RST." + dCurrent.strftime('%Y-%m-%d_%H') + ':00_DOMAIN1'
+        if hourTmp <= nHours and os.path.isfile(lsmRestartPath) and os.path.isfile(hydroRestartPath):
+            hourStart = hourTmp
     
     output = []
-    for hourModel in range(0,nHours+1):
+    hourLast = -1
+    for hourModel in range(hourStart,nHours+1):
         dCurrent = bDateOrig + datetime.timedelta(seconds=3600.0*hourModel)
         lsmRestartPath = runDir + "/RESTART." + dCurrent.strftime('%Y%m%d%H') + "_DOMAIN1"
         hydroRestartPath = runDir + "/HYDRO_RST." + dCurrent.strftime('%Y-%m-%d_%H') + ':00_DOMAIN1'
         
         if os.path.isfile(lsmRestartPath) and os.path.isfile(hydroRestartPath):
             bDate = dCurrent
+            hourLast = hourModel
+
+    if hourLast >= 0:
+        restartCache[cacheKey] = hourLast
+    else:
+        restartCache.pop(cacheKey,None)
             
     # If the bDate has reached the eDate, this means the model completed as expected.
     if bDate == eDate:
@@ -2290,3 +2342,105 @@ def submitGroupCalibration(jobData,groupScript,pbsJobId,groupNum):
         except:
             jobData.errMsg = "ERROR: Unable to launch: " + groupScript
             raise
+
+def handoffPath(jobData,programType,groupNum):
+    """
+    Generic function to return the path of the file a group job uses to pass
+    the job ID of its successor to the orchestrator.
+    """
+    return str(jobData.jobDir) + "/" + programType + "_" + str(jobData.jobID) + "_" + \
+           str(groupNum) + ".HANDOFF"
+
+def groupJobId(jobData):
+    """
+    Generic function to return the scheduler job ID of the group job this
+    program is running in, or None if it is not running under qsub/slurm.
+    """
+    if jobData.jobRunType == 2:
+        return os.environ.get('PBS_JOBID')
+    if jobData.jobRunType == 3 or jobData.jobRunType == 6:
+        return os.environ.get('SLURM_JOB_ID')
+    return None
+
+def handoffTime(jobData,begTimeStamp):
+    """
+    Generic function to return the time at which a group job should hand off
+    to its successor, based on the group walltime and the handoff margin. None
+    is returned if handoff is disabled, or this program is not running as a
+    qsub/slurm group job, or if the handoff margin is not smaller than the
+    walltime, which would hand off before any basin is processed.
+    """
+    if int(jobData.groupHandoff) <= 0 or groupJobId(jobData) is None:
+        return None
+    hrTmp, minTmp, secTmp = [int(valTmp) for valTmp in str(jobData.groupWalltime).split(':')]
+    wallTmp = datetime.timedelta(hours=hrTmp,minutes=minTmp,seconds=secTmp)
+    marginTmp = datetime.timedelta(minutes=int(jobData.groupHandoff))
+    if marginTmp >= wallTmp:
+        return None
+    return begTimeStamp + wallTmp - marginTmp
+
+def handoffDue(handoffAt):
+    """
+    Generic function to determine if a group job has reached its handoff time.
+    """
+    if handoffAt is None:
+        return False
+    return datetime.datetime.now() >= handoffAt
+
+def submitSuccessor(jobData,programType,groupNum,groupScript):
+    """
+    Generic function for a group job close to its walltime to submit its own
+    successor. The successor is held by the scheduler until this job ends
+    (afterany), so it starts as soon as the allocation is released. The new
+    job ID is written to the handoff file for the orchestrator to pick up.
+    """
+    jobIdTmp = groupJobId(jobData)
+    if jobIdTmp is None:
+        jobData.errMsg = "ERROR: Unable to determine the scheduler job ID of group: " + str(groupNum)
+        raise Exception()
+    if not os.path.isfile(groupScript):
+        jobData.errMsg = "ERROR: Group script: " + groupScript + " not found for handoff."
+        raise Exception()
+
+    if jobData.jobRunType == 2:
+        cmd = ['qsub','-W','depend=afterany:' + jobIdTmp,groupScript]
+    else:
+        cmd = ['sbatch','--parsable','--dependency=afterany:' + jobIdTmp,groupScript]
+    try:
+        jobTmp = subprocess.check_output(cmd)
+        nextId = int(jobTmp.decode("UTF-8").strip().split(';')[0].split('.')[0])
+    except:
+        jobData.errMsg = "ERROR: Unable to submit successor for group: " + str(groupNum) + \
+                         " from: " + groupScript
+        raise
+
+    pathTmp = handoffPath(jobData,programType,groupNum)
+    try:
+        with open(pathTmp + ".TMP",'w') as fileObj:
+            fileObj.write(str(nextId) + '\n')
+        os.replace(pathTmp + ".TMP",pathTmp)
+    except:
+        jobData.errMsg = "ERROR: Unable to write handoff file: " + pathTmp
+        raise
+
+    return nextId
+
+def takeHandoff(jobData,programType,groupNum):
+    """
+    Generic function used by the orchestrators to pick up the job ID of a
+    successor submitted by a group job. The handoff file is removed once read.
+    Returns None if there is no handoff waiting.
+    """
+    pathTmp = handoffPath(jobData,programType,groupNum)
+    if not os.path.isfile(pathTmp):
+        return None
+    try:
+        with open(pathTmp,'r') as fileObj:
+            nextId = int(fileObj.read().strip())
+    except:
+        nextId = None
+    try:
+        os.remove(pathTmp)
+    except OSError:
+        pass
+    return nextId
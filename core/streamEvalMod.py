@@ -0,0 +1,288 @@
+# Module file containing the streaming evaluator for calibration simulations.
+# While a model simulation is running, the CHANOBS output written so far is
+# scored against the streamflow observations. For objective functions built
+# on the sum of squared errors (Rmse, Nse, NNse, NNseSq), the error gathered
+# so far gives a lower bound on the objective function of the completed
+# simulation, as the remainder of the simulation can only add to it. Once that
+# bound exceeds the best objective function found so far for the basin, the
+# parameter set can no longer be selected by DDS. The simulation is stopped,
+# and the calibration code records the parameter set as rejected, with the
+# bound as its objective function value.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import os
+import datetime
+import numpy as np
+import pandas as pd
+from netCDF4 import Dataset
+from core import retentionMod
+from core import statusMod
+import warnings
+warnings.filterwarnings("ignore")
+
+# Streamflow objective functions a lower bound can be computed for.
+BOUNDED_OBJ_FUNCS = ['rmse','nse','nnse','nnsesq']
+
+# Flag left in the calibration directory for the R code, holding the lower
+# bound on the streamflow objective function. Also used by fidelityMod, with
+# the predicted objective function of a candidate failing the screening.
+EARLY_STOP_FLAG = "EARLY_STOP"
+
+# Model output and observations read so far, keyed by run directory.
+modelCache = {}
+obsCache = {}
+
+def enabled(staticData):
+    """
+    Generic function to determine if the streaming evaluator can be used for
+    this job. The combined objective function is only bounded when streamflow
+    is being calibrated with a bounded objective function at a single site.
+    The snow and soil moisture components are never negative, so they add
+    nothing to the bound.
+    """
+    if staticData.earlyStop != 1:
+        return False
+    if staticData.enableStreamflowCalib != 1 or staticData.enableMultiSites != 0:
+        return False
+    if float(staticData.streamflowWeight) <= 0.0:
+        return False
+    return str(staticData.streamflowObjFunc).lower() in BOUNDED_OBJ_FUNCS
+
+def clearEarlyStop(jobData,workDir,runDir):
+    """
+    Generic function to remove an early stop flag left over from a previous
+    iteration, along with the model output read for it, before a new
+    simulation is started.
+    """
+    flagPath = workDir + "/" + EARLY_STOP_FLAG
+    if os.path.isfile(flagPath):
+        try:
+            os.remove(flagPath)
+        except:
+            jobData.errMsg = "ERROR: Failure to remove: " + flagPath
+            raise
+    modelCache.pop(runDir,None)
+
+def readObs(workDir,dailyFlag):
+    """
+    Generic function to read the streamflow observations exported with the
+    observation store by the R code. Returns the times (seconds since epoch)
+    and values, or None if the observations have not been exported yet.
+    """
+    if dailyFlag == 1:
+        csvPath = workDir + "/obsStreamDaily.csv"
+    else:
+        csvPath = workDir + "/obsStreamHourly.csv"
+    try:
+        statTmp = os.stat(csvPath)
+    except OSError:
+        return None
+    stampTmp = [csvPath,statTmp.st_mtime,statTmp.st_size]
+
+    if workDir in obsCache and obsCache[workDir][0] == stampTmp:
+        return obsCache[workDir][1]
+
+    try:
+        obsTmp = pd.read_csv(csvPath,dtype={'site_no':str})
+    except:
+        print("WARNING: Unable to read streamflow observations: " + csvPath)
+        return None
+    obsTmp = obsTmp[~np.isnan(obsTmp.obs.values)]
+    obsTimes = obsTmp.time.values.astype(np.int64)
+    obsVals = obsTmp.obs.values.astype(np.float64)
+    obsOrder = np.argsort(obsTimes)
+    obsOut = [obsTimes[obsOrder],obsVals[obsOrder]]
+    obsCache[workDir] = [stampTmp,obsOut]
+    return obsOut
+
+def readModel(runDir,linkId,splitFlag):
+    """
+    Generic function to read the streamflow written so far by the model at the
+    gage link. Split output files are only read once. Output left over from
+    a previous iteration is ignored, using the parameter file written for this
+    iteration as the reference time. Files still being written by the model
+    are picked up on the next check. Returns a dictionary of streamflow keyed
+    by the time (seconds since epoch).
+    """
+    try:
+        paramStamp = os.stat(runDir + "/Fulldom.nc").st_mtime
+    except OSError:
+        return {}
+
+    if runDir not in modelCache or modelCache[runDir]['stamp'] != paramStamp:
+        modelCache[runDir] = {'stamp':paramStamp,'files':set(),'flow':{}}
+    cacheTmp = modelCache[runDir]
+
+    if splitFlag == 1:
+        for fileTmp in sorted(os.listdir(runDir)):
+            matchTmp = retentionMod.OUTPUT_REGEX.match(fileTmp)
+            if matchTmp is None or matchTmp.group(2) != 'CHANOBS':
+                continue
+            if fileTmp in cacheTmp['files']:
+                continue
+            pathTmp = runDir + "/" + fileTmp
+            try:
+                if os.stat(pathTmp).st_mtime < paramStamp:
+                    continue
+                idTmp = Dataset(pathTmp,'r')
+                featureTmp = idTmp.variables['feature_id'][:]
+                flowTmp = idTmp.variables['streamflow'][:]
+                idTmp.close()
+            except:
+                continue
+            indTmp = np.where(np.asarray(featureTmp) == linkId)[0]
+            if len(indTmp) == 0:
+                continue
+            dCurrent = datetime.datetime.strptime(matchTmp.group(1),'%Y%m%d%H%M')
+            timeTmp = int((dCurrent - datetime.datetime(1970,1,1)).total_seconds())
+            cacheTmp['flow'][timeTmp] = float(np.ma.filled(np.ma.asarray(flowTmp[indTmp[0]],dtype=np.float64),np.nan))
+            cacheTmp['files'].add(fileTmp)
+    else:
+        # The output is appended to a single file, which is re-read each time.
+        pathTmp = runDir + "/CHANOBS_DOMAIN1.nc"
+        try:
+            if os.stat(pathTmp).st_mtime < paramStamp:
+                return {}
+            idTmp = Dataset(pathTmp,'r')
+            featureTmp = np.asarray(idTmp.variables['feature_id'][:]).flatten()
+            timesTmp = np.asarray(idTmp.variables['time'][:]).flatten()
+            flowTmp = np.ma.filled(np.ma.asarray(idTmp.variables['streamflow'][:],dtype=np.float64),np.nan)
+            idTmp.close()
+        except:
+            return cacheTmp['flow']
+        indTmp = np.where(featureTmp == linkId)[0]
+        if len(indTmp) == 0 or len(timesTmp) == 0:
+            return cacheTmp['flow']
+        flowTmp = flowTmp.reshape(len(timesTmp),-1)[:,indTmp[0]]
+        # Time is in minutes since the epoch.
+        for stepTmp in range(0,len(timesTmp)):
+            cacheTmp['flow'][int(timesTmp[stepTmp])*60] = flowTmp[stepTmp]
+
+    return cacheTmp['flow']
+
+def epochSeconds(dateIn):
+    """
+    Generic function to convert a datetime object into seconds since the epoch.
+    """
+    return int((dateIn - datetime.datetime(1970,1,1)).total_seconds())
+
+def modelSeries(staticData,flowTmp):
+    """
+    Generic function to convert the streamflow read by readModel into sorted
+    arrays of times and values. Only output the R code will evaluate, from
+    the beginning of the evaluation period on, is kept.
+    """
+    if len(flowTmp) == 0:
+        return np.array([],dtype=np.int64), np.array([],dtype=np.float64)
+    modTimes = np.fromiter(flowTmp.keys(),dtype=np.int64,count=len(flowTmp))
+    modVals = np.fromiter(flowTmp.values(),dtype=np.float64,count=len(flowTmp))
+    startTime = epochSeconds(staticData.bCalibEvalDate)
+    if int(staticData.SplitOutputCount) == 1:
+        keepInd = modTimes >= startTime
+    else:
+        keepInd = modTimes > startTime
+    orderTmp = np.argsort(modTimes[keepInd])
+    return modTimes[keepInd][orderTmp], modVals[keepInd][orderTmp]
+
+def dailyMeans(modTimes,modVals):
+    """
+    Generic function to convert the hourly streamflow into daily means, the same
+    way Convert2Daily does in the R code. The last day is dropped, as the
+    model may not be done with it yet.
+    """
+    dayTimes = modTimes - np.mod(modTimes,86400)
+    validInd = ~np.isnan(modVals)
+    daysOut, dayInd = np.unique(dayTimes,return_inverse=True)
+    sumTmp = np.bincount(dayInd,weights=np.where(validInd,modVals,0.0),minlength=len(daysOut))
+    countTmp = np.bincount(dayInd,weights=validInd.astype(np.float64),minlength=len(daysOut))
+    keepInd = (countTmp > 0) & (daysOut < dayTimes.max())
+    return daysOut[keepInd], sumTmp[keepInd]/countTmp[keepInd]
+
+def lowerBound(objFn,modTimes,modVals,obsTimes,obsVals):
+    """
+    Generic function to compute a lower bound on the streamflow objective
+    function of the completed simulation. Each error term written so far will
+    be part of the final sum of squared errors, which can only grow. The final
+    number of pairs, and the spread of the observations about their mean, can
+    be no larger than over every observation in the evaluation period.
+    """
+    if len(obsVals) < 2 or len(modVals) == 0:
+        return None
+    if objFn == 'nnsesq':
+        modVals = modVals**2
+        obsVals = obsVals**2
+
+    posTmp = np.clip(np.searchsorted(obsTimes,modTimes),0,len(obsTimes)-1)
+    matchInd = (obsTimes[posTmp] == modTimes) & ~np.isnan(modVals)
+    sse = np.sum((modVals[matchInd] - obsVals[posTmp[matchInd]])**2)
+
+    if objFn == 'rmse':
+        return np.sqrt(sse/len(obsVals))
+    sst = np.sum((obsVals - obsVals.mean())**2)
+    if sst <= 0.0:
+        return None
+    boundTmp = sse/sst
+    if objFn in ['nnse','nnsesq']:
+        # 1 - NNSE = (1 - NSE)/(2 - NSE), which increases with 1 - NSE.
+        boundTmp = boundTmp/(1.0 + boundTmp)
+    return boundTmp
+
+def checkEarlyStop(jobData,staticData,db,gageID,gageMeta,basinNum,iteration,workDir,runDir):
+    """
+    Generic function to score the model output written so far for a running
+    calibration simulation. If the lower bound on the objective function
+    exceeds the best objective function found so far, the early stop flag is
+    left for the R code and the simulation is stopped. Returns True if the
+    simulation was stopped.
+    """
+    if iteration == 0 or not enabled(staticData):
+        return False
+
+    obsTmp = readObs(workDir,int(staticData.dailyAnalysis))
+    if obsTmp is None:
+        return False
+
+    try:
+        bestObj = db.bestObjective(jobData,int(jobData.jobID),int(gageID))
+    except:
+        raise
+    if bestObj is None:
+        return False
+
+    modTimes, modVals = modelSeries(staticData,readModel(runDir,int(gageMeta.comID),int(staticData.SplitOutputCount)))
+    if len(modTimes) == 0:
+        return False
+    if int(staticData.dailyAnalysis) == 1:
+        modTimes, modVals = dailyMeans(modTimes,modVals)
+    # The observations are limited to the evaluation period.
+    startTime = epochSeconds(staticData.bCalibEvalDate)
+    endTime = epochSeconds(staticData.eCalibDate)
+    obsInd = (obsTmp[0] >= startTime) & (obsTmp[0] <= endTime)
+
+    boundTmp = lowerBound(str(staticData.streamflowObjFunc).lower(),modTimes,modVals,
+                          obsTmp[0][obsInd],obsTmp[1][obsInd])
+    if boundTmp is None:
+        return False
+    if float(staticData.streamflowWeight)*boundTmp <= bestObj:
+        return False
+
+    print("OBJECTIVE FUNCTION LOWER BOUND: " + str(float(staticData.streamflowWeight)*boundTmp) + \
+          " EXCEEDS BEST: " + str(bestObj) + ". STOPPING SIMULATION EARLY")
+    flagPath = workDir + "/" + EARLY_STOP_FLAG
+    try:
+        with open(flagPath + ".TMP",'w') as fileObj:
+            fileObj.write(repr(float(boundTmp)) + "\n")
+        os.replace(flagPath + ".TMP",flagPath)
+    except:
+        jobData.errMsg = "ERROR: Unable to create early stop flag: " + flagPath
+        raise
+
+    try:
+        statusMod.killBasJob(jobData,basinNum)
+    except:
+        raise
+    modelCache.pop(runDir,None)
+    return True
@@ -9,6 +9,8 @@ from core import calibIoMod
 from core import namelistMod
 from core import statusMod
 from core import errMod
+from core import retentionMod
+from core import restartStoreMod
 import subprocess
 import time
 import pandas as pd
@@ -46,8 +48,7 @@ def runTroute(statusData,staticData,db,gageID,gage,gageMeta,modType):
     except:
         raise
 
-    yamlFile = open(statusData.trouteConfig)
-    yamlDict = yaml.load(yamlFile, Loader=yaml.FullLoader)
+    yamlDict = calibIoMod.loadTrouteYaml(statusData)
 
     begDate = min(staticData.bValidDate, staticData.bCalibDate)
     endDate = max(staticData.eValidDate, staticData.eCalibDate)
@@ -315,6 +316,16 @@ def runModelCtrl(statusData,staticData,db,gageID,gage,keySlot,basinNum,libPathTo
         basinStatus = statusMod.checkBasJobValid(statusData,basinNum,'CTRL',pbsJobId)
     except:
         raise
+
+    # Enforce the output retention policy while the model is running. Once the
+    # model is no longer running, a final pass is made before any evaluation.
+    try:
+        if basinStatus:
+            retentionMod.startWatcher(statusData,staticData,runDir,2)
+        else:
+            retentionMod.stopWatcher(statusData,staticData,runDir)
+    except:
+        raise
     try:
         genParmStatus = statusMod.checkParmGenJob(statusData,basinNum,pbsJobId)
     except:
@@ -337,8 +348,7 @@ def runModelCtrl(statusData,staticData,db,gageID,gage,keySlot,basinNum,libPathTo
             keySlot[basinNum,0] = 1.0
             keyStatus = 1.0
             return
-        yamlFile = open(statusData.trouteConfig)
-        yamlDict = yaml.load(yamlFile, Loader=yaml.FullLoader)
+        yamlDict = calibIoMod.loadTrouteYaml(statusData)
         runStatus = statusMod.walkModTroute(min(staticData.bValidDate, staticData.bCalibDate),max(staticData.eValidDate, staticData.eCalibDate),runDir,yamlDict)
         begDate = runStatus[0]
         endDate = runStatus[1]
@@ -583,6 +593,9 @@ def runModelCtrl(statusData,staticData,db,gageID,gage,keySlot,basinNum,libPathTo
             statusData.errMsg = "ERROR: Unable to launch WRF-Hydro job for gage: " + str(gageMeta.gage[basinNum])
             raise
 
+        # Start pruning the run directory per the output retention policy.
+        retentionMod.startWatcher(statusData,staticData,runDir,2)
+
         #if statusData.jobRunType == 1:
         #    # Fire off model.
         #    cmd = "bsub < " + runDir + "/run_WH.sh"
@@ -664,6 +677,9 @@ def runModelCtrl(statusData,staticData,db,gageID,gage,keySlot,basinNum,libPathTo
             statusData.errMsg = "ERROR: Unable to launch WRF-Hydro job for gage: " + str(gageMeta.gage[basinNum])
             raise
 
+        # Start pruning the run directory per the output retention policy.
+        retentionMod.startWatcher(statusData,staticData,runDir,2)
+
         #if statusData.jobRunType == 1:
         #    # Fire off model.
         #    cmd = "bsub < " + runDir + "/run_WH.sh"
@@ -952,6 +968,16 @@ def runModelBest(statusData,staticData,db,gageID,gage,keySlot,basinNum,pbsJobId)
         basinStatus = statusMod.checkBasJobValid(statusData,basinNum,'BEST',pbsJobId)
     except:
         raise
+
+    # Enforce the output retention policy while the model is running. Once the
+    # model is no longer running, a final pass is made before any evaluation.
+    try:
+        if basinStatus:
+            retentionMod.startWatcher(statusData,staticData,runDir,3)
+        else:
+            retentionMod.stopWatcher(statusData,staticData,runDir)
+    except:
+        raise
     try:
         evalStatus = statusMod.checkEvalJob(statusData,basinNum,pbsJobId)
     except:
@@ -977,8 +1003,7 @@ def runModelBest(statusData,staticData,db,gageID,gage,keySlot,basinNum,pbsJobId)
             keySlot[basinNum,1] = 0.75
             keyStatus = 0.75
         else:    
-            yamlFile = open(statusData.trouteConfig)
-            yamlDict = yaml.load(yamlFile, Loader=yaml.FullLoader)
+            yamlDict = calibIoMod.loadTrouteYaml(statusData)
             runStatus = statusMod.walkModTroute(min(staticData.bValidDate, staticData.bCalibDate),max(staticData.eValidDate, staticData.eCalibDate),runDir,yamlDict)
             begDate = runStatus[0]
             endDate = runStatus[1]
@@ -1233,6 +1258,9 @@ def runModelBest(statusData,staticData,db,gageID,gage,keySlot,basinNum,pbsJobId)
         except:
             statusData.errMsg = "ERROR: Unable to launch WRF-Hydro job for gage: " + str(gageMeta.gage[basinNum])
             raise
+
+        # Start pruning the run directory per the output retention policy.
+        retentionMod.startWatcher(statusData,staticData,runDir,3)
                 
         # Fire off model.
         #if statusData.jobRunType == 1:
@@ -1314,6 +1342,9 @@ def runModelBest(statusData,staticData,db,gageID,gage,keySlot,basinNum,pbsJobId)
             statusData.errMsg = "ERROR: Unable to launch WRF-Hydro job for gage: " + str(gageMeta.gage[basinNum])
             raise
 
+        # Start pruning the run directory per the output retention policy.
+        retentionMod.startWatcher(statusData,staticData,runDir,3)
+
         #if statusData.jobRunType == 1:
         #    cmd = "bsub < " + runDir + "/run_WH.sh"
         #    try:
@@ -2250,8 +2281,8 @@ def linkToRst(statusData,gage,runDir,gageMeta,staticData):
     link2 = runDir + "/HYDRO_RST." + begDate.strftime('%Y-%m-%d') + "_00:00_DOMAIN1"
     if staticData.optSpinFlag == 0: 
         # Check to make sure symbolic link to spinup state exists.
-        check1 = statusData.jobDir + "/" + gage + "/RUN.SPINUP/OUTPUT/RESTART." + statusData.eSpinDate.strftime('%Y%m%d') + "00_DOMAIN1"
-        check2 = statusData.jobDir + "/" + gage + "/RUN.SPINUP/OUTPUT/HYDRO_RST." + statusData.eSpinDate.strftime('%Y-%m-%d') + "_00:00_DOMAIN1"
+        # If linked from the restart store, link to the files in the store directly.
+        check1, check2 = restartStoreMod.spinupState(statusData,gage)
         if not os.path.isfile(check1):
             statusData.errMsg = "ERROR: Spinup state: " + check1 + " not found."
             raise Exception()
@@ -73,7 +73,7 @@ def main(argv):
                        nnse real, peak_bias real, peak_tm_err_hr real, event_volume_bias real,
                        cor_snow real, rmse_snow real, bias_snow real, nse_snow real, kge_snow real,
                        cor_soil real, rmse_soil real, bias_soil real, nse_soil real, kge_soil real, kge_alpha_soil real,
-                       best integer, complete real)''')
+                       best integer, complete real, stopped integer default 0)''')
     # Xia added new metrics for Calib_Stats and Valid_Stats 20210610
     except:
         errOut(dbConn,"Unable to create table: Calib_Stats.",dbPath)
@@ -105,7 +105,11 @@ def main(argv):
                        huc4 text, huc6 text, huc8 text, ecol3 text, ecol4 text,
                        rfc text, dx_hydro real, agg_factor integer, hydro_tbl_spatial text,
                        opt_spin_land_path text, opt_spin_hydro_path text,
-                       chan_parm_path text)''')
+                       chan_parm_path text, land_nx integer, land_ny integer,
+                       hydro_nx integer, hydro_ny integer, geo_file_size integer,
+                       fulldom_file_size integer, soil_file_size integer,
+                       hydro_tbl_file_size integer, wrfinput_file_size integer,
+                       rtlink_file_size integer)''')
     except:
         errOut(dbConn,"Unable to create table: Domain_Meta.",dbPath)
         
@@ -149,6 +153,32 @@ def main(argv):
     except:
         errOut(dbConn,"Unable to create table: Valid_Stats.",dbPath)
     
+    try:
+        dbConn.execute('''CREATE TABLE Basin_Status
+                       (jobID integer, domainID integer, phase integer,
+                       iteration integer, state integer,
+                       PRIMARY KEY (jobID, domainID, phase, iteration))''')
+    except:
+        errOut(dbConn,"Unable to create table: Basin_Status.",dbPath)
+    
+    try:
+        dbConn.execute('''CREATE TABLE Calib_Convergence
+                       (jobID integer, domainID integer, iteration integer,
+                       reason text, bestObj real, improvement real,
+                       projectedGain real, nSkipped integer,
+                       PRIMARY KEY (jobID, domainID))''')
+    except:
+        errOut(dbConn,"Unable to create table: Calib_Convergence.",dbPath)
+    
+    try:
+        dbConn.execute('''CREATE TABLE Calib_Fidelity
+                       (jobID integer, domainID integer, iteration integer,
+                       shortObj real, predictedObj real, threshold real,
+                       promoted integer,
+                       PRIMARY KEY (jobID, domainID, iteration))''')
+    except:
+        errOut(dbConn,"Unable to create table: Calib_Fidelity.",dbPath)
+    
     # Close the database file
     try:
         dbConn.close()
@@ -31,6 +31,15 @@
 # 24) 'ecol3' - Level 3 eco region identifier with this basin.
 # 25) 'ecol4' - Level 4 eco region identifier with this basin.
 # 26) 'rfc' - River Forecast Center basin resides in.
+#
+# By default, basins are validated and entered into the DB one at a time.
+# With the --bulk option, all basins are validated (file checks, grid
+# spacing calculations) in parallel over a pool of processes, and then
+# entered into the DB in a single transaction. If any basin fails
+# validation, nothing is entered. In both modes, the grid dimensions
+# of the land and hydro grids, along with the sizes of the main input
+# files, are stored in the Domain_Meta table so later stages of the
+# workflow do not need to re-open the files.
 
 # Logan Karsten
 # National Center for Atmospheric Research
@@ -42,6 +51,7 @@ import sys
 import pandas as pd
 from netCDF4 import Dataset
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 
 #import warnings
 #warnings.filterwarnings("ignore")
@@ -55,6 +65,24 @@ for j in range(1,len(pathSplit)-1):
 topDir = libPath
 libPathTop = libPath + 'core'
 
+# Columns entered into the Domain_Meta table for each basin, in order.
+DOMAIN_COLUMNS = ['gage_id','link_id','domain_path','gage_agency','geo_e','geo_w','geo_s','geo_n',
+                  'hyd_e','hyd_w','hyd_s','hyd_n','geo_file','land_spatial_meta_file','wrfinput_file',
+                  'soil_file','fulldom_file','rtlink_file','spweight_file','gw_file','gw_mask',
+                  'lake_file','forcing_dir','obs_file','site_name','lat','lon','area_sqmi','area_sqkm',
+                  'county_cd','state','huc2','huc4','huc6','huc8','ecol3','ecol4','rfc','dx_hydro',
+                  'agg_factor','hydro_tbl_spatial','opt_spin_land_path','opt_spin_hydro_path',
+                  'chan_parm_path','land_nx','land_ny','hydro_nx','hydro_ny','geo_file_size',
+                  'fulldom_file_size','soil_file_size','hydro_tbl_file_size','wrfinput_file_size',
+                  'rtlink_file_size']
+
+# Columns added to the Domain_Meta table after its original definition. These
+# are added to older DB files that do not contain them yet.
+NEW_COLUMNS = [['land_nx','integer'],['land_ny','integer'],['hydro_nx','integer'],
+               ['hydro_ny','integer'],['geo_file_size','integer'],['fulldom_file_size','integer'],
+               ['soil_file_size','integer'],['hydro_tbl_file_size','integer'],
+               ['wrfinput_file_size','integer'],['rtlink_file_size','integer']]
+
 def main(argv):
     # Parse arguments. User must input a job name and directory.
     parser = argparse.ArgumentParser(description='Utility program to enter ' + \
@@ -63,6 +91,10 @@ def main(argv):
                         help='Input CSV file containing information on basins.')
     parser.add_argument('--optDbPath',type=str,nargs='?',
                         help='Optional alternative path to SQLite DB file.')
+    parser.add_argument('--bulk',action='store_true',
+                        help='Validate all basins in parallel and enter them in a single transaction.')
+    parser.add_argument('--nProcs',type=int,nargs='?',
+                        help='Optional number of processes to use with --bulk. Defaults to the number of CPUs.')
                         
     args = parser.parse_args()
     
@@ -78,6 +110,14 @@ def main(argv):
         if not os.path.isfile(dbPath):
             print("ERROR: SQLite3 DB file: " + dbPath + " Does Not Exist.")
             sys.exit(1)
+
+    if args.nProcs is not None:
+        if args.nProcs <= 0:
+            print("ERROR: Please specify a number of processes greater than zero.")
+            sys.exit(1)
+        nProcs = args.nProcs
+    else:
+        nProcs = os.cpu_count()
     
     # Open the SQLite DB file
     try:
@@ -91,6 +131,9 @@ def main(argv):
     except:
         print("ERROR: Unable to establish cursor object for: " + dbPath)
         sys.exit(1)
+
+    # Add any columns to the domain table that are missing from older DB files.
+    addNewColumns(conn,dbCursor)
     
     # Create expected dictionary of column types
     dtype_dic= {'site_no':str,'link':int,'hyd_w':int,'hyd_e':int,'hyd_s':int,'hyd_n':int,
@@ -129,149 +172,68 @@ def main(argv):
     if nSites <= 0:
         print("ERROR: Zero entries detected in input CSV file.")
         sys.exit(1)
-        
-    # Loop through basins and enter information into the DB.
-    for siteNum in range(0,nSites):
-        # Pull necessary data from CSV file
-        siteNo = metaCSV.site_no[siteNum]
-        link = metaCSV.link[siteNum]
-        hydW = metaCSV.hyd_w[siteNum]
-        hydE = metaCSV.hyd_e[siteNum]
-        hydS = metaCSV.hyd_s[siteNum]
-        hydN = metaCSV.hyd_n[siteNum]
-        geoW = metaCSV.geo_w[siteNum]
-        geoE = metaCSV.geo_e[siteNum]
-        geoS = metaCSV.geo_s[siteNum]
-        geoN = metaCSV.geo_n[siteNum]
-        dirBasin = metaCSV.dirname[siteNum]
-        agency = metaCSV.agency_cd[siteNum]
-        sName = metaCSV.site_name[siteNum]
-        lat = metaCSV.lat[siteNum]
-        lon = metaCSV.lon[siteNum]
-        sqMi = metaCSV.area_sqmi[siteNum]
-        sqKm = metaCSV.area_sqkm[siteNum]
-        county = metaCSV.county_cd[siteNum]
-        state = metaCSV.state[siteNum]
-        huc2 = metaCSV.HUC2[siteNum]
-        huc4 = metaCSV.HUC4[siteNum]
-        huc6 = metaCSV.HUC6[siteNum]
-        huc8 = metaCSV.HUC8[siteNum]
-        eco3 = metaCSV.ecol3[siteNum]
-        eco4 = metaCSV.ecol4[siteNum]
-        rfc = metaCSV.rfc[siteNum]
-        
-        if not os.path.isdir(dirBasin):
-            print("ERROR: Directory: " + dirBasin + " not found.")
-            sys.exit(1)
-            
-        # Compose paths to input files and check for existence of files.
-        geoPath = dirBasin + "/geo_em.nc"
-        landSpatialMetaPath = dirBasin + "/GEOGRID_LDASOUT_Spatial_Metadata.nc"
-        fullDomPath = dirBasin + "/Fulldom.nc"
-        gwPath = dirBasin + "/GWBUCKPARM.nc"
-        gwMskPath = dirBasin + "/GWBASINS.nc"
-        lakePath1 = dirBasin + "/LAKEPARM.nc"
-        lakePath2 = dirBasin + "/LAKEPARM.TBL"
-        chanParmPath = dirBasin + "/CHANPARM.TBL"
-        routePath = dirBasin + "/RouteLink.nc"
-        soilPath = dirBasin + "/soil_properties.nc"
-        hydro2d = dirBasin + "/HYDRO_TBL_2D.nc"
-        wghtPath = dirBasin + "/spatialweights.nc"
-        wrfInPath = dirBasin + "/wrfinput.nc"
-        forceDir = dirBasin + "/FORCING"
-        obsDir = dirBasin + "/OBS/"
-        optSpinLandFile = dirBasin + "/LandRestartSubstitute.nc"
-        optSpinHydroFile = dirBasin + "/HydroRestartSubstitute.nc"
-        
-        # Double check to make sure input files exist
-        if not os.path.isfile(geoPath):
-            print("ERROR: " + geoPath + " not found.")
-            sys.exit(1)
-        if not os.path.isfile(landSpatialMetaPath):
-            print("WARNING: " + landSpatialMetaPath + " not found. Output will not be CF-Compliant.")
-            landSpatialMetaPath = "-9999"
-        if not os.path.isfile(fullDomPath):
-            print("ERROR: " + fullDomPath + " not found.")
-            sys.exit(1)
-        if not os.path.isfile(gwPath):
-            print("WARNING: " + gwPath + " not found. Assuming you are running without the ground water bucket model.")
-            gwPath = "-9999"
-        if not os.path.isfile(lakePath1) and not os.path.isfile(lakePath2):
-            print("WARNING: No lake parameter files found. Assuming you have setup a domain with no lakes.")
-            lakePath = '-9999'
-        if not os.path.isfile(routePath):
-            print("WARNING: " + routePath + " not found. Assuming this is for gridded routing.....")
-            routePath = "-9999"
-        if not os.path.isfile(chanParmPath):
-            print("WARNING: " + chanParmPath + " not found. Assuming this is a basin with reach-based routing....")
-            chanParmPath = "-9999"
-        if not os.path.isfile(soilPath):
-            print("ERROR: " + soilPath + " not found.")
-            sys.exit(1)
-        if not os.path.isfile(hydro2d):
-            print("ERROR: " + hydro2d + " not found.")
-            sys.exit(1)
-        if not os.path.isfile(wghtPath):
-            print("WARNING: " + wghtPath + " not found. Assuming you are running a non NWM routing....")
-            wghtPath = "-9999"
-        if not os.path.isfile(wrfInPath):
-            print("ERROR: " + wrfInPath + " not found.")
-            sys.exit(1)
-        if not os.path.isdir(forceDir):
-            print("ERROR: " + forceDir + " not found.")
-            sys.exit(1)
-        if not os.path.isdir(obsDir):
-            print("ERROR: " + obsDir + " not found.")
-            sys.exit(1)
-        if not os.path.isfile(gwMskPath):
-            print("WARNING: " + gwMskPath + " not found. Assuming you are running NWM routing....")
-            gwMskPath = "-9999"
-        if not os.path.isfile(optSpinLandFile):
-            print("WARNING: " + optSpinLandFile + " not found for optional spinup states.")
-            optSpinLandFile = "-9999"
-        if not os.path.isfile(optSpinHydroFile):
-            print("WARNING: " + optSpinHydroFile + " not found for optional spinup states.")
-            optSpinHydroFile = "-9999"
-            
-        # Look for a NetCDF lake parameter file first, and use it. If not, use the ASCII table instead.
-        if os.path.isfile(lakePath1):
-            lakePath = lakePath1
-        else:
-            if os.path.isfile(lakePath2):
-                lakePath = lakePath2
-            
-        # Calculate grid spacing and aggregation factors from geogrid and Fulldom files...
-        dxrt,aggFactor = calcSpacing(geoPath,fullDomPath)
-        
-        # Compose Postgres command
-        cmd = "INSERT INTO \"Domain_Meta\" (gage_id,link_id,domain_path,gage_agency,geo_e," + \
-              "geo_w,geo_s,geo_n,hyd_e,hyd_w,hyd_s,hyd_n,geo_file,land_spatial_meta_file,wrfinput_file," + \
-              "soil_file,fulldom_file,rtlink_file,spweight_file," + \
-              "gw_file,gw_mask,lake_file,forcing_dir,obs_file,site_name,lat,lon," + \
-              "area_sqmi,area_sqkm,county_cd,state,huc2,huc4,huc6,huc8,ecol3,ecol4,rfc," + \
-              "dx_hydro,agg_factor,hydro_tbl_spatial,opt_spin_land_path," + \
-              "opt_spin_hydro_path,chan_parm_path) VALUES " + \
-              "('%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s','%s');" % (siteNo,\
-              link,dirBasin,agency,geoE,geoW,geoS,geoN,hydE,hydW,\
-              hydS,hydN,geoPath,landSpatialMetaPath,wrfInPath,soilPath,fullDomPath,routePath,wghtPath,gwPath,\
-              gwMskPath,lakePath,forceDir,obsDir,sName,lat,lon,sqMi,sqKm,\
-              county,state,huc2,huc4,huc6,huc8,eco3,eco4,rfc,dxrt,aggFactor,hydro2d,
-              optSpinLandFile,optSpinHydroFile,chanParmPath)
-              
-        # Make entry into DB
+
+    # Pull the CSV rows into plain Python dictionaries so they can be handed
+    # off to worker processes.
+    basinRows = metaCSV.to_dict('records')
+
+    # Compose the SQL command used to enter each basin.
+    cmd = "INSERT INTO \"Domain_Meta\" (" + ",".join(DOMAIN_COLUMNS) + ") VALUES (" + \
+          ",".join(['?']*len(DOMAIN_COLUMNS)) + ");"
+
+    if args.bulk:
+        # Validate all basins in parallel. Results come back in the order of
+        # the CSV file.
+        print("Validating " + str(nSites) + " basins using " + str(nProcs) + " processes.")
         try:
-            #conn.execute(cmd)
-            dbCursor.execute(cmd)
+            with ProcessPoolExecutor(max_workers=nProcs) as pool:
+                results = list(pool.map(checkBasin,basinRows,chunksize=max(1,int(nSites/(nProcs*4)))))
         except:
-            print("ERROR: Unable to execute postgres command: " + cmd)
+            print("ERROR: Failure validating basins in parallel.")
             sys.exit(1)
-            
+
+        errList = []
+        for values, warnList, errMsg in results:
+            for warnMsg in warnList:
+                print(warnMsg)
+            if errMsg is not None:
+                errList.append(errMsg)
+        if len(errList) > 0:
+            for errMsg in errList:
+                print(errMsg)
+            print("ERROR: " + str(len(errList)) + " basins failed validation. No basins were entered into the DB.")
+            sys.exit(1)
+
+        # Enter all basins in a single transaction.
         try:
-            #db.commit()
+            dbCursor.executemany(cmd,[values for values, warnList, errMsg in results])
             conn.commit()
         except:
-            print("ERROR: Unable to commit postgres command: " + cmd)
+            conn.rollback()
+            print("ERROR: Unable to enter basins into the DB. No basins were entered.")
             sys.exit(1)
+    else:
+        # Loop through basins and enter information into the DB.
+        for basinRow in basinRows:
+            values, warnList, errMsg = checkBasin(basinRow)
+            for warnMsg in warnList:
+                print(warnMsg)
+            if errMsg is not None:
+                print(errMsg)
+                sys.exit(1)
+
+            # Make entry into DB
+            try:
+                dbCursor.execute(cmd,values)
+            except:
+                print("ERROR: Unable to execute SQL command: " + cmd + " for basin: " + str(basinRow['site_no']))
+                sys.exit(1)
+
+            try:
+                conn.commit()
+            except:
+                print("ERROR: Unable to commit SQL command: " + cmd + " for basin: " + str(basinRow['site_no']))
+                sys.exit(1)
             
     # Close connection to DB
     try:
@@ -279,10 +241,150 @@ def main(argv):
     except:
         print("ERROR: Unable to close DB connection.")
         sys.exit(1)
+
+def addNewColumns(conn,dbCursor):
+    """ Generic function to add columns to the Domain_Meta table of DB files
+        created before those columns existed.
+    """
+    try:
+        dbCursor.execute("PRAGMA table_info(\"Domain_Meta\");")
+        existCols = [colTmp[1] for colTmp in dbCursor.fetchall()]
+    except:
+        print("ERROR: Unable to query the columns of the Domain_Meta table.")
+        sys.exit(1)
+
+    for colName, colType in NEW_COLUMNS:
+        if colName in existCols:
+            continue
+        try:
+            dbCursor.execute("ALTER TABLE \"Domain_Meta\" ADD COLUMN " + colName + " " + colType + ";")
+            conn.commit()
+        except:
+            print("ERROR: Unable to add column: " + colName + " to the Domain_Meta table.")
+            sys.exit(1)
+
+def fileSize(pathTmp):
+    """ Generic function to return the size of a file in bytes, or None if
+        the file does not exist. A single stat call is used for both.
+    """
+    try:
+        statTmp = os.stat(pathTmp)
+    except OSError:
+        return None
+    return statTmp.st_size
+
+def checkBasin(basinRow):
+    """ Generic function to validate the input files for a single basin, and
+        compose the values entered into the Domain_Meta table. Returns the
+        values, a list of warning messages, and an error message (None if the
+        basin passed validation). This is ran in worker processes for bulk
+        entries, so nothing is printed here.
+    """
+    warnList = []
+    dirBasin = str(basinRow['dirname'])
+
+    if not os.path.isdir(dirBasin):
+        return [None,warnList,"ERROR: Directory: " + dirBasin + " not found."]
+
+    # Compose paths to input files and check for existence of files.
+    geoPath = dirBasin + "/geo_em.nc"
+    landSpatialMetaPath = dirBasin + "/GEOGRID_LDASOUT_Spatial_Metadata.nc"
+    fullDomPath = dirBasin + "/Fulldom.nc"
+    gwPath = dirBasin + "/GWBUCKPARM.nc"
+    gwMskPath = dirBasin + "/GWBASINS.nc"
+    lakePath1 = dirBasin + "/LAKEPARM.nc"
+    lakePath2 = dirBasin + "/LAKEPARM.TBL"
+    chanParmPath = dirBasin + "/CHANPARM.TBL"
+    routePath = dirBasin + "/RouteLink.nc"
+    soilPath = dirBasin + "/soil_properties.nc"
+    hydro2d = dirBasin + "/HYDRO_TBL_2D.nc"
+    wghtPath = dirBasin + "/spatialweights.nc"
+    wrfInPath = dirBasin + "/wrfinput.nc"
+    forceDir = dirBasin + "/FORCING"
+    obsDir = dirBasin + "/OBS/"
+    optSpinLandFile = dirBasin + "/LandRestartSubstitute.nc"
+    optSpinHydroFile = dirBasin + "/HydroRestartSubstitute.nc"
+
+    # Sizes of the main input files. These double as the existence checks.
+    geoSize = fileSize(geoPath)
+    fullDomSize = fileSize(fullDomPath)
+    soilSize = fileSize(soilPath)
+    hydro2dSize = fileSize(hydro2d)
+    wrfInSize = fileSize(wrfInPath)
+    routeSize = fileSize(routePath)
+
+    # Double check to make sure input files exist
+    if geoSize is None:
+        return [None,warnList,"ERROR: " + geoPath + " not found."]
+    if not os.path.isfile(landSpatialMetaPath):
+        warnList.append("WARNING: " + landSpatialMetaPath + " not found. Output will not be CF-Compliant.")
+        landSpatialMetaPath = "-9999"
+    if fullDomSize is None:
+        return [None,warnList,"ERROR: " + fullDomPath + " not found."]
+    if not os.path.isfile(gwPath):
+        warnList.append("WARNING: " + gwPath + " not found. Assuming you are running without the ground water bucket model.")
+        gwPath = "-9999"
+    if os.path.isfile(lakePath1):
+        # Look for a NetCDF lake parameter file first, and use it. If not, use the ASCII table instead.
+        lakePath = lakePath1
+    elif os.path.isfile(lakePath2):
+        lakePath = lakePath2
+    else:
+        warnList.append("WARNING: No lake parameter files found. Assuming you have setup a domain with no lakes.")
+        lakePath = '-9999'
+    if routeSize is None:
+        warnList.append("WARNING: " + routePath + " not found. Assuming this is for gridded routing.....")
+        routePath = "-9999"
+        routeSize = -9999
+    if not os.path.isfile(chanParmPath):
+        warnList.append("WARNING: " + chanParmPath + " not found. Assuming this is a basin with reach-based routing....")
+        chanParmPath = "-9999"
+    if soilSize is None:
+        return [None,warnList,"ERROR: " + soilPath + " not found."]
+    if hydro2dSize is None:
+        return [None,warnList,"ERROR: " + hydro2d + " not found."]
+    if not os.path.isfile(wghtPath):
+        warnList.append("WARNING: " + wghtPath + " not found. Assuming you are running a non NWM routing....")
+        wghtPath = "-9999"
+    if wrfInSize is None:
+        return [None,warnList,"ERROR: " + wrfInPath + " not found."]
+    if not os.path.isdir(forceDir):
+        return [None,warnList,"ERROR: " + forceDir + " not found."]
+    if not os.path.isdir(obsDir):
+        return [None,warnList,"ERROR: " + obsDir + " not found."]
+    if not os.path.isfile(gwMskPath):
+        warnList.append("WARNING: " + gwMskPath + " not found. Assuming you are running NWM routing....")
+        gwMskPath = "-9999"
+    if not os.path.isfile(optSpinLandFile):
+        warnList.append("WARNING: " + optSpinLandFile + " not found for optional spinup states.")
+        optSpinLandFile = "-9999"
+    if not os.path.isfile(optSpinHydroFile):
+        warnList.append("WARNING: " + optSpinHydroFile + " not found for optional spinup states.")
+        optSpinHydroFile = "-9999"
+
+    # Calculate grid spacing and aggregation factors from geogrid and Fulldom files...
+    try:
+        dxrt,aggFactor,landNx,landNy,hydroNx,hydroNy = calcSpacing(geoPath,fullDomPath)
+    except Exception as errTmp:
+        return [None,warnList,str(errTmp)]
+
+    values = (str(basinRow['site_no']),int(basinRow['link']),dirBasin,str(basinRow['agency_cd']),
+              int(basinRow['geo_e']),int(basinRow['geo_w']),int(basinRow['geo_s']),int(basinRow['geo_n']),
+              int(basinRow['hyd_e']),int(basinRow['hyd_w']),int(basinRow['hyd_s']),int(basinRow['hyd_n']),
+              geoPath,landSpatialMetaPath,wrfInPath,soilPath,fullDomPath,routePath,wghtPath,gwPath,
+              gwMskPath,lakePath,forceDir,obsDir,str(basinRow['site_name']),float(basinRow['lat']),
+              float(basinRow['lon']),float(basinRow['area_sqmi']),float(basinRow['area_sqkm']),
+              str(basinRow['county_cd']),str(basinRow['state']),str(basinRow['HUC2']),str(basinRow['HUC4']),
+              str(basinRow['HUC6']),str(basinRow['HUC8']),str(basinRow['ecol3']),str(basinRow['ecol4']),
+              str(basinRow['rfc']),dxrt,aggFactor,hydro2d,optSpinLandFile,optSpinHydroFile,chanParmPath,
+              landNx,landNy,hydroNx,hydroNy,geoSize,fullDomSize,soilSize,hydro2dSize,wrfInSize,routeSize)
+
+    return [values,warnList,None]
         
 def calcSpacing(geoPath,fullDomPath):
     """ Generic function to calculate the high resolution grid spacing and 
-        aggregation factor between the land and hydro grid. 
+        aggregation factor between the land and hydro grid. The dimensions
+        of both grids are returned as well.
     """
     
     # Open the geogrid file and pull the DX attribute (meters) from the file. 
@@ -290,28 +392,26 @@ def calcSpacing(geoPath,fullDomPath):
         idGeo = Dataset(geoPath,'r')
         dxLand = float(idGeo.DX)
         nRowLand = float(idGeo.variables['XLAT_M'].shape[1])
+        nColLand = int(idGeo.variables['XLAT_M'].shape[2])
     except:
-        print("ERROR: Unable to open: " + geoPath + " and extract DX global attribute along with number of rows.")
-        sys.exit(1)
+        raise Exception("ERROR: Unable to open: " + geoPath + " and extract DX global attribute along with number of rows.")
         
     try:
         idGeo.close()
     except:
-        print("ERROR: Unable to close: " + geoPath)
-        sys.exit(1)
+        raise Exception("ERROR: Unable to close: " + geoPath)
         
     # Open the Fulldom file and extract the resolution from teh "x" coordinate variable.
     try:
         idFullDom = Dataset(fullDomPath,'r')
     except:
-        print("ERROR: Unable to open: " + fullDomPath)
-        sys.exit(1)
+        raise Exception("ERROR: Unable to open: " + fullDomPath)
     
     try:
         nRowHydro = float(idFullDom.variables['y'].shape[0])
+        nColHydro = int(idFullDom.variables['x'].shape[0])
     except:
-        print("ERROR: Unable to extract Fulldom number of rows from y coordinate variable.")
-        sys.exit(1)
+        raise Exception("ERROR: Unable to extract Fulldom number of rows from y coordinate variable.")
         
     try:
         idFullDom.close()
@@ -321,7 +421,7 @@ def calcSpacing(geoPath,fullDomPath):
     aggFactor = int(nRowHydro/nRowLand)
     dxHydro = dxLand/aggFactor
     
-    return dxHydro,aggFactor
+    return dxHydro,aggFactor,nColLand,int(nRowLand),nColHydro,int(nRowHydro)
         
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -96,11 +96,17 @@ def main(argv):
         errMod.errOut(jobData)
         
     # If a job ID value was found, this means information from this configuration
-    # file has already been initiated by the workflow into the database. 
+    # file has already been initiated by the workflow into the database. The
+    # only exception is a previous attempt where the setup of the job directories
+    # did not finish, in which case the setup is resumed.
+    resumeFlag = False
     if int(jobData.jobID) != -9999:
-        jobData.errMsg = "ERROR: Information for this job has already " + \
-                         "been entered as job ID: " + str(jobData.jobID)
-        errMod.errOut(jobData)
+        if not calibIoMod.setupIncomplete(jobData):
+            jobData.errMsg = "ERROR: Information for this job has already " + \
+                             "been entered as job ID: " + str(jobData.jobID)
+            errMod.errOut(jobData)
+        print("RESUMING INCOMPLETE SETUP FOR JOB ID: " + str(jobData.jobID))
+        resumeFlag = True
         
     # Extract list of gages to perform workflow on
     try:
@@ -108,38 +114,40 @@ def main(argv):
     except:
         errMod.errOut(jobData)
         
-    # Check to see if this job ID contains any entries in other tables. If it does,
-    # Warn the user that this data will be wiped, and prompt the user to confirm
-    # they want to delete the data from the other tables. 
-    try:
-        statusTmp = db.checkPreviousEntries(jobData)
-    except:
-        errMod.errOut(jobData)
+    # The remaining database entries for the job are only made for a new job.
+    if not resumeFlag:
+        # Check to see if this job ID contains any entries in other tables. If it does,
+        # Warn the user that this data will be wiped, and prompt the user to confirm
+        # they want to delete the data from the other tables. 
+        try:
+            statusTmp = db.checkPreviousEntries(jobData)
+        except:
+            errMod.errOut(jobData)
 
-    # If any entries in the tables were found, warn the user that tables from an
-    # orphaned ghost job are being deleted. This may be a situation where a previous 
-    # job was ran in the DB, it was removed from Job_Meta, but the remaining tables
-    # weren't cleaned up.
-    if not statusTmp:
-        print("WARNING: Old orphaned table entries from this jobID are being deleted.")
+        # If any entries in the tables were found, warn the user that tables from an
+        # orphaned ghost job are being deleted. This may be a situation where a previous 
+        # job was ran in the DB, it was removed from Job_Meta, but the remaining tables
+        # weren't cleaned up.
+        if not statusTmp:
+            print("WARNING: Old orphaned table entries from this jobID are being deleted.")
+            try:
+                db.cleanupJob(jobData)
+            except:
+                errMod.errOut(jobData)
+
+        # Create DB entries for job name
         try:
-            db.cleanupJob(jobData)
+            db.enterJobID(jobData,optExpId)
         except:
             errMod.errOut(jobData)
-        
-    # Create DB entries for job name
-    try:
-        db.enterJobID(jobData,optExpId)
-    except:
-        errMod.errOut(jobData)
-        
-    # Pull Job ID from newly created job. Will be used for calibration 
-    # parameter DB entries
-    try:
-        db.getJobID(jobData)
-    except:
-        errMod.errOut(jobData)
-    
+
+        # Pull Job ID from newly created job. Will be used for calibration 
+        # parameter DB entries
+        try:
+            db.getJobID(jobData)
+        except:
+            errMod.errOut(jobData)
+
     # Create necessary run directories to hold output, analysis, etc.
     try:
         calibIoMod.setupModels(jobData,db,args,libPathTop)
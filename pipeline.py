@@ -0,0 +1,355 @@
+# Main calling program to carry a group of basins through the spinup,
+# calibration and validation of the National Water Model in a single
+# program. Each basin moves on to its next phase as soon as its previous
+# phase is complete, rather than waiting for every basin in the job to
+# finish that phase. This allows the model cores assigned to a basin that
+# finishes early to go straight to later-phase work.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+# karsten@ucar.edu
+# 303-497-2693
+
+import sys
+import argparse
+import os
+import numpy as np
+import time
+import datetime
+
+from core import statusMod
+from core import dbMod
+from core import errMod
+from core import configMod
+from core import calibIoMod
+from core import spinupMod
+from core import calibMod
+from core import validMod
+from core import basinStatusMod
+from core import snapshotMod
+
+# Set the Python path to include package specific functions.
+prPath = os.path.realpath(__file__)
+pathSplit = prPath.split('/')
+libPath = '/'
+for j in range(1,len(pathSplit)-1):
+    libPath = libPath + pathSplit[j] + '/'
+topDir = libPath
+libPathTop = libPath + 'core'
+
+# Phase values each basin walks through.
+PHASE_SPINUP = 0
+PHASE_CALIB = 1
+PHASE_VALID_CTRL = 2
+PHASE_VALID_BEST = 3
+PHASE_COMPLETE = 4
+
+def basinPhases(spinKeySlot,calibKeySlot,validKeySlot,groupMask,runSpinup,runCalib,runValid):
+    """
+    Generic function to determine the phase of each basin from the status of
+    each phase. Basins outside of this group are flagged as complete.
+    """
+    phaseOut = np.full(len(groupMask),PHASE_COMPLETE,np.int64)
+    calibDone = basinStatusMod.isDone(calibKeySlot).all(axis=1)
+    for basin in np.nonzero(groupMask)[0]:
+        if runSpinup and spinKeySlot[basin] != 1.0:
+            phaseOut[basin] = PHASE_SPINUP
+        elif runCalib and not calibDone[basin]:
+            phaseOut[basin] = PHASE_CALIB
+        elif runValid and validKeySlot[basin,0] != 1.0:
+            phaseOut[basin] = PHASE_VALID_CTRL
+        elif runValid and validKeySlot[basin,1] != 1.0:
+            phaseOut[basin] = PHASE_VALID_BEST
+    return phaseOut
+
+def main(argv):
+    # Parse arguments. User must input a job name.
+    parser = argparse.ArgumentParser(description='Main program to start or restart ' + \
+             'the spinup/calibration/validation pipeline for WRF-Hydro')
+    parser.add_argument('jobID',metavar='jobID',type=str,nargs='+',
+                        help='Job ID specific to calibration experiment.')
+    parser.add_argument('groupNum',metavar='groupNum',type=str,nargs='+',
+                        help='Group number associated with basins to process.')
+    parser.add_argument('--optDbPath',type=str,nargs='?',
+                        help='Optional alternative path to SQLite DB file.')
+
+    args = parser.parse_args()
+
+    # If the SQLite file does not exist, throw an error.
+    if args.optDbPath is not None:
+        if not os.path.isfile(args.optDbPath):
+            print("ERROR: " + args.optDbPath + " Does Not Exist.")
+            sys.exit(1)
+        else:
+            dbPath = args.optDbPath
+    else:
+        dbPath = topDir + "wrfHydroCalib.db"
+        if not os.path.isfile(dbPath):
+            print("ERROR: SQLite3 DB file: " + dbPath + " Does Not Exist.")
+            sys.exit(1)
+
+    groupNum = int(args.groupNum[0])
+
+    # Establish the beginning timestamp for this program.
+    begTimeStamp = datetime.datetime.now()
+
+    # Initialize object to hold status and job information
+    jobData = statusMod.statusMeta()
+    jobData.jobID = int(args.jobID[0])
+    jobData.dbPath = dbPath
+
+    # Establish database connection.
+    db = dbMod.Database(jobData)
+    try:
+        db.connect(jobData)
+    except:
+        print(jobData.errMsg)
+        sys.exit(1)
+
+    # Extract job data from database
+    try:
+        db.jobStatus(jobData)
+    except:
+        print(jobData.errMsg)
+        sys.exit(1)
+
+    # Pull extensive meta-data describing the job from the config file.
+    configPath = str(jobData.jobDir) + "/setup.config"
+    if not os.path.isfile(configPath):
+        print("ERROR: Configuration file: " + configPath + " not found.")
+        sys.exit(1)
+    try:
+        staticData = configMod.readConfig(configPath)
+    except:
+        print("ERROR: Failure to read configuration file: " + configPath)
+        sys.exit(1)
+
+    # Assign the SQL command from the config file into the jobData structure
+    jobData.gSQL = staticData.gSQL
+    jobData.trouteFlag = staticData.trouteFlag
+    jobData.trouteConfig = staticData.trouteConfig
+    jobData.moduleLoadStr = staticData.moduleLoadStr
+    jobData.moduleLoadTrouteStr = staticData.moduleLoadTrouteStr
+    jobData.groupWalltime = staticData.groupWalltime
+    jobData.groupHandoff = staticData.groupHandoff
+
+    # Check gages in directory to match what's in the database
+    try:
+        jobData.checkGages2(db)
+    except:
+        errMod.errOut(jobData)
+
+    # If this group job is being resubmitted, pull the state snapshot written by the
+    # previous one. It is ignored if the config file or the basins have changed.
+    snapPath = snapshotMod.snapshotPath(jobData,"PIPELINE",groupNum)
+    snapIn = snapshotMod.readSnapshot(jobData,snapPath,groupNum,configPath)
+    if snapIn is not None:
+        print("RESTORING STATE SNAPSHOT: " + snapPath)
+        snapshotMod.restoreMetaCache(jobData,snapIn)
+
+    # Load the domain metadata for all basins, along with the troute configuration,
+    # once up front instead of for every basin on every pass of the workflow.
+    try:
+        calibIoMod.loadMetaCache(jobData,db)
+    except:
+        errMod.errOut(jobData)
+
+    # Calculate the CPU/group layout for all basins.
+    try:
+        jobData.calcGroupNum()
+    except:
+        errMod.errOut(jobData)
+
+    # Determine which phases need to be ran. The spinup is skipped if it was already
+    # entered as complete, or if the user has specified a cold start or optional
+    # spinup files. Validation requires the calibration, so both are skipped if
+    # the calibration flag is 0.
+    runSpinup = True
+    if int(jobData.spinComplete) == 1 or staticData.coldStart == 1 or staticData.optSpinFlag != 0:
+        runSpinup = False
+    runCalib = True
+    if jobData.calibFlag != 1 or int(jobData.calibComplete) == 1:
+        runCalib = False
+    runValid = True
+    if jobData.calibFlag != 1 or int(jobData.validCompleteBEST) == 1:
+        runValid = False
+
+    nBasins = len(jobData.gages)
+
+    # Status "key" arrays for each phase. See spinup.py, calib.py and validation.py
+    # for a description of the values these arrays can hold.
+    spinKeySlot = np.empty(nBasins)
+    spinKeySlot[:] = 0.0
+    calibKeySlot = np.empty([nBasins,int(jobData.nIter)])
+    calibKeySlot[:,:] = 0.0
+    validKeySlot = np.empty([nBasins,2])
+    validKeySlot[:,:] = 0.0
+
+    # Create arrays to hold system job ID values for each phase. These are only
+    # used for PBS as qstat has demonstrated slow behavior when doing a full qstat command.
+    # The arrays are columns of a single array, so they are saved to the state snapshot together.
+    jobIds = np.empty([nBasins,4],np.int64)
+    jobIds[:,:] = -9999
+    spinJobId = jobIds[:,0]
+    calibJobId = jobIds[:,1]
+    ctrlJobId = jobIds[:,2]
+    bestJobId = jobIds[:,3]
+
+    groupMask = np.array(jobData.gageGroup) == groupNum
+    for basin in np.nonzero(groupMask)[0]:
+        if jobData.gageIDs[basin] == -9999:
+            jobData.errMsg = "ERROR: Unable to locate domainID for gage: " + str(jobData.gages[basin])
+            errMod.errOut(jobData)
+
+    # The status of each phase is persisted to the Basin_Status table (the Calib_Stats
+    # table for the calibration) once per pass through the basins. When restarting,
+    # phases already found complete are pulled with a single query for each, so the
+    # basins pick up at the phase they were in, and the rest are checked on disk.
+    validMask = np.zeros([nBasins,2],dtype=bool)
+    validMask[groupMask,:] = True
+    spinTracker = basinStatusMod.statusTracker(jobData,basinStatusMod.PHASE_SPINUP,spinKeySlot,groupMask)
+    calibTracker = basinStatusMod.statusTracker(jobData,basinStatusMod.PHASE_CALIB,calibKeySlot,groupMask)
+    validTracker = basinStatusMod.statusTracker(jobData,basinStatusMod.PHASE_VALID,validKeySlot,validMask)
+    try:
+        if runSpinup:
+            spinTracker.restore(jobData,db,spinKeySlot,True)
+        if runCalib:
+            calibTracker.restoreIterations(jobData,db,calibKeySlot,False)
+        if runValid:
+            validTracker.restore(jobData,db,validKeySlot,True)
+    except:
+        errMod.errOut(jobData)
+    if snapIn is not None:
+        snapshotMod.applySnapshot(jobData,snapIn,np.column_stack([spinKeySlot,calibKeySlot,validKeySlot]),
+                                  jobIds,groupMask)
+
+    # Establish the starting phase for each basin in this group.
+    basinPhase = basinPhases(spinKeySlot,calibKeySlot,validKeySlot,groupMask,runSpinup,runCalib,runValid)
+
+    # Time at which this group job hands off to a successor before hitting its walltime.
+    handoffAt = statusMod.handoffTime(jobData,begTimeStamp)
+    groupScript = jobData.jobDir + "/run_pipeline_group_" + str(groupNum) + ".sh"
+
+    completeStatus = False
+    while not completeStatus:
+        # Walk through each basin in this group, advancing it through its current
+        # phase. Once a phase is complete, the basin moves to the next phase on the
+        # following pass, using the same model cores that were assigned to it.
+        for basin in range(0,nBasins):
+            if basinPhase[basin] == PHASE_COMPLETE:
+                continue
+            print("PROCESSING BASIN: " + str(basin) + " PHASE: " + str(basinPhase[basin]))
+
+            if basinPhase[basin] == PHASE_SPINUP:
+                try:
+                    spinupMod.runModel(jobData,staticData,db,jobData.gageIDs[basin],
+                                       jobData.gages[basin],spinKeySlot,basin,spinJobId)
+                except:
+                    errMod.errOut(jobData)
+                if spinKeySlot[basin] == 1.0:
+                    print("SPINUP COMPLETE FOR BASIN: " + str(jobData.gages[basin]))
+                    if runCalib:
+                        basinPhase[basin] = PHASE_CALIB
+                    elif runValid:
+                        basinPhase[basin] = PHASE_VALID_CTRL
+                    else:
+                        basinPhase[basin] = PHASE_COMPLETE
+
+            elif basinPhase[basin] == PHASE_CALIB:
+                for iteration in range(0,int(jobData.nIter)):
+                    if calibKeySlot[basin,iteration] == 1.0 or \
+                       calibKeySlot[basin,iteration] == basinStatusMod.SKIPPED_VALUE:
+                        continue
+                    try:
+                        calibMod.runModel(jobData,staticData,db,jobData.gageIDs[basin],
+                                          jobData.gages[basin],calibKeySlot,basin,iteration,calibJobId)
+                    except:
+                        errMod.errOut(jobData)
+                # Iterations skipped once the basin converged count as done.
+                if basinStatusMod.isDone(calibKeySlot[basin,:]).all():
+                    print("CALIBRATION COMPLETE FOR BASIN: " + str(jobData.gages[basin]))
+                    if runValid:
+                        basinPhase[basin] = PHASE_VALID_CTRL
+                    else:
+                        basinPhase[basin] = PHASE_COMPLETE
+
+            elif basinPhase[basin] == PHASE_VALID_CTRL:
+                try:
+                    validMod.runModelCtrl(jobData,staticData,db,jobData.gageIDs[basin],
+                                          jobData.gages[basin],validKeySlot,basin,libPathTop,ctrlJobId)
+                except:
+                    errMod.errOut(jobData)
+                if validKeySlot[basin,0] == 1.0:
+                    print("CONTROL VALIDATION COMPLETE FOR BASIN: " + str(jobData.gages[basin]))
+                    basinPhase[basin] = PHASE_VALID_BEST
+
+            elif basinPhase[basin] == PHASE_VALID_BEST:
+                try:
+                    validMod.runModelBest(jobData,staticData,db,jobData.gageIDs[basin],
+                                          jobData.gages[basin],validKeySlot,basin,bestJobId)
+                except:
+                    errMod.errOut(jobData)
+                if validKeySlot[basin,1] == 1.0:
+                    print("BEST VALIDATION COMPLETE FOR BASIN: " + str(jobData.gages[basin]))
+                    basinPhase[basin] = PHASE_COMPLETE
+
+            # Stop walking basins once this group job is due to hand off.
+            if statusMod.handoffDue(handoffAt):
+                break
+
+        # Persist the status changes from this pass in bulk.
+        try:
+            if runSpinup:
+                spinTracker.save(jobData,db,spinKeySlot)
+            if runCalib:
+                calibTracker.save(jobData,db,calibKeySlot)
+            if runValid:
+                validTracker.save(jobData,db,validKeySlot)
+        except:
+            errMod.errOut(jobData)
+
+        # Write the state snapshot used to resume this group if it is resubmitted.
+        try:
+            snapshotMod.writeSnapshot(jobData,snapPath,groupNum,configPath,
+                                      np.column_stack([spinKeySlot,calibKeySlot,validKeySlot]),jobIds)
+        except:
+            errMod.errOut(jobData)
+
+        # Check to see if program requirements have been met.
+        if (basinPhase == PHASE_COMPLETE).all():
+            # Touch the complete flags to let the calling program know this group
+            # of basins is complete. The per-phase flags are also touched so the
+            # individual phase orchestrators treat this group as complete.
+            flagList = [str(jobData.jobDir) + "/PIPELINE_GROUP_" + str(groupNum) + ".COMPLETE"]
+            if runSpinup:
+                flagList.append(str(jobData.jobDir) + "/SPINUP_GROUP_" + str(groupNum) + ".COMPLETE")
+            if runCalib:
+                flagList.append(str(jobData.jobDir) + "/CALIB_GROUP_" + str(groupNum) + ".COMPLETE")
+            if runValid:
+                flagList.append(str(jobData.jobDir) + "/VALID_GROUP_" + str(groupNum) + "_CTRL.COMPLETE")
+                flagList.append(str(jobData.jobDir) + "/VALID_GROUP_" + str(groupNum) + "_BEST.COMPLETE")
+            for basinCompleteFlag in flagList:
+                try:
+                    open(basinCompleteFlag,'a').close()
+                except:
+                    jobData.errMsg = "Unable to create complete flag: " + basinCompleteFlag
+                    errMod.errOut(jobData)
+            snapshotMod.removeSnapshot(snapPath)
+
+            completeStatus = True
+        elif statusMod.handoffDue(handoffAt):
+            # This group job is close to its walltime, and its state has been saved
+            # above. Submit a successor that starts once this job ends, and exit cleanly.
+            try:
+                nextId = statusMod.submitSuccessor(jobData,"WPG",groupNum,groupScript)
+            except:
+                errMod.errOut(jobData)
+            print("HANDING OFF GROUP: " + str(groupNum) + " TO JOB: " + str(nextId))
+            sys.exit(0)
+        else:
+            # Allow the program to wait before the next pass over the basins.
+            time.sleep(5)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
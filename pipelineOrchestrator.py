@@ -0,0 +1,204 @@
+# This is a high-level Python program for supervising the spinup, calibration
+# and validation workflows together as a single daemon on a distributed HPC
+# environment. Rather than running spinOrchestrator.py, calibOrchestrator.py
+# and runValidOrchestrator.py one after another, each basin group runs the
+# pipeline.py program, which moves every basin on to its next phase as soon
+# as its previous phase finishes. Basins no longer sit idle at phase boundaries
+# waiting for the slowest basin in the job.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+# 303-497-2693
+# karsten@ucar.edu
+
+import os
+import sys
+import argparse
+import pwd
+import numpy as np
+from core import statusMod
+from core import dbMod
+from core import configMod
+from core import errMod
+from core import calibIoMod
+from core import asyncStatusMod
+import time
+import datetime
+
+# Set the Python path to include package specific functions.
+prPath = os.path.realpath(__file__)
+pathSplit = prPath.split('/')
+libPath = '/'
+for j in range(1,len(pathSplit)-1):
+    libPath = libPath + pathSplit[j] + '/'
+topDir = libPath
+libPathTop = libPath + 'core'
+
+#import warnings
+#warnings.filterwarnings("ignore")
+
+def main(argv):
+    # Parse arguments. User must input a job name.
+    parser = argparse.ArgumentParser(description='Main orchestrator to start or restart ' + \
+                                                 'the spinup/calibration/validation pipeline for WRF-Hydro')
+    parser.add_argument('jobID', metavar='jobID', type=str, nargs='+',
+                        help='Job ID specific to calibration experiment.')
+    parser.add_argument('--optDbPath', type=str, nargs='?',
+                        help='Optional alternative path to SQLite DB file.')
+
+    args = parser.parse_args()
+
+    # If the SQLite file does not exist, throw an error.
+    if args.optDbPath is not None:
+        if not os.path.isfile(args.optDbPath):
+            print("ERROR: " + args.optDbPath + " Does Not Exist.")
+            sys.exit(1)
+        else:
+            dbPath = args.optDbPath
+    else:
+        dbPath = topDir + "wrfHydroCalib.db"
+        if not os.path.isfile(dbPath):
+            print("ERROR: SQLite3 DB file: " + dbPath + " Does Not Exist.")
+            sys.exit(1)
+
+    # Get current user who is running this program.
+    userTmp = pwd.getpwuid(os.getuid()).pw_name
+
+    # Initialize object to hold status and job information
+    jobData = statusMod.statusMeta()
+    jobData.jobID = int(args.jobID[0])
+    jobData.dbPath = dbPath
+
+    # Establish database connection.
+    db = dbMod.Database(jobData)
+    db.lockPath = dbPath + ".LOCK"
+    try:
+        db.connect(jobData)
+    except:
+        print(jobData.errMsg)
+        sys.exit(1)
+
+    # Extract job data from database
+    try:
+        db.jobStatus(jobData)
+    except:
+        print(jobData.errMsg)
+        sys.exit(1)
+
+    # Pull extensive meta-data describing the job from the config file.
+    configPath = str(jobData.jobDir) + "/setup.config"
+    if not os.path.isfile(configPath):
+        print("ERROR: Configuration file: " + configPath + " not found.")
+        sys.exit(1)
+    try:
+        staticData = configMod.readConfig(configPath)
+    except:
+        print("ERROR: Failure to read configuration file: " + configPath)
+        sys.exit(1)
+
+    # Assign the SQL command from the config file into the jobData structure
+    jobData.gSQL = staticData.gSQL
+    jobData.trouteFlag = staticData.trouteFlag
+    jobData.trouteConfig = staticData.trouteConfig
+    jobData.moduleLoadStr = staticData.moduleLoadStr
+    jobData.moduleLoadTrouteStr = staticData.moduleLoadTrouteStr
+    jobData.groupWalltime = staticData.groupWalltime
+    jobData.groupHandoff = staticData.groupHandoff
+
+    # Check gages in directory to match what's in the database
+    try:
+        jobData.checkGages2(db)
+    except:
+        errMod.errOut(jobData)
+
+    # Calculate the CPU/group layout for all basins.
+    try:
+        jobData.calcGroupNum()
+    except:
+        errMod.errOut(jobData)
+
+    # If the whole pipeline has already completed, throw an error. The calibration
+    # and validation are only considered if the user specified to run calibration.
+    if int(jobData.spinComplete) == 1 and (jobData.calibFlag != 1 or int(jobData.validCompleteBEST) == 1):
+        jobData.errMsg = "ERROR: Pipeline for job ID: " + str(jobData.jobID) + \
+                         " has already completed."
+        errMod.errOut(jobData)
+
+    # This daemon runs unattended, so ownership changes must go through one of the
+    # individual phase orchestrators, which prompt for new contact information.
+    if userTmp != jobData.owner:
+        jobData.errMsg = "ERROR: User: " + userTmp + " is not the owner of job ID: " + \
+                         str(jobData.jobID) + ". Please take over the job with one of the " + \
+                         "phase orchestrators before running the pipeline."
+        errMod.errOut(jobData)
+
+    # Create an array to hold systme job ID values. This will only be used for
+    # PBS as qstat has demonstrated slow behavior when doing a full qstat command.
+    # We will track job ID values and do a qstat <jobID> and populate this array
+    # to keep track of things.
+    pbsJobId = np.empty([jobData.nGroups], np.int64)
+    pbsJobId[:] = -9999
+
+    # Compose a complete flag for each group of basins. If this complete flag is present,
+    # that means these basins have been carried through every phase.
+    flagPaths = [str(jobData.jobDir) + "/PIPELINE_GROUP_" + str(basinGroup) + ".COMPLETE"
+                 for basinGroup in range(0,jobData.nGroups)]
+
+    def submitGroup(basinGroup):
+        # Setup a job script that will execute the pipeline program, passing in the group number
+        # to instruct the workflow on which basins to process. We will regenerate the run script
+        # each time to ensure no previous group scripts are being used.
+        if jobData.jobRunType == 4:
+            # This is for MPI scripts as we don't have a scheduler.
+            runScript = jobData.jobDir + "/WPG_" + str(jobData.jobID) + "_" + \
+                        str(basinGroup)
+        else:
+            runScript = jobData.jobDir + "/run_pipeline_group_" + str(basinGroup) + ".sh"
+        if os.path.isfile(runScript):
+            try:
+                os.remove(runScript)
+            except:
+                jobData.errMsg = "Unable to remove old run script file: " + runScript
+                errMod.errOut(jobData)
+        try:
+            calibIoMod.generateCalibGroupScript(jobData,basinGroup,runScript,topDir,program='pipeline.py',
+                                                jobPrefix='WPG',label='Pipelines')
+        except:
+            errMod.errOut(jobData)
+        try:
+            statusMod.submitGroupCalibration(jobData,runScript,pbsJobId,basinGroup)
+        except:
+            errMod.errOut(jobData)
+
+    # Probe all basin groups concurrently once per tick. Each group job is an instance of the
+    # pipeline.py program carrying the basins for a group through every phase. Groups that are
+    # neither running nor complete are resubmitted. This returns once all COMPLETE flags are
+    # present, which means the requirements for completion have been met.
+    asyncStatusMod.runGroupLoop(jobData,staticData,db,pbsJobId,'WPG',flagPaths,submitGroup)
+
+    # Enter each phase as complete into the database.
+    if sum(jobData.groupComplete) == jobData.nGroups:
+        jobData.spinComplete = 1
+        try:
+            db.updateSpinupStatus(jobData)
+        except:
+            errMod.errOut(jobData)
+        if jobData.calibFlag == 1:
+            jobData.calibComplete = 1
+            try:
+                db.updateCalibStatus(jobData)
+            except:
+                errMod.errOut(jobData)
+            jobData.validCompleteCTRL = 1
+            jobData.validCompleteBEST = 1
+            for valid_type in ['CTRL','BEST']:
+                try:
+                    db.updateValidationStatus(jobData,valid_type)
+                except:
+                    errMod.errOut(jobData)
+        jobData.genMsg = "PIPELINE FOR JOB ID: " + str(jobData.jobID) + " COMPLETE."
+        errMod.sendMsg(jobData)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -21,6 +21,7 @@ from core import dbMod
 from core import errMod
 from core import configMod
 from core import sensitivityMod
+from core import basinStatusMod
 import pandas as pd
 
 # Set the Python path to include package specific functions.
@@ -290,22 +291,20 @@ def main(argv):
     pbsPostId = np.empty([len(jobData.gages)],np.int64)
     pbsPostId[:] = -9999
     
-    # Pull all the status values into the keySlot array. 
+    # Pull all the status values into the keySlot array with a single query.
     for basin in range(0,len(jobData.gages)):
-        domainID = jobData.gageIDs[basin]
-            
-        if domainID == -9999:
+        if jobData.gageIDs[basin] == -9999:
             jobData.errMsg = "ERROR: Unable to locate domainID for gage: " + str(jobData.gages[basin])
             errMod.errOut(jobData)
-            
-        # We are going to pull all values for one basin, then place them into the array.
-        # This is faster then looping over each iteration at a time. 
-        statusData = db.sensIterationStatus(jobData,domainID,str(jobData.gages[basin]))
-        statusData = [list(item) for item in statusData]
-        for iteration in range(0,int(jobData.nSensIter)):
-            for iteration2 in range(0,int(jobData.nSensIter)):
-                if statusData[iteration2][0] == iteration+1:
-                    keySlot[basin,iteration] = float(statusData[iteration2][1])
+
+    # The status of each basin/iteration is persisted to the Basin_Status table
+    # once per pass through the basins.
+    statusTracker = basinStatusMod.statusTracker(jobData,basinStatusMod.PHASE_SENS,keySlot,
+                                                 np.ones(len(jobData.gages),dtype=bool))
+    try:
+        statusTracker.restoreIterations(jobData,db,keySlot,True)
+    except:
+        errMod.errOut(jobData)
             
     if len(np.where(keySlot != 0.0)[0]) == 0:
         # We need to either check to see if pre-processing has taken place, or
@@ -436,6 +435,12 @@ def main(argv):
             #        jobData.errMsg = "ERROR: Unable to update workflow LOCK file: " + lockPath
             #        errMod.errOut(jobData)
             
+        # Persist the status changes from this pass in bulk.
+        try:
+            statusTracker.save(jobData,db,keySlot)
+        except:
+            errMod.errOut(jobData)
+
         # Check to see if program requirements have been met.
         if keySlot.sum() == entryValue and postProcStatus:
             jobData.sensComplete = 1
@@ -21,6 +21,8 @@ from core import dbMod
 from core import configMod
 from core import errMod
 from core import calibIoMod
+from core import asyncStatusMod
+from core import restartStoreMod
 import time
 import datetime
 
@@ -108,6 +110,8 @@ def main(argv):
     jobData.trouteConfig = staticData.trouteConfig
     jobData.moduleLoadStr = staticData.moduleLoadStr
     jobData.moduleLoadTrouteStr = staticData.moduleLoadTrouteStr
+    jobData.groupWalltime = staticData.groupWalltime
+    jobData.groupHandoff = staticData.groupHandoff
     jobData.trouteCompleteBasin = 0
     
     # Check gages in directory to match what's in the database
@@ -203,88 +207,58 @@ def main(argv):
     pbsJobId = np.empty([jobData.nGroups], np.int64)
     pbsJobId[:] = -9999
 
-    # Initialize a complete status flag to be false. The orchestrator program
-    # will loop over each group, checking for a COMPLETE flag. Once all COMPLETE
-    # flags are present, the requirements for completetion have been met, and the
-    # program will exit successfully.
-    completeStatus = False
+    # Compose a complete flag for each group of basins. If this complete flag is present,
+    # that means these basins are complete.
+    flagPaths = [str(jobData.jobDir) + "/SPINUP_GROUP_" + str(basinGroup) + ".COMPLETE"
+                 for basinGroup in range(0,jobData.nGroups)]
 
-    while not completeStatus:
-        # Backup our database file, if needed (logic will dictate in function).
+    # Link the spinup state of any basins already in the shared restart store. Groups
+    # with all of their basins found are flagged as complete, and never submitted.
+    try:
+        restartStoreMod.prefillGroups(jobData,staticData,db,flagPaths)
+    except:
+        errMod.errOut(jobData)
+
+    def submitGroup(basinGroup):
+        # Setup a job script that will execute the spinup program, passing in the group number
+        # to instruct the workflow on which basins to process. We will regenerate the run script
+        # each time to ensure no previous group scripts are being used.
+        if jobData.jobRunType == 4:
+            # This is for MPI scripts as we don't have a scheduler.
+            runScript = jobData.jobDir + "/WSG_" + str(jobData.jobID) + "_" + \
+                        str(basinGroup)
+        else:
+            runScript = jobData.jobDir + "/run_group_" + str(basinGroup) + ".sh"
+        if os.path.isfile(runScript):
+            try:
+                os.remove(runScript)
+            except:
+                jobData.errMsg = "Unable to remove old run script file: " + runScript
+                errMod.errOut(jobData)
         try:
-            jobData.backupDatabase(staticData, db)
+            calibIoMod.generateSpinupGroupScript(jobData, basinGroup, runScript, topDir)
+        except:
+            errMod.errOut(jobData)
+        try:
+            statusMod.submitGroupCalibration(jobData,runScript,pbsJobId,basinGroup)
         except:
             errMod.errOut(jobData)
 
-        # Loop over each basin group. This program will check to see if a group job is running
-        # which is an instance of the spinup.py program looping over basins for a group..
-        for basinGroup in range(0,jobData.nGroups):
-            print("WORKING ON GROUP: " + str(basinGroup))
-            # Compose a complete flag for this specific group of basins. If this complete flag is present,
-            # that means these basins are complete.
-            basinCompleteFlag = str(jobData.jobDir) + "/SPINUP_GROUP_" + str(basinGroup) + ".COMPLETE"
-
-            if os.path.isfile(basinCompleteFlag):
-                jobData.groupComplete[basinGroup] = 1
-                continue
-
-            # Setup a job script that will execute the spinup program, passing in the group number
-            # to instruct the workflow on which basins to process.
-            if jobData.jobRunType == 4:
-                # This is for MPI scripts as we don't have a scheduler.
-                runScript = jobData.jobDir + "/WSG_" + str(jobData.jobID) + "_" + \
-                            str(basinGroup)
-            else:
-                runScript = jobData.jobDir + "/run_group_" + str(basinGroup) + ".sh"
-            if not os.path.isfile(runScript):
-                try:
-                    calibIoMod.generateSpinupGroupScript(jobData, basinGroup, runScript, topDir)
-                except:
-                    errMod.errOut(jobData)
-            else:
-                # We will regenerate the run script each time to ensure no previous group
-                # scripts are not being used.
-                try:
-                    os.remove(runScript)
-                except:
-                    jobData.errMsg = "Unable to remove old run script file: " + runScript
-                    errMod.errOut(jobData)
-                try:
-                    calibIoMod.generateSpinupGroupScript(jobData, basinGroup, runScript, topDir)
-                except:
-                    errMod.errOut(jobData)
-
-            # Check to see if this group is currently running.
-            groupStatus = statusMod.checkBasGroupJob(jobData,basinGroup,pbsJobId,'WSG')
-
-            print('GROUP STATUS = ' + str(groupStatus))
-            if not groupStatus:
-                # Check to see if the complete flag was generated.
-                if os.path.isfile(basinCompleteFlag):
-                    jobData.groupComplete[basinGroup] = 1
-                    continue
-                else:
-                    # We need to fire off a new group job.
-                    print('SUBMITTING GROUP JOB')
-                    try:
-                        statusMod.submitGroupCalibration(jobData,runScript,pbsJobId,basinGroup)
-                    except:
-                        errMod.errOut(jobData)
-                    print(pbsJobId)
+    # Probe all basin groups concurrently once per tick. Each group job is an instance of the
+    # spinup.py program looping over basins for a group. Groups that are neither running nor
+    # complete are resubmitted. This returns once all COMPLETE flags are present, which means
+    # the requirements for completion have been met.
+    asyncStatusMod.runGroupLoop(jobData,staticData,db,pbsJobId,'WSG',flagPaths,submitGroup)
 
-            # Allow for some time in-between groups.
-            time.sleep(15)
-        
-        # Check to see if the program requirements have been met.
-        if sum(jobData.groupComplete) == jobData.nGroups:
-            jobData.spinComplete = 1
-            try:
-                db.updateSpinupStatus(jobData)
-            except:
-                errMod.errout(jobData)
-            jobData.genMsg = "SPINUP FOR JOB ID: " + str(jobData.jobID) + " COMPLETE."
-            errMod.sendMsg(jobData)
+    # Check to see if the program requirements have been met.
+    if sum(jobData.groupComplete) == jobData.nGroups:
+        jobData.spinComplete = 1
+        try:
+            db.updateSpinupStatus(jobData)
+        except:
+            errMod.errout(jobData)
+        jobData.genMsg = "SPINUP FOR JOB ID: " + str(jobData.jobID) + " COMPLETE."
+        errMod.sendMsg(jobData)
 
-            completeStatus = True
 if __name__ == "__main__":
     main(sys.argv[1:])
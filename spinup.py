@@ -22,7 +22,9 @@ from core import statusMod
 from core import dbMod
 from core import errMod
 from core import spinupMod
+from core import basinStatusMod
 from core import configMod
+from core import calibIoMod
 
 # Set the Python path to include package specific functions.
 prPath = os.path.realpath(__file__)
@@ -113,6 +115,8 @@ def main(argv):
     jobData.trouteConfig = staticData.trouteConfig
     jobData.moduleLoadStr = staticData.moduleLoadStr
     jobData.moduleLoadTrouteStr = staticData.moduleLoadTrouteStr
+    jobData.groupWalltime = staticData.groupWalltime
+    jobData.groupHandoff = staticData.groupHandoff
     jobData.trouteCompleteBasin = 0
     # Check gages in directory to match what's in the database
     try:
@@ -120,6 +124,13 @@ def main(argv):
     except:
         errMod.errOut(jobData)
 
+    # Load the domain metadata for all basins, along with the troute configuration,
+    # once up front instead of for every basin on every pass of the workflow.
+    try:
+        calibIoMod.loadMetaCache(jobData,db)
+    except:
+        errMod.errOut(jobData)
+
     # Calculate the CPU/group layout for all basins.
     try:
         jobData.calcGroupNum()
@@ -256,6 +267,21 @@ def main(argv):
     # to keep track of things. 
     pbsJobId = np.empty([len(jobData.gages)],np.int64)
     pbsJobId[:] = -9999
+
+    # Basins handled by this program. Their status is persisted to the Basin_Status
+    # table once per pass through the basins. When restarting, basins already found
+    # complete are pulled with a single query, the rest are checked on disk.
+    groupMask = np.array(jobData.gageGroup) == int(args.groupNum[0])
+    statusTracker = basinStatusMod.statusTracker(jobData,basinStatusMod.PHASE_SPINUP,keySlot,groupMask)
+    try:
+        statusTracker.restore(jobData,db,keySlot,True)
+    except:
+        errMod.errOut(jobData)
+
+    # Time at which this group job hands off to a successor before hitting its walltime.
+    handoffAt = statusMod.handoffTime(jobData,begTimeStamp)
+    groupScript = jobData.jobDir + "/run_group_" + str(args.groupNum[0]) + ".sh"
+
     while not completeStatus:
         basCount = 0
         # Walk through spinup directory for each basin. Determine the status of
@@ -278,25 +304,28 @@ def main(argv):
         # If output is not complete, the model is still running, status stays at 0.5.
         # If job is not running, and output has been completed, status goes to 1.0.
         # This continues indefinitely until statuses for ALL basins go to 1.0.
-        for basin in range(0,len(jobData.gages)):
-            # Only process basins that are part of this group, per the argument passed into the
-            # program.
-            if jobData.gageGroup[basin] != int(args.groupNum[0]):
-                keySlot[basin] = 1.0
-                continue
+        # Only process basins that are part of this group, per the argument passed into the
+        # program, and whose status is not already 1.0.
+        keySlot[~groupMask] = 1.0
+        actionMask = groupMask & basinStatusMod.needsAction(basinStatusMod.encode(keySlot))
+        for basin in np.nonzero(actionMask)[0]:
             basCount += 1
-            keyStatusCheck1 = keySlot[basin]
-            # If the status is already 1.0, then continue the loop as now work needs to be done.
-            if keyStatusCheck1 == 1.0:
-                continue
-            else:
-                try:
-                    spinupMod.runModel(jobData,staticData,db,jobData.gageIDs[basin],
-                                       jobData.gages[basin],keySlot,basin,pbsJobId)
-                except:
-                    errMod.errOut(jobData)
-                # Allow the program to wait before moving onto the next basin
+            try:
+                spinupMod.runModel(jobData,staticData,db,jobData.gageIDs[basin],
+                                   jobData.gages[basin],keySlot,basin,pbsJobId)
+            except:
+                errMod.errOut(jobData)
+            # Allow the program to wait before moving onto the next basin
             time.sleep(5)
+            # Stop walking basins once this group job is due to hand off.
+            if statusMod.handoffDue(handoffAt):
+                break
+
+        # Persist the status changes from this pass in bulk.
+        try:
+            statusTracker.save(jobData,db,keySlot)
+        except:
+            errMod.errOut(jobData)
       
 
         if keySlot.sum() == entryValue:
@@ -320,6 +349,17 @@ def main(argv):
                     errMod.errOut(jobData)
                 
             completeStatus = True
+
+        # If this group job is close to its walltime, its state has been saved above.
+        # Submit a successor that starts once this job ends, and exit cleanly.
+        if not completeStatus and statusMod.handoffDue(handoffAt):
+            try:
+                nextId = statusMod.submitSuccessor(jobData,"WSG",args.groupNum[0],groupScript)
+            except:
+                errMod.errOut(jobData)
+            print("HANDING OFF GROUP: " + str(args.groupNum[0]) + " TO JOB: " + str(nextId))
+            sys.exit(0)
+
         # Open the Python LOCK file. Write a blank line to the file and close it.
         # This action will simply modify the file modification time while only adding
         # a blank line.
@@ -0,0 +1,199 @@
+# This is a top-level, self-contained Python program that will cut the
+# restart states of basins out of the LSM (RESTART) and hydro (HYDRO_RST)
+# restart files of a parent domain, such as a single regional spinup,
+# instead of running a spinup for each basin. The basins must have been
+# entered into the DB with inputDomainMeta.py, with geo/hydro extents
+# relative to the same parent domain. Channel, lake and groundwater bucket
+# variables are remapped through the RouteLink, LAKEPARM and GWBUCKPARM
+# files of the parent domain and each basin, so the parent files are needed
+# for whichever of those are in the parent hydro restart file.
+#
+# The basin restart files keep the names of the parent restart files. With
+# the --jobDir option, they are written to the spinup output directory of
+# each basin in a calibration job (after jobInit.py). If the parent restart
+# files are valid at the end of the spinup of the job, the spinup of each
+# basin is seen as complete by the workflow. Channel, lake or groundwater
+# bucket variables are only left out of the restart files of basins without
+# the matching parameter file when not writing into a job directory.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import argparse
+import os
+import sys
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# Establish top-level paths that are used to find the DB file.
+prPath = os.path.realpath(__file__)
+pathSplit = prPath.split('/')
+libPath = '/'
+for j in range(1,len(pathSplit)-1):
+    libPath = libPath + pathSplit[j] + '/'
+topDir = libPath
+
+from core import restartSubsetMod
+
+# Columns pulled from the Domain_Meta table for each basin.
+DOMAIN_COLUMNS = ['gage_id','geo_w','geo_e','geo_s','geo_n','hyd_w','hyd_e','hyd_s','hyd_n',
+                  'rtlink_file','lake_file','gw_file']
+
+# Grid size columns. These are not in older DB files.
+SIZE_COLUMNS = ['land_nx','land_ny','hydro_nx','hydro_ny']
+
+def main(argv):
+    # Parse arguments.
+    parser = argparse.ArgumentParser(description='Utility program to cut basin restart ' + \
+             'states out of the restart files of a parent domain.')
+    parser.add_argument('lsmRst',metavar='lsmRst',type=str,nargs=1,
+                        help='Parent domain LSM restart file (RESTART.YYYYMMDDHH_DOMAIN1).')
+    parser.add_argument('hydroRst',metavar='hydroRst',type=str,nargs=1,
+                        help='Parent domain hydro restart file (HYDRO_RST.YYYY-MM-DD_HH:00_DOMAIN1).')
+    parser.add_argument('outDir',metavar='outDir',type=str,nargs=1,
+                        help='Output directory. Basin restart files are written to <outDir>/<gage>.')
+    parser.add_argument('--parentRouteLink',type=str,nargs='?',
+                        help='Parent domain RouteLink file, to remap channel variables.')
+    parser.add_argument('--parentLake',type=str,nargs='?',
+                        help='Parent domain LAKEPARM netCDF file, to remap lake variables.')
+    parser.add_argument('--parentGw',type=str,nargs='?',
+                        help='Parent domain GWBUCKPARM file, to remap groundwater bucket variables.')
+    parser.add_argument('--gages',type=str,nargs='+',
+                        help='Optional list of gages to process. Defaults to all basins in the DB.')
+    parser.add_argument('--jobDir',action='store_true',
+                        help='Treat outDir as a calibration job directory, writing to ' + \
+                             '<outDir>/<gage>/RUN.SPINUP/OUTPUT.')
+    parser.add_argument('--optDbPath',type=str,nargs='?',
+                        help='Optional alternative path to SQLite DB file.')
+    parser.add_argument('--nProcs',type=int,nargs='?',
+                        help='Optional number of processes to use. Defaults to the number of CPUs.')
+
+    args = parser.parse_args()
+
+    # If the SQLite file does not exist, throw an error.
+    if args.optDbPath is not None:
+        if not os.path.isfile(args.optDbPath):
+            print("ERROR: " + args.optDbPath + " Does Not Exist.")
+            sys.exit(1)
+        else:
+            dbPath = args.optDbPath
+    else:
+        dbPath = topDir + "wrfHydroCalib.db"
+        if not os.path.isfile(dbPath):
+            print("ERROR: SQLite3 DB file: " + dbPath + " Does Not Exist.")
+            sys.exit(1)
+
+    if args.nProcs is not None:
+        if args.nProcs <= 0:
+            print("ERROR: Please specify a number of processes greater than zero.")
+            sys.exit(1)
+        nProcs = args.nProcs
+    else:
+        nProcs = os.cpu_count()
+
+    parentInfo = {'lsm_rst':args.lsmRst[0],'hydro_rst':args.hydroRst[0],
+                  'rtlink_file':args.parentRouteLink,'lake_file':args.parentLake,
+                  'gw_file':args.parentGw}
+    for pathTmp in parentInfo.values():
+        if pathTmp is not None and not os.path.isfile(pathTmp):
+            print("ERROR: File: " + pathTmp + " not found.")
+            sys.exit(1)
+    outDir = args.outDir[0]
+    if not os.path.isdir(outDir):
+        print("ERROR: Output directory: " + outDir + " not found.")
+        sys.exit(1)
+
+    # Open the SQLite DB file
+    try:
+        conn = sqlite3.connect(dbPath)
+    except:
+        print("ERROR: Unable to connect to: " + dbPath + ". Please intiialize the DB file.")
+        sys.exit(1)
+
+    try:
+        dbCursor = conn.cursor()
+    except:
+        print("ERROR: Unable to establish cursor object for: " + dbPath)
+        sys.exit(1)
+
+    try:
+        dbCursor.execute("PRAGMA table_info(\"Domain_Meta\");")
+        existCols = [colTmp[1] for colTmp in dbCursor.fetchall()]
+    except:
+        print("ERROR: Unable to query the columns of the Domain_Meta table.")
+        sys.exit(1)
+    colList = DOMAIN_COLUMNS + [colTmp for colTmp in SIZE_COLUMNS if colTmp in existCols]
+
+    sqlCmd = "SELECT " + ",".join(colList) + " from \"Domain_Meta\""
+    if args.gages:
+        sqlCmd = sqlCmd + " where gage_id in (" + ",".join(['?']*len(args.gages)) + ");"
+        sqlArgs = args.gages
+    else:
+        sqlCmd = sqlCmd + ";"
+        sqlArgs = []
+    try:
+        dbCursor.execute(sqlCmd,sqlArgs)
+        results = dbCursor.fetchall()
+    except:
+        print("ERROR: Unable to execute SQL command: " + sqlCmd)
+        sys.exit(1)
+
+    try:
+        conn.close()
+    except:
+        print("ERROR: Unable to close DB connection.")
+        sys.exit(1)
+
+    basinRows = [dict(zip(colList,rowTmp)) for rowTmp in results]
+    if args.gages:
+        foundGages = [str(basinRow['gage_id']) for basinRow in basinRows]
+        for gageTmp in args.gages:
+            if gageTmp not in foundGages:
+                print("ERROR: Gage: " + gageTmp + " not found in the DB.")
+                sys.exit(1)
+    nBasins = len(basinRows)
+    if nBasins == 0:
+        print("No gages have been entered into the DB tables.")
+        sys.exit(0)
+
+    for basinRow in basinRows:
+        if args.jobDir:
+            basinRow['out_dir'] = outDir + "/" + str(basinRow['gage_id']) + "/RUN.SPINUP/OUTPUT"
+        else:
+            basinRow['out_dir'] = outDir + "/" + str(basinRow['gage_id'])
+            if not os.path.isdir(basinRow['out_dir']):
+                try:
+                    os.mkdir(basinRow['out_dir'])
+                except:
+                    print("ERROR: Unable to create output directory: " + basinRow['out_dir'])
+                    sys.exit(1)
+
+    # Subset all basins in parallel. Results come back in the order of the
+    # basins.
+    print("Subsetting restart states for " + str(nBasins) + " basins using " + str(nProcs) + " processes.")
+    try:
+        with ProcessPoolExecutor(max_workers=nProcs) as pool:
+            results = list(pool.map(partial(restartSubsetMod.subsetBasin,parentInfo=parentInfo,
+                                            strict=args.jobDir),basinRows,
+                                    chunksize=max(1,int(nBasins/(nProcs*4)))))
+    except:
+        print("ERROR: Failure subsetting restart states in parallel.")
+        sys.exit(1)
+
+    errList = []
+    for warnList, errMsg in results:
+        for warnMsg in warnList:
+            print(warnMsg)
+        if errMsg is not None:
+            errList.append(errMsg)
+    if len(errList) > 0:
+        for errMsg in errList:
+            print(errMsg)
+        print("ERROR: " + str(len(errList)) + " of " + str(nBasins) + " basins failed subsetting.")
+        sys.exit(1)
+    print("Restart states created for " + str(nBasins) + " basins.")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,252 @@
+# Tests for cutting basin restart states out of parent domain restart files
+# (core/restartSubsetMod.py). A tiny parent domain is built on the fly: an
+# 8x6 land grid with a 2x routing grid, five channel reaches, three lakes
+# and four groundwater buckets. Every value encodes its position in the
+# parent domain, so the tests can check exactly where each value came from.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+# Establish the top-level path so the core modules can be imported.
+topDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0,topDir)
+
+try:
+    from netCDF4 import Dataset
+    from core import restartSubsetMod
+except ImportError:
+    Dataset = None
+
+# Parent domain sizes.
+NX = 8
+NY = 6
+AGG = 2
+NSOIL = 4
+PARENT_LINKS = [10,20,30,40,50]
+PARENT_LAKES = [7,8,9]
+PARENT_BUCKETS = [100,200,300,400]
+
+LSM_NAME = "RESTART.2018100100_DOMAIN1"
+HYDRO_NAME = "HYDRO_RST.2018-10-01_00:00_DOMAIN1"
+
+def gridValues(shape):
+    """
+    Generic function to return an array whose values encode their position.
+    """
+    return np.arange(int(np.prod(shape)),dtype=np.float32).reshape(shape)
+
+def writeIds(pathOut,dimName,varName,ids):
+    """
+    Generic function to write a parameter file holding a single ID variable.
+    """
+    idOut = Dataset(pathOut,'w')
+    idOut.createDimension(dimName,len(ids))
+    idOut.createVariable(varName,'i8',(dimName,))[:] = np.array(ids,dtype=np.int64)
+    idOut.close()
+
+def writeParent(dirOut):
+    """
+    Generic function to write the parent domain restart and parameter files.
+    """
+    idOut = Dataset(dirOut + "/" + LSM_NAME,'w')
+    idOut.createDimension('Time',None)
+    idOut.createDimension('DateStrLen',19)
+    idOut.createDimension('south_north',NY)
+    idOut.createDimension('west_east',NX)
+    idOut.createDimension('soil_layers_stag',NSOIL)
+    idOut.setncatts({'WEST-EAST_GRID_DIMENSION':np.int32(NX+1),
+                     'SOUTH-NORTH_GRID_DIMENSION':np.int32(NY+1),
+                     'TITLE':'synthetic parent'})
+    varTmp = idOut.createVariable('Times','S1',('Time','DateStrLen'))
+    varTmp[0,:] = np.array(list("2018-10-01_00:00:00"),dtype='S1')
+    varTmp = idOut.createVariable('SOIL_M','f4',('Time','south_north','soil_layers_stag','west_east'),
+                                  fill_value=-9999.0)
+    varTmp.units = 'm3 m-3'
+    varTmp[:] = gridValues((1,NY,NSOIL,NX))
+    idOut.createVariable('SNEQV','f4',('Time','south_north','west_east'))[:] = gridValues((1,NY,NX))
+    idOut.close()
+
+    idOut = Dataset(dirOut + "/" + HYDRO_NAME,'w')
+    idOut.createDimension('depth',NSOIL)
+    idOut.createDimension('ix',NX)
+    idOut.createDimension('iy',NY)
+    idOut.createDimension('ixrt',NX*AGG)
+    idOut.createDimension('iyrt',NY*AGG)
+    idOut.createDimension('links',len(PARENT_LINKS))
+    idOut.createDimension('lakes',len(PARENT_LAKES))
+    idOut.createDimension('basns',len(PARENT_BUCKETS))
+    idOut.setncatts({'Restart_Time':'2018-10-01_00:00:00'})
+    idOut.createVariable('stc','f4',('depth','iy','ix'))[:] = gridValues((NSOIL,NY,NX))
+    idOut.createVariable('sfcheadsubrt','f4',('iyrt','ixrt'))[:] = gridValues((NY*AGG,NX*AGG))
+    idOut.createVariable('hlink','f4',('links',))[:] = np.array(PARENT_LINKS,dtype=np.float32)/10.0
+    idOut.createVariable('qlink1','f4',('links',))[:] = np.array(PARENT_LINKS,dtype=np.float32)
+    idOut.createVariable('resht','f4',('lakes',))[:] = np.array(PARENT_LAKES,dtype=np.float32)
+    idOut.createVariable('z_gwsubbas','f4',('basns',))[:] = np.array(PARENT_BUCKETS,dtype=np.float32)
+    idOut.close()
+
+    writeIds(dirOut + "/RouteLink.nc",'feature_id','link',PARENT_LINKS)
+    writeIds(dirOut + "/LAKEPARM.nc",'feature_id','lake_id',PARENT_LAKES)
+    writeIds(dirOut + "/GWBUCKPARM.nc",'BasinDim','ComID',PARENT_BUCKETS)
+
+@unittest.skipIf(Dataset is None,"netCDF4 is not available")
+class subsetBasinTests(unittest.TestCase):
+    def setUp(self):
+        self.topTmp = tempfile.mkdtemp()
+        self.parentDir = self.topTmp + "/PARENT"
+        self.basinDir = self.topTmp + "/BASIN"
+        self.outDir = self.topTmp + "/OUT"
+        for dirTmp in [self.parentDir,self.basinDir,self.outDir]:
+            os.mkdir(dirTmp)
+        writeParent(self.parentDir)
+        restartSubsetMod.parentCache.clear()
+
+        # Basin covering land columns 3-6 and rows 2-4 (1-based) of the parent.
+        writeIds(self.basinDir + "/RouteLink.nc",'feature_id','link',[40,10,30])
+        writeIds(self.basinDir + "/LAKEPARM.nc",'feature_id','lake_id',[9,7])
+        writeIds(self.basinDir + "/GWBUCKPARM.nc",'BasinDim','ComID',[300,100,400])
+        self.basinInfo = {'gage_id':'01234567','geo_w':3,'geo_e':6,'geo_s':2,'geo_n':4,
+                          'hyd_w':5,'hyd_e':12,'hyd_s':3,'hyd_n':8,
+                          'rtlink_file':self.basinDir + "/RouteLink.nc",
+                          'lake_file':self.basinDir + "/LAKEPARM.nc",
+                          'gw_file':self.basinDir + "/GWBUCKPARM.nc",
+                          'land_nx':4,'land_ny':3,'hydro_nx':8,'hydro_ny':6,
+                          'out_dir':self.outDir}
+        self.parentInfo = {'lsm_rst':self.parentDir + "/" + LSM_NAME,
+                           'hydro_rst':self.parentDir + "/" + HYDRO_NAME,
+                           'rtlink_file':self.parentDir + "/RouteLink.nc",
+                           'lake_file':self.parentDir + "/LAKEPARM.nc",
+                           'gw_file':self.parentDir + "/GWBUCKPARM.nc"}
+
+    def tearDown(self):
+        shutil.rmtree(self.topTmp)
+
+    def runSubset(self):
+        return restartSubsetMod.subsetBasin(self.basinInfo,self.parentInfo)
+
+    def readVar(self,fileName,varName):
+        idIn = Dataset(self.outDir + "/" + fileName,'r')
+        try:
+            return np.array(idIn.variables[varName][:])
+        finally:
+            idIn.close()
+
+    def test_grid_slicing(self):
+        warnList, errMsg = self.runSubset()
+        self.assertIsNone(errMsg)
+        self.assertEqual(warnList,[])
+        soilTmp = self.readVar(LSM_NAME,'SOIL_M')
+        self.assertEqual(soilTmp.shape,(1,3,NSOIL,4))
+        np.testing.assert_array_equal(soilTmp,gridValues((1,NY,NSOIL,NX))[:,1:4,:,2:6])
+        np.testing.assert_array_equal(self.readVar(LSM_NAME,'SNEQV'),gridValues((1,NY,NX))[:,1:4,2:6])
+        np.testing.assert_array_equal(self.readVar(HYDRO_NAME,'stc'),gridValues((NSOIL,NY,NX))[:,1:4,2:6])
+        np.testing.assert_array_equal(self.readVar(HYDRO_NAME,'sfcheadsubrt'),
+                                      gridValues((NY*AGG,NX*AGG))[2:8,4:12])
+
+    def test_non_grid_variables_copied(self):
+        self.runSubset()
+        timeTmp = self.readVar(LSM_NAME,'Times')
+        self.assertEqual(b''.join(timeTmp[0]).decode(),"2018-10-01_00:00:00")
+        idIn = Dataset(self.outDir + "/" + LSM_NAME,'r')
+        try:
+            self.assertEqual(idIn.variables['SOIL_M'].units,'m3 m-3')
+            self.assertEqual(idIn.variables['SOIL_M']._FillValue,-9999.0)
+            self.assertTrue(idIn.dimensions['Time'].isunlimited())
+        finally:
+            idIn.close()
+
+    def test_grid_dimension_attributes(self):
+        self.runSubset()
+        idIn = Dataset(self.outDir + "/" + LSM_NAME,'r')
+        try:
+            self.assertEqual(int(idIn.getncattr('WEST-EAST_GRID_DIMENSION')),5)
+            self.assertEqual(int(idIn.getncattr('SOUTH-NORTH_GRID_DIMENSION')),4)
+            self.assertEqual(idIn.getncattr('TITLE'),'synthetic parent')
+        finally:
+            idIn.close()
+
+    def test_id_remapping_order(self):
+        self.runSubset()
+        np.testing.assert_allclose(self.readVar(HYDRO_NAME,'hlink'),[4.0,1.0,3.0])
+        np.testing.assert_array_equal(self.readVar(HYDRO_NAME,'qlink1'),[40.0,10.0,30.0])
+        np.testing.assert_array_equal(self.readVar(HYDRO_NAME,'resht'),[9.0,7.0])
+        np.testing.assert_array_equal(self.readVar(HYDRO_NAME,'z_gwsubbas'),[300.0,100.0,400.0])
+
+    def test_missing_basin_file_drops_variables(self):
+        self.basinInfo['gw_file'] = '-9999'
+        warnList, errMsg = self.runSubset()
+        self.assertIsNone(errMsg)
+        self.assertEqual(len(warnList),1)
+        idIn = Dataset(self.outDir + "/" + HYDRO_NAME,'r')
+        try:
+            self.assertNotIn('z_gwsubbas',idIn.variables.keys())
+            self.assertNotIn('basns',idIn.dimensions.keys())
+        finally:
+            idIn.close()
+
+    def test_missing_basin_file_strict(self):
+        self.basinInfo['gw_file'] = '-9999'
+        warnList, errMsg = restartSubsetMod.subsetBasin(self.basinInfo,self.parentInfo,strict=True)
+        self.assertIsNotNone(errMsg)
+        self.assertIn("gw_file",errMsg)
+        self.assertFalse(os.path.isfile(self.outDir + "/" + LSM_NAME))
+        self.assertFalse(os.path.isfile(self.outDir + "/" + HYDRO_NAME))
+
+    def test_missing_id(self):
+        writeIds(self.basinDir + "/RouteLink.nc",'feature_id','link',[40,99])
+        warnList, errMsg = self.runSubset()
+        self.assertIsNotNone(errMsg)
+        self.assertIn("links",errMsg)
+        self.assertIn("99",errMsg)
+        self.assertFalse(os.path.isfile(self.outDir + "/" + HYDRO_NAME))
+
+    def test_missing_parent_file(self):
+        self.parentInfo['lake_file'] = None
+        warnList, errMsg = self.runSubset()
+        self.assertIsNotNone(errMsg)
+        self.assertIn("lake_file",errMsg)
+
+    def test_out_of_extent(self):
+        self.basinInfo['geo_e'] = NX + 2
+        self.basinInfo['land_nx'] = None
+        warnList, errMsg = self.runSubset()
+        self.assertIsNotNone(errMsg)
+        self.assertIn("beyond the parent grid",errMsg)
+        self.assertFalse(os.path.isfile(self.outDir + "/" + LSM_NAME))
+        self.assertFalse(os.path.isfile(self.outDir + "/" + LSM_NAME + ".TMP"))
+
+    def test_invalid_extent(self):
+        self.basinInfo['geo_w'] = 0
+        warnList, errMsg = self.runSubset()
+        self.assertIsNotNone(errMsg)
+        self.assertIn("Invalid extents",errMsg)
+
+    def test_basin_grid_size_mismatch(self):
+        self.basinInfo['hydro_nx'] = 9
+        warnList, errMsg = self.runSubset()
+        self.assertIsNotNone(errMsg)
+        self.assertIn("do not match the basin grid size",errMsg)
+
+@unittest.skipIf(Dataset is None,"netCDF4 is not available")
+class idIndexTests(unittest.TestCase):
+    def test_order(self):
+        indTmp = restartSubsetMod.idIndex(np.array([50,10,30,20,40]),np.array([20,50,10]))
+        np.testing.assert_array_equal(indTmp,[3,0,1])
+
+    def test_missing(self):
+        with self.assertRaises(ValueError):
+            restartSubsetMod.idIndex(np.array([50,10,30]),np.array([10,99]))
+
+    def test_empty_parent(self):
+        with self.assertRaises(ValueError):
+            restartSubsetMod.idIndex(np.array([],dtype=np.int64),np.array([10]))
+
+if __name__ == '__main__':
+    unittest.main()
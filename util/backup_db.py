@@ -3,6 +3,16 @@
 # parameter values, and basin information. This was created for
 # NCAR-specific activities, but can be used by anyone who wishes
 # to backup their calibration DB files to a Postgress DB.
+#
+# With the --incremental option, only rows that were inserted or updated
+# since the last backup are sent. Triggers placed on the sqlite tables
+# record changed rows into a Sync_Log table, and the last log entry sent
+# to each external database is kept in a Sync_State table. Changed rows are
+# shipped in batches with COPY FROM STDIN into a staging table, which then
+# replaces the matching rows in the external tables. The first incremental
+# backup to a given external database sends every row. For testing, the
+# external database can be a local Postgres instance created with
+# psql_schema.sql (e.g. host localhost with --port).
 
 # Logan Karsten
 # National Center for Atmospheric Research
@@ -13,8 +23,19 @@ import sys
 import os
 import argparse
 import sqlite3
+import csv
+import io
 import psycopg2
 
+# Tables sent during an incremental backup, along with the columns that
+# uniquely identify a row in each table.
+SYNC_TABLES = [['Job_Params',['jobID','param']],
+               ['Sens_Params',['jobID','domainID','iteration','paramName']],
+               ['Sens_Stats',['jobID','domainID','iteration','timestep']],
+               ['Calib_Params',['jobID','domainID','iteration','paramName']],
+               ['Calib_Stats',['jobID','domainID','iteration']],
+               ['Valid_Stats',['jobID','domainID','simulation','evalPeriod']]]
+
 def main(argv):
     # Parse arguments. User must input a job name.
     parser = argparse.ArgumentParser(description='Utility program for backing up database files to an '
@@ -29,6 +50,12 @@ def main(argv):
                         help='Name of database user name.')
     parser.add_argument('dbPwd', metavar='dbPwd', type=str, nargs='+',
                         help='Database password.')
+    parser.add_argument('--port', type=int, nargs='?',
+                        help='Optional port of the external SQL host.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only send rows that changed since the last backup, using COPY.')
+    parser.add_argument('--batchSize', type=int, nargs='?', default=10000,
+                        help='Number of rows sent per COPY batch with --incremental. Defaults to 10000.')
 
     args = parser.parse_args()
 
@@ -58,6 +85,8 @@ def main(argv):
     # Connect to the external postgress DB.
     strTmp = "dbname='" + args.dbName[0] + "' user='" + args.dbUserName[0] + "' host='" + args.host[0] + \
              "' password='" + args.dbPwd[0] + "'"
+    if args.port is not None:
+        strTmp = strTmp + " port='" + str(args.port) + "'"
     try:
         connExt = psycopg2.connect(strTmp)
     except:
@@ -133,7 +162,9 @@ def main(argv):
                 print("Unexpected multiple basin entries for ID: " + str(bsnTmp[0]) +
                       " in external database file")
                 sys.exit(1)
-            if len(resultsTmp[0]) != 45:
+            # Basins entered with grid dimensions and file sizes carry extra
+            # columns. Those are not copied to the external database.
+            if len(resultsTmp[0]) < 45:
                 print("Unexpected basin information for ID: " + str(bsnTmp[0]) +
                       " in external database file")
                 sys.exit(1)
@@ -231,6 +262,10 @@ def main(argv):
                       " from external database.")
                 sys.exit(1)
 
+        if args.incremental:
+            # Calibration/sensitivity/validation tables are sent below for all jobs at once.
+            continue
+
         # Now, either enter information for calibration/sensitivity/validation into the various tables holding
         # the data. If the entry has already been created, update it. Otherwise, create a new entry.
         print("Extracting Job_Params information from the sqlite file.")
@@ -665,6 +700,14 @@ def main(argv):
 
 
 
+    if args.incremental:
+        targetName = args.host[0] + ":" + str(args.port) + "/" + args.dbName[0]
+        try:
+            syncIncremental(connIn,connExt,targetName,args.batchSize)
+        except Exception as err:
+            print("Unable to run incremental backup to external database: " + str(err))
+            sys.exit(1)
+
     # Close the sqlite connection.
     try:
         connIn.close()
@@ -678,5 +721,125 @@ def main(argv):
         print("Unable to to close connection to external postgres database.")
         sys.exit(1)
 
+def setupSyncLog(connIn):
+    """
+    Generic function to create the Sync_Log/Sync_State tables in the sqlite file,
+    along with the triggers that log inserted or updated rows.
+    """
+    connIn.execute("CREATE TABLE IF NOT EXISTS \"Sync_Log\" (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                   "\"tableName\" text, \"rowNum\" integer);")
+    connIn.execute("CREATE TABLE IF NOT EXISTS \"Sync_State\" (target text, \"tableName\" text, "
+                   "\"lastSeq\" integer);")
+    for tableName, keyCols in SYNC_TABLES:
+        for eventTmp in ['INSERT','UPDATE']:
+            connIn.execute("CREATE TRIGGER IF NOT EXISTS \"Sync_" + tableName + "_" + eventTmp + "\" AFTER " +
+                           eventTmp + " ON \"" + tableName + "\" BEGIN INSERT INTO \"Sync_Log\" "
+                           "(\"tableName\",\"rowNum\") VALUES ('" + tableName + "',NEW.rowid); END;")
+    connIn.commit()
+
+def syncIncremental(connIn,connExt,targetName,batchSize):
+    """
+    Generic function to send rows that changed since the last backup to the
+    external database. Domain ID values are translated to the unique domain
+    ID values of the external database.
+    """
+    setupSyncLog(connIn)
+    dbCursorIn = connIn.cursor()
+    dbCursorExt = connExt.cursor()
+
+    # Map local domain ID values to the external domain ID values.
+    dbCursorIn.execute("select \"domainID\",domain_path from \"Domain_Meta\";")
+    localPaths = dict(dbCursorIn.fetchall())
+    dbCursorExt.execute("select \"domainID\",\"localDomainID\",domain_path from \"Domain_Meta\";")
+    domainMap = {}
+    for extId, localId, pathTmp in dbCursorExt.fetchall():
+        if localId in localPaths and localPaths[localId] == pathTmp:
+            domainMap[localId] = extId
+
+    for tableName, keyCols in SYNC_TABLES:
+        # Changes logged after this point are picked up by the next backup.
+        dbCursorIn.execute("select max(seq) from \"Sync_Log\";")
+        maxSeq = dbCursorIn.fetchone()[0]
+        if maxSeq is None:
+            maxSeq = 0
+
+        dbCursorIn.execute("select \"lastSeq\" from \"Sync_State\" where target=? and \"tableName\"=?;",
+                           (targetName,tableName))
+        resultsTmp = dbCursorIn.fetchone()
+
+        # Only columns present in both databases are sent.
+        dbCursorIn.execute("PRAGMA table_info(\"" + tableName + "\");")
+        localCols = [colTmp[1] for colTmp in dbCursorIn.fetchall()]
+        dbCursorExt.execute("select column_name from information_schema.columns where table_name=%s;",
+                            (tableName,))
+        extCols = [colTmp[0] for colTmp in dbCursorExt.fetchall()]
+        colNames = [colTmp for colTmp in localCols if colTmp in extCols]
+        selectCols = ",".join(["\"" + colTmp + "\"" for colTmp in colNames])
+
+        if resultsTmp is None:
+            # First backup to this external database. Send every row.
+            print("Sending all " + tableName + " rows to: " + targetName)
+            readCursor = connIn.cursor()
+            readCursor.execute("select " + selectCols + " from \"" + tableName + "\";")
+            nSent = sendRows(readCursor,dbCursorExt,connExt,tableName,keyCols,colNames,domainMap,batchSize)
+        else:
+            print("Sending changed " + tableName + " rows to: " + targetName)
+            readCursor = connIn.cursor()
+            readCursor.execute("select " + selectCols + " from \"" + tableName + "\" where rowid in (" +
+                               "select distinct \"rowNum\" from \"Sync_Log\" where \"tableName\"=? and " +
+                               "seq>? and seq<=?);",(tableName,resultsTmp[0],maxSeq))
+            nSent = sendRows(readCursor,dbCursorExt,connExt,tableName,keyCols,colNames,domainMap,batchSize)
+        print("Sent " + str(nSent) + " " + tableName + " rows.")
+
+        # Record the backup, and drop log entries no longer needed by any external database.
+        dbCursorIn.execute("delete from \"Sync_State\" where target=? and \"tableName\"=?;",(targetName,tableName))
+        dbCursorIn.execute("insert into \"Sync_State\" (target,\"tableName\",\"lastSeq\") values (?,?,?);",
+                           (targetName,tableName,maxSeq))
+        dbCursorIn.execute("delete from \"Sync_Log\" where \"tableName\"=? and seq<=(select min(\"lastSeq\") "
+                           "from \"Sync_State\" where \"tableName\"=?);",(tableName,tableName))
+        connIn.commit()
+
+def sendRows(readCursor,dbCursorExt,connExt,tableName,keyCols,colNames,domainMap,batchSize):
+    """
+    Generic function to send rows from a sqlite cursor to the external database
+    in batches. Each batch is copied into a staging table, which then replaces
+    any rows in the external table with the same key values.
+    """
+    colList = ",".join(["\"" + colTmp + "\"" for colTmp in colNames])
+    keyMatch = " and ".join(["t.\"" + colTmp + "\" = s.\"" + colTmp + "\"" for colTmp in keyCols])
+    domainInd = colNames.index('domainID') if 'domainID' in colNames else None
+    nSent = 0
+
+    while True:
+        rows = readCursor.fetchmany(batchSize)
+        if len(rows) == 0:
+            break
+
+        bufTmp = io.StringIO()
+        writer = csv.writer(bufTmp)
+        for row in rows:
+            row = list(row)
+            if domainInd is not None:
+                if row[domainInd] not in domainMap:
+                    raise Exception("No external domain ID found for local basin ID: " + str(row[domainInd]))
+                row[domainInd] = domainMap[row[domainInd]]
+            writer.writerow(['' if valTmp is None else valTmp for valTmp in row])
+        bufTmp.seek(0)
+
+        try:
+            dbCursorExt.execute("CREATE TEMP TABLE sync_stage ON COMMIT DROP AS SELECT " + colList +
+                                " FROM \"" + tableName + "\" WITH NO DATA;")
+            dbCursorExt.copy_expert("COPY sync_stage (" + colList + ") FROM STDIN WITH (FORMAT csv)",bufTmp)
+            dbCursorExt.execute("DELETE FROM \"" + tableName + "\" t USING sync_stage s WHERE " + keyMatch + ";")
+            dbCursorExt.execute("INSERT INTO \"" + tableName + "\" (" + colList + ") SELECT " + colList +
+                                " FROM sync_stage;")
+            connExt.commit()
+        except:
+            connExt.rollback()
+            raise
+        nSent = nSent + len(rows)
+
+    return nSent
+
 if __name__ == "__main__":
     main(sys.argv[1:])
\ No newline at end of file
@@ -25,6 +25,17 @@ The following arguments are passed into the program:
                      MPTABLE.TBL, GENPARM.TBL, and HYDRO.TBL global parameter
                      tables, which are necessary for this program to run
                      successfully. 
+
+More than one domain directory may be passed in, either on the command line
+ahead of the table directory, or through a text file of domain directories
+(one per line) with the --domainList option. Domains are then processed in
+parallel over a pool of worker processes (see --nProcs), which allows the
+parameter files to be regenerated for a large set of basins at once.
+
+Each parameter is filled by building a vector of values indexed by soil or
+vegetation category from the tables, and mapping the geogrid category grid
+through it with a single lookup, instead of scanning the grid once per
+category.
                   
 Author - Logan Karsten
 Organization - National Center for Atmospheric Research
@@ -39,91 +50,149 @@ import shutil
 import os
 import sys
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 def main(argv):
     # Parse user-provided arguments
     parser = argparse.ArgumentParser(description='Utility program to create soil_properties.nc,' + \
              ' and HYDRO_TBL_2D.nc for the calibration workflow')
-    parser.add_argument('domainDirectory',metavar='domainDirectory',type=str,nargs='+',
+    parser.add_argument('domainDirectory',metavar='domainDirectory',type=str,nargs='*',
                         help='Directory containing necessary input NetCDF domain files.')
-    parser.add_argument('tableDirectory',metavar='tableDirectory',type=str,nargs='+',
+    parser.add_argument('tableDirectory',metavar='tableDirectory',type=str,nargs=1,
                         help='Directory containing input global static table files, ' + \
                         'such as MPTABLE.TBL,etc.')
+    parser.add_argument('--domainList',type=str,nargs='?',
+                        help='Optional text file listing domain directories to process, one per line.')
+    parser.add_argument('--nProcs',type=int,nargs='?',
+                        help='Optional number of worker processes used when processing more than ' + \
+                        'one domain. Defaults to the number of CPUs.')
     args = parser.parse_args()
     
+    domainDirs = list(args.domainDirectory)
+    if args.domainList is not None:
+        try:
+            with open(args.domainList,'r') as fTmp:
+                for lineTmp in fTmp:
+                    if len(lineTmp.strip()) > 0:
+                        domainDirs.append(lineTmp.strip())
+        except:
+            print('ERROR: Unable to read domain list: ' + args.domainList)
+            sys.exit(1)
+    if len(domainDirs) == 0:
+        print('ERROR: No domain directories were passed in.')
+        sys.exit(1)
+    if args.nProcs is not None:
+        if args.nProcs <= 0:
+            print('ERROR: Please specify a number of processes greater than zero.')
+            sys.exit(1)
+        nProcs = args.nProcs
+    else:
+        nProcs = os.cpu_count()
+    
+    if len(domainDirs) == 1:
+        try:
+            createParams(domainDirs[0],args.tableDirectory[0],True)
+        except Exception as err:
+            print(str(err))
+            sys.exit(1)
+        return
+    
+    # Batch mode. Each domain is processed in a worker process.
+    print('Processing ' + str(len(domainDirs)) + ' domains using ' + str(nProcs) + ' processes.')
+    errList = []
+    with ProcessPoolExecutor(max_workers=nProcs) as pool:
+        futures = {pool.submit(createParams,domainDir,args.tableDirectory[0],False):domainDir 
+                   for domainDir in domainDirs}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                print('Completed: ' + futures[future])
+            except Exception as err:
+                print('FAILED: ' + futures[future] + ' - ' + str(err))
+                errList.append(futures[future])
+    if len(errList) > 0:
+        print('ERROR: ' + str(len(errList)) + ' out of ' + str(len(domainDirs)) + ' domains failed.')
+        sys.exit(1)
+
+def createParams(domainDir,tableDir,verbose):
+    """
+    Generic function to create soil_properties.nc and HYDRO_TBL_2D.nc for a
+    single domain directory. Raises an exception containing the error message
+    if the files cannot be created.
+    """
     # Establish program constants
     fillParam = -9999
     soilFillVal = -9999
     
     # Check for existence of directories and expected files.
-    if not os.path.isdir(args.domainDirectory[0]):
-        errOut(args,'ERROR: ' + args.domainDirectory[0] + ' Not Found.')
-    if not os.path.isdir(args.tableDirectory[0]):
-        errOut(args,'ERROR: ' + args.tableDirectory[0] + ' Not Found.')
+    if not os.path.isdir(domainDir):
+        errOut(domainDir,'ERROR: ' + domainDir + ' Not Found.')
+    if not os.path.isdir(tableDir):
+        errOut(domainDir,'ERROR: ' + tableDir + ' Not Found.')
     
-    geoFile = args.domainDirectory[0] + '/geo_em.nc'
-    soilTbl = args.tableDirectory[0] + '/SOILPARM.TBL'
-    mpTbl = args.tableDirectory[0] + '/MPTABLE.TBL'
-    genTbl = args.tableDirectory[0] + '/GENPARM.TBL'
-    hydroTbl = args.tableDirectory[0] + '/HYDRO.TBL'
-    soilPropOut = args.domainDirectory[0] + '/soil_properties.nc'
-    hydroTblOut = args.domainDirectory[0] + '/HYDRO_TBL_2D.nc'
+    geoFile = domainDir + '/geo_em.nc'
+    soilTbl = tableDir + '/SOILPARM.TBL'
+    mpTbl = tableDir + '/MPTABLE.TBL'
+    genTbl = tableDir + '/GENPARM.TBL'
+    hydroTbl = tableDir + '/HYDRO.TBL'
+    soilPropOut = domainDir + '/soil_properties.nc'
+    hydroTblOut = domainDir + '/HYDRO_TBL_2D.nc'
     
     if not os.path.isfile(geoFile):
-        errOut(args,'ERROR: ' + geoFile + ' Not Found.')
+        errOut(domainDir,'ERROR: ' + geoFile + ' Not Found.')
     if not os.path.isfile(soilTbl):
-        errOut(args,'ERROR: ' + soilTbl + ' Not Found.')
+        errOut(domainDir,'ERROR: ' + soilTbl + ' Not Found.')
     if not os.path.isfile(mpTbl):
-        errOut(args,'ERROR: ' + mpTbl + ' Not Found.')
+        errOut(domainDir,'ERROR: ' + mpTbl + ' Not Found.')
     if not os.path.isfile(genTbl):
-        errOut(args,'ERROR: ' + genTbl + ' Not Found.')
+        errOut(domainDir,'ERROR: ' + genTbl + ' Not Found.')
     if not os.path.isfile(hydroTbl):
-        errOut(args,'ERROR: ' + hydroTbl + ' Not Found.')
+        errOut(domainDir,'ERROR: ' + hydroTbl + ' Not Found.')
     if os.path.isfile(soilPropOut):
-        errOut(args,'ERROR: ' + soilPropOut + ' Already Exists. Please remove and re-run program')
+        errOut(domainDir,'ERROR: ' + soilPropOut + ' Already Exists. Please remove and re-run program')
     if os.path.isfile(hydroTblOut):
-        errOut(args,'ERROR: ' + hydroTblOut + ' Already Exists. Please remove and re-run program')
+        errOut(domainDir,'ERROR: ' + hydroTblOut + ' Already Exists. Please remove and re-run program')
         
     # Establish paths to original copies of the data and temporary files during creation
-    #geoOrig = args.domainDirectory[0] + '/geo_em.nc.ORIG'
-    soilPropTmp = args.domainDirectory[0] + '/soil_properties_TMP.nc'
-    hydroOutTmp = args.domainDirectory[0] + '/HYDRO_TBL_2D_TMP.nc'
+    #geoOrig = domainDir + '/geo_em.nc.ORIG'
+    soilPropTmp = domainDir + '/soil_properties_TMP.nc'
+    hydroOutTmp = domainDir + '/HYDRO_TBL_2D_TMP.nc'
     
     # Open the original Geogrid file
     try:
         idGeoOrig = Dataset(geoFile,'r')
     except:
-        errOut(args,'ERROR: Unable to open: ' + geoFile)
+        errOut(domainDir,'ERROR: Unable to open: ' + geoFile)
         
     # Extract dimension sizes
     try:
         nxGeo = idGeoOrig.dimensions['west_east'].size
         nyGeo = idGeoOrig.dimensions['south_north'].size
     except:
-        errOut(args,'ERROR: Unable to extract dimension sizes from: ' + geoFile)
+        errOut(domainDir,'ERROR: Unable to extract dimension sizes from: ' + geoFile)
         
     # Open and read the SOILPARM.TBL file. We will assume to use the STATSGO parameter
     # values presented. We will assume this based on the soil_cat dimension length
     # in the geogrid file. If it's not 16, we will throw an error assuming there 
     # is another soil classification scheme being used. 
     if idGeoOrig.dimensions['soil_cat'].size != 16:
-        errOut(args,'ERROR: geo_em.nc contains a non-STATSGO classification scheme.')
+        errOut(domainDir,'ERROR: geo_em.nc contains a non-STATSGO classification scheme.')
     try:
         soilTblDf = pd.read_csv(soilTbl,sep=',',header=None,skiprows=[0,1,2],nrows=19,
                                 names=('solId','BB','DRYSMC','F11','MAXSMC','REFSMC',
                                 'SATPSI','SATDK','SATDW','WLTSMC','QTZ','solName'))
     except:
-        errOut(args,'ERROR: Unable to read: ' + soilTbl)
+        errOut(domainDir,'ERROR: Unable to read: ' + soilTbl)
         
     # Read in the MPTABLE.TBL. For now, we will only accept use of the USGS land
     # classification. Future iterations of this program will allow for additional
     # classification schemes. 
     if idGeoOrig.MMINLU != 'USGS':
-        errOut(args,'ERROR: Only USGS land classification scheme allowed from geo_em.nc')
+        errOut(domainDir,'ERROR: Only USGS land classification scheme allowed from geo_em.nc')
     try:
         mpTblDf = pd.read_csv(mpTbl,sep=',',header=None,skiprows=43,nrows=99,comment='!')
     except:
-        errOut(args,'ERROR: Unable to open: ' + mpTbl)
+        errOut(domainDir,'ERROR: Unable to open: ' + mpTbl)
     # Run some additional formatting to accomodate the nature of the input file.
     try:
         mpTblDf = mpTblDf[pd.notnull(mpTblDf[2])]
@@ -137,7 +206,7 @@ def main(argv):
         for i in range(0,len(mpTblDf.Name)):
             mpTblDf.Name[i] = mpTblDf.Name[i].strip()
     except:
-        errOut(args,'ERROR: Unable to format input from: ' + mpTbl + ' Please check the table file.')
+        errOut(domainDir,'ERROR: Unable to format input from: ' + mpTbl + ' Please check the table file.')
         
     ## Read in GENPARM.TBL
     try:
@@ -147,7 +216,7 @@ def main(argv):
         refdk = float(pd.read_csv(genTbl,header=None,skiprows=21,nrows=1)[0][0])
         genTab = {'SLOPE':slopeData,'REFKDT':refkdt,'REFDK':refdk}
     except:
-        errOut(args,'ERROR: Unable to open and extract values from: ' + genTbl)
+        errOut(domainDir,'ERROR: Unable to open and extract values from: ' + genTbl)
      
     # Read in the HYDRO.TBL.
     try:
@@ -156,7 +225,7 @@ def main(argv):
         sfcRoughDf = pd.read_csv(hydroTbl,sep=',',header=None,skiprows=2,nrows=28,
                                  names=('OV_ROUGH2D','descrip'))
     except:
-        errOut(args,'ERROR: Unable to open: ' + hydroTbl)
+        errOut(domainDir,'ERROR: Unable to open: ' + hydroTbl)
         
     # Establish dictionaries for all the ouptut variables and their associated units.
     soilOutUnits = {'slope':'m','refkdt':'m','bexp':'m^3/m^3','cwpvt':'m',
@@ -198,7 +267,7 @@ def main(argv):
                                          'south_north','west_east'),fill_value=fillParam)
             idSoilOut.variables[tmpVar].units = soilOutUnits[tmpVar]
     except:
-        errOut(args,'ERROR: Unable to create temporary soil_properties.nc file.')
+        errOut(domainDir,'ERROR: Unable to create temporary soil_properties.nc file.')
         
     try:
         idHydroOut = Dataset(hydroOutTmp,'w')
@@ -208,47 +277,58 @@ def main(argv):
             idHydroOut.createVariable(tmpVar,'f4',('south_north','west_east'),fill_value=fillParam)
             idHydroOut.variables[tmpVar].units = hydroOutUnits[tmpVar]
     except:
-        errOut(args,'ERROR: Unable to create temporary HYDRO_TBL_2D.nc file.')
+        errOut(domainDir,'ERROR: Unable to create temporary HYDRO_TBL_2D.nc file.')
     
     # Extract necessary fields from the geogrid file for calculations and conversions.
+    # The category grids are only read once.
     try:
-        vegmap = idGeoOrig.variables['LU_INDEX'][0,:,:]
-        solmap = idGeoOrig.variables['SCT_DOM'][0,:,:]
+        vegmap = np.array(idGeoOrig.variables['LU_INDEX'][0,:,:])
+        solmap = np.array(idGeoOrig.variables['SCT_DOM'][0,:,:])
         vegWater = idGeoOrig.ISWATER
         soilWater = idGeoOrig.ISOILWATER
         vegUrban = idGeoOrig.ISURBAN
     except:
-        errOut(args,'ERROR: Unable to pull necessary input variables from geogrid file.')
+        errOut(domainDir,'ERROR: Unable to pull necessary input variables from geogrid file.')
     
     solmap[np.where((vegmap != vegWater) & (solmap == soilWater))] = soilFillVal
     solmap[np.where(vegmap == vegWater)] = soilWater
-        
+    
+    # Surface roughness is mapped from the vegetation categories, with the 
+    # water category substituted in.
+    roughmap = vegmap.copy()
+    roughmap[np.where(vegmap == soilWater)] = vegWater
+    
+    # Position of each grid cell's category within the table categories. These
+    # are shared by every parameter pulled from the same table.
+    soilPos = categoryPositions(solmap,soilTblDf.solId)
+    vegPos = categoryPositions(vegmap,range(1,len(mpTblDf.columns.values)-1))
+    roughPos = categoryPositions(roughmap,range(1,len(sfcRoughDf.descrip)+1))
+    urbanInd = np.where((vegmap == vegUrban) & (solmap != soilWater))
+    
     # Translate updated parameter values to the new soil_properties.nc file
-    print("Updating soil_properties.nc")
+    if verbose:
+        print("Updating soil_properties.nc")
     for param in idSoilOut.variables:
         paramName = soilLookupVars[param]
-        print("Processing: " + param)
+        if verbose:
+            print("Processing: " + param)
         if paramName in soilTblDf.columns.values:
             # Parameter is in the soil table, map to the categories
-            print("Updating: " + paramName)
-            pnew = idGeoOrig.variables['SCT_DOM'][0,:,:]
-            pnew[np.where((vegmap != vegWater) & (pnew == soilWater))] = soilFillVal
-            pnew[np.where(vegmap == vegWater)] = soilWater
-            # Loop through each soil category
-            cntTmp = 0
-            for catTmp in soilTblDf.solId:
-                pnew[np.where(solmap == int(catTmp))] = float(soilTblDf[paramName][cntTmp])
-                cntTmp = cntTmp + 1
-            # Write output to NetCDF
-            for i in range(0,soilOutDims[param]+1):
-                idSoilOut.variables[param][0,i,:,:] = pnew
+            if verbose:
+                print("Updating: " + paramName)
+            pnew = mapCategories(solmap,soilPos,soilTblDf[paramName])
+            # Write all soil layers to NetCDF at once.
+            if soilOutDims[param] == 3:
+                idSoilOut.variables[param][0,:,:,:] = np.broadcast_to(pnew,(4,nyGeo,nxGeo))
+            else:
+                idSoilOut.variables[param][0,:,:] = pnew
         elif len(np.where(mpTblDf.Name == paramName)[0]) == 1:
             # Parameter is in the table, map to the categories. 
-            print("Updating: " + paramName)
+            if verbose:
+                print("Updating: " + paramName)
             indexTmp = np.where(mpTblDf.Name == paramName)[0][0]
-            pnew = idGeoOrig.variables['LU_INDEX'][0,:,:]
-            for catTmp in range(0,len(mpTblDf.columns.values)-2):
-                pnew[np.where(vegmap == int(catTmp+1))] = float(mpTblDf[catTmp][indexTmp])
+            pnew = mapCategories(vegmap,vegPos,[mpTblDf[catTmp][indexTmp] for catTmp in
+                                                range(0,len(mpTblDf.columns.values)-2)])
             # Write output to NetCDF
             idSoilOut.variables[param][0,:,:] = pnew
         elif paramName in genTab:
@@ -259,36 +339,29 @@ def main(argv):
     idSoilOut.close()
         
     # Translate updated parameter values to the new HYDRO_TBL_2D.nc file
-    print("Updating HYDRO_2D_TBL.nc")
+    if verbose:
+        print("Updating HYDRO_2D_TBL.nc")
     for param in idHydroOut.variables:
         paramName = hydroLookupVars[param]
-        print("Processing: " + param)
+        if verbose:
+            print("Processing: " + param)
         if soilLookupVars[hydroLookupVars[param]] in soilTblDf.columns.values:
-            print("Updating HYDRO soil parameters: " + paramName)
-            pnew = idGeoOrig.variables['SCT_DOM'][0,:,:]
-            pnew[np.where((vegmap != vegWater) & (pnew == soilWater))] = soilFillVal
-            pnew[np.where(vegmap == vegWater)] = soilWater
-            # Loop through each soil category
-            cntTmp = 0
-            for catTmp in soilTblDf.solId:
-                pnew[np.where(solmap == int(catTmp))] = float(soilTblDf[soilLookupVars[paramName]][cntTmp])
-                cntTmp = cntTmp + 1
+            if verbose:
+                print("Updating HYDRO soil parameters: " + paramName)
+            pnew = mapCategories(solmap,soilPos,soilTblDf[soilLookupVars[paramName]])
             # Manually make some changes to urban cells to match hydro code.
             if param == 'SMCMAX1':
-                pnew[np.where((vegmap == vegUrban) & (solmap != soilWater))] = 0.45
+                pnew[urbanInd] = 0.45
             if param == 'SMCREF1':
-                pnew[np.where((vegmap == vegUrban) & (solmap != soilWater))] = 0.42
+                pnew[urbanInd] = 0.42
             if param == 'SMCWLT1':
-                pnew[np.where((vegmap == vegUrban) & (solmap != soilWater))] = 0.40
+                pnew[urbanInd] = 0.40
             # Write to an output NetCDF file
             idHydroOut.variables[param][:,:] = pnew
         elif paramName in sfcRoughDf:
-            print("Updating OV_ROUGH2D")
-            pnew = idGeoOrig.variables['LU_INDEX'][0,:,:]
-            pnew[np.where(vegmap == soilWater)] = vegWater
-            # Loop through each vegetation category
-            for catTmp in range(0,len(sfcRoughDf.descrip)):
-                pnew[np.where(pnew == int(catTmp+1))] = float(sfcRoughDf.OV_ROUGH2D[catTmp])
+            if verbose:
+                print("Updating OV_ROUGH2D")
+            pnew = mapCategories(roughmap,roughPos,sfcRoughDf.OV_ROUGH2D)
             # Write output to NetCDF
             idHydroOut.variables[param][:,:] = pnew
             
@@ -299,35 +372,62 @@ def main(argv):
     try:
         idGeoOrig.close()
     except:
-        errOut(args,'ERROR: Unable to close: ' + geoFile)
+        errOut(domainDir,'ERROR: Unable to close: ' + geoFile)
         
     # Move temporary soil_properties and HYDRO_2D_TBL into final spots.
     try:
         shutil.move(soilPropTmp,soilPropOut)
     except:
-        errOut(args,'ERROR: Unable to move: ' + soilPropTmp + ' to final location')
+        errOut(domainDir,'ERROR: Unable to move: ' + soilPropTmp + ' to final location')
     
     try:
         shutil.move(hydroOutTmp,hydroTblOut)
     except:
-        errOut(args,'ERROR: Unable to move: ' + hydroOutTmp + ' to final location')
+        errOut(domainDir,'ERROR: Unable to move: ' + hydroOutTmp + ' to final location')
+
+def categoryPositions(catGrid,catIds):
+    """
+    Generic function to find the position of each grid cell's category within
+    a list of table categories. Cells whose category is not in the list are
+    assigned -1.
+    """
+    catIds = np.array([int(catTmp) for catTmp in catIds],dtype=np.int64)
+    lookup = np.full(max(catIds.max()+1,1),-1,dtype=np.int64)
+    lookup[catIds] = np.arange(len(catIds))
+    
+    catInt = np.rint(catGrid).astype(np.int64)
+    inRange = (catInt == catGrid) & (catInt >= 0) & (catInt < len(lookup))
+    catPos = np.full(catGrid.shape,-1,dtype=np.int64)
+    catPos[inRange] = lookup[catInt[inRange]]
+    
+    return catPos
+
+def mapCategories(catGrid,catPos,catValues):
+    """
+    Generic function to map a grid of categories to parameter values using
+    the category positions from categoryPositions. Cells without a matching
+    category keep their original category value.
+    """
+    catValues = np.array([float(valTmp) for valTmp in catValues])
+    pnew = np.take(catValues,np.maximum(catPos,0))
+    
+    return np.where(catPos >= 0,pnew,catGrid)
 
-def errOut(args,message):
+def errOut(domainDir,message):
     """
-    Generic function to convey an error message to the user and cleanup
-    old files that need to be deleted.
+    Generic function to cleanup old files that need to be deleted after an
+    error, and raise the error message back up to the calling program.
     """
     
     # Print error message to screen for the user
-    print(message)
-    print('Cleaning Up Residual Files')
+    print('Cleaning Up Residual Files in: ' + domainDir)
     
-    geoOrig = args.domainDirectory[0] + '/geo_em.nc.ORIG'
-    geoTmp = args.domainDirectory[0] + '/geo_em_TMP.nc'
-    soilPropTmp = args.domainDirectory[0] + '/soil_properties_TMP.nc'
-    hydroOutTmp = args.domainDirectory[0] + '/HYDRO_TBL_2D_TMP.nc'
-    soilPropOut = args.domainDirectory[0] + '/soil_properties.nc'
-    hydroTblOut = args.domainDirectory[0] + '/HYDRO_TBL_2D.nc'
+    geoOrig = domainDir + '/geo_em.nc.ORIG'
+    geoTmp = domainDir + '/geo_em_TMP.nc'
+    soilPropTmp = domainDir + '/soil_properties_TMP.nc'
+    hydroOutTmp = domainDir + '/HYDRO_TBL_2D_TMP.nc'
+    soilPropOut = domainDir + '/soil_properties.nc'
+    hydroTblOut = domainDir + '/HYDRO_TBL_2D.nc'
     
     if os.path.isfile(soilPropTmp):
         os.remove(soilPropTmp)
@@ -342,8 +442,8 @@ def errOut(args,message):
     if os.path.isfile(hydroTblOut):
         os.remove(hydroTblOut)
         
-    # Exit out of the program
-    sys.exit(1)
+    # Pass the error back to the calling program.
+    raise Exception(message)
     
 if __name__ == "__main__":
     main(sys.argv[1:])
\ No newline at end of file
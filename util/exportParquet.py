@@ -0,0 +1,389 @@
+# Utility program to export the calibration, sensitivity and validation
+# tables of a calibration DB file to partitioned Parquet datasets for
+# post-hoc analysis across jobs. Each of Calib_Params, Calib_Stats,
+# Sens_Params, Sens_Stats and Valid_Stats is written under:
+#     outDir/<table>/jobID=<jobID>/domainID=<domainID>/part-<stamp>.parquet
+# which can be read directly with pyarrow.dataset, pandas, Spark, etc.
+# Domain_Meta is small and is re-written in full to outDir/Domain_Meta.parquet
+# on each export.
+#
+# Rows are streamed from the DB file in chunks, and only one Parquet file is
+# open at a time, so memory use is bounded by the chunk size rather than the
+# size of the tables.
+#
+# Exports are incremental. A state file in the output directory records,
+# for each job and basin, the last calibration/sensitivity iteration that
+# was exported, along with which basins have had their validation statistics
+# exported. Only iterations completed since the last export are written. An
+# iteration is exported once it, and every iteration before it, is complete.
+# Note the "best" column of Calib_Stats reflects the state of the DB when the
+# iteration was exported. Use --full to re-export a job from scratch.
+#
+# The DB file is opened read-only. To avoid touching the live workflow DB,
+# point this program at one of the hourly DB_BACKUP copies of the job.
+
+# Logan Karsten
+# National Center for Atmospheric Research
+# Research Applications Laboratory
+# karsten@ucar.edu
+
+import sys
+import os
+import argparse
+import datetime
+import json
+import shutil
+import sqlite3
+import uuid
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Name of the file in the output directory holding the export state.
+STATE_FILE = '.EXPORT_STATE.json'
+
+# Number of Valid_Stats rows logged for a basin once validation is complete.
+NUM_VALID_STATS = 6
+
+# Calib_Stats complete value of an iteration skipped once the calibration of
+# a basin converged (basinStatusMod.SKIPPED_VALUE). These rows are final, but
+# hold no statistics.
+SKIPPED_STATUS = 3.0
+
+def main(argv):
+    # Parse arguments. User must input a DB file and an output directory.
+    parser = argparse.ArgumentParser(description='Utility program to export calibration DB ' + \
+                                     'tables to partitioned Parquet datasets.')
+    parser.add_argument('dbPath',metavar='dbPath',type=str,nargs=1,
+                        help='Path to the calibration DB file to export from.')
+    parser.add_argument('outDir',metavar='outDir',type=str,nargs=1,
+                        help='Directory to write the Parquet datasets to.')
+    parser.add_argument('--jobID',type=int,nargs='?',
+                        help='Optional job ID to export. Defaults to all jobs in the DB file.')
+    parser.add_argument('--chunkSize',type=int,nargs='?',default=50000,
+                        help='Number of rows held in memory at once. Defaults to 50000.')
+    parser.add_argument('--full',action='store_true',
+                        help='Remove any previous export of the selected jobs and export them from scratch.')
+
+    args = parser.parse_args()
+
+    dbPath = args.dbPath[0]
+    outDir = args.outDir[0]
+
+    if not os.path.isfile(dbPath):
+        print("ERROR: Unable to locate DB file: " + dbPath)
+        sys.exit(1)
+    if args.chunkSize <= 0:
+        print("ERROR: Please specify a chunk size greater than zero.")
+        sys.exit(1)
+    if not os.path.isdir(outDir):
+        try:
+            os.makedirs(outDir)
+        except:
+            print("ERROR: Unable to create output directory: " + outDir)
+            sys.exit(1)
+
+    # Open the DB file read-only.
+    try:
+        conn = sqlite3.connect('file:' + os.path.abspath(dbPath) + '?mode=ro',uri=True)
+        dbCursor = conn.cursor()
+    except:
+        print("ERROR: Unable to open DB file: " + dbPath + " read-only.")
+        sys.exit(1)
+
+    # Remove any partial files left behind by an export that did not finish.
+    cleanTmpFiles(outDir)
+
+    statePath = outDir + "/" + STATE_FILE
+    try:
+        exportState = readState(statePath)
+    except:
+        print("ERROR: Unable to read export state file: " + statePath)
+        sys.exit(1)
+
+    if args.jobID is not None:
+        jobList = [args.jobID]
+    else:
+        try:
+            dbCursor.execute("SELECT \"jobID\" from \"Job_Meta\";")
+            jobList = [int(jobTmp[0]) for jobTmp in dbCursor.fetchall()]
+        except:
+            print("ERROR: Unable to extract job IDs from: " + dbPath)
+            sys.exit(1)
+
+    if args.full:
+        for jobID in jobList:
+            removeJob(outDir,exportState,jobID)
+
+    # Unique stamp placed in the name of every file written during this export.
+    # The random suffix keeps exports started within the same second apart.
+    stamp = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S') + "-" + uuid.uuid4().hex[:12]
+    partFiles = []
+
+    try:
+        for jobID in jobList:
+            print("Exporting job: " + str(jobID))
+
+            # Calibration iterations.
+            newRanges = completeRanges(dbCursor,"Calib_Stats",jobID,
+                                       exportState['calib'].get(str(jobID),{}),args.chunkSize)
+            exportTable(dbCursor,"Calib_Stats",jobID,newRanges,outDir,stamp,args.chunkSize,partFiles)
+            exportTable(dbCursor,"Calib_Params",jobID,newRanges,outDir,stamp,args.chunkSize,partFiles)
+            updateState(exportState['calib'],jobID,newRanges)
+
+            # Sensitivity iterations.
+            newRanges = completeRanges(dbCursor,"Sens_Stats",jobID,
+                                       exportState['sens'].get(str(jobID),{}),args.chunkSize)
+            exportTable(dbCursor,"Sens_Stats",jobID,newRanges,outDir,stamp,args.chunkSize,partFiles)
+            exportTable(dbCursor,"Sens_Params",jobID,newRanges,outDir,stamp,args.chunkSize,partFiles)
+            updateState(exportState['sens'],jobID,newRanges)
+
+            # Validation statistics are exported once per basin, after the
+            # validation is complete.
+            newRanges = validBasins(dbCursor,jobID,exportState['valid'].get(str(jobID),{}))
+            exportTable(dbCursor,"Valid_Stats",jobID,newRanges,outDir,stamp,args.chunkSize,partFiles)
+            updateState(exportState['valid'],jobID,newRanges)
+
+        exportDomainMeta(dbCursor,outDir,args.chunkSize,partFiles)
+    except Exception as err:
+        print("ERROR: Failure exporting tables from: " + dbPath + " - " + str(err))
+        cleanTmpFiles(outDir)
+        sys.exit(1)
+
+    # Move the finished files into place, then record the new export state.
+    try:
+        for tmpPath in partFiles:
+            os.replace(tmpPath,tmpPath[:-4])
+        writeState(statePath,exportState)
+    except:
+        print("ERROR: Unable to finalize export to: " + outDir)
+        sys.exit(1)
+
+    print("Wrote " + str(len(partFiles)) + " Parquet files to: " + outDir)
+
+    try:
+        conn.close()
+    except:
+        print("ERROR: Unable to close DB file: " + dbPath)
+        sys.exit(1)
+
+def readState(statePath):
+    """
+    Generic function to read the export state file. An empty state is returned
+    if no previous export has been made.
+    """
+    exportState = {'calib':{},'sens':{},'valid':{}}
+    if os.path.isfile(statePath):
+        with open(statePath,'r') as fTmp:
+            exportState.update(json.load(fTmp))
+    return exportState
+
+def writeState(statePath,exportState):
+    """
+    Generic function to write the export state file.
+    """
+    with open(statePath + '.tmp','w') as fTmp:
+        json.dump(exportState,fTmp)
+    os.replace(statePath + '.tmp',statePath)
+
+def updateState(stateTmp,jobID,newRanges):
+    """
+    Generic function to record the last exported iteration for each basin.
+    """
+    jobState = stateTmp.setdefault(str(jobID),{})
+    for domainID in newRanges:
+        jobState[str(domainID)] = newRanges[domainID][1]
+
+def removeJob(outDir,exportState,jobID):
+    """
+    Generic function to remove a previous export of a job, along with its state.
+    """
+    for tableName in ['Calib_Params','Calib_Stats','Sens_Params','Sens_Stats','Valid_Stats']:
+        jobDir = outDir + "/" + tableName + "/jobID=" + str(jobID)
+        if os.path.isdir(jobDir):
+            shutil.rmtree(jobDir)
+    for keyTmp in ['calib','sens','valid']:
+        exportState[keyTmp].pop(str(jobID),None)
+
+def cleanTmpFiles(outDir):
+    """
+    Generic function to remove partially written Parquet files.
+    """
+    for dirPath, dirNames, fileNames in os.walk(outDir):
+        for fileName in fileNames:
+            if fileName.endswith('.parquet.tmp'):
+                os.remove(os.path.join(dirPath,fileName))
+
+def completeRanges(dbCursor,tableName,jobID,jobState,chunkSize):
+    """
+    Generic function to find, for each basin in a job, the range of iterations
+    completed since the last export. Only iterations following an unbroken run
+    of complete iterations are included. Iterations skipped once a basin
+    converged are final, so they are exported as well, keeping their complete
+    value so they can be told apart from evaluated iterations. Returns a
+    dictionary of domainID to [lastExported,newLast] iteration values.
+    """
+    # Sensitivity iterations have an entry for each time step. An iteration
+    # is complete once every entry is complete.
+    sqlCmd = "SELECT \"domainID\",iteration,min(complete) from \"" + tableName + "\" where " + \
+             "\"jobID\"=? group by \"domainID\",iteration order by \"domainID\",iteration;"
+    dbCursor.execute(sqlCmd,(jobID,))
+
+    newRanges = {}
+    stopList = set()
+    while True:
+        rows = dbCursor.fetchmany(chunkSize)
+        if len(rows) == 0:
+            break
+        for domainID, iteration, complete in rows:
+            if domainID in stopList:
+                continue
+            lastExport = jobState.get(str(domainID),None)
+            if lastExport is not None and iteration <= lastExport:
+                continue
+            if complete is None or float(complete) not in [1.0,SKIPPED_STATUS]:
+                stopList.add(domainID)
+                continue
+            newRanges[domainID] = [lastExport,iteration]
+
+    return newRanges
+
+def validBasins(dbCursor,jobID,jobState):
+    """
+    Generic function to find basins with complete validation statistics that
+    have not been exported. Returns the same dictionary layout as completeRanges.
+    """
+    sqlCmd = "SELECT \"domainID\",count(*) from \"Valid_Stats\" where \"jobID\"=? group by \"domainID\";"
+    dbCursor.execute(sqlCmd,(jobID,))
+
+    newRanges = {}
+    for domainID, numStats in dbCursor.fetchall():
+        if str(domainID) in jobState or numStats < NUM_VALID_STATS:
+            continue
+        newRanges[domainID] = [None,1]
+
+    return newRanges
+
+def arrowSchema(dbCursor,tableName,skipCols):
+    """
+    Generic function to build an Arrow schema from the declared column types
+    of a DB table.
+    """
+    dbCursor.execute("PRAGMA table_info(\"" + tableName + "\");")
+    fields = []
+    for colInfo in dbCursor.fetchall():
+        if colInfo[1] in skipCols:
+            continue
+        typeTmp = str(colInfo[2]).lower()
+        if 'int' in typeTmp:
+            fields.append(pa.field(colInfo[1],pa.int64()))
+        elif 'real' in typeTmp:
+            fields.append(pa.field(colInfo[1],pa.float64()))
+        else:
+            fields.append(pa.field(colInfo[1],pa.string()))
+    return pa.schema(fields)
+
+def convertValue(valTmp,typeTmp):
+    """
+    Generic function to convert a DB value to the type of its Arrow column.
+    Values that cannot be converted are set to null.
+    """
+    if valTmp is None:
+        return None
+    try:
+        if pa.types.is_integer(typeTmp):
+            return int(valTmp)
+        if pa.types.is_floating(typeTmp):
+            return float(valTmp)
+    except (TypeError,ValueError):
+        return None
+    return str(valTmp)
+
+def writeChunk(writer,schema,colIndex,rows):
+    """
+    Generic function to write a list of DB rows to a Parquet file as a row group.
+    """
+    arrays = []
+    for field in schema:
+        indTmp = colIndex[field.name]
+        arrays.append(pa.array([convertValue(row[indTmp],field.type) for row in rows],type=field.type))
+    writer.write_table(pa.Table.from_arrays(arrays,schema=schema))
+
+def exportTable(dbCursor,tableName,jobID,newRanges,outDir,stamp,chunkSize,partFiles):
+    """
+    Generic function to stream the new rows of a table for a job into Parquet
+    files, one per basin. Rows are read in order of basin, so only one file is
+    open at a time.
+    """
+    if len(newRanges) == 0:
+        return
+
+    schema = arrowSchema(dbCursor,tableName,['jobID','domainID'])
+
+    if tableName == 'Valid_Stats':
+        sqlCmd = "SELECT * from \"" + tableName + "\" where \"jobID\"=? order by \"domainID\";"
+    else:
+        sqlCmd = "SELECT * from \"" + tableName + "\" where \"jobID\"=? order by \"domainID\",iteration;"
+    dbCursor.execute(sqlCmd,(jobID,))
+    colIndex = dict([[dbCursor.description[i][0],i] for i in range(0,len(dbCursor.description))])
+    domainInd = colIndex['domainID']
+    iterInd = colIndex.get('iteration',None)
+
+    writer = None
+    writeDomain = None
+    bufferRows = []
+    while True:
+        rows = dbCursor.fetchmany(chunkSize)
+        if len(rows) == 0:
+            break
+        for row in rows:
+            domainID = row[domainInd]
+            if domainID not in newRanges:
+                continue
+            if iterInd is not None:
+                lastExport, newLast = newRanges[domainID]
+                if (lastExport is not None and row[iterInd] <= lastExport) or row[iterInd] > newLast:
+                    continue
+            if domainID != writeDomain:
+                # Moving on to the next basin. Close out the previous file.
+                if len(bufferRows) > 0:
+                    writeChunk(writer,schema,colIndex,bufferRows)
+                    bufferRows = []
+                if writer is not None:
+                    writer.close()
+                partDir = outDir + "/" + tableName + "/jobID=" + str(jobID) + "/domainID=" + str(domainID)
+                if not os.path.isdir(partDir):
+                    os.makedirs(partDir)
+                partPath = partDir + "/part-" + stamp + ".parquet.tmp"
+                writer = pq.ParquetWriter(partPath,schema)
+                partFiles.append(partPath)
+                writeDomain = domainID
+            bufferRows.append(row)
+            if len(bufferRows) >= chunkSize:
+                writeChunk(writer,schema,colIndex,bufferRows)
+                bufferRows = []
+
+    if len(bufferRows) > 0:
+        writeChunk(writer,schema,colIndex,bufferRows)
+    if writer is not None:
+        writer.close()
+
+def exportDomainMeta(dbCursor,outDir,chunkSize,partFiles):
+    """
+    Generic function to export the full Domain_Meta table to a single Parquet file.
+    """
+    schema = arrowSchema(dbCursor,'Domain_Meta',[])
+    dbCursor.execute("SELECT * from \"Domain_Meta\" order by \"domainID\";")
+    colIndex = dict([[dbCursor.description[i][0],i] for i in range(0,len(dbCursor.description))])
+
+    partPath = outDir + "/Domain_Meta.parquet.tmp"
+    writer = pq.ParquetWriter(partPath,schema)
+    partFiles.append(partPath)
+    while True:
+        rows = dbCursor.fetchmany(chunkSize)
+        if len(rows) == 0:
+            break
+        writeChunk(writer,schema,colIndex,rows)
+    writer.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -31,6 +31,7 @@ from core import statusMod
 from core import dbMod
 from core import errMod
 from core import configMod
+from core import basinStatusMod
 
 def main(argv):
     # Parse arguments. User must input a job name and directory.
@@ -60,7 +61,8 @@ def main(argv):
                '-0.1':'CALIBRATON PROGRAM FOR DEFAULT PARAMETERS LOCKED',
                '0.0':'NOT STARTED','0.25':'CALIBRATION PROGRAM FOR DEFAULT PROGRAM RUNNING',
                '0.5':'MODEL CURRENTLY RUNNING','0.75':'MODEL COMPLETE READY FOR PARAMETER ESTIMATION',
-               '0.9':'PARAMETER ESTIMATION OCCURRING','1.0':'MODEL ITERATION COMPLETE'}
+               '0.9':'PARAMETER ESTIMATION OCCURRING','1.0':'MODEL ITERATION COMPLETE',
+               '3.0':'ITERATION SKIPPED - CALIBRATION CONVERGED'}
     
     # Initialize object to hold status and job information
     jobData = statusMod.statusMeta()
@@ -153,12 +155,17 @@ def main(argv):
             completeArray[iteration] = keyStatus
 
         indComplete = np.where(completeArray == 1)
+        indSkipped = np.where(completeArray == basinStatusMod.SKIPPED_VALUE)
         indCheck1 = np.where(completeArray != 1.0)
         indCheck2 = np.where(completeArray == 0.0)
-        meanSum = meanSum + len(indComplete[0])
+        meanSum = meanSum + len(indComplete[0]) + len(indSkipped[0])
         if len(indComplete[0]) == int(jobData.nIter):
             msgOut = msgOut + "BASIN: " + str(jobData.gages[basin]) + \
                      ": CALIBRATION COMPLETE.\n"
+        elif len(indSkipped[0]) > 0 and len(indComplete[0]) + len(indSkipped[0]) == int(jobData.nIter):
+            msgOut = msgOut + "BASIN: " + str(jobData.gages[basin]) + \
+                     ": CALIBRATION CONVERGED AFTER ITERATION: " + str(len(indComplete[0])) + \
+                     " - " + str(len(indSkipped[0])) + " ITERATIONS SKIPPED.\n"
         else:
             if len(indCheck2[0]) == int(jobData.nIter):
                 msgOut = msgOut + "BASIN: " + str(jobData.gages[basin]) + \
@@ -1,5 +1,11 @@
 # Utility program to dumping calibration/validation parameters/statistics
 # for a given job experiment ID value to a NetCDF file.
+#
+# The Calib_Stats, Valid_Stats and Calib_Params tables are each pulled for
+# the job with a single query, pivoted into (gage,iteration) arrays, and
+# written to the NetCDF file one variable at a time. With the --allMetrics
+# option, every metric column in the statistics tables is written out, along
+# with the calibration parameter values as a (gage,iteration,param) cube.
 
 # Logan Karsten
 # Natinonal Center for Atmospheric Research
@@ -10,7 +16,32 @@ import sqlite3
 import argparse
 import os
 import sys
-from netCDF4 import Dataset
+import numpy as np
+import pandas as pd
+from netCDF4 import Dataset, stringtochar
+
+# Calib_Stats columns written out by default, along with the associated NetCDF variable.
+CALIB_VARS = [['bias','calibBias'],['rmse','calibRmse'],['cor','calibCorrelation'],
+              ['nse','calibNse'],['nselog','calibNseLog'],['kge','calibKge'],
+              ['fdcerr','calibFdc'],['msof','calibMsof'],
+              ['hyperResMultiObj','calibHyperResMultiObj'],['best','calibBest']]
+
+# Valid_Stats columns written out by default, along with the associated NetCDF variable.
+# Valid_Stats contains no fdcerr column, so validFdc is left as missing.
+VALID_VARS = [['bias','validBias'],['rmse','validRmse'],['cor','validCorrelation'],
+              ['nse','validNse'],['nselog','validNseLog'],['kge','validKge'],
+              ['fdcerr','validFdc'],['msof','validMsof'],
+              ['hyperResMultiObj','validHyperResMultiObj']]
+
+# Non-metric columns in the statistics tables.
+KEY_COLS = ['jobID','domainID','iteration','simulation','evalPeriod','complete','stopped']
+
+# Validation simulations, in the order of the ctrlBest dimension.
+VALID_SIMS = ['default','calibrated']
+
+# Calib_Stats complete value of an iteration skipped once the calibration of
+# a basin converged (basinStatusMod.SKIPPED_VALUE).
+SKIPPED_STATUS = 3.0
 
 def main(argv):
     # Parse arguments. User must input a jobID, the DB file to pull from. Optionally,
@@ -23,6 +54,9 @@ def main(argv):
                         help='Required path to sqllite3 DB file.')
     parser.add_argument('--optOutPath',type=str,nargs='?',
                         help='Optional output path for NetCDF file.')
+    parser.add_argument('--allMetrics',action='store_true',
+                        help='Output every metric column, along with a (gage,iteration,param) ' + \
+                        'cube of calibration parameter values.')
 
     args = parser.parse_args()
 
@@ -32,6 +66,7 @@ def main(argv):
         sys.exit(1)
 
     dbPath = args.inDB[0]
+    jobID = int(args.jobID[0])
 
     # Open the SQLite DB file
     try:
@@ -40,484 +75,187 @@ def main(argv):
         print("ERROR: Unable to connect to: " + dbPath + ". Please intiialize the DB file.")
         sys.exit(1)
 
-    try:
-        dbCursor = conn.cursor()
-    except:
-        print("ERROR: Unable to establish cursor object for: " + dbPath)
-        sys.exit(1)
-        
     # First, pull the number of gages and iterations from the Job_Meta table. This will
     # help determine how many data entries to expect.
-    sqlCmd = "SELECT num_iter from \"Job_Meta\" where \"jobID\"=%s;" % args.jobID[0]
+    sqlCmd = "SELECT num_iter,num_gages from \"Job_Meta\" where \"jobID\"=?;"
     try:
-        dbCursor.execute(sqlCmd)
-        results = dbCursor.fetchone()
+        results = conn.execute(sqlCmd,(jobID,)).fetchone()
     except:
         print("ERROR: Unable to execute SQL command: " + sqlCmd)
         sys.exit(1)
-        
-    if len(results) == 0:
-        print("ERROR: User-provided Job ID: " + str(args.jobID[0]) + " returned no results. " + \
+
+    if results is None:
+        print("ERROR: User-provided Job ID: " + str(jobID) + " returned no results. " + \
               " Please confirm job has been initialized.")
         sys.exit(1)
-        
+
     numIter = int(results[0])
-    
-    sqlCmd = "SELECT num_gages from \"Job_Meta\" where \"jobID\"=%s;" % args.jobID[0]
-    try:
-        dbCursor.execute(sqlCmd)
-        results = dbCursor.fetchone()
-    except:
-        print("ERROR: Unable to execute SQL command: " + sqlCmd)
-        sys.exit(1)
-        
-    if len(results) == 0:
-        print("ERROR: User-provided Job ID: " + str(args.jobID[0]) + " returned no results. " + \
-              " Please confirm job has been initialized.")
-        sys.exit(1)
-    
-    numGages = int(results[0])
-    #numCalibStatEntries = numIter*numGages
-    
-    # Next, do a sample pull from Calib_Params for a given domain ID within this job ID
-    # and determine how many parameters are being calibrated. We will need this number
-    # for the output file. 
-    sqlCmd = "SELECT \"domainID\" from \"Calib_Params\" where \"jobID\"=%s;" % args.jobID[0]
+    numGages = int(results[1])
+
+    # Pull the statistics and parameter tables for this job, one query each.
     try:
-        dbCursor.execute(sqlCmd)
-        results1 = dbCursor.fetchone()
+        calibStats = pd.read_sql_query("SELECT * from \"Calib_Stats\" where \"jobID\"=?;",conn,params=(jobID,))
+        validStats = pd.read_sql_query("SELECT * from \"Valid_Stats\" where \"jobID\"=?;",conn,params=(jobID,))
+        calibParams = pd.read_sql_query("SELECT \"domainID\",iteration,\"paramName\",\"paramValue\" from " + \
+                                        "\"Calib_Params\" where \"jobID\"=?;",conn,params=(jobID,))
     except:
-        print("ERROR: Unable to execute SQL command: " + sqlCmd)
+        print("ERROR: Unable to extract calibration/validation data for job: " + str(jobID))
         sys.exit(1)
-        
-    if len(results1) == 0:
-        print("ERROR: User-provided Job ID: " + str(args.jobID[0]) + " returned no results. " + \
+
+    if len(calibParams) == 0:
+        print("ERROR: User-provided Job ID: " + str(jobID) + " returned no results. " + \
               " Please confirm job has been initialized.")
         sys.exit(1)
-        
-    sqlCmd = "SELECT * from \"Calib_Params\" where \"jobID\"=%s and \"domainID\"=%s and iteration=1;" % (args.jobID[0],int(results1[0]))
-    try:
-        dbCursor.execute(sqlCmd)
-        results = dbCursor.fetchall()
-    except:
-        print("ERROR: Unable to execute SQL command: " + sqlCmd)
-        sys.exit(1)
-        
-    if len(results) == 0:
-        print("ERROR: User-provided Job ID: " + str(args.jobID[0]) + " returned no results. " + \
-              " Please confirm job has been initialized.")
+
+    # Gages are ordered as they appear in the first iteration of Calib_Stats.
+    jobGageIDs = list(calibStats.domainID[calibStats.iteration == 1])
+    if numGages != len(jobGageIDs):
+        print("ERROR: Number of gages found in Calib_Stats does not match what is in Job_Meta.")
         sys.exit(1)
-        
-    numCalibParams = len(results)
-    
-    # Extract the parameter names, which will be used later for parameter value
-    # extraction using similar logic.
-    sqlCmd = "SELECT \"paramName\" from \"Calib_Params\" where \"jobID\"=%s and \"domainID\"=%s and iteration=1;" % (args.jobID[0],int(results1[0]))
+
+    # Calibration parameter names, in the order they were entered for the first gage.
+    paramsTmp = calibParams[(calibParams.domainID == calibParams.domainID.iloc[0]) & (calibParams.iteration == 1)]
+    calibParamNames = list(paramsTmp.paramName)
+    numCalibParams = len(calibParamNames)
+
+    sqlCmd = "SELECT \"domainID\",gage_id from \"Domain_Meta\" where \"domainID\" in (" + \
+             ",".join(["?"]*numGages) + ");"
     try:
-        dbCursor.execute(sqlCmd)
-        calibParamNames = dbCursor.fetchall()
+        gageMap = dict(conn.execute(sqlCmd,[int(idTmp) for idTmp in jobGageIDs]).fetchall())
     except:
-        print("ERROR: Unable to execute SQL command: " + sqlCmd)
+        print("ERROR: Unable to extract gage_id values for job: " + str(jobID))
         sys.exit(1)
-        
+    for idTmp in jobGageIDs:
+        if int(idTmp) not in gageMap:
+            print("ERROR: Unable to extract gage_id for domainID: " + str(idTmp))
+            sys.exit(1)
+
     # Create the ouptut NetCDF file that will contain output.
     if args.optOutPath:
         outPath = args.optOutPath
     else:
-        outPath = "./CalibrationData_Job_" + str(args.jobID[0]) + ".nc"
-        
+        outPath = "./CalibrationData_Job_" + str(jobID) + ".nc"
+
     idOut = Dataset(outPath,'w')
-    
-    # Create dimensions
-    idOut.createDimension('numGages',numGages)
-    idOut.createDimension('numIterations',numIter)
-    idOut.createDimension('numParams',numCalibParams)
-    idOut.createDimension('gageStrLen',30)
-    idOut.createDimension('ctrlBest',2)
-    
-    # Create a gage variable that will contain the gage string for each domain.
-    idOut.createVariable("gage","S1",("numGages","gageStrLen"))
-    
-    # Loop through, extract the gage ID and place it into the gVar
-    sqlCmd = "SELECT \"domainID\" from \"Calib_Stats\" where \"jobID\"=%s and iteration=1;" % args.jobID[0]
+
     try:
-        dbCursor.execute(sqlCmd)
-        jobGageIDs = dbCursor.fetchall()
+        # Create dimensions
+        idOut.createDimension('numGages',numGages)
+        idOut.createDimension('numIterations',numIter)
+        idOut.createDimension('numParams',numCalibParams)
+        idOut.createDimension('gageStrLen',30)
+        idOut.createDimension('ctrlBest',2)
+
+        # Create a gage variable that will contain the gage string for each domain.
+        idOut.createVariable("gage","S1",("numGages","gageStrLen"))
+        gageStr = np.array([str(gageMap[int(idTmp)])[0:30] for idTmp in jobGageIDs],dtype='S30')
+        idOut.variables['gage'][:,:] = stringtochar(gageStr)
+
+        # Row/column positions of each Calib_Stats/Calib_Params entry in the output arrays.
+        gageIndex = pd.Series(np.arange(numGages),index=[int(idTmp) for idTmp in jobGageIDs])
+
+        # Flag the iterations skipped once the calibration of a basin converged. These hold
+        # no statistics, so they are left out of the statistic variables below.
+        skippedInd = calibStats.complete.astype(float) == SKIPPED_STATUS
+        calibStats = calibStats.assign(skipped=skippedInd.astype(int))
+        idOut.createVariable("calibSkipped","i4",("numGages","numIterations"),fill_value=-9999)
+        idOut.variables['calibSkipped'][:,:] = pivotIterations(calibStats,'skipped',gageIndex,numGages,numIter)
+        calibStats = calibStats[~skippedInd].drop(columns=['skipped'])
+
+        # Flag the iterations whose simulation was stopped early, as their objective
+        # function value is only a bound or prediction. Older DB files have no such column.
+        if 'stopped' in calibStats.columns:
+            calibStats = calibStats.assign(stopped=calibStats.stopped.fillna(0).astype(int))
+            idOut.createVariable("calibStopped","i4",("numGages","numIterations"),fill_value=-9999)
+            idOut.variables['calibStopped'][:,:] = pivotIterations(calibStats,'stopped',gageIndex,numGages,numIter)
+
+        # Create the statistic variables that will contain data for each gage, for all iterations.
+        calibVars = list(CALIB_VARS)
+        if args.allMetrics:
+            for colTmp in calibStats.columns:
+                if colTmp not in KEY_COLS and colTmp not in [varTmp[0] for varTmp in calibVars]:
+                    calibVars.append([colTmp,'calib_' + colTmp])
+        for colTmp, varName in calibVars:
+            idOut.createVariable(varName,"f8",("numGages","numIterations"),fill_value=-9999)
+            idOut.variables[varName][:,:] = pivotIterations(calibStats,colTmp,gageIndex,numGages,numIter)
+
+        # Create the validation statistics variables that will contain the control/best
+        # stats for each gage. Each gage entry will contain two values: One for
+        # the stats representative of the simulation driven with the control parameter
+        # values and another with stats representative of the simulation driven with the
+        # calibrated parameter values. The first entry for each simulation is used.
+        validFirst = validStats.drop_duplicates(['domainID','simulation'],keep='first')
+        validVars = list(VALID_VARS)
+        if args.allMetrics:
+            for colTmp in validStats.columns:
+                if colTmp not in KEY_COLS and colTmp not in [varTmp[0] for varTmp in validVars]:
+                    validVars.append([colTmp,'valid_' + colTmp])
+        for colTmp, varName in validVars:
+            idOut.createVariable(varName,"f8",("numGages","ctrlBest"),fill_value=-9999)
+            idOut.variables[varName][:,:] = pivotSimulations(validFirst,colTmp,gageIndex,numGages)
+        for simTmp in VALID_SIMS:
+            simGages = set(validFirst.domainID[validFirst.simulation == simTmp])
+            for idTmp in jobGageIDs:
+                if idTmp not in simGages:
+                    print("WARNING: Unable to extract " + simTmp + " validation stats for domainID: " + str(idTmp))
+
+        # Pivot the calibration parameters into a (gage,iteration,param) cube, and write
+        # a variable for each parameter.
+        paramCube = np.full((numGages,numIter,numCalibParams),np.nan)
+        paramPos = calibParams.paramName.map(dict(zip(calibParamNames,range(0,numCalibParams))))
+        gagePos = calibParams.domainID.map(gageIndex)
+        iterPos = calibParams.iteration - 1
+        keepInd = paramPos.notnull() & gagePos.notnull() & (iterPos >= 0) & (iterPos < numIter)
+        paramCube[gagePos[keepInd].astype(int),iterPos[keepInd].astype(int),
+                  paramPos[keepInd].astype(int)] = calibParams.paramValue[keepInd]
+        paramCube = np.where(np.isnan(paramCube),-9999,paramCube)
+        for i in range(0,numCalibParams):
+            idOut.createVariable(calibParamNames[i],"f8",("numGages","numIterations"),fill_value = -9999)
+            idOut.variables[calibParamNames[i]][:,:] = paramCube[:,:,i]
+
+        if args.allMetrics:
+            idOut.createDimension('paramStrLen',max([len(nameTmp) for nameTmp in calibParamNames]))
+            idOut.createVariable("paramName","S1",("numParams","paramStrLen"))
+            idOut.variables['paramName'][:,:] = stringtochar(np.array(calibParamNames,dtype='S' +
+                                                                      str(len(idOut.dimensions['paramStrLen']))))
+            idOut.createVariable("calibParams","f8",("numGages","numIterations","numParams"),fill_value = -9999)
+            idOut.variables['calibParams'][:,:,:] = paramCube
     except:
-        print("ERROR: Unable to execute SQL command: " + sqlCmd)
-        sys.exit(1)
-        
-    if numGages != len(jobGageIDs):
-        print("ERROR: Number of gages found in Calib_Stats does not match what is in Job_Meta.")
+        print("ERROR: Unable to write calibration/validation data to: " + outPath)
         idOut.close()
         if os.path.isfile(outPath):
             os.remove(outPath)
         sys.exit(1)
-        
-    for i in range(0,numGages):
-        sqlCmd = "SELECT gage_id from \"Domain_Meta\" where \"domainID\"=%s;" % jobGageIDs[i][0]
-        try:
-            dbCursor.execute(sqlCmd)
-            gageIdTmp = dbCursor.fetchone()
-        except:
-            print("ERROR: Unable to extract gage_id for domainID: " + str(jobGageIDs[i][0]))
-            idOut.close()
-            if os.path.isfile(outPath):
-                os.remove(outPath)
-            sys.exit(1)
-        for j in range(0,len(gageIdTmp[0])):
-            idOut.variables['gage'][i,j] = gageIdTmp[0][j]
-        
-    # Create the statistic variables that will contain data for each gage, for all iterations.
-    idOut.createVariable("calibBias","f8",("numGages","numIterations"),fill_value=-9999)
-    idOut.createVariable("calibRmse","f8",("numGages","numIterations"),fill_value=-9999)
-    idOut.createVariable("calibCorrelation","f8",("numGages","numIterations"),fill_value=-9999)
-    idOut.createVariable("calibNse","f8",("numGages","numIterations"),fill_value=-9999)
-    #idOut.createVariable("calibNseWt","f8",("numGages","numIterations"),fill_value=-9999)
-    idOut.createVariable("calibNseLog","f8",("numGages","numIterations"),fill_value=-9999)
-    idOut.createVariable("calibKge","f8",("numGages","numIterations"),fill_value=-9999)
-    idOut.createVariable("calibFdc","f8",("numGages","numIterations"),fill_value=-9999)
-    idOut.createVariable("calibMsof","f8",("numGages","numIterations"),fill_value=-9999)
-    idOut.createVariable("calibHyperResMultiObj","f8",("numGages","numIterations"),fill_value=-9999)
-    idOut.createVariable("calibBest","f8",("numGages","numIterations"),fill_value=-9999)
-    
-    # Create the validation statistics variables that will contain the control/best 
-    # stats for each gage. Each gage entry will contain two values: One for
-    # the stats representative of the simulation driven with the control parameter
-    # values and another with stats representative of the simulation driven with the 
-    # calibrated parameter values. 
-    idOut.createVariable("validBias","f8",("numGages","ctrlBest"),fill_value=-9999)
-    idOut.createVariable("validRmse","f8",("numGages","ctrlBest"),fill_value=-9999)
-    idOut.createVariable("validCorrelation","f8",("numGages","ctrlBest"),fill_value=-9999)
-    idOut.createVariable("validNse","f8",("numGages","ctrlBest"),fill_value=-9999)
-    #idOut.createVariable("validNseWt","f8",("numGages","ctrlBest"),fill_value=-9999)
-    idOut.createVariable("validNseLog","f8",("numGages","ctrlBest"),fill_value=-9999)
-    idOut.createVariable("validKge","f8",("numGages","ctrlBest"),fill_value=-9999)
-    idOut.createVariable("validFdc","f8",("numGages","ctrlBest"),fill_value=-9999)
-    idOut.createVariable("validMsof","f8",("numGages","ctrlBest"),fill_value=-9999)
-    idOut.createVariable("validHyperResMultiObj","f8",("numGages","ctrlBest"),fill_value=-9999)
-    
-    # Loop through the gages and extract calibration stats for each 
-    # Close the NetCDF output file.
-    for i in range(0,numGages):
-        sqlCmd = "SELECT bias from \"Calib_Stats\" where \"jobID\"=%s and \"domainID\"=%s;" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsBias = dbCursor.fetchall()
-        except:
-            print("ERROR: Unable to extract bias stats for domainID: " + str(jobGageIDs[i][0]))
-            idOut.close()
-            if os.path.isfile(outPath):
-                os.remove(outPath)
-            sys.exit(1)
-            
-        sqlCmd = "SELECT rmse from \"Calib_Stats\" where \"jobID\"=%s and \"domainID\"=%s;" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsRmse = dbCursor.fetchall()
-        except:
-            print("ERROR: Unable to extract rmse stats for domainID: " + str(jobGageIDs[i][0]))
-            idOut.close()
-            if os.path.isfile(outPath):
-                os.remove(outPath)
-            sys.exit(1)
-            
-        sqlCmd = "SELECT cor from \"Calib_Stats\" where \"jobID\"=%s and \"domainID\"=%s;" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsCor = dbCursor.fetchall()
-        except:
-            print("ERROR: Unable to extract correlation stats for domainID: " + str(jobGageIDs[i][0]))
-            idOut.close()
-            if os.path.isfile(outPath):
-                os.remove(outPath)
-            sys.exit(1)
-            
-        sqlCmd = "SELECT nse from \"Calib_Stats\" where \"jobID\"=%s and \"domainID\"=%s;" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsNse = dbCursor.fetchall()
-        except:
-            print("ERROR: Unable to extract nse stats for domainID: " + str(jobGageIDs[i][0]))
-            idOut.close()
-            if os.path.isfile(outPath):
-                os.remove(outPath)
-            sys.exit(1)
-            
-        #sqlCmd = "SELECT nseWt from \"Calib_Stats\" where \"jobID\"=%s and \"domainID\"=%s;" % (args.jobID[0],jobGageIDs[i][0])
-        #try:
-        #    dbCursor.execute(sqlCmd)
-        #    resultsNseWt = dbCursor.fetchall()
-        #except:
-        #    print "ERROR: Unable to extract nseWt stats for domainID: " + str(jobGageIDs[i][0])
-        #    idOut.close()
-        #    if os.path.isfile(outPath):
-        #        os.remove(outPath)
-        #    sys.exit(1)
-            
-        sqlCmd = "SELECT nselog from \"Calib_Stats\" where \"jobID\"=%s and \"domainID\"=%s;" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsNseLog = dbCursor.fetchall()
-        except:
-            print("ERROR: Unable to extract nselog stats for domainID: " + str(jobGageIDs[i][0]))
-            idOut.close()
-            if os.path.isfile(outPath):
-                os.remove(outPath)
-            sys.exit(1)
-            
-        sqlCmd = "SELECT kge from \"Calib_Stats\" where \"jobID\"=%s and \"domainID\"=%s;" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsKge = dbCursor.fetchall()
-        except:
-            print("ERROR: Unable to extract kge stats for domainID: " + str(jobGageIDs[i][0]))
-            idOut.close()
-            if os.path.isfile(outPath):
-                os.remove(outPath)
-            sys.exit(1)
-            
-        sqlCmd = "SELECT fdcerr from \"Calib_Stats\" where \"jobID\"=%s and \"domainID\"=%s;" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsFdcerr = dbCursor.fetchall()
-        except:
-            print("ERROR: Unable to extract fdcerr stats for domainID: " + str(jobGageIDs[i][0]))
-            idOut.close()
-            if os.path.isfile(outPath):
-                os.remove(outPath)
-            sys.exit(1)
-            
-        sqlCmd = "SELECT msof from \"Calib_Stats\" where \"jobID\"=%s and \"domainID\"=%s;" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsMsof = dbCursor.fetchall()
-        except:
-            print("ERROR: Unable to extract msof stats for domainID: " + str(jobGageIDs[i][0]))
-            idOut.close()
-            if os.path.isfile(outPath):
-                os.remove(outPath)
-            sys.exit(1)
 
-        sqlCmd = "SELECT \"hyperResMultiObj\" from \"Calib_Stats\" where \"jobID\"=%s and \"domainID\"=%s;" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsHyperResMultiObj = dbCursor.fetchall()
-        except:
-            print("ERROR: Unable to extract hyperResMultiObj stats for domainID: " + str(jobGageIDs[i][0]))
-            idOut.close()
-            if os.path.isfile(outPath):
-                os.remove(outPath)
-            sys.exit(1)
-            
-        sqlCmd = "SELECT best from \"Calib_Stats\" where \"jobID\"=%s and \"domainID\"=%s;" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsBest = dbCursor.fetchall()
-        except:
-            print("ERROR: Unable to extract bias best iteration for domainID: " + str(jobGageIDs[i][0]))
-            idOut.close()
-            if os.path.isfile(outPath):
-                os.remove(outPath)
-            sys.exit(1)
-            
-        # Place statistics for gage into the NetCDF variables accordingly.
-        for j in range(0,numIter):
-            idOut.variables['calibBias'][i,j] = resultsBias[j][0]
-            idOut.variables['calibRmse'][i,j] = resultsRmse[j][0]
-            idOut.variables['calibCorrelation'][i,j] = resultsCor[j][0]
-            idOut.variables['calibNse'][i,j] = resultsNse[j][0]
-            #idOut.variables['calibNseWt'][i,j] = resultsNseWt[j][0]
-            idOut.variables['calibNseLog'][i,j] = resultsNseLog[j][0]
-            idOut.variables['calibKge'][i,j] = resultsKge[j][0]
-            idOut.variables['calibFdc'][i,j] = resultsFdcerr[j][0]
-            idOut.variables['calibMsof'][i,j] = resultsMsof[j][0]
-            idOut.variables['calibHyperResMultiObj'][i,j] = resultsHyperResMultiObj[j][0]
-            idOut.variables['calibBest'][i,j] = resultsBest[j][0]
-            
-    # Loop through each gage and extract the stats for the control/best simulations 
-    # for the validation period. 
-    for i in range(0,numGages):
-        # Bias
-        sqlCmd = "SELECT bias from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"default\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validBias'][i,0] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract control bias stats for domainID: " + str(jobGageIDs[i][0]))
-        
-        sqlCmd = "SELECT bias from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"calibrated\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp= dbCursor.fetchall()
-            idOut.variables['validBias'][i,1] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract best bias stats for domainID: " + str(jobGageIDs[i][0]))
-        
-        # RMSE
-        sqlCmd = "SELECT rmse from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"default\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validRmse'][i,0] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract control RMSE stats for domainID: " + str(jobGageIDs[i][0]))
-        
-        sqlCmd = "SELECT rmse from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"calibrated\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validRmse'][i,1] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract best RMSE stats for domainID: " + str(jobGageIDs[i][0]))
-        
-        # Correlation Coefficient
-        sqlCmd = "SELECT cor from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"default\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validCorrelation'][i,0] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract control correlation stats for domainID: " + str(jobGageIDs[i][0]))
-        
-        sqlCmd = "SELECT cor from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"calibrated\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validCorrelation'][i,1] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract best correlation stats for domainID: " + str(jobGageIDs[i][0]))
-
-        # NSE
-        sqlCmd = "SELECT nse from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"default\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validNse'][i,0] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract control nse stats for domainID: " + str(jobGageIDs[i][0]))
-        
-        sqlCmd = "SELECT nse from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"calibrated\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validNse'][i,1] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract best nse stats for domainID: " + str(jobGageIDs[i][0]))
-        
-        # NSE Weight
-        #sqlCmd = "SELECT nseWt from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"default\";" % (args.jobID[0],jobGageIDs[i][0])
-        #try:
-        #    dbCursor.execute(sqlCmd)
-        #    resultsTmp = dbCursor.fetchall()
-        #    idOut.variables['validNseWt'][i,0] = resultsTmp[0][0]
-        #except:
-        #    print "WARNING: Unable to extract control nseWt stats for domainID: " + str(jobGageIDs[i][0])
-        
-        #sqlCmd = "SELECT nseWt from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"calibrated\";" % (args.jobID[0],jobGageIDs[i][0])
-        #try:
-        #    dbCursor.execute(sqlCmd)
-        #    resultsTmp = dbCursor.fetchall()
-        #    idOut.variables['validNseWt'][i,1] = resultsTmp[0][0]
-        #except:
-        #    print "WARNING: Unable to extract best nseWt stats for domainID: " + str(jobGageIDs[i][0])
-
-        # NSE Log
-        sqlCmd = "SELECT nselog from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"default\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validNseLog'][i,0] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract control nse log stats for domainID: " + str(jobGageIDs[i][0]))
-        
-        sqlCmd = "SELECT nselog from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"calibrated\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validNseLog'][i,1] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract best nse log stats for domainID: " + str(jobGageIDs[i][0]))
-
-        # KGE
-        sqlCmd = "SELECT kge from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"default\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validKge'][i,0] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract control kge stats for domainID: " + str(jobGageIDs[i][0]))
-        
-        sqlCmd = "SELECT kge from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"calibrated\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validKge'][i,1] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract best kge stats for domainID: " + str(jobGageIDs[i][0]))
-
-        # MSOF
-        sqlCmd = "SELECT msof from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"default\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validMsof'][i,0] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract control msof stats for domainID: " + str(jobGageIDs[i][0]))
-        
-        sqlCmd = "SELECT msof from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"calibrated\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validMsof'][i,1] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract best msof stats for domainID: " + str(jobGageIDs[i][0]))
-
-        # Hyper Resolution Objective Function
-        sqlCmd = "SELECT hyperResMultiObj from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"default\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validHyperResMultiObj'][i,0] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract control hyperResMultiObj stats for domainID: " + str(jobGageIDs[i][0]))
-        
-        sqlCmd = "SELECT hyperResMultiObj from \"Valid_Stats\" where \"jobID\"=%s and \"domainID\"=%s and simulation=\"calibrated\";" % (args.jobID[0],jobGageIDs[i][0])
-        try:
-            dbCursor.execute(sqlCmd)
-            resultsTmp = dbCursor.fetchall()
-            idOut.variables['validHyperResMultiObj'][i,1] = resultsTmp[0][0]
-        except:
-            print("WARNING: Unable to extract best hyperResMultiObj stats for domainID: " + str(jobGageIDs[i][0]))
-        
-            
-           
-    # Loop through all the calibration parameters for this job. For each parameter
-    # the program will extract all parameter values for each gage, for each iteration.
-    for calibParamName in calibParamNames:
-        # First create a NetCDF variable for this calibration parameter.
-        idOut.createVariable(calibParamName[0],"f8",("numGages","numIterations"),fill_value = -9999)
-        
-        # Loop through each gage
-        for i in range(0,numGages):
-            # Extract all parameter values for this gage.
-            sqlCmd = "SELECT \"paramValue\" from \"Calib_Params\" where \"jobID\"=%s and \"domainID\"=%s and \"paramName\"=\"%s\";" % (args.jobID[0],jobGageIDs[i][0],calibParamName[0])
-            try:
-                dbCursor.execute(sqlCmd)
-                paramsTmp = dbCursor.fetchall()
-            except:
-                print("ERROR: Unable to extract calibration parameter: " + calibParamName[0] + " for domainID: " + str(jobGageIDs[i][0]))
-                idOut.close()
-                if os.path.isfile(outPath):
-                    os.remove(outPath)
-                sys.exit(1)
-                
-            # Place parameter values into the NetCDF file accordingly.
-            for j in range(0,numIter):
-                idOut.variables[calibParamName[0]][i,j] = paramsTmp[j][0]
-        
     idOut.close()
-    
+
+def pivotIterations(statsDf,colName,gageIndex,numGages,numIter):
+    """
+    Generic function to pivot a column of the Calib_Stats table into a
+    (gage,iteration) array. Missing entries are set to -9999.
+    """
+    outArray = np.full((numGages,numIter),-9999.0)
+    if colName not in statsDf.columns:
+        return outArray
+    gagePos = statsDf.domainID.map(gageIndex)
+    iterPos = statsDf.iteration - 1
+    keepInd = gagePos.notnull() & (iterPos >= 0) & (iterPos < numIter) & statsDf[colName].notnull()
+    outArray[gagePos[keepInd].astype(int),iterPos[keepInd].astype(int)] = statsDf[colName][keepInd]
+    return outArray
+
+def pivotSimulations(statsDf,colName,gageIndex,numGages):
+    """
+    Generic function to pivot a column of the Valid_Stats table into a
+    (gage,ctrlBest) array. Missing entries are set to -9999.
+    """
+    outArray = np.full((numGages,len(VALID_SIMS)),-9999.0)
+    if colName not in statsDf.columns:
+        return outArray
+    gagePos = statsDf.domainID.map(gageIndex)
+    simPos = statsDf.simulation.map(dict(zip(VALID_SIMS,range(0,len(VALID_SIMS)))))
+    keepInd = gagePos.notnull() & simPos.notnull() & statsDf[colName].notnull()
+    outArray[gagePos[keepInd].astype(int),simPos[keepInd].astype(int)] = statsDf[colName][keepInd]
+    return outArray
+
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -117,6 +117,15 @@ def main(argv):
         print("Optional land restart path: " + str(results[gage][42]))
         print("Optional hydro restart path: " + str(results[gage][43]))
         print("CHANPARM path: " + str(results[gage][44]))
+        if len(results[gage]) > 54:
+            print("Land grid dimensions (nx,ny): " + str(results[gage][45]) + "," + str(results[gage][46]))
+            print("Hydro grid dimensions (nx,ny): " + str(results[gage][47]) + "," + str(results[gage][48]))
+            print("Geogrid file size (bytes): " + str(results[gage][49]))
+            print("Fulldom file size (bytes): " + str(results[gage][50]))
+            print("Soil properties file size (bytes): " + str(results[gage][51]))
+            print("2D Hydro parameter table size (bytes): " + str(results[gage][52]))
+            print("Wrfinput file size (bytes): " + str(results[gage][53]))
+            print("RouteLink file size (bytes): " + str(results[gage][54]))
         print("--------------------------------------------------")
         
     # Close connection to DB
@@ -32,7 +32,8 @@ CREATE TABLE "Calib_Stats" (
    "msof" real DEFAULT NULL,
    "hyperResMultiObj" real DEFAULT NULL,
    "best" integer DEFAULT NULL,
-   "complete" float DEFAULT NULL
+   "complete" float DEFAULT NULL,
+   "stopped" integer DEFAULT 0
 );
 ALTER TABLE "Calib_Stats" OWNER TO "WH_Calib_rw";
 DROP TABLE IF EXISTS "Sens_Stats";
@@ -101,7 +102,17 @@ CREATE TABLE "Domain_Meta" (
    "hydro_tbl_spatial" character varying(512),
    "opt_spin_land_path" character varying(512),
    "opt_spin_hydro_path" character varying(512),
-   "chan_parm_path" character varying(512)
+   "chan_parm_path" character varying(512),
+   "land_nx" integer DEFAULT NULL,
+   "land_ny" integer DEFAULT NULL,
+   "hydro_nx" integer DEFAULT NULL,
+   "hydro_ny" integer DEFAULT NULL,
+   "geo_file_size" bigint DEFAULT NULL,
+   "fulldom_file_size" bigint DEFAULT NULL,
+   "soil_file_size" bigint DEFAULT NULL,
+   "hydro_tbl_file_size" bigint DEFAULT NULL,
+   "wrfinput_file_size" bigint DEFAULT NULL,
+   "rtlink_file_size" bigint DEFAULT NULL
 );
 ALTER TABLE "Domain_Meta" OWNER TO "WH_Calib_rw";
 DROP TABLE IF EXISTS "Job_Meta";
@@ -176,4 +187,39 @@ CREATE TABLE "Valid_Stats" (
    "msof" real DEFAULT NULL,
    "hyperResMultiObj" real DEFAULT NULL
 );
-ALTER TABLE "Valid_Stats" OWNER TO "WH_Calib_rw";
\ No newline at end of file
+ALTER TABLE "Valid_Stats" OWNER TO "WH_Calib_rw";
+DROP TABLE IF EXISTS "Basin_Status";
+CREATE TABLE "Basin_Status" (
+   "jobID" integer NOT NULL,
+   "domainID" integer NOT NULL,
+   "phase" smallint NOT NULL,
+   "iteration" integer NOT NULL,
+   "state" smallint NOT NULL,
+   PRIMARY KEY ("jobID","domainID","phase","iteration")
+);
+ALTER TABLE "Basin_Status" OWNER TO "WH_Calib_rw";
+DROP TABLE IF EXISTS "Calib_Convergence";
+CREATE TABLE "Calib_Convergence" (
+   "jobID" integer NOT NULL,
+   "domainID" integer NOT NULL,
+   "iteration" integer NOT NULL,
+   "reason" text NOT NULL,
+   "bestObj" real DEFAULT NULL,
+   "improvement" real DEFAULT NULL,
+   "projectedGain" real DEFAULT NULL,
+   "nSkipped" integer NOT NULL,
+   PRIMARY KEY ("jobID","domainID")
+);
+ALTER TABLE "Calib_Convergence" OWNER TO "WH_Calib_rw";
+DROP TABLE IF EXISTS "Calib_Fidelity";
+CREATE TABLE "Calib_Fidelity" (
+   "jobID" integer NOT NULL,
+   "domainID" integer NOT NULL,
+   "iteration" integer NOT NULL,
+   "shortObj" real NOT NULL,
+   "predictedObj" real DEFAULT NULL,
+   "threshold" real DEFAULT NULL,
+   "promoted" smallint NOT NULL,
+   PRIMARY KEY ("jobID","domainID","iteration")
+);
+ALTER TABLE "Calib_Fidelity" OWNER TO "WH_Calib_rw";
@@ -21,6 +21,7 @@ from core import dbMod
 from core import configMod
 from core import errMod
 from core import calibIoMod
+from core import asyncStatusMod
 import time
 import datetime
 
@@ -108,6 +109,8 @@ def main(argv):
     jobData.trouteConfig = staticData.trouteConfig
     jobData.moduleLoadStr = staticData.moduleLoadStr
     jobData.moduleLoadTrouteStr = staticData.moduleLoadTrouteStr
+    jobData.groupWalltime = staticData.groupWalltime
+    jobData.groupHandoff = staticData.groupHandoff
 
     # Check gages in directory to match what's in the database
     try:
@@ -229,93 +232,54 @@ def main(argv):
     pbsJobId = np.empty([jobData.nGroups], np.int64)
     pbsJobId[:] = -9999
 
-    # Initialize a complete status flag to be false. The orchestrator program
-    # will loop over each group, checking for a COMPLETE flag. Once all COMPLETE
-    # flags are present, the requirements for completetion have been met, and the
-    # program will exit successfully.
-    completeStatus = False
-
-    while not completeStatus:
-        # Loop over each basin group. This program will check to see if a group job is running
-        # which is an instance of the calib.py program looping over basins for a group.
-        # Backup our database file, if needed (logic will dictate in function).
+    # Compose a complete flag for each group of basins. If this complete flag is present,
+    # that means these basins are complete.
+    flagPaths = [str(jobData.jobDir) + "/VALID_GROUP_" + str(basinGroup) + "_" + valid_type + ".COMPLETE"
+                 for basinGroup in range(0,jobData.nGroups)]
+
+    def submitGroup(basinGroup):
+        # Setup a job script that will execute the validation program, passing in the group number
+        # to instruct the workflow on which basins to process. We will regenerate the run script
+        # each time to ensure no previous group scripts are being used.
+        if jobData.jobRunType == 4:
+            # This is for MPI scripts as we don't have a scheduler.
+            runScript = jobData.jobDir + "/WVG_" + str(jobData.jobID) + "_" + \
+                        str(basinGroup) + "_" + valid_type
+        else:
+            runScript = jobData.jobDir + "/run_group_" + str(basinGroup) + "_" + valid_type + ".sh"
+        if os.path.isfile(runScript):
+            try:
+                os.remove(runScript)
+            except:
+                jobData.errMsg = "Unable to remove old run script file: " + runScript
+                errMod.errOut(jobData)
         try:
-            jobData.backupDatabase(staticData, db)
+            calibIoMod.generateValidGroupScript(jobData, basinGroup, runScript, valid_type, topDir)
+        except:
+            errMod.errOut(jobData)
+        try:
+            statusMod.submitGroupCalibration(jobData,runScript,pbsJobId,basinGroup)
         except:
             errMod.errOut(jobData)
 
-        for basinGroup in range(0,jobData.nGroups):
-            print("WORKING ON GROUP: " + str(basinGroup))
-            # Compose a complete flag for this specific group of basins. If this complete flag is present,
-            # that means these basins are complete.
-            basinCompleteFlag = str(jobData.jobDir) + "/VALID_GROUP_" + str(basinGroup) + "_" + valid_type + ".COMPLETE"
-
-            if os.path.isfile(basinCompleteFlag):
-                jobData.groupComplete[basinGroup] = 1
-                continue
-
-            # Setup a job script that will execute the calibration program, passing in the group number
-            # to instruct the workflow on which basins to process.
-            if jobData.jobRunType == 4:
-                # This is for MPI scripts as we don't have a scheduler.
-                runScript = jobData.jobDir + "/WVG_" + str(jobData.jobID) + "_" + \
-                            str(basinGroup) + "_" + valid_type
-            else:
-                runScript = jobData.jobDir + "/run_group_" + str(basinGroup) + "_" + valid_type + ".sh"
-            if not os.path.isfile(runScript):
-                try:
-                    calibIoMod.generateValidGroupScript(jobData, basinGroup, runScript, valid_type, topDir)
-                except:
-                    errMod.errOut(jobData)
-            else:
-                # We will regenerate the run script each time to ensure no previous group
-                # scripts are not being used.
-                try:
-                    os.remove(runScript)
-                except:
-                    jobData.errMsg = "Unable to remove old run script file: " + runScript
-                    errMod.errOut(jobData)
-                try:
-                    calibIoMod.generateValidGroupScript(jobData, basinGroup, runScript, valid_type, topDir)
-                except:
-                    errMod.errOut(jobData)
-
-            # Check to see if this group is currently running.
-            groupStatus = statusMod.checkBasGroupJob(jobData,basinGroup,pbsJobId,'WVG')
-
-            print('GROUP STATUS = ' + str(groupStatus))
-            if not groupStatus:
-                # Check to see if the complete flag was generated.
-                if os.path.isfile(basinCompleteFlag):
-                    jobData.groupComplete[basinGroup] = 1
-                    continue
-                else:
-                    # We need to fire off a new group job.
-                    print('SUBMITTING GROUP JOB')
-                    try:
-                        statusMod.submitGroupCalibration(jobData,runScript,pbsJobId,basinGroup)
-                    except:
-                        errMod.errOut(jobData)
-                    print(pbsJobId)
-
-            # Allow for some time in-between groups.
-            time.sleep(5)
-
-        # Check to see if the program requirements have been met.
-
-        if sum(jobData.groupComplete) == jobData.nGroups:
-            if(valid_type == 'BEST'):
-                jobData.validCompleteBEST = 1
-            elif(valid_type == 'CTRL'):
-                jobData.validCompleteCTRL = 1
-            try:
-                db.updateValidationStatus(jobData,valid_type)
-            except:
-                errMod.errout(jobData)
-            jobData.genMsg = "VALIDATION FOR JOB ID: " + str(jobData.jobID) + " " + valid_type + " is COMPLETE."
-            errMod.sendMsg(jobData)
-
-            completeStatus = True
+    # Probe all basin groups concurrently once per tick. Each group job is an instance of the
+    # validation.py program looping over basins for a group. Groups that are neither running nor
+    # complete are resubmitted. This returns once all COMPLETE flags are present, which means
+    # the requirements for completion have been met.
+    asyncStatusMod.runGroupLoop(jobData,staticData,db,pbsJobId,'WVG',flagPaths,submitGroup)
+
+    # Check to see if the program requirements have been met.
+    if sum(jobData.groupComplete) == jobData.nGroups:
+        if(valid_type == 'BEST'):
+            jobData.validCompleteBEST = 1
+        elif(valid_type == 'CTRL'):
+            jobData.validCompleteCTRL = 1
+        try:
+            db.updateValidationStatus(jobData,valid_type)
+        except:
+            errMod.errout(jobData)
+        jobData.genMsg = "VALIDATION FOR JOB ID: " + str(jobData.jobID) + " " + valid_type + " is COMPLETE."
+        errMod.sendMsg(jobData)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -24,7 +24,9 @@ from core import statusMod
 from core import dbMod
 from core import errMod
 from core import validMod
+from core import basinStatusMod
 from core import configMod
+from core import calibIoMod
 
 # Set the Python path to include package specific functions.
 prPath = os.path.realpath(__file__)
@@ -108,12 +110,21 @@ def main(argv):
     jobData.trouteConfig = staticData.trouteConfig
     jobData.moduleLoadStr = staticData.moduleLoadStr
     jobData.moduleLoadTrouteStr = staticData.moduleLoadTrouteStr        
+    jobData.groupWalltime = staticData.groupWalltime
+    jobData.groupHandoff = staticData.groupHandoff
     # Check gages in directory to match what's in the database
     try:
         jobData.checkGages2(db)
     except:
         errMod.errOut(jobData)
 
+    # Load the domain metadata for all basins, along with the troute configuration,
+    # once up front instead of for every basin on every pass of the workflow.
+    try:
+        calibIoMod.loadMetaCache(jobData,db)
+    except:
+        errMod.errOut(jobData)
+
     # Calculate the CPU/group layout for all basins.
     try:
         jobData.calcGroupNum()
@@ -305,7 +316,28 @@ def main(argv):
     pbsJobIdCtrl[:] = -9999
     pbsJobIdBest = np.empty([len(jobData.gages)],np.int64)
     pbsJobIdBest[:] = -9999
+
+    # Basins handled by this program, along with the keySlot column of the
+    # simulation being ran. Their status is persisted to the Basin_Status table
+    # once per pass through the basins. When restarting, simulations already
+    # found complete are pulled with a single query, the rest are checked on disk.
+    groupMask = np.array(jobData.gageGroup) == int(args.groupNum[0])
+    if valid_type == 'CTRL':
+        validCol = 0
+    else:
+        validCol = 1
+    cellMask = np.zeros([len(jobData.gages),2],dtype=bool)
+    cellMask[groupMask,validCol] = True
+    statusTracker = basinStatusMod.statusTracker(jobData,basinStatusMod.PHASE_VALID,keySlot,cellMask)
+    try:
+        statusTracker.restore(jobData,db,keySlot,True)
+    except:
+        errMod.errOut(jobData)
  
+    # Time at which this group job hands off to a successor before hitting its walltime.
+    handoffAt = statusMod.handoffTime(jobData,begTimeStamp)
+    groupScript = jobData.jobDir + "/run_group_" + str(args.groupNum[0]) + "_" + valid_type + ".sh"
+
     while not completeStatus:
         # Walk through spinup directory for each basin. Determine the status of
         # the model runs by the files available. If restarting, modify the 
@@ -327,7 +359,9 @@ def main(argv):
         # If output is not complete, the model is still running, status stays at 0.5.
         # If job is not running, and output has been completed, status goes to 1.0.
         # This continues indefinitely until statuses for ALL basins go to 1.0.
-        for basin in range(0,len(jobData.gages)):
+        # Basins of this group whose simulation is complete need no more work.
+        actionMask = ~groupMask | basinStatusMod.needsAction(basinStatusMod.encode(keySlot[:,validCol]))
+        for basin in np.nonzero(actionMask)[0]:
             print("PROCESSING BASIN: " + str(basin))
             # Only process basins that are part of this group, per the argument passed into the
             # program.
@@ -358,6 +392,15 @@ def main(argv):
                     errMod.errOut(jobData)
 
             time.sleep(5)
+            # Stop walking basins once this group job is due to hand off.
+            if statusMod.handoffDue(handoffAt):
+                break
+
+        # Persist the status changes from this pass in bulk.
+        try:
+            statusTracker.save(jobData,db,keySlot)
+        except:
+            errMod.errOut(jobData)
             
         # Check to see if program requirements have been met.
         if keySlot.sum() == entryValue:
@@ -385,6 +428,16 @@ def main(argv):
 
                 completeStatus = True
 
+        # If this group job is close to its walltime, its state has been saved above.
+        # Submit a successor that starts once this job ends, and exit cleanly.
+        if not completeStatus and statusMod.handoffDue(handoffAt):
+            try:
+                nextId = statusMod.submitSuccessor(jobData,"WVG",args.groupNum[0],groupScript)
+            except:
+                errMod.errOut(jobData)
+            print("HANDING OFF GROUP: " + str(args.groupNum[0]) + " TO JOB: " + str(nextId))
+            sys.exit(0)
+
         # Open the Python LOCK file. Write a blank line to the file and close it.
         # This action will simply modify the file modification time while only adding
         # a blank line.